@@ -12,6 +12,8 @@ from .world_api import world_bp
 from .story_api import story_bp
 from .npc_api import npc_bp
 from .events_api import events_bp
+from .metrics_api import metrics_bp
+from .jobs_api import jobs_bp, register_job_handlers
 
 
 def register_blueprints(app):
@@ -39,5 +41,12 @@ def register_blueprints(app):
     # 注册事件相关API
     app.register_blueprint(events_bp, url_prefix='/api/events')
 
+    # 注册运行指标API
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+
+    # 注册异步任务API及任务处理函数
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+    register_job_handlers()
+
 
 __all__ = ['register_blueprints']
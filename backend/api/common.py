@@ -0,0 +1,85 @@
+"""
+API公共工具
+"""
+
+from typing import Optional
+from flask import request, jsonify
+from llm.scheduler import LLMOverloadedError
+
+
+def get_request_deadline() -> Optional[float]:
+    """
+    读取客户端指定的LLM排队截止时间（请求头 X-Request-Deadline，单位秒）
+
+    Returns:
+        Optional[float]: 截止时间，未指定或格式错误时返回None（使用默认值）
+    """
+    value = request.headers.get('X-Request-Deadline')
+    try:
+        deadline = float(value) if value else None
+    except ValueError:
+        return None
+    return deadline if deadline and deadline > 0 else None
+
+
+def llm_overloaded_response(error: LLMOverloadedError):
+    """
+    LLM服务繁忙时的 429 响应
+
+    Args:
+        error (LLMOverloadedError): 调度器拒绝请求时抛出的异常
+
+    Returns:
+        Response: 带 Retry-After 头的 429 响应
+    """
+    response = jsonify({
+        "status": "error",
+        "message": str(error),
+        "retry_after": error.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def wants_async_response(data: Optional[dict]) -> bool:
+    """
+    客户端是否要求以异步任务方式处理请求
+
+    请求头 ``Prefer: respond-async`` 或请求体中 ``"async": true`` 均可开启。
+
+    Args:
+        data (Optional[dict]): 请求体
+
+    Returns:
+        bool: 是否异步处理
+    """
+    prefer = request.headers.get('Prefer', '')
+    if 'respond-async' in [item.strip().lower() for item in prefer.split(',')]:
+        return True
+    return bool(data) and data.get('async') is True
+
+
+def job_accepted_response(job: dict):
+    """
+    异步任务已受理的 202 响应
+
+    Args:
+        job (dict): 任务记录
+
+    Returns:
+        Response: 带 Location 头的 202 响应
+    """
+    job_id = job["job_id"]
+    status_url = f"/api/jobs/{job_id}"
+    response = jsonify({
+        "status": "accepted",
+        "job_id": job_id,
+        "job_status": job["status"],
+        "status_url": status_url,
+        "events_url": f"{status_url}/events",
+        "message": "任务已受理，正在后台处理"
+    })
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
@@ -3,9 +3,27 @@
 """
 
 import os
+import uuid
 from datetime import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from services import get_game_data_service, get_session_service, get_game_action_service
+from services.job_service import get_job_service, JobFailedError
+from services.history_memory import get_history_memory
+from services.game_action_service import ACTION_MODES
+from utils.stream_utils import format_sse_event
+from utils.hero_prefetch import get_hero_prefetcher
+from utils.resource_registry import get_resource_registry
+from utils.static_responses import get_static_response_cache
+from llm.scheduler import get_llm_scheduler, LLMOverloadedError, PRIORITY_INTERACTIVE
+from api.common import (
+    get_request_deadline, llm_overloaded_response, wants_async_response, job_accepted_response
+)
+
+# 异步任务中LLM请求的排队截止时间（秒），客户端不再同步等待，可以比交互请求宽松
+JOB_LLM_DEADLINE = float(os.environ.get('JOB_LLM_DEADLINE', 300))
+
+# 开场白文本
+PROLOGUE_FILE = 'prompts/prologue.txt'
 
 # 创建蓝图
 game_bp = Blueprint('game', __name__)
@@ -30,6 +48,7 @@ def process_game_action():
     data = request.json
     game_id = data.get('game_id', '')
     player_action = data.get('action', '')
+    mode = data.get('mode')
 
     logger.debug(f"请求参数 - 游戏ID: {game_id}")
     logger.debug(f"请求参数 - 行动长度: {len(player_action)} 字符")
@@ -47,6 +66,10 @@ def process_game_action():
             logger.warning("请求缺少玩家行动描述")
             return jsonify({"status": "error", "message": "缺少玩家行动描述"}), 400
 
+        if mode is not None and mode not in ACTION_MODES:
+            logger.warning(f"未知的行动处理模式: {mode}")
+            return jsonify({"status": "error", "message": f"未知的行动处理模式: {mode}"}), 400
+
         logger.debug("请求参数验证通过")
 
         # 验证游戏会话
@@ -58,6 +81,17 @@ def process_game_action():
 
         logger.debug("游戏会话验证通过")
 
+        # 异步模式：提交后台任务，立即返回任务ID
+        if wants_async_response(data):
+            job = get_job_service().submit_job("game_action", {
+                "game_id": game_id,
+                "action": player_action,
+                "mode": mode,
+                "action_id": f"action_{uuid.uuid4().hex}"
+            }, game_id=game_id)
+            logger.info(f"行动处理已转为异步任务: {game_id}, {job['job_id']}")
+            return job_accepted_response(job)
+
         # 处理玩家行动
         logger.info(f"开始处理玩家行动: {game_id}")
         logger.debug(f"行动处理开始时间: {datetime.now().isoformat()}")
@@ -66,7 +100,11 @@ def process_game_action():
         start_time = time.time()
 
         game_action_service = get_game_action_service()
-        action_result = game_action_service.process_player_action(game_id, player_action)
+        scheduler = get_llm_scheduler()
+        with scheduler.request_context(PRIORITY_INTERACTIVE, game_id, get_request_deadline()):
+            # 预计排队时间超过截止时间时立即返回 429
+            scheduler.admit()
+            action_result = game_action_service.process_player_action(game_id, player_action, mode)
 
         end_time = time.time()
         processing_time = end_time - start_time
@@ -99,6 +137,9 @@ def process_game_action():
             "message": "行动处理完成"
         })
 
+    except LLMOverloadedError as e:
+        logger.warning(f"LLM服务繁忙，拒绝行动处理请求: {game_id}")
+        return llm_overloaded_response(e)
     except Exception as e:
         logger.error(f"游戏行动处理异常: {e}")
         import traceback
@@ -106,6 +147,135 @@ def process_game_action():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def run_game_action_job(params):
+    """
+    异步任务处理函数：执行玩家行动
+
+    服务重启后任务会重新执行，若行动ID已记入游戏状态，说明行动已在重启前处理完毕，不再重复执行。
+
+    Args:
+        params (dict): 任务参数（game_id、action、mode、action_id）
+
+    Returns:
+        dict: 行动结果和更新后的游戏状态
+    """
+    game_id = params["game_id"]
+    game_data_service = get_game_data_service()
+
+    game_state = game_data_service.get_game_state(game_id)
+    if not game_state:
+        raise JobFailedError("游戏会话不存在或已过期")
+    game_action_service = get_game_action_service()
+    action_id = params.get("action_id")
+    if action_id and game_action_service.is_action_applied(game_state, action_id):
+        raise JobFailedError("该行动已在服务重启前处理，请刷新游戏状态")
+
+    scheduler = get_llm_scheduler()
+    with scheduler.request_context(PRIORITY_INTERACTIVE, game_id, JOB_LLM_DEADLINE):
+        action_result = game_action_service.process_player_action(
+            game_id, params["action"], params.get("mode"), action_id
+        )
+
+    if not action_result:
+        raise JobFailedError("行动处理失败")
+    if "error" in action_result:
+        raise JobFailedError(action_result["error"])
+
+    return {
+        "result": action_result,
+        "updated_game_state": game_data_service.get_game_state(game_id)
+    }
+
+
+@game_bp.route('/action/stream', methods=['POST'])
+def process_game_action_stream():
+    """以SSE方式处理玩家的游戏行动，实时推送叙述文本"""
+    from utils.logger import get_logger
+    logger = get_logger(__name__)
+
+    logger.info("收到流式游戏行动处理请求")
+
+    data = request.json or {}
+    game_id = data.get('game_id', '')
+    player_action = data.get('action', '')
+    mode = data.get('mode')
+
+    # 验证必需参数
+    if not game_id:
+        logger.warning("请求缺少游戏ID")
+        return jsonify({"status": "error", "message": "缺少游戏ID"}), 400
+
+    if not player_action:
+        logger.warning("请求缺少玩家行动描述")
+        return jsonify({"status": "error", "message": "缺少玩家行动描述"}), 400
+
+    if mode is not None and mode not in ACTION_MODES:
+        logger.warning(f"未知的行动处理模式: {mode}")
+        return jsonify({"status": "error", "message": f"未知的行动处理模式: {mode}"}), 400
+
+    # 验证游戏会话
+    session_service = get_session_service()
+    if not session_service.validate_session(game_id):
+        logger.warning(f"游戏会话验证失败: {game_id}")
+        return jsonify({"status": "error", "message": "游戏会话不存在或已过期"}), 404
+
+    # 预计排队时间超过截止时间时在建立流之前返回 429
+    scheduler = get_llm_scheduler()
+    deadline = get_request_deadline()
+    try:
+        with scheduler.request_context(PRIORITY_INTERACTIVE, game_id, deadline):
+            scheduler.admit()
+    except LLMOverloadedError as e:
+        logger.warning(f"LLM服务繁忙，拒绝流式行动处理请求: {game_id}")
+        return llm_overloaded_response(e)
+
+    def generate():
+        import time
+        start_time = time.time()
+
+        game_action_service = get_game_action_service()
+        with scheduler.request_context(PRIORITY_INTERACTIVE, game_id, deadline):
+            for event in game_action_service.process_player_action_stream(game_id, player_action, mode):
+                event_type = event["type"]
+
+                if event_type == "narrative":
+                    yield format_sse_event("narrative", {"text": event["text"]})
+                elif event_type == "period":
+                    yield format_sse_event("period", {
+                        "period": event["period"],
+                        "result": event["result"],
+                        "resumed": event.get("resumed", False)
+                    })
+                elif event_type == "result":
+                    game_data_service = get_game_data_service()
+                    updated_game_state = game_data_service.get_game_state(game_id)
+                    logger.info(f"流式游戏行动处理完成: {game_id}，耗时: {time.time() - start_time:.2f}秒")
+                    yield format_sse_event("result", {
+                        "status": "success",
+                        "result": event["result"],
+                        "updated_game_state": updated_game_state,
+                        "message": "行动处理完成"
+                    })
+                else:
+                    logger.error(f"流式行动处理失败: {game_id}, {event.get('message')}")
+                    error_data = {
+                        "status": "error",
+                        "message": event.get("message", "行动处理失败")
+                    }
+                    if "retry_after" in event:
+                        error_data["retry_after"] = event["retry_after"]
+                    yield format_sse_event("error", error_data)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @game_bp.route('/session/create', methods=['POST'])
 def create_game_session():
     """创建新的游戏会话"""
@@ -188,15 +358,11 @@ def create_new_game():
 def get_prologue():
     """获取游戏开场白"""
     try:
-        # 从文件中读取开场白文本
-        prologue_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)), 
-            'resources', 'prompts', 'prologue.txt'
+        # 开场白只随资源文件变化，返回预先序列化和压缩的缓存响应
+        return get_static_response_cache().respond(
+            'game/prologue', (PROLOGUE_FILE,),
+            lambda: {"status": "success", "prologue": get_resource_registry().get_text(PROLOGUE_FILE)}
         )
-        with open(prologue_path, 'r', encoding='utf-8') as file:
-            prologue_text = file.read()
-        
-        return jsonify({"status": "success", "prologue": prologue_text})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -208,12 +374,14 @@ def start_game():
     player_response = data.get('playerResponse', '')
 
     try:
-        # 这个接口现在只是简单地接收玩家响应，实际的游戏初始化由create_world接口完成
-        # player_response 将在未来版本中使用
+        # 实际的游戏初始化由create_world接口完成，这里在后台预取勇者信息，
+        # 随后的 /api/world/create 或 /api/hero/analyze 直接取用预取结果
+        prefetch_started = get_hero_prefetcher().prefetch(player_response)
         return jsonify({
             "status": "success",
             "message": "已接收玩家响应",
-            "received_response": bool(player_response)
+            "received_response": bool(player_response),
+            "prefetch_started": prefetch_started
         })
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -263,6 +431,26 @@ def get_game_state(game_id):
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@game_bp.route('/session/<game_id>/history', methods=['GET'])
+def get_game_history(game_id):
+    """获取完整的历史记录（包括已移入冷存储的记录）和前情摘要"""
+    try:
+        game_state = get_game_data_service().get_game_state(game_id)
+        if not game_state:
+            return jsonify({"status": "error", "message": "游戏状态不存在或已过期"}), 404
+
+        history_memory = get_history_memory()
+        summary, _ = history_memory.build_prompt_sections(game_state)
+        return jsonify({
+            "status": "success",
+            "history": history_memory.load_full_history(game_id, game_state),
+            "summary": summary,
+            "message": "历史记录获取成功"
+        })
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 @game_bp.route('/session/<game_id>/state', methods=['PUT'])
 def update_game_state(game_id):
     """更新游戏状态"""
@@ -4,8 +4,10 @@
 
 import random
 from flask import Blueprint, request, jsonify
-from utils.text_analyzer import extract_hero_info, extract_equipment
+from utils.hero_prefetch import get_hero_prefetcher
 from models import Hero
+from llm.scheduler import get_llm_scheduler, LLMOverloadedError, PRIORITY_INTERACTIVE
+from api.common import get_request_deadline, llm_overloaded_response
 
 # 创建蓝图
 hero_bp = Blueprint('hero', __name__)
@@ -83,8 +85,13 @@ def analyze_hero():
     
     try:
         # 从玩家输入中提取勇者信息
-        hero_info = extract_hero_info(player_response)
-        equipment = extract_equipment(player_response)
+        scheduler = get_llm_scheduler()
+        prefetcher = get_hero_prefetcher()
+        with scheduler.request_context(PRIORITY_INTERACTIVE, deadline=get_request_deadline()):
+            # 已有 /api/game/start 发起的预取时直接等待其结果，无需再申请LLM槽位
+            if not prefetcher.has_prefetch(player_response):
+                scheduler.admit()
+            hero_info, equipment = prefetcher.get_or_extract(player_response)
         
         # 创建勇者对象
         hero = Hero(
@@ -118,5 +125,7 @@ def analyze_hero():
             "hero": hero.to_dict(),
             "message": "勇者信息分析完成"
         })
+    except LLMOverloadedError as e:
+        return llm_overloaded_response(e)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -0,0 +1,71 @@
+"""
+异步任务相关API接口
+"""
+
+from flask import Blueprint, jsonify, Response, stream_with_context
+from services.job_service import get_job_service, FINISHED_STATUSES
+from utils.stream_utils import format_sse_event
+
+# SSE 订阅时两次心跳之间的最长间隔（秒）
+KEEPALIVE_INTERVAL = 15
+
+# 创建蓝图
+jobs_bp = Blueprint('jobs', __name__)
+
+
+def register_job_handlers():
+    """注册各类异步任务的处理函数"""
+    from api.game_api import run_game_action_job
+    from api.story_api import run_story_progress_job, run_story_progress_batch_job
+
+    job_service = get_job_service()
+    job_service.register_handler("game_action", run_game_action_job)
+    job_service.register_handler("story_progress", run_story_progress_job)
+    job_service.register_handler("story_progress_batch", run_story_progress_batch_job)
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询异步任务状态和结果"""
+    job_service = get_job_service()
+    job = job_service.get_job(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "任务不存在或已过期"}), 404
+
+    return jsonify({
+        "status": "success",
+        "job": job_service.public_view(job),
+        "message": "任务信息获取成功"
+    })
+
+
+@jobs_bp.route('/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """以SSE方式订阅异步任务状态，任务结束后关闭连接"""
+    job_service = get_job_service()
+    job = job_service.get_job(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "任务不存在或已过期"}), 404
+
+    def generate():
+        current = job
+        yield format_sse_event("status", job_service.public_view(current))
+        while current.get("status") not in FINISHED_STATUSES:
+            latest = job_service.wait_for_update(job_id, current.get("updated_at"), KEEPALIVE_INTERVAL)
+            if latest is None:
+                yield format_sse_event("error", {"status": "error", "message": "任务不存在或已过期"})
+                return
+            if latest.get("updated_at") == current.get("updated_at"):
+                yield ": keep-alive\n\n"
+                continue
+            current = latest
+            yield format_sse_event("status", job_service.public_view(current))
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -0,0 +1,30 @@
+"""
+运行指标API接口
+"""
+
+from flask import Blueprint, jsonify
+from llm.context_cache import get_prompt_prefix_cache
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 创建蓝图
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('', methods=['GET'])
+def get_runtime_metrics():
+    """获取运行指标：LLM调用耗时、提示前缀命中率、缓存统计等"""
+    try:
+        # 确保提示前缀缓存已注册统计收集函数
+        get_prompt_prefix_cache()
+
+        return jsonify({
+            "status": "success",
+            "metrics": get_metrics().snapshot()
+        })
+
+    except Exception as e:
+        logger.error(f"获取运行指标异常: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
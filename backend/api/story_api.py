@@ -2,61 +2,93 @@
 剧情推演相关API接口
 """
 
+import os
 from flask import Blueprint, request, jsonify
 from models import CharacterAction, LocationInfo, TimeOfDay
-from llm.story_engine import create_story_progression
+from llm.story_engine import create_story_progression, build_story_context, get_story_engine
+from llm.scheduler import get_llm_scheduler, LLMOverloadedError, PRIORITY_BACKGROUND
+from services.job_service import get_job_service
+from api.common import (
+    get_request_deadline, llm_overloaded_response, wants_async_response, job_accepted_response
+)
+
+# 异步任务中LLM请求的排队截止时间（秒）
+JOB_LLM_DEADLINE = float(os.environ.get('JOB_LLM_DEADLINE', 300))
+
+# 批量推演一次请求最多包含的推演项数
+STORY_BATCH_MAX_ITEMS = int(os.environ.get('STORY_BATCH_MAX_ITEMS', 32))
 
 # 创建蓝图
 story_bp = Blueprint('story', __name__)
 
 
+def _parse_story_request(data):
+    """
+    解析剧情推演请求参数
+
+    Args:
+        data (dict): 请求体
+
+    Returns:
+        dict: create_story_progression 的参数
+    """
+    location_data = data.get('location', {})
+    character_actions_data = data.get('character_actions', [])
+    current_time_str = data.get('current_time', 'D1Morning')
+
+    # 创建地点信息对象
+    location = LocationInfo(
+        name=location_data.get('name', '未知地点'),
+        description=location_data.get('description', ''),
+        current_characters=location_data.get('current_characters', []),
+        special_properties=location_data.get('special_properties', {})
+    )
+
+    # 创建角色动作对象列表
+    character_actions = []
+    for action_data in character_actions_data:
+        action = CharacterAction(
+            character_name=action_data.get('character_name', ''),
+            action_description=action_data.get('action_description', ''),
+            location=action_data.get('location', '')
+        )
+        character_actions.append(action)
+
+    # 转换时间枚举
+    try:
+        current_time = TimeOfDay[current_time_str]
+    except KeyError:
+        current_time = TimeOfDay.D1Morning  # 默认值
+
+    return {
+        "location": location,
+        "character_actions": character_actions,
+        "world_history": data.get('world_history', []),
+        "current_time": current_time,
+        "current_world_state": data.get('current_world_state', {}),
+        "current_character_states": data.get('current_character_states', {}),
+        "history_summary": data.get('history_summary') or ""
+    }
+
+
 @story_bp.route('/progress', methods=['POST'])
 def progress_story():
     """进行剧情推演"""
     data = request.json
     
     try:
-        # 解析输入参数
-        location_data = data.get('location', {})
-        character_actions_data = data.get('character_actions', [])
-        world_history = data.get('world_history', [])
-        current_time_str = data.get('current_time', 'D1Morning')
-        current_world_state = data.get('current_world_state', {})
-        current_character_states = data.get('current_character_states', {})
-        
-        # 创建地点信息对象
-        location = LocationInfo(
-            name=location_data.get('name', '未知地点'),
-            description=location_data.get('description', ''),
-            current_characters=location_data.get('current_characters', []),
-            special_properties=location_data.get('special_properties', {})
-        )
-        
-        # 创建角色动作对象列表
-        character_actions = []
-        for action_data in character_actions_data:
-            action = CharacterAction(
-                character_name=action_data.get('character_name', ''),
-                action_description=action_data.get('action_description', ''),
-                location=action_data.get('location', '')
-            )
-            character_actions.append(action)
-        
-        # 转换时间枚举
-        try:
-            current_time = TimeOfDay[current_time_str]
-        except KeyError:
-            current_time = TimeOfDay.D1Morning  # 默认值
+        story_kwargs = _parse_story_request(data)
+
+        # 异步模式：提交后台任务，立即返回任务ID
+        if wants_async_response(data):
+            job = get_job_service().submit_job("story_progress", data, game_id=data.get('game_id'))
+            return job_accepted_response(job)
         
-        # 调用剧情推演引擎
-        result = create_story_progression(
-            location=location,
-            character_actions=character_actions,
-            world_history=world_history,
-            current_time=current_time,
-            current_world_state=current_world_state,
-            current_character_states=current_character_states
-        )
+        # 调用剧情推演引擎（后台推演，优先级低于玩家行动）
+        scheduler = get_llm_scheduler()
+        with scheduler.request_context(PRIORITY_BACKGROUND, data.get('game_id'), get_request_deadline()):
+            scheduler.admit()
+            result = create_story_progression(**story_kwargs)
         
         return jsonify({
             "status": "success",
@@ -64,5 +96,124 @@ def progress_story():
             "message": "剧情推演完成"
         })
         
+    except LLMOverloadedError as e:
+        return llm_overloaded_response(e)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def _get_batch_items(data):
+    """
+    读取批量推演请求中的推演项
+
+    Args:
+        data (dict): 请求体，items 为推演项列表，每项与 /progress 的请求体格式相同
+
+    Returns:
+        list: 推演项列表
+
+    Raises:
+        ValueError: 推演项为空、格式错误或数量超过上限
+    """
+    items = (data or {}).get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError("items 必须是非空列表")
+    if len(items) > STORY_BATCH_MAX_ITEMS:
+        raise ValueError(f"一次最多推演 {STORY_BATCH_MAX_ITEMS} 项")
+    if not all(isinstance(item, dict) for item in items):
+        raise ValueError("items 中的每一项都必须是对象")
+    return items
+
+
+def _run_story_batch(items):
+    """
+    并发执行批量推演
+
+    Args:
+        items (list): 推演项列表
+
+    Returns:
+        dict: 包含整体状态、各项结果和成功/失败数量的响应内容
+    """
+    contexts = [build_story_context(**_parse_story_request(item)) for item in items]
+    results = []
+    for index, result in enumerate(get_story_engine().progress_many(contexts)):
+        if isinstance(result, Exception):
+            results.append({"index": index, "status": "error", "message": str(result)})
+        else:
+            results.append({"index": index, "status": "success", "result": result.to_dict()})
+
+    failed = sum(1 for item in results if item["status"] == "error")
+    if failed == 0:
+        status, message = "success", "批量剧情推演完成"
+    elif failed < len(results):
+        status, message = "partial", f"批量剧情推演部分完成，{failed} 项失败"
+    else:
+        status, message = "error", "批量剧情推演全部失败"
+    return {
+        "status": status,
+        "results": results,
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "message": message
+    }
+
+
+@story_bp.route('/progress/batch', methods=['POST'])
+def progress_story_batch():
+    """批量剧情推演：多个地点或时间段并发推演，单项失败不影响其他项"""
+    data = request.json
+
+    try:
+        items = _get_batch_items(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    try:
+        # 异步模式：提交后台任务，立即返回任务ID
+        if wants_async_response(data):
+            job = get_job_service().submit_job("story_progress_batch", data, game_id=data.get('game_id'))
+            return job_accepted_response(job)
+
+        scheduler = get_llm_scheduler()
+        with scheduler.request_context(PRIORITY_BACKGROUND, data.get('game_id'), get_request_deadline()):
+            scheduler.admit()
+            response = _run_story_batch(items)
+
+        return jsonify(response), (500 if response["status"] == "error" else 200)
+
+    except LLMOverloadedError as e:
+        return llm_overloaded_response(e)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def run_story_progress_job(params):
+    """
+    异步任务处理函数：执行剧情推演
+
+    Args:
+        params (dict): 原始请求体
+
+    Returns:
+        dict: 推演结果
+    """
+    scheduler = get_llm_scheduler()
+    with scheduler.request_context(PRIORITY_BACKGROUND, params.get('game_id'), JOB_LLM_DEADLINE):
+        result = create_story_progression(**_parse_story_request(params))
+    return result.to_dict()
+
+
+def run_story_progress_batch_job(params):
+    """
+    异步任务处理函数：执行批量剧情推演
+
+    Args:
+        params (dict): 原始请求体
+
+    Returns:
+        dict: 各项推演结果
+    """
+    scheduler = get_llm_scheduler()
+    with scheduler.request_context(PRIORITY_BACKGROUND, params.get('game_id'), JOB_LLM_DEADLINE):
+        return _run_story_batch(_get_batch_items(params))
@@ -3,28 +3,29 @@
 """
 
 import random
-import json
-import os
 from flask import Blueprint, request, jsonify
-from utils.text_analyzer import extract_hero_info, extract_equipment
+from utils.hero_prefetch import get_hero_prefetcher
 from models import World, Hero
 from services import get_game_data_service
+from services.npc_catalog import get_npc_catalog
+from llm.scheduler import get_llm_scheduler, LLMOverloadedError, PRIORITY_INTERACTIVE
+from api.common import get_request_deadline, llm_overloaded_response
+from utils.resource_registry import get_resource_registry, thaw
+from utils.static_responses import get_static_response_cache
 
 
 # 创建蓝图
 world_bp = Blueprint('world', __name__)
 
+# 世界描述文件
+WORLD_DESCRIPTION_FILE = 'world/world_description.json'
+
 
 def load_world_description():
     """从world_description.json文件加载世界基本描述"""
-    world_desc_path = os.path.join(
-        os.path.dirname(os.path.dirname(__file__)),
-        'resources', 'world', 'world_description.json'
-    )
-
     try:
-        with open(world_desc_path, 'r', encoding='utf-8') as file:
-            return json.load(file)
+        # 注册表中的数据不可修改，复制一份供调用方写入世界状态
+        return thaw(get_resource_registry().get_json(WORLD_DESCRIPTION_FILE))
     except Exception as e:
         print(f"加载世界描述文件失败: {e}")
         # 返回默认的世界描述
@@ -87,62 +88,14 @@ def generate_world_info(hero_data):
     return world
 
 
-def generate_npc_info():
-    """生成NPC信息"""
-    import json
-    import os
-    from models import NPC
-    
-    # 读取NPC模板文件
-    npc_template_path = os.path.join(
-        os.path.dirname(os.path.dirname(__file__)), 
-        'resources', 'npc', 'npc_templates.json'
-    )
-    
-    npcs = {}
-    
-    try:
-        with open(npc_template_path, 'r', encoding='utf-8') as file:
-            npc_templates = json.load(file)
-            
-        # 根据模板创建NPC对象
-        for npc_id, npc_data in npc_templates.items():
-            npc = NPC(
-                name=npc_data['name'],
-                age=npc_data['age'],
-                gender=npc_data['gender'],
-                profession=npc_data['profession']
-            )
-            
-            # 设置NPC属性
-            for stat_name, stat_value in npc_data['stats'].items():
-                npc.update_stats(stat_name, stat_value)
-
-            # 设置与勇者的关系值（默认为0，后续通过RelationshipGraph管理）
-            npc.update_relationship(0)
-
-            # 初始化事件列表（事件在游戏过程中动态添加）
-            npc.events = []
-            
-            npcs[npc_id] = npc
-            
-    except Exception as e:
-        print(f"加载NPC模板失败: {e}")
-        # 如果加载失败，返回空字典
-        pass
-    
-    return npcs
-
-
 @world_bp.route('/description', methods=['GET'])
 def get_world_description():
     """获取世界基本描述信息"""
     try:
-        world_desc = load_world_description()
-        return jsonify({
-            "status": "success",
-            "data": world_desc
-        })
+        return get_static_response_cache().respond(
+            'world/description', (WORLD_DESCRIPTION_FILE,),
+            lambda: {"status": "success", "data": load_world_description()}
+        )
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -158,8 +111,13 @@ def create_world():
         game_data_service = get_game_data_service()
 
         # 1. 从玩家输入中提取勇者信息
-        hero_info = extract_hero_info(player_response)
-        equipment = extract_equipment(player_response)
+        scheduler = get_llm_scheduler()
+        prefetcher = get_hero_prefetcher()
+        with scheduler.request_context(PRIORITY_INTERACTIVE, deadline=get_request_deadline()):
+            # 已有 /api/game/start 发起的预取时直接等待其结果，无需再申请LLM槽位
+            if not prefetcher.has_prefetch(player_response):
+                scheduler.admit()
+            hero_info, equipment = prefetcher.get_or_extract(player_response)
 
         # 合并信息
         base_stats = {
@@ -207,14 +165,14 @@ def create_world():
 
         # 3. 生成世界基本情况
         world = generate_world_info(hero_data)
-        npcs = generate_npc_info()
 
         # 4. 初始化游戏状态
         initial_state = {
             "day": 1,
             "player": hero.to_dict(),
             "world": world.to_dict(),
-            "npc": {npc_id: npc.to_dict() for npc_id, npc in npcs.items()},
+            # NPC初始数据从进程内的NPC目录复制，不再读取模板和构建NPC对象
+            "npc": get_npc_catalog().copy_all(),
             "initialResponse": player_response
         }
 
@@ -232,5 +190,7 @@ def create_world():
             "gameState": initial_state,
             "message": "世界创建完成，游戏会话已建立"
         })
+    except LLMOverloadedError as e:
+        return llm_overloaded_response(e)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
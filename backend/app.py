@@ -3,6 +3,7 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 from api import register_blueprints
 from utils.cleanup_tasks import start_cleanup_tasks
+from services.job_service import get_job_service
 import atexit
 
 # 加载环境变量
@@ -15,6 +16,9 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 # 注册所有API蓝图
 register_blueprints(app)
 
+# 重新排队服务重启前未完成的异步任务
+get_job_service().resume_pending_jobs()
+
 # 启动清理任务
 start_cleanup_tasks()
 
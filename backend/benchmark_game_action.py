@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+游戏行动处理基准测试
+启动本地模拟 ARK 服务（llm/fake_ark_server.py），并发执行多局游戏的行动处理，统计端到端延迟和吞吐量。
+
+不消耗真实API额度；使用 --live 时改为调用 ARK_API_BASE 指向的服务。
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("ARK_API_KEY", "benchmark-key")
+
+from llm.fake_ark_server import FakeArkServer, LATENCY_PROFILES, get_latency_profile
+from services import get_game_data_service, get_game_action_service
+
+
+def create_benchmark_game() -> str:
+    """创建基准测试用的游戏"""
+    return get_game_data_service().create_new_game({
+        "player": {"name": "基准勇者", "stats": {"hp": 100, "mp": 100, "strength": 15}},
+        "world": {"current_time": "上午", "weather": "晴天"},
+        "npc": {
+            "king": {"name": "国王", "profession": "国王", "relationship": 0},
+            "princess": {"name": "公主", "profession": "公主", "relationship": 0},
+            "blacksmith": {"name": "铁匠", "profession": "铁匠", "relationship": 0}
+        },
+        "history": []
+    })
+
+
+def run_action(game_id: str, stream: bool):
+    """执行一次行动，返回 (耗时, 首个叙述块耗时, 是否成功)"""
+    service = get_game_action_service()
+    start_time = time.perf_counter()
+
+    if not stream:
+        result = service.process_player_action(game_id, "前往王城拜见国王，然后去铁匠铺看看")
+        return time.perf_counter() - start_time, None, result is not None
+
+    first_narrative = None
+    success = False
+    for event in service.process_player_action_stream(game_id, "前往王城拜见国王，然后去铁匠铺看看"):
+        if event["type"] == "narrative" and first_narrative is None:
+            first_narrative = time.perf_counter() - start_time
+        success = event["type"] == "result"
+    return time.perf_counter() - start_time, first_narrative, success
+
+
+def _format_stats(values):
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+    return f"平均 {statistics.mean(values):.2f}s, 中位数 {statistics.median(values):.2f}s, " \
+           f"P95 {p95:.2f}s, 最大 {values[-1]:.2f}s"
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="游戏行动处理基准测试")
+    parser.add_argument("--games", type=int, default=8, help="并发的游戏数")
+    parser.add_argument("--actions", type=int, default=3, help="每局游戏的行动次数")
+    parser.add_argument("--profile", default="fast", choices=sorted(LATENCY_PROFILES), help="模拟服务延迟配置")
+    parser.add_argument("--stream", action="store_true", help="使用流式行动处理")
+    parser.add_argument("--seed", type=int, default=42, help="模拟服务随机种子")
+    parser.add_argument("--live", action="store_true", help="调用 ARK_API_BASE 指向的真实服务")
+    args = parser.parse_args()
+
+    server = None
+    if not args.live:
+        server = FakeArkServer(get_latency_profile(args.profile), seed=args.seed).start()
+        os.environ["ARK_API_BASE"] = server.api_base
+
+    print("=" * 60)
+    print(f"游戏行动基准测试（{'真实服务' if args.live else '模拟服务: ' + args.profile}，"
+          f"{args.games} 局 × {args.actions} 次，{'流式' if args.stream else '非流式'}）")
+    print("=" * 60)
+
+    try:
+        game_ids = [create_benchmark_game() for _ in range(args.games)]
+
+        def play(game_id):
+            return [run_action(game_id, args.stream) for _ in range(args.actions)]
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.games) as executor:
+            results = [item for game_results in executor.map(play, game_ids) for item in game_results]
+        elapsed = time.perf_counter() - start_time
+
+        durations = [duration for duration, _, ok in results if ok]
+        failures = sum(1 for _, _, ok in results if not ok)
+
+        if durations:
+            print(f"端到端延迟: {_format_stats(durations)}")
+        first_chunks = [first for _, first, ok in results if ok and first is not None]
+        if first_chunks:
+            print(f"首个叙述块: {_format_stats(first_chunks)}")
+        print(f"成功 {len(durations)}，失败 {failures}，总耗时 {elapsed:.2f}s，吞吐量 {len(results) / elapsed:.2f} 次/秒")
+        if server:
+            print(f"模拟服务统计: {server.stats}")
+    finally:
+        if server:
+            server.stop()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
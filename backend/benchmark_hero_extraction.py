@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+勇者信息提取模式基准测试
+比较 sequential / concurrent / combined 三种模式的端到端延迟
+
+默认使用模拟的LLM延迟（首字延迟 + 按输出长度计算的生成时间），不消耗真实API额度。
+使用 --live 时调用真实的LLM服务（需要配置 ARK_API_KEY）。
+"""
+
+import sys
+import time
+import shutil
+import argparse
+import statistics
+import tempfile
+
+import utils.llm_cache as llm_cache
+import utils.text_analyzer as text_analyzer
+
+
+SAMPLE_INPUT = "我叫艾伦，是一名25岁的男性剑士，非常强壮，头戴铁盔，身穿锁子甲，手持长剑和盾牌。"
+
+HERO_INFO_OUTPUT = (
+    '<提取结果>{"name": "艾伦", "gender": "男", "profession": "剑士", "age": 25, "personality": null, '
+    '"stats": {"strength": 80, "intelligence": null, "agility": null, "luck": null}}</提取结果>'
+    '<解释>玩家明确提到了姓名、性别、年龄和职业。</解释>'
+)
+EQUIPMENT_OUTPUT = (
+    '<提取结果>{"head": "铁盔", "chest": "锁子甲", "legs": null, "hands": ["长剑", "盾牌"], '
+    '"feet": null, "neck": null, "wrists": []}</提取结果>'
+    '<解释>玩家提到了头盔、盔甲和武器。</解释>'
+)
+COMBINED_OUTPUT = (
+    '<提取结果>{"hero_info": {"name": "艾伦", "gender": "男", "profession": "剑士", "age": 25, '
+    '"personality": null, "stats": {"strength": 80, "intelligence": null, "agility": null, "luck": null}}, '
+    '"equipment": {"head": "铁盔", "chest": "锁子甲", "legs": null, "hands": ["长剑", "盾牌"], '
+    '"feet": null, "neck": null, "wrists": []}}</提取结果>'
+    '<解释>玩家明确提到了基本信息和装备。</解释>'
+)
+
+
+def make_simulated_completion(first_token_latency: float, seconds_per_char: float):
+    """
+    创建模拟的 create_chat_completion
+
+    延迟 = 首字延迟 + 输出字符数 × 每字符生成时间，合并提示的输出更长，生成时间相应增加。
+    """
+    def simulated_completion(prompt, system_message="", **kwargs):
+        if '"hero_info"' in prompt:
+            content = COMBINED_OUTPUT
+        elif '"equipment"' in prompt or '"head"' in prompt:
+            content = EQUIPMENT_OUTPUT
+        else:
+            content = HERO_INFO_OUTPUT
+        time.sleep(first_token_latency + len(content) * seconds_per_char)
+        return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+    return simulated_completion
+
+
+def run_mode(mode: str, iterations: int):
+    """运行指定模式并返回每次的耗时列表"""
+    durations = []
+    for i in range(iterations):
+        # 每次使用不同的输入，避免命中缓存
+        text = f"{SAMPLE_INPUT}（第{mode}-{i}次）"
+        start_time = time.perf_counter()
+        hero_info, equipment = text_analyzer.extract_hero_profile(text, mode=mode)
+        durations.append(time.perf_counter() - start_time)
+        assert isinstance(hero_info, dict) and "stats" in hero_info, "勇者信息提取失败"
+        assert isinstance(equipment, dict), "装备信息提取失败"
+    return durations
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="勇者信息提取模式基准测试")
+    parser.add_argument("--iterations", type=int, default=5, help="每种模式的运行次数")
+    parser.add_argument("--first-token-latency", type=float, default=0.8, help="模拟的首字延迟（秒）")
+    parser.add_argument("--seconds-per-char", type=float, default=0.004, help="模拟的每字符生成时间（秒）")
+    parser.add_argument("--live", action="store_true", help="调用真实LLM服务")
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="extraction_benchmark_")
+    llm_cache._extraction_cache = llm_cache.LLMResponseCache(cache_dir=cache_dir)
+
+    if not args.live:
+        text_analyzer.create_chat_completion = make_simulated_completion(
+            args.first_token_latency, args.seconds_per_char
+        )
+
+    print("=" * 60)
+    print(f"勇者信息提取基准测试（{'真实LLM' if args.live else '模拟LLM'}，每种模式 {args.iterations} 次）")
+    print("=" * 60)
+    print(f"{'模式':<12}{'平均(秒)':>10}{'中位数(秒)':>12}{'最大(秒)':>10}{'LLM调用':>10}")
+
+    try:
+        for mode, calls in (('sequential', 2), ('concurrent', 2), ('combined', 1)):
+            durations = run_mode(mode, args.iterations)
+            print(f"{mode:<12}{statistics.mean(durations):>10.2f}{statistics.median(durations):>12.2f}"
+                  f"{max(durations):>10.2f}{calls:>10}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
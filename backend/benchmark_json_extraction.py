@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+JSON提取基准测试
+对比原有的正则匹配级联（StoryEngine 的四个 re.DOTALL 模式）与单次线性扫描的提取器（utils/json_extractor.py），
+统计各种输出格式下的提取耗时与正确率，并测量流式输出结束后剩余的解析时间。
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+from llm.fake_ark_server import build_game_action_content, build_story_content
+from utils.json_extractor import IncrementalJSONExtractor, extract_json_object
+
+# 原 StoryEngine._extract_result_json 使用的模式
+REGEX_PATTERNS = [
+    r"<推演结果>\s*```json\s*({.*?})\s*```\s*</推演结果>",
+    r"<推演结果>\s*({.*?})\s*</推演结果>",
+    r"```json\s*({.*?})\s*```",
+    r"({.*?})"
+]
+
+
+def regex_cascade(model_output: str) -> dict:
+    """原有的正则级联提取"""
+    for pattern in REGEX_PATTERNS:
+        match = re.search(pattern, model_output, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(1).strip())
+            except json.JSONDecodeError:
+                continue
+    raise ValueError("未找到有效的 JSON 内容。")
+
+
+def build_samples(rng: random.Random):
+    """构造不同格式的模型输出：(名称, 输出, 期望结果)"""
+    action = build_game_action_content("", "第2天 生命值: 90 魔法值: 80", rng)
+    action_obj = json.loads(action[action.index('{'):action.rindex('}') + 1])
+    story = build_story_content("")
+    story_obj = json.loads(story[story.index('{'):story.rindex('}') + 1])
+    story_payload = json.dumps(story_obj, ensure_ascii=False, indent=2)
+
+    return [
+        ("行动-代码块", action, action_obj),
+        ("推演-标签", story, story_obj),
+        ("推演-标签加代码块", f"<推演结果>\n```json\n{story_payload}\n```\n</推演结果>", story_obj),
+        ("推演-无包裹", f"推演结果如下：\n{story_payload}\n", story_obj),
+        ("推演-前置说明", f"请按照 {{JSON}} 格式：\n{story_payload}", story_obj)
+    ]
+
+
+def _time(func, output, iterations):
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            func(output)
+        except ValueError:
+            pass
+    return (time.perf_counter() - start_time) / iterations * 1e6
+
+
+def _check(func, output, expected):
+    try:
+        return func(output) == expected
+    except ValueError:
+        return False
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="JSON提取基准测试")
+    parser.add_argument("--iterations", type=int, default=2000, help="每个样本的重复次数")
+    parser.add_argument("--chunk-size", type=int, default=8, help="模拟流式输出的分块大小（字符）")
+    args = parser.parse_args()
+
+    samples = build_samples(random.Random(42))
+
+    print("=" * 72)
+    print(f"{'样本':<16}{'长度':>6}{'正则(µs)':>12}{'扫描(µs)':>12}{'正则正确':>10}{'扫描正确':>10}")
+    print("-" * 72)
+    for name, output, expected in samples:
+        regex_us = _time(regex_cascade, output, args.iterations)
+        scan_us = _time(extract_json_object, output, args.iterations)
+        print(f"{name:<16}{len(output):>6}{regex_us:>12.1f}{scan_us:>12.1f}"
+              f"{'✓' if _check(regex_cascade, output, expected) else '✗':>10}"
+              f"{'✓' if _check(extract_json_object, output, expected) else '✗':>10}")
+
+    # 流式输出：逐块输入时，最后一块到达后剩余的解析耗时
+    print("-" * 72)
+    name, output, _ = samples[1]
+    chunks = [output[i:i + args.chunk_size] for i in range(0, len(output), args.chunk_size)]
+    tail_times = []
+    for _ in range(200):
+        extractor = IncrementalJSONExtractor()
+        for chunk in chunks[:-1]:
+            extractor.feed(chunk)
+        start_time = time.perf_counter()
+        extractor.feed(chunks[-1])
+        extractor.finish()
+        tail_times.append(time.perf_counter() - start_time)
+    full_us = _time(regex_cascade, output, args.iterations)
+    print(f"流式 {name}: 最后一块后剩余解析 {sum(tail_times) / len(tail_times) * 1e6:.1f}µs，"
+          f"整段正则解析 {full_us:.1f}µs")
+    print("=" * 72)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+"""
+异步LLM聊天模块
+
+基于 asyncio 的火山引擎 ARK API 客户端，使用信号量限制同时进行的请求数；
+每个请求与同步调用一样经过LLM调度器槽位、密钥池和任务路由。
+安装了 aiohttp 时使用其连接池发送请求，否则退回到标准库实现的 HTTP/1.1 客户端。
+
+Flask 视图等同步代码通过 ``run_coroutine_sync`` / ``create_chat_completions``
+把协程提交到后台事件循环线程执行，少量线程即可维持大量进行中的LLM请求。
+"""
+
+import os
+import ssl
+import json
+import time
+import asyncio
+import threading
+import concurrent.futures
+from typing import Dict, List, Any, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from llm.chat import (
+    DEFAULT_TIMEOUT, NON_CONTEXT_ERROR_STATUSES, ContextCacheError,
+    _build_payload, _build_headers, _estimate_payload_tokens, _resolve_chat_url, _record_usage
+)
+from llm.model_routing import get_model_router
+from llm.key_pool import get_api_key_pool
+from llm.scheduler import get_llm_scheduler
+from utils.logger import get_logger
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp 为可选依赖
+    aiohttp = None
+
+logger = get_logger('llm.async_chat', level='info')
+
+# 视为网络错误的异常类型
+_NETWORK_ERRORS = (OSError, EOFError, ValueError) + ((aiohttp.ClientError,) if aiohttp else ())
+
+# 默认最大并发请求数，可通过环境变量 LLM_MAX_CONCURRENCY 配置
+DEFAULT_MAX_CONCURRENCY = 64
+
+
+class AsyncLLMClient:
+    """异步LLM客户端"""
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 timeout: float = DEFAULT_TIMEOUT, use_aiohttp: Optional[bool] = None):
+        """
+        初始化异步LLM客户端
+
+        Args:
+            max_concurrency (int): 同时进行的最大请求数
+            timeout (float): 单个请求的超时时间（秒）
+            use_aiohttp (Optional[bool]): 是否使用 aiohttp，None 表示已安装时自动使用
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.use_aiohttp = (aiohttp is not None) if use_aiohttp is None else (use_aiohttp and aiohttp is not None)
+
+        # 信号量和 aiohttp 会话都绑定到具体的事件循环
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+        self._sessions: Dict[int, Any] = {}
+        self.in_flight = 0
+
+        logger.info(f"异步LLM客户端初始化完成，最大并发: {max_concurrency}，"
+                    f"HTTP实现: {'aiohttp' if self.use_aiohttp else 'stdlib'}")
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环对应的并发信号量"""
+        loop_id = id(asyncio.get_running_loop())
+        semaphore = self._semaphores.get(loop_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop_id] = semaphore
+        return semaphore
+
+    async def create_chat_completion(
+        self,
+        prompt: str,
+        system_message: str = "",
+        model: Optional[str] = None,
+        api_url: Optional[str] = None,
+        context_id: Optional[str] = None,
+        task: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        异步调用 ARK API 创建对话完成
+
+        与同步的 ``chat.create_chat_completion`` 一样经过调度器槽位、密钥池和任务路由，
+        请求的优先级、游戏ID和截止时间取自调用方的 ``request_context``。
+
+        Args:
+            prompt (str): 用户提问内容
+            system_message (str, optional): 系统提示信息
+            model (Optional[str], optional): 模型 ID，默认使用任务路由中的模型
+            api_url (Optional[str], optional): API 端点 URL，默认根据路由或 ARK_API_BASE 生成
+            context_id (Optional[str], optional): 上下文缓存ID，指定时请求发送到上下文对话端点
+            task (Optional[str], optional): 任务类型，决定模型、超时和采样参数
+
+        Returns:
+            Dict[str, Any]: API 响应内容
+
+        Raises:
+            LLMOverloadedError: 调度器或密钥池繁忙
+            ContextCacheError: 上下文缓存不存在或已过期
+            Exception: 当 API 调用失败时抛出异常
+        """
+        router = get_model_router()
+        route = router.get_route(task)
+        timeout = route.timeout if task else self.timeout
+        payload = _build_payload(prompt, system_message, model or route.model, context_id=context_id, route=route)
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        pool = get_api_key_pool()
+        scheduler = get_llm_scheduler()
+
+        async with self._get_semaphore():
+            # 与同步调用共用调度器槽位和密钥池，繁忙时抛出 LLMOverloadedError
+            ticket = await scheduler.acquire_async()
+            try:
+                lease = await pool.acquire_async(_estimate_payload_tokens(payload))
+                self.in_flight += 1
+                start_time = time.time()
+                try:
+                    logger.debug(f"发送异步LLM请求，密钥: {lease.key_id}，当前进行中: {self.in_flight}")
+                    status, response_body = await asyncio.wait_for(
+                        self._post(_resolve_chat_url(api_url, context_id, route, lease),
+                                   _build_headers(lease.key), body),
+                        timeout=timeout
+                    )
+                    if status == 429:
+                        lease.mark_rate_limited()
+                    result = _parse_response(status, response_body, context_id)
+                    lease.completion_tokens = (result.get('usage') or {}).get('completion_tokens') or 0
+                except asyncio.TimeoutError:
+                    logger.error(f"异步 LLM API 请求超时 (超过{timeout}秒)")
+                    router.record_error(task)
+                    raise Exception(f"LLM服务响应超时，请稍后重试")
+                except _NETWORK_ERRORS as e:
+                    logger.error(f"异步 API 请求失败: {e}")
+                    router.record_error(task)
+                    raise Exception(f"LLM服务调用失败: {str(e)}")
+                except ContextCacheError:
+                    raise
+                except Exception:
+                    router.record_error(task)
+                    raise
+                finally:
+                    self.in_flight -= 1
+                    pool.release(lease)
+            finally:
+                scheduler.release(ticket)
+
+        end_time = time.time()
+        logger.info(f"异步LLM请求完成，耗时: {end_time - start_time:.2f}秒")
+        router.record_latency(task, end_time - start_time)
+        _record_usage(payload, result.get('usage'))
+        return result
+
+    async def gather_chat_completions(
+        self,
+        requests: List[Dict[str, Any]],
+        return_exceptions: bool = True,
+        max_concurrency: Optional[int] = None
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        并发执行多个对话完成请求
+
+        Args:
+            requests (List[Dict[str, Any]]): 请求参数列表，每项为 create_chat_completion 的关键字参数
+            return_exceptions (bool): 为True时失败的请求以异常对象返回，不影响其他请求
+            max_concurrency (Optional[int]): 这批请求同时进行的最大数量，None 表示只受客户端并发上限限制
+
+        Returns:
+            List[Union[Dict[str, Any], Exception]]: 与请求顺序一致的结果列表
+        """
+        logger.info(f"并发执行 {len(requests)} 个LLM请求")
+        if max_concurrency:
+            limit = asyncio.Semaphore(max_concurrency)
+
+            async def limited(request):
+                async with limit:
+                    return await self.create_chat_completion(**request)
+
+            tasks = [limited(request) for request in requests]
+        else:
+            tasks = [self.create_chat_completion(**request) for request in requests]
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+
+    async def post_raw(self, url: str, headers: Dict[str, str], body: bytes) -> Tuple[int, bytes]:
+        """
+        在并发限制内发送已序列化的请求体，不解析响应
+
+        Args:
+            url (str): API 端点 URL
+            headers (Dict[str, str]): 请求头
+            body (bytes): 请求体
+
+        Returns:
+            Tuple[int, bytes]: 状态码和响应体
+        """
+        async with self._get_semaphore():
+            self.in_flight += 1
+            try:
+                return await self._post(url, headers, body)
+            finally:
+                self.in_flight -= 1
+
+    async def _post(self, url: str, headers: Dict[str, str], body: bytes) -> Tuple[int, bytes]:
+        """发送POST请求，返回状态码和响应体"""
+        if self.use_aiohttp:
+            return await self._post_aiohttp(url, headers, body)
+        return await _stdlib_post(url, headers, body)
+
+    async def _post_aiohttp(self, url: str, headers: Dict[str, str], body: bytes) -> Tuple[int, bytes]:
+        """使用 aiohttp 发送POST请求"""
+        loop_id = id(asyncio.get_running_loop())
+        session = self._sessions.get(loop_id)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[loop_id] = session
+
+        async with session.post(url, headers=headers, data=body) as response:
+            return response.status, await response.read()
+
+
+def _parse_response(status: int, response_body: bytes, context_id: Optional[str]) -> Dict[str, Any]:
+    """检查状态码并解析响应体，上下文缓存失效时抛出 ContextCacheError"""
+    if status >= 400:
+        if context_id and 400 <= status < 500 and status not in NON_CONTEXT_ERROR_STATUSES:
+            logger.warning(f"上下文缓存不可用 ({status}): {context_id}")
+            raise ContextCacheError(f"上下文缓存不可用: {status}")
+        logger.error(f"异步 API 请求失败，状态码: {status}")
+        logger.error(f"响应内容: {response_body[:500]!r}")
+        raise Exception(f"LLM服务调用失败: HTTP {status}")
+
+    try:
+        return json.loads(response_body.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        logger.error(f"异步 API 响应解析失败: {e}")
+        raise Exception(f"LLM服务调用失败: 响应格式错误")
+
+
+async def _stdlib_post(url: str, headers: Dict[str, str], body: bytes) -> Tuple[int, bytes]:
+    """
+    基于 asyncio 流的最小 HTTP/1.1 POST 实现
+
+    每个请求使用独立连接（Connection: close），支持 Content-Length 和 chunked 两种响应体。
+    """
+    parts = urlsplit(url)
+    is_https = parts.scheme == 'https'
+    host = parts.hostname
+    port = parts.port or (443 if is_https else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path = f"{path}?{parts.query}"
+
+    ssl_context = ssl.create_default_context() if is_https else None
+    reader, writer = await asyncio.open_connection(
+        host, port, ssl=ssl_context, server_hostname=host if is_https else None
+    )
+
+    try:
+        request_headers = {
+            'Host': parts.netloc,
+            'Content-Length': str(len(body)),
+            'Connection': 'close',
+            **headers
+        }
+        head = f"POST {path} HTTP/1.1\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in request_headers.items())
+        writer.write(head.encode('latin-1') + b"\r\n" + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("服务器未返回响应")
+        status = int(status_line.split()[1])
+
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size_line = await reader.readline()
+                size = int(size_line.split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            response_body = b"".join(chunks)
+        elif 'content-length' in response_headers:
+            response_body = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            response_body = await reader.read()
+
+        return status, response_body
+    finally:
+        writer.close()
+
+
+class _EventLoopThread:
+    """在后台线程中运行的事件循环，供同步代码提交协程"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name='llm-event-loop', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+# 全局事件循环线程与客户端实例
+_loop_thread = None
+_loop_thread_lock = threading.Lock()
+_async_llm_client = None
+
+
+def _get_loop_thread() -> _EventLoopThread:
+    """获取全局后台事件循环线程"""
+    global _loop_thread
+    if _loop_thread is None:
+        with _loop_thread_lock:
+            if _loop_thread is None:
+                _loop_thread = _EventLoopThread()
+    return _loop_thread
+
+
+def get_async_llm_client() -> AsyncLLMClient:
+    """
+    获取全局异步LLM客户端实例
+
+    Returns:
+        AsyncLLMClient: 异步LLM客户端实例
+    """
+    global _async_llm_client
+    if _async_llm_client is None:
+        max_concurrency = int(os.environ.get('LLM_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY))
+        _async_llm_client = AsyncLLMClient(max_concurrency=max_concurrency)
+    return _async_llm_client
+
+
+def run_coroutine_sync(coro, timeout: Optional[float] = None):
+    """
+    在后台事件循环中执行协程并阻塞等待结果；协程在调用方上下文的副本中运行，
+    调用方设置的 ``request_context`` 对其中的LLM调用同样生效
+
+    Args:
+        coro: 要执行的协程
+        timeout (Optional[float]): 等待超时时间（秒）
+
+    Returns:
+        协程的返回值
+
+    Raises:
+        concurrent.futures.TimeoutError: 超过等待时间，此时协程被取消
+    """
+    loop_thread = _get_loop_thread()
+    future = asyncio.run_coroutine_threadsafe(coro, loop_thread.loop)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+def create_chat_completions(requests: List[Dict[str, Any]],
+                            max_concurrency: Optional[int] = None) -> List[Union[Dict[str, Any], Exception]]:
+    """
+    同步接口：并发执行多个对话完成请求
+
+    Args:
+        requests (List[Dict[str, Any]]): 请求参数列表，每项为 create_chat_completion 的关键字参数
+        max_concurrency (Optional[int]): 这批请求同时进行的最大数量，None 表示只受客户端并发上限限制
+
+    Returns:
+        List[Union[Dict[str, Any], Exception]]: 与请求顺序一致的结果列表，失败项为异常对象
+    """
+    client = get_async_llm_client()
+    return run_coroutine_sync(client.gather_chat_completions(requests, max_concurrency=max_concurrency))
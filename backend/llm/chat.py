@@ -5,12 +5,19 @@
 import os
 import sys
 import json
+import time
 import requests
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator, Union
 from dotenv import load_dotenv
 
 # 导入日志模块
 from utils.logger import get_logger
+from utils.token_budget import get_token_estimator
+from utils.resource_registry import get_resource_registry
+from llm.scheduler import get_llm_scheduler
+from llm.model_routing import get_model_router, ModelRoute
+from llm.hedging import get_request_hedger
+from llm.key_pool import get_api_key_pool, KeyLease
 
 # 加载.env文件中的环境变量
 load_dotenv()
@@ -18,6 +25,42 @@ load_dotenv()
 # 获取日志记录器
 logger = get_logger('llm.chat', level='info')
 
+# 默认模型与API端点
+DEFAULT_MODEL = "ep-20250219141351-ntqmd"
+# 可通过环境变量 ARK_API_BASE 指向其他兼容服务（如本地的 llm/fake_ark_server.py）
+DEFAULT_API_BASE = "https://ark.cn-beijing.volces.com/api/v3"
+DEFAULT_API_URL = f"{DEFAULT_API_BASE}/chat/completions"
+
+# 默认系统提示文件（由资源注册表加载）
+SYSTEM_PROMPT = 'prompts/system_prompt.txt'
+
+# 上下文缓存的默认有效期（秒）
+DEFAULT_CONTEXT_TTL = 3600
+
+# 非流式请求的总超时时间（秒），LLM调用通常需要较长时间
+DEFAULT_TIMEOUT = 60
+
+# 流式请求的超时：(连接超时, 两个数据块之间的最大间隔)
+STREAM_TIMEOUT = (10, 60)
+
+# 上下文对话端点返回这些以外的4xx状态码时，视为上下文不存在或已过期
+NON_CONTEXT_ERROR_STATUSES = (401, 403, 429)
+
+
+class ContextCacheError(Exception):
+    """上下文缓存不存在或已过期（上下文对话端点返回4xx），调用方可改用完整提示重试"""
+
+
+def _context_error_status(error: requests.exceptions.RequestException, context_id: Optional[str]) -> Optional[int]:
+    """带上下文ID的请求因上下文不存在或已过期失败时返回状态码，其他错误返回None"""
+    response = getattr(error, 'response', None)
+    if not context_id or response is None:
+        return None
+    status = response.status_code
+    if 400 <= status < 500 and status not in NON_CONTEXT_ERROR_STATUSES:
+        return status
+    return None
+
 
 def get_api_key() -> str:
     """
@@ -38,109 +81,204 @@ def get_api_key() -> str:
     
     return api_key
 
+def get_api_base() -> str:
+    """
+    获取 ARK API 根地址，优先使用环境变量 ARK_API_BASE
+
+    Returns:
+        str: API 根地址（不含末尾斜杠）
+    """
+    return os.environ.get("ARK_API_BASE", DEFAULT_API_BASE).rstrip('/')
+
+
+def get_chat_url(context_id: Optional[str] = None, api_base: Optional[str] = None) -> str:
+    """
+    获取对话端点 URL
+
+    Args:
+        context_id (Optional[str]): 上下文缓存ID，指定时返回上下文对话端点
+        api_base (Optional[str]): API 根地址，默认根据 ARK_API_BASE 获取
+
+    Returns:
+        str: 对话端点 URL
+    """
+    api_base = api_base.rstrip('/') if api_base else get_api_base()
+    if context_id:
+        return f"{api_base}/context/chat/completions"
+    return f"{api_base}/chat/completions"
+
+
 def get_system_prompt() -> str:
     """
-    从环境变量获取系统提示信息，如果不存在则使用默认值
+    从资源文件获取系统提示信息（文件修改后自动重新加载），如果不存在则使用默认值
     
     Returns:
         str: 系统提示信息
     """
-    # 优先从环境变量获取系统提示信息
-    system_prompt_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'resources', 'prompts', 'system_prompt.txt')
-    
-    logger.debug(f"尝试从路径加载系统提示: {system_prompt_path}")
-    if os.path.exists(system_prompt_path):
-        try:
-            with open(system_prompt_path, 'r', encoding='utf-8') as file:
-                system_prompt = file.read()
-            logger.info(f"成功从文件加载系统提示: {system_prompt_path}")
-        except Exception as e:
-            logger.error(f"读取系统提示文件失败: {e}")
-            system_prompt = "你是游戏的智能助手."
+    try:
+        return get_resource_registry().get_text(SYSTEM_PROMPT)
+    except FileNotFoundError:
+        logger.warning(f"系统提示文件不存在: {SYSTEM_PROMPT}，使用默认提示")
+    except Exception as e:
+        logger.error(f"读取系统提示文件失败: {e}")
+    return "你是游戏的智能助手."
+
+
+def _build_payload(prompt: str, system_message: str, model: str, stream: bool = False,
+                   context_id: Optional[str] = None, route: Optional[ModelRoute] = None) -> Dict[str, Any]:
+    """构建请求负载，指定 context_id 时系统消息已包含在缓存的上下文中；指定路由时附带其采样参数"""
+    if context_id:
+        payload = {
+            "model": model,
+            "context_id": context_id,
+            "messages": [{"role": "user", "content": prompt}]
+        }
     else:
-        logger.warning(f"系统提示文件不存在: {system_prompt_path}，使用默认提示")
-        system_prompt = "你是游戏的智能助手."
-    
-    return system_prompt
+        if not system_message:
+            logger.debug("未提供系统消息，获取默认系统提示")
+            system_message = get_system_prompt()
+
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ]
+        }
+    if route is not None:
+        if route.max_tokens is not None:
+            payload["max_tokens"] = route.max_tokens
+        if route.temperature is not None:
+            payload["temperature"] = route.temperature
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def _build_headers(api_key: Optional[str] = None) -> Dict[str, str]:
+    """构建请求头，未指定密钥时使用 ARK_API_KEY"""
+    return {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {api_key or get_api_key()}'
+    }
+
+
+def _payload_text(payload: Dict[str, Any]) -> str:
+    """请求负载中所有消息的文本"""
+    return "".join(message.get('content', '') for message in payload.get('messages', []))
+
+
+def _estimate_payload_tokens(payload: Dict[str, Any]) -> int:
+    """估算请求负载的输入token数，用于预留密钥的TPM额度"""
+    return get_token_estimator().estimate(_payload_text(payload))
+
+
+def _resolve_chat_url(api_url: Optional[str], context_id: Optional[str], route: ModelRoute,
+                      lease: KeyLease) -> str:
+    """
+    确定对话端点：显式指定的URL > 任务路由的端点 > 密钥的端点 > ARK_API_BASE
+
+    上下文缓存只存在于创建它的端点上，带 context_id 的请求不使用密钥的端点。
+    """
+    if api_url:
+        return api_url
+    api_base = route.api_base or (None if context_id else lease.api_base)
+    return get_chat_url(context_id, api_base)
 
 
 def create_chat_completion(
     prompt: str,
     system_message: str = "",
-    model: str = "ep-20250219141351-ntqmd",
-    api_url: str = "https://ark.cn-beijing.volces.com/api/v3/chat/completions"
-) -> Dict[str, Any]:
+    model: Optional[str] = None,
+    api_url: Optional[str] = None,
+    stream: bool = False,
+    context_id: Optional[str] = None,
+    task: Optional[str] = None
+) -> Union[Dict[str, Any], Iterator[str]]:
     """
     调用火山引擎 ARK API 创建对话完成
     
     Args:
         prompt (str): 用户提问内容
         system_message (str, optional): 系统提示信息
-        model (str, optional): 模型 ID
-        api_url (str, optional): API 端点 URL
+        model (Optional[str], optional): 模型 ID，默认使用任务路由中的模型
+        api_url (Optional[str], optional): API 端点 URL，默认根据路由或 ARK_API_BASE 生成
+        stream (bool, optional): 为True时以流式方式返回，结果为逐块产出文本的迭代器
+        context_id (Optional[str], optional): 上下文缓存ID，指定时请求发送到上下文对话端点
+        task (Optional[str], optional): 任务类型（见 llm/model_routing.py），决定模型、超时和采样参数
     
     Returns:
-        Dict[str, Any]: API 响应内容
+        Union[Dict[str, Any], Iterator[str]]: API 响应内容；流式模式下为文本块迭代器
     
     Raises:
         Exception: 当 API 调用失败时抛出异常
     """
-    logger.info(f"开始创建对话完成，模型: {model}")
-    logger.debug(f"用户提示: {prompt[:50]}..." if len(prompt) > 50 else f"用户提示: {prompt}")
+    if stream:
+        return stream_chat_completion(prompt, system_message, model, api_url, context_id, task)
 
-    if not system_message:
-        logger.debug("未提供系统消息，获取默认系统提示")
-        system_message = get_system_prompt()
+    router = get_model_router()
+    route = router.get_route(task)
+    model = model or route.model
+
+    logger.info(f"开始创建对话完成，任务: {task or 'default'}，模型: {model}")
+    logger.debug(f"用户提示: {prompt[:50]}..." if len(prompt) > 50 else f"用户提示: {prompt}")
 
     # 准备请求负载
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": prompt}
-        ]
-    }
-    
-    # 准备请求头
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {get_api_key()}'
-    }
-    
+    payload = _build_payload(prompt, system_message, model, context_id=context_id, route=route)
+
+    # 超时时间由任务路由决定，LLM调用通常需要较长时间
+    timeout = route.timeout
+
     try:
-        # 发送请求
-        logger.debug(f"发送请求到 API 端点: {api_url}")
-        logger.debug(f"请求头: {headers}")
-        logger.debug(f"请求体大小: {len(json.dumps(payload))} 字符")
+        # 通过调度器控制同时进行的LLM请求数，繁忙时抛出 LLMOverloadedError；
+        # 再从密钥池中选择负载最低的可用密钥，所有密钥都达到限额时同样抛出 LLMOverloadedError
+        hedger = get_request_hedger()
+        with get_llm_scheduler().slot(), get_api_key_pool().lease(_estimate_payload_tokens(payload)) as lease:
+            api_url = _resolve_chat_url(api_url, context_id, route, lease)
+            headers = _build_headers(lease.key)
 
-        # 设置60秒超时时间，LLM调用通常需要较长时间
-        timeout = 60
-        logger.info(f"开始发送LLM请求，超时时间: {timeout}秒")
+            # 发送请求
+            logger.debug(f"发送请求到 API 端点: {api_url}，密钥: {lease.key_id}")
+            logger.debug(f"请求体大小: {len(json.dumps(payload))} 字符")
+            logger.info(f"开始发送LLM请求，超时时间: {timeout}秒")
 
-        import time
-        start_time = time.time()
-        response = requests.post(api_url, headers=headers, json=payload, timeout=timeout)
-        end_time = time.time()
+            start_time = time.time()
+            if hedger.is_enabled(task):
+                # 慢请求超过对冲延迟时发送对冲请求，先完成的胜出
+                result = hedger.post_json(api_url, headers, payload, timeout, task, context_id, lease)
+            else:
+                response = requests.post(api_url, headers=headers, json=payload, timeout=timeout)
+                # 检查响应状态
+                response.raise_for_status()
+                logger.debug(f"HTTP状态码: {response.status_code}")
+                # 解析响应
+                result = response.json()
+            end_time = time.time()
+            lease.completion_tokens = (result.get('usage') or {}).get('completion_tokens') or 0
 
         logger.info(f"LLM请求完成，耗时: {end_time - start_time:.2f}秒")
+        router.record_latency(task, end_time - start_time)
 
-        # 检查响应状态
-        response.raise_for_status()
-        logger.debug(f"HTTP状态码: {response.status_code}")
-
-        # 解析响应
-        result = response.json()
         logger.info("成功获取 API 响应")
         logger.debug(f"响应内容长度: {len(json.dumps(result, ensure_ascii=False))} 字符")
         logger.info(f"响应内容: {json.dumps(result, ensure_ascii=False)[:200]}..." if len(json.dumps(result, ensure_ascii=False)) > 200 else f"响应内容: {json.dumps(result, ensure_ascii=False)}")
 
+        # 记录token用量并校准本地估算
+        _record_usage(payload, result.get('usage'))
+
         # 返回 JSON 响应
         return result
     except requests.exceptions.Timeout as e:
         logger.error(f"LLM API 请求超时 (超过{timeout}秒): {e}")
+        router.record_error(task)
         raise Exception(f"LLM服务响应超时，请稍后重试")
     except requests.exceptions.RequestException as e:
+        context_status = _context_error_status(e, context_id)
+        if context_status is not None:
+            logger.warning(f"上下文缓存不可用 ({context_status}): {context_id}")
+            raise ContextCacheError(f"上下文缓存不可用: {context_status}") from e
         logger.error(f"API 请求失败: {e}")
+        router.record_error(task)
         if hasattr(e, 'response') and e.response:
             logger.error(f"状态码: {e.response.status_code}")
             logger.error(f"响应内容: {e.response.text}")
@@ -148,3 +286,196 @@ def create_chat_completion(
     except Exception as e:
         logger.error(f"LLM调用过程中发生未知错误: {e}")
         raise
+
+
+def _record_usage(payload: Dict[str, Any], usage: Optional[Dict[str, Any]]):
+    """记录服务返回的token用量，并用于校准本地token估算器"""
+    if not usage:
+        return
+
+    prompt_tokens = usage.get('prompt_tokens')
+    completion_tokens = usage.get('completion_tokens')
+    prompt_text = _payload_text(payload)
+
+    estimator = get_token_estimator()
+    estimated = estimator.estimate(prompt_text)
+    if payload.get('context_id'):
+        # 输入用量包含缓存的上下文前缀，而负载中只有变化后缀，不用于校准
+        logger.info(f"LLM token用量（含上下文缓存）: 输入 {prompt_tokens}（后缀估算 {estimated}），输出 {completion_tokens}")
+        return
+    estimator.calibrate(prompt_text, prompt_tokens)
+
+    logger.info(f"LLM token用量: 输入 {prompt_tokens}（估算 {estimated}），输出 {completion_tokens}，"
+                f"校准系数 {estimator.scale:.3f}")
+
+
+def create_context(
+    system_message: str,
+    model: str = DEFAULT_MODEL,
+    ttl: int = DEFAULT_CONTEXT_TTL,
+    api_url: Optional[str] = None
+) -> str:
+    """
+    创建上下文缓存，缓存固定的系统消息前缀
+
+    Args:
+        system_message (str): 需要缓存的系统消息
+        model (str, optional): 模型 ID
+        ttl (int, optional): 上下文有效期（秒）
+        api_url (Optional[str], optional): 上下文创建端点 URL，默认根据 ARK_API_BASE 生成
+
+    Returns:
+        str: 上下文ID
+
+    Raises:
+        Exception: 当创建失败时抛出异常
+    """
+    api_url = api_url or f"{get_api_base()}/context/create"
+    payload = {
+        "model": model,
+        "mode": "common_prefix",
+        "messages": [{"role": "system", "content": system_message}],
+        "ttl": ttl
+    }
+
+    try:
+        with get_api_key_pool().lease(_estimate_payload_tokens(payload)) as lease:
+            start_time = time.time()
+            response = requests.post(api_url, headers=_build_headers(lease.key), json=payload,
+                                     timeout=DEFAULT_TIMEOUT)
+            response.raise_for_status()
+            context_id = response.json().get('id')
+    except requests.exceptions.RequestException as e:
+        logger.error(f"创建上下文缓存失败: {e}")
+        raise Exception(f"LLM服务调用失败: {str(e)}")
+    except ValueError as e:
+        logger.error(f"上下文缓存响应解析失败: {e}")
+        raise Exception(f"LLM服务调用失败: 响应格式错误")
+
+    if not context_id:
+        raise Exception("LLM服务调用失败: 未返回上下文ID")
+
+    logger.info(f"上下文缓存创建完成: {context_id}，耗时: {time.time() - start_time:.2f}秒")
+    return context_id
+
+
+def parse_stream_line(line: str) -> Optional[str]:
+    """
+    解析一行SSE流数据，提取增量文本
+
+    ARK 流式接口按 OpenAI 兼容格式返回 ``data: {...}`` 行，
+    以 ``data: [DONE]`` 结束。
+
+    Args:
+        line (str): 原始SSE行
+
+    Returns:
+        Optional[str]: 增量文本，非数据行或无内容时返回None
+    """
+    line = line.strip()
+    if not line.startswith('data:'):
+        return None
+
+    data = line[len('data:'):].strip()
+    if not data or data == '[DONE]':
+        return None
+
+    try:
+        chunk = json.loads(data)
+    except json.JSONDecodeError:
+        logger.warning(f"无法解析的流式数据块: {data[:200]}")
+        return None
+
+    choices = chunk.get('choices') or [{}]
+    delta = choices[0].get('delta') or {}
+    return delta.get('content') or None
+
+
+def stream_chat_completion(
+    prompt: str,
+    system_message: str = "",
+    model: Optional[str] = None,
+    api_url: Optional[str] = None,
+    context_id: Optional[str] = None,
+    task: Optional[str] = None
+) -> Iterator[str]:
+    """
+    以流式方式调用火山引擎 ARK API，逐块产出模型生成的文本
+
+    Args:
+        prompt (str): 用户提问内容
+        system_message (str, optional): 系统提示信息
+        model (Optional[str], optional): 模型 ID，默认使用任务路由中的模型
+        api_url (Optional[str], optional): API 端点 URL，默认根据路由或 ARK_API_BASE 生成
+        context_id (Optional[str], optional): 上下文缓存ID
+        task (Optional[str], optional): 任务类型，决定模型、数据块间隔超时和采样参数
+
+    Yields:
+        str: 模型增量生成的文本块
+
+    Raises:
+        Exception: 当 API 调用失败时抛出异常
+    """
+    router = get_model_router()
+    route = router.get_route(task)
+    model = model or route.model
+    timeout = (STREAM_TIMEOUT[0], route.timeout)
+
+    logger.info(f"开始创建流式对话完成，任务: {task or 'default'}，模型: {model}")
+
+    payload = _build_payload(prompt, system_message, model, stream=True, context_id=context_id, route=route)
+
+    first_chunk_time = None
+    total_chars = 0
+    estimator = get_token_estimator()
+
+    try:
+        hedger = get_request_hedger()
+        # 流式请求在整个生成过程中占用调度器槽位和密钥
+        with get_llm_scheduler().slot(), get_api_key_pool().lease(_estimate_payload_tokens(payload)) as lease:
+            api_url = _resolve_chat_url(api_url, context_id, route, lease)
+            headers = _build_headers(lease.key)
+            start_time = time.time()
+            if hedger.is_enabled(task):
+                # 超过对冲延迟仍未收到首个数据块时发送对冲请求，先收到数据的胜出
+                response, lines = hedger.open_stream(api_url, headers, payload, timeout, task, context_id,
+                                                     lease)
+            else:
+                response = requests.post(api_url, headers=headers, json=payload, timeout=timeout, stream=True)
+                lines = None
+            with response:
+                response.raise_for_status()
+
+                for raw_line in lines or response.iter_lines(decode_unicode=False):
+                    if not raw_line:
+                        continue
+                    content = parse_stream_line(raw_line.decode('utf-8', errors='replace'))
+                    if content is None:
+                        continue
+
+                    if first_chunk_time is None:
+                        first_chunk_time = time.time()
+                        router.record_latency(task, first_chunk_time - start_time, stream=True)
+                        logger.info(f"收到首个流式数据块，耗时: {first_chunk_time - start_time:.2f}秒")
+
+                    total_chars += len(content)
+                    # 流式响应不返回用量，按生成文本估算输出token数
+                    lease.completion_tokens += estimator.estimate(content)
+                    yield content
+
+            router.record_latency(task, time.time() - start_time)
+            logger.info(f"流式LLM请求完成，总耗时: {time.time() - start_time:.2f}秒，生成 {total_chars} 字符")
+    except requests.exceptions.Timeout as e:
+        logger.error(f"流式 LLM API 请求超时: {e}")
+        router.record_error(task)
+        raise Exception(f"LLM服务响应超时，请稍后重试")
+    except requests.exceptions.RequestException as e:
+        context_status = _context_error_status(e, context_id)
+        if context_status is not None:
+            logger.warning(f"上下文缓存不可用 ({context_status}): {context_id}")
+            raise ContextCacheError(f"上下文缓存不可用: {context_status}") from e
+        logger.error(f"流式 API 请求失败: {e}")
+        router.record_error(task)
+        if hasattr(e, 'response') and e.response:
+            logger.error(f"状态码: {e.response.status_code}")
+        raise Exception(f"LLM服务调用失败: {str(e)}")
@@ -0,0 +1,229 @@
+"""
+提示前缀缓存模块
+
+游戏行动提示分为固定前缀（系统规则、世界设定、NPC名册）和变化后缀（属性、历史、行动）。
+同一局游戏的多次行动中前缀基本不变，本模块按游戏记录前缀指纹：
+
+- 启用上下文缓存（环境变量 ARK_CONTEXT_CACHE=1）时，为每局游戏创建 ARK 上下文缓存，
+  后续请求只发送变化后缀，前缀变化或上下文过期时重新创建；
+- 未启用时照常发送完整提示，仅统计前缀命中率（服务端的隐式前缀缓存同样受益于稳定的前缀）。
+
+命中率和命中/未命中时的请求耗时记录到全局指标中。
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Union
+
+from llm import chat
+from llm.model_routing import get_model_router
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger('llm.context_cache', level='info')
+
+# 最多记录的游戏数，超出后淘汰最久未使用的记录
+DEFAULT_MAX_ENTRIES = 1024
+
+# 上下文缓存提前失效的余量（秒），避免使用即将过期的上下文
+CONTEXT_EXPIRY_MARGIN = 60
+
+
+class PromptPrefixCache:
+    """按游戏记录提示前缀与上下文缓存"""
+
+    def __init__(self, enabled: Optional[bool] = None, ttl_seconds: int = chat.DEFAULT_CONTEXT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, api_base: Optional[str] = None):
+        """
+        初始化提示前缀缓存
+
+        Args:
+            enabled (Optional[bool]): 是否使用 ARK 上下文缓存，None 表示读取环境变量 ARK_CONTEXT_CACHE
+            ttl_seconds (int): 上下文缓存有效期（秒）
+            max_entries (int): 最多记录的游戏数
+            api_base (Optional[str]): ARK API 根地址，None 表示每次请求时读取 ARK_API_BASE
+        """
+        if enabled is None:
+            enabled = os.environ.get('ARK_CONTEXT_CACHE', '').lower() in ('1', 'true', 'yes')
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.api_base = api_base.rstrip('/') if api_base else None
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = get_metrics()
+
+        logger.info(f"提示前缀缓存初始化完成，上下文缓存: {'启用' if enabled else '未启用'}")
+
+    @staticmethod
+    def fingerprint(prefix: str) -> str:
+        """计算前缀指纹"""
+        return hashlib.sha256(prefix.encode('utf-8')).hexdigest()[:16]
+
+    def create_chat_completion(self, cache_key: str, prefix: str, prompt: str, stream: bool = False,
+                               task: Optional[str] = None) -> Union[Dict[str, Any], Iterator[str]]:
+        """
+        使用固定前缀和变化后缀发起对话
+
+        Args:
+            cache_key (str): 缓存键，通常为游戏ID
+            prefix (str): 固定前缀，作为系统消息发送或缓存
+            prompt (str): 变化后缀，作为用户消息发送
+            stream (bool): 是否以流式方式返回
+            task (Optional[str]): 任务类型（见 llm/model_routing.py）
+
+        Returns:
+            Union[Dict[str, Any], Iterator[str]]: API 响应内容；流式模式下为文本块迭代器
+        """
+        prefix_hash = self.fingerprint(prefix)
+        hit, context_id = self._lookup(cache_key, prefix_hash)
+        outcome = "hit" if hit else "miss"
+
+        self.metrics.increment(f"llm.prompt_prefix.{outcome}")
+        logger.info(f"提示前缀{'命中' if hit else '未命中'}: {cache_key}，前缀 {len(prefix)} 字符")
+
+        if self.enabled and context_id is None:
+            context_id = self._create_context(cache_key, prefix, prefix_hash, task)
+
+        start_time = time.perf_counter()
+
+        if stream:
+            return self._timed_stream(cache_key, prefix, prompt, context_id, outcome, start_time, task)
+
+        try:
+            result = chat.create_chat_completion(prompt, system_message=prefix, context_id=context_id,
+                                                 api_url=self._chat_url(context_id), task=task)
+        except chat.ContextCacheError:
+            # 只在上下文不存在或已过期时改用完整提示重试；超时、限流等错误直接抛出，避免在服务繁忙时加倍请求
+            self._on_context_error(cache_key)
+            result = chat.create_chat_completion(prompt, system_message=prefix, api_url=self._chat_url(None),
+                                                 task=task)
+
+        self.metrics.observe(f"llm.prompt_prefix.{outcome}_latency", time.perf_counter() - start_time)
+        return result
+
+    def _timed_stream(self, cache_key: str, prefix: str, prompt: str, context_id: Optional[str],
+                      outcome: str, start_time: float, task: Optional[str] = None) -> Iterator[str]:
+        """流式请求，记录首个数据块的耗时；收到数据前发现上下文失效时改用完整提示重试"""
+        first_chunk = True
+        try:
+            for chunk in chat.create_chat_completion(prompt, system_message=prefix, stream=True,
+                                                     context_id=context_id, api_url=self._chat_url(context_id),
+                                                     task=task):
+                if first_chunk:
+                    first_chunk = False
+                    self.metrics.observe(f"llm.prompt_prefix.{outcome}_first_chunk_latency",
+                                         time.perf_counter() - start_time)
+                yield chunk
+            return
+        except chat.ContextCacheError:
+            if not first_chunk:
+                raise
+            self._on_context_error(cache_key)
+
+        yield from chat.create_chat_completion(prompt, system_message=prefix, stream=True,
+                                               api_url=self._chat_url(None), task=task)
+
+    def _on_context_error(self, cache_key: str):
+        """上下文不存在或已过期：丢弃记录，下次请求重新创建"""
+        logger.warning(f"上下文缓存已失效，改用完整提示: {cache_key}")
+        self.metrics.increment("llm.prompt_prefix.context_expired")
+        self.invalidate(cache_key)
+
+    def _chat_url(self, context_id: Optional[str]) -> Optional[str]:
+        """获取对话端点：有上下文ID时使用上下文对话端点；未指定根地址时返回None，由对话模块按路由和密钥选择"""
+        if self.api_base is None:
+            return None
+        if context_id:
+            return f"{self.api_base}/context/chat/completions"
+        return f"{self.api_base}/chat/completions"
+
+    def _lookup(self, cache_key: str, prefix_hash: str):
+        """查找前缀记录，返回 (是否命中, 可用的上下文ID)"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            hit = entry is not None and entry["prefix_hash"] == prefix_hash
+            context_id = None
+            if hit and entry.get("context_id") and entry.get("expires_at", 0) > now:
+                context_id = entry["context_id"]
+
+            if not hit:
+                self._entries[cache_key] = {"prefix_hash": prefix_hash}
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return hit, context_id
+
+    def _create_context(self, cache_key: str, prefix: str, prefix_hash: str,
+                        task: Optional[str] = None) -> Optional[str]:
+        """为游戏创建上下文缓存（使用任务路由的模型），失败时返回None（退回完整提示）"""
+        try:
+            api_url = f"{self.api_base}/context/create" if self.api_base else None
+            model = get_model_router().get_route(task).model
+            context_id = chat.create_context(prefix, model=model, ttl=self.ttl_seconds, api_url=api_url)
+        except Exception as e:
+            logger.warning(f"创建上下文缓存失败，使用完整提示: {e}")
+            self.metrics.increment("llm.prompt_prefix.context_create_errors")
+            return None
+
+        self.metrics.increment("llm.prompt_prefix.context_created")
+        with self._lock:
+            self._entries[cache_key] = {
+                "prefix_hash": prefix_hash,
+                "context_id": context_id,
+                "expires_at": time.time() + self.ttl_seconds - CONTEXT_EXPIRY_MARGIN
+            }
+        return context_id
+
+    def invalidate(self, cache_key: str):
+        """删除指定游戏的前缀记录"""
+        with self._lock:
+            self._entries.pop(cache_key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取前缀命中率及耗时统计
+
+        Returns:
+            Dict[str, Any]: 命中/未命中次数、命中率和两种情况下的请求耗时
+        """
+        hits = self.metrics.get_counter("llm.prompt_prefix.hit")
+        misses = self.metrics.get_counter("llm.prompt_prefix.miss")
+        total = hits + misses
+        with self._lock:
+            entries = len(self._entries)
+
+        return {
+            "context_cache_enabled": self.enabled,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "entries": entries,
+            "hit_latency": self.metrics.get_timer("llm.prompt_prefix.hit_latency"),
+            "miss_latency": self.metrics.get_timer("llm.prompt_prefix.miss_latency")
+        }
+
+
+# 全局提示前缀缓存实例
+_prompt_prefix_cache = None
+
+
+def get_prompt_prefix_cache() -> PromptPrefixCache:
+    """
+    获取全局提示前缀缓存实例
+
+    Returns:
+        PromptPrefixCache: 提示前缀缓存实例
+    """
+    global _prompt_prefix_cache
+    if _prompt_prefix_cache is None:
+        ttl_seconds = int(os.environ.get('ARK_CONTEXT_TTL', chat.DEFAULT_CONTEXT_TTL))
+        _prompt_prefix_cache = PromptPrefixCache(ttl_seconds=ttl_seconds)
+        get_metrics().register_collector("prompt_prefix", _prompt_prefix_cache.get_stats)
+    return _prompt_prefix_cache
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+本地模拟 ARK 对话服务
+
+实现 /api/v3/chat/completions（含流式）和上下文缓存接口，根据提示内容返回符合格式的固定响应：
+
+- 游戏行动提示：```json 代码块中的 player_actions / time_progression / day_summary / updated_states
+- 分时段推演提示：```json 代码块中单个时段的 player_action / period / updated_states
+- 勇者一天的规划提示与NPC反应提示：```json 代码块中的规划（含 npc_interactions）和单个NPC的反应
+- 剧情推演提示：<推演结果> 标签中的推演JSON
+- 勇者信息/装备提取提示：<提取结果> 标签中的提取JSON
+
+可按延迟配置模拟首字延迟、生成速度，以及按比例注入 429、5xx 和超时，
+用于在不消耗真实API额度的情况下进行测试、压测和基准测试。
+
+使用方法：
+    python -m llm.fake_ark_server --port 8765 --profile realistic
+    export ARK_API_BASE=http://127.0.0.1:8765/api/v3
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from dataclasses import dataclass, replace
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict, List, Optional
+
+from utils.token_budget import get_token_estimator
+from utils.logger import get_logger
+
+logger = get_logger('llm.fake_ark_server', level='info')
+
+# 流式响应每个数据块的字符数
+STREAM_CHUNK_CHARS = 8
+
+
+@dataclass
+class LatencyProfile:
+    """延迟与错误注入配置"""
+
+    first_token_latency: float = 0.0   # 首字延迟均值（秒）
+    latency_sigma: float = 0.0         # 首字延迟的对数正态分布参数，0表示固定延迟
+    seconds_per_char: float = 0.0      # 每个输出字符的生成时间（秒）
+    error_429_rate: float = 0.0        # 返回 429 的比例
+    error_5xx_rate: float = 0.0        # 返回 500/502/503 的比例
+    timeout_rate: float = 0.0          # 不返回响应（模拟超时）的比例
+    timeout_seconds: float = 120.0     # 模拟超时时保持连接的时间（秒）
+    retry_after: int = 1               # 429 响应的 Retry-After（秒）
+
+
+# 预置延迟配置
+LATENCY_PROFILES = {
+    "instant": LatencyProfile(),
+    "fast": LatencyProfile(first_token_latency=0.2, latency_sigma=0.3, seconds_per_char=0.0005),
+    "realistic": LatencyProfile(first_token_latency=1.5, latency_sigma=0.5, seconds_per_char=0.01),
+    "slow": LatencyProfile(first_token_latency=8.0, latency_sigma=0.4, seconds_per_char=0.03),
+    "flaky": LatencyProfile(first_token_latency=1.5, latency_sigma=0.5, seconds_per_char=0.01,
+                            error_429_rate=0.1, error_5xx_rate=0.05, timeout_rate=0.02, timeout_seconds=90.0)
+}
+
+
+def get_latency_profile(name: str = "instant", **overrides) -> LatencyProfile:
+    """
+    获取预置延迟配置，可覆盖部分参数
+
+    Args:
+        name (str): 配置名称，见 LATENCY_PROFILES
+        **overrides: 覆盖的字段
+
+    Returns:
+        LatencyProfile: 延迟配置
+    """
+    if name not in LATENCY_PROFILES:
+        raise ValueError(f"未知的延迟配置: {name}，可选: {', '.join(LATENCY_PROFILES)}")
+    return replace(LATENCY_PROFILES[name], **overrides)
+
+
+def _find_int(pattern: str, text: str, default: int) -> int:
+    match = re.search(pattern, text)
+    return int(match.group(1)) if match else default
+
+
+# 行动推演的时段
+PERIODS = {"morning": "上午", "afternoon": "下午", "evening": "晚上"}
+
+
+def _game_action_context(system_message: str, prompt: str, rng: random.Random) -> Dict[str, Any]:
+    """从行动提示中读取天数、玩家属性，并随机选出参与的NPC"""
+    day = _find_int(r'第(\d+)天', prompt, 1)
+    stats = {
+        name: _find_int(rf'{label}: (\d+)', prompt, 50)
+        for name, label in (('strength', '力量'), ('intelligence', '智力'), ('agility', '敏捷'), ('luck', '幸运'))
+    }
+    stats = {"hp": _find_int(r'生命值: (\d+)', prompt, 100), "mp": _find_int(r'魔法值: (\d+)', prompt, 100), **stats}
+
+    # NPC名册在系统消息（或上下文缓存）中，格式为 "- **npc_id** (名称)"
+    roster = re.findall(r'^- \*\*(\w+)\*\* \((.+?)\)', system_message + "\n" + prompt, re.MULTILINE)
+    involved = rng.sample(roster, min(2, len(roster)))
+    return {"day": day, "stats": stats, "involved": involved}
+
+
+def _build_period(day: int, period: str, label: str, involved: List[Any]) -> Dict[str, Any]:
+    """生成单个时段的推演结果"""
+    npc_names = "、".join(name for _, name in involved) or "村民"
+    return {
+        "narrative": f"第{day}天{label}，勇者按计划行动，与{npc_names}有了交流。",
+        "location": "村庄",
+        "weather": "晴天",
+        "atmosphere": "宁静",
+        "events": [{"type": "dialogue", "description": f"{label}与{npc_names}交谈", "location": "村庄广场"}],
+        "state_changes": {
+            "player": {"hp": 0, "mp": 0, "strength": 0, "intelligence": 0, "agility": 0, "luck": 0},
+            "world": {"weather": "晴天", "current_time": period},
+            "relationships": {name: 1 for _, name in involved}
+        }
+    }
+
+
+def _build_day_summary(day: int, involved: List[Any]) -> Dict[str, Any]:
+    npc_names = "、".join(name for _, name in involved) or "村民"
+    return {
+        "narrative": f"第{day}天平静地过去了。",
+        "major_events": [f"结识了{npc_names}"],
+        "achievements": [],
+        "consequences": []
+    }
+
+
+def build_game_action_content(system_message: str, prompt: str, rng: random.Random) -> str:
+    """生成游戏行动推演响应（```json 代码块）"""
+    context = _game_action_context(system_message, prompt, rng)
+    day, involved = context["day"], context["involved"]
+
+    result = {
+        "player_actions": {period: f"{label}的行动" for period, label in PERIODS.items()},
+        "npc_actions": {
+            npc_id: {period: f"{name}{label}照常生活" for period, label in PERIODS.items()}
+            for npc_id, name in involved
+        },
+        "time_progression": {period: _build_period(day, period, label, involved) for period, label in PERIODS.items()},
+        "day_summary": _build_day_summary(day, involved),
+        "updated_states": {
+            "player": context["stats"],
+            "world": {"current_time": "evening", "weather": "晴天"},
+            "npcs": {npc_id: {"relationship": 3} for npc_id, _ in involved}
+        }
+    }
+    return "```json\n" + json.dumps(result, ensure_ascii=False, indent=2) + "\n```"
+
+
+def build_period_content(system_message: str, prompt: str, period: str, rng: random.Random) -> str:
+    """生成分时段推演中单个时段的响应（```json 代码块）"""
+    context = _game_action_context(system_message, prompt, rng)
+    day, involved = context["day"], context["involved"]
+    label = PERIODS.get(period, period)
+
+    result = {
+        "player_action": f"{label}的行动",
+        "npc_actions": {npc_id: f"{name}{label}照常生活" for npc_id, name in involved},
+        "period": _build_period(day, period, label, involved),
+        "updated_states": {
+            "player": context["stats"],
+            "world": {"current_time": period, "weather": "晴天"},
+            "npcs": {npc_id: {"relationship": 1} for npc_id, _ in involved}
+        }
+    }
+    if period == "evening":
+        result["day_summary"] = _build_day_summary(day, involved)
+    return "```json\n" + json.dumps(result, ensure_ascii=False, indent=2) + "\n```"
+
+
+def build_plan_content(system_message: str, prompt: str, rng: random.Random) -> str:
+    """生成勇者一天的规划响应（不含NPC的行动和状态，列出接触的NPC）"""
+    context = _game_action_context(system_message, prompt, rng)
+    day, involved = context["day"], context["involved"]
+    periods = list(PERIODS.items())
+
+    time_progression = {}
+    for period, label in periods:
+        period_data = _build_period(day, period, label, involved)
+        period_data["state_changes"].pop("relationships")
+        time_progression[period] = period_data
+
+    result = {
+        "player_actions": {period: f"{label}的行动" for period, label in periods},
+        "npc_interactions": {npc_id: periods[index % len(periods)][0] for index, (npc_id, _) in enumerate(involved)},
+        "time_progression": time_progression,
+        "day_summary": _build_day_summary(day, involved),
+        "updated_states": {
+            "player": context["stats"],
+            "world": {"current_time": "evening", "weather": "晴天"}
+        }
+    }
+    return "```json\n" + json.dumps(result, ensure_ascii=False, indent=2) + "\n```"
+
+
+def build_npc_reaction_content(prompt: str) -> str:
+    """生成单个NPC的反应响应"""
+    match = re.search(r'NPC (\S+)（ID: ', prompt)
+    name = match.group(1) if match else "村民"
+    result = {
+        "actions": {period: f"{name}{label}照常生活" for period, label in PERIODS.items()},
+        "reaction": f"{name}对勇者点头致意。",
+        "relationship_change": 2
+    }
+    return "```json\n" + json.dumps(result, ensure_ascii=False, indent=2) + "\n```"
+
+
+def build_story_content(prompt: str) -> str:
+    """生成剧情推演响应（<推演结果> 标签）"""
+    result = {
+        "narrative_description": "众人在此相遇，彼此交换了近况。",
+        "event_summary": "一次平静的相遇",
+        "updated_character_states": {},
+        "updated_world_state": {"weather": "晴天", "atmosphere": "宁静", "locations": {}, "global_events": [],
+                                "notes": ""},
+        "relationship_changes": {}
+    }
+    return f"<推演结果>\n{json.dumps(result, ensure_ascii=False, indent=2)}\n</推演结果>"
+
+
+def build_extraction_content(prompt: str) -> str:
+    """生成勇者信息/装备提取响应（<提取结果> 标签）"""
+    hero_info = {
+        "name": "艾伦", "gender": "男", "profession": "剑士", "age": 25, "personality": None,
+        "stats": {"strength": 60, "intelligence": None, "agility": None, "luck": None}
+    }
+    equipment = {"head": None, "chest": "皮甲", "legs": None, "hands": ["长剑"], "feet": None, "neck": None,
+                 "wrists": []}
+
+    if '"hero_info"' in prompt:
+        result = {"hero_info": hero_info, "equipment": equipment}
+    elif '"head"' in prompt:
+        result = equipment
+    else:
+        result = hero_info
+    return f"<提取结果>{json.dumps(result, ensure_ascii=False)}</提取结果>\n<解释>模拟服务生成的提取结果。</解释>"
+
+
+def build_content(messages: List[Dict[str, Any]], rng: random.Random) -> str:
+    """根据提示内容选择响应类型"""
+    system_message = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") != "system")
+
+    if "<推演结果>" in prompt:
+        return build_story_content(prompt)
+    if "<提取结果>" in prompt:
+        return build_extraction_content(prompt)
+    if '"relationship_change"' in prompt:
+        return build_npc_reaction_content(prompt)
+    if '"npc_interactions"' in prompt:
+        return build_plan_content(system_message, prompt, rng)
+    period = re.search(r'当前推演时段: (\w+)', prompt)
+    if period:
+        return build_period_content(system_message, prompt, period.group(1), rng)
+    if "time_progression" in system_message or "玩家行动" in prompt:
+        return build_game_action_content(system_message, prompt, rng)
+    return f"模拟回复：{prompt[:50]}"
+
+
+class _FakeArkHandler(BaseHTTPRequestHandler):
+    """模拟 ARK 接口的请求处理器"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        fake: "FakeArkServer" = self.server.fake
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return self._send_json(400, {"error": {"code": "InvalidParameter", "message": "invalid json"}})
+
+        path = self.path.split('?')[0]
+        fake.record("requests")
+
+        if path.endswith('/context/create'):
+            context_id = f"ctx-{uuid.uuid4().hex[:12]}"
+            fake.contexts[context_id] = payload.get("messages", [])
+            fake.record("contexts_created")
+            return self._send_json(200, {"id": context_id, "model": payload.get("model"),
+                                         "mode": payload.get("mode"), "ttl": payload.get("ttl")})
+
+        if path.endswith('/context/chat/completions'):
+            prefix_messages = fake.contexts.get(payload.get("context_id"))
+            if prefix_messages is None:
+                return self._send_json(404, {"error": {"code": "NotFound", "message": "context not found"}})
+            messages = prefix_messages + payload.get("messages", [])
+        elif path.endswith('/chat/completions'):
+            messages = payload.get("messages", [])
+        else:
+            return self._send_json(404, {"error": {"code": "NotFound", "message": "unknown endpoint"}})
+
+        profile = fake.profile
+        fault = fake.draw_fault()
+        if fault == "timeout":
+            fake.record("timeouts")
+            time.sleep(profile.timeout_seconds)
+            self.close_connection = True
+            return
+        if fault == "429":
+            fake.record("errors_429")
+            return self._send_json(429, {"error": {"code": "RateLimitExceeded", "message": "rate limited"}},
+                                   {"Retry-After": str(profile.retry_after)})
+        if fault == "5xx":
+            fake.record("errors_5xx")
+            status = fake.rng_choice([500, 502, 503])
+            return self._send_json(status, {"error": {"code": "InternalServiceError", "message": "server error"}})
+
+        content = fake.build_content(messages)
+        time.sleep(fake.sample_first_token_latency())
+
+        if payload.get("stream"):
+            return self._send_stream(content, profile)
+
+        time.sleep(len(content) * profile.seconds_per_char)
+        fake.record("completions")
+        return self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": fake.usage(messages, content)
+        })
+
+    def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已取消请求（如对冲落败）
+            self.server.fake.record("client_disconnects")
+
+    def _send_stream(self, content: str, profile: LatencyProfile):
+        fake: "FakeArkServer" = self.server.fake
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            for start in range(0, len(content), STREAM_CHUNK_CHARS):
+                piece = content[start:start + STREAM_CHUNK_CHARS]
+                chunk = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": piece}}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(len(piece) * profile.seconds_per_char)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            fake.record("completions")
+        except (BrokenPipeError, ConnectionResetError):
+            fake.record("client_disconnects")
+
+    def log_message(self, format, *args):
+        logger.debug(f"模拟ARK服务: {format % args}")
+
+
+class FakeArkServer:
+    """本地模拟 ARK 服务"""
+
+    def __init__(self, profile: Optional[LatencyProfile] = None, host: str = "127.0.0.1", port: int = 0,
+                 seed: Optional[int] = None):
+        """
+        初始化模拟服务
+
+        Args:
+            profile (Optional[LatencyProfile]): 延迟与错误注入配置，默认无延迟
+            host (str): 监听地址
+            port (int): 监听端口，0表示随机端口
+            seed (Optional[int]): 随机种子，便于复现
+        """
+        self.profile = profile or LatencyProfile()
+        self.contexts: Dict[str, List[Dict[str, Any]]] = {}
+        self.stats: Dict[str, int] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self._server = ThreadingHTTPServer((host, port), _FakeArkHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def api_base(self) -> str:
+        """服务的 API 根地址，可设置为 ARK_API_BASE"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v3"
+
+    def start(self) -> "FakeArkServer":
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-ark-server', daemon=True)
+        self._thread.start()
+        logger.info(f"模拟ARK服务已启动: {self.api_base}")
+        return self
+
+    def stop(self):
+        """停止服务"""
+        self._server.shutdown()
+        self._server.server_close()
+        logger.info("模拟ARK服务已停止")
+
+    def __enter__(self) -> "FakeArkServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def record(self, name: str):
+        """记录统计计数"""
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def draw_fault(self) -> Optional[str]:
+        """按配置的比例抽取本次请求要注入的故障"""
+        profile = self.profile
+        with self._lock:
+            value = self._rng.random()
+        for fault, rate in (("429", profile.error_429_rate), ("5xx", profile.error_5xx_rate),
+                            ("timeout", profile.timeout_rate)):
+            if value < rate:
+                return fault
+            value -= rate
+        return None
+
+    def sample_first_token_latency(self) -> float:
+        """按配置抽取首字延迟"""
+        profile = self.profile
+        if profile.first_token_latency <= 0:
+            return 0.0
+        if profile.latency_sigma <= 0:
+            return profile.first_token_latency
+        with self._lock:
+            return profile.first_token_latency * self._rng.lognormvariate(0, profile.latency_sigma)
+
+    def rng_choice(self, options: List[Any]) -> Any:
+        with self._lock:
+            return self._rng.choice(options)
+
+    def build_content(self, messages: List[Dict[str, Any]]) -> str:
+        with self._lock:
+            rng = random.Random(self._rng.random())
+        return build_content(messages, rng)
+
+    @staticmethod
+    def usage(messages: List[Dict[str, Any]], content: str) -> Dict[str, int]:
+        """按本地估算生成 usage 字段"""
+        estimator = get_token_estimator()
+        prompt_tokens = int(sum(estimator.estimate_raw(m.get("content", "")) for m in messages))
+        completion_tokens = int(estimator.estimate_raw(content))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="本地模拟 ARK 对话服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("FAKE_ARK_PORT", 8765)), help="监听端口")
+    parser.add_argument("--profile", default=os.environ.get("FAKE_ARK_PROFILE", "realistic"),
+                        choices=sorted(LATENCY_PROFILES), help="延迟配置")
+    parser.add_argument("--first-token-latency", type=float, help="首字延迟均值（秒）")
+    parser.add_argument("--seconds-per-char", type=float, help="每字符生成时间（秒）")
+    parser.add_argument("--error-429-rate", type=float, help="429 比例")
+    parser.add_argument("--error-5xx-rate", type=float, help="5xx 比例")
+    parser.add_argument("--timeout-rate", type=float, help="超时比例")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    args = parser.parse_args()
+
+    overrides = {
+        field: getattr(args, field)
+        for field in ("first_token_latency", "seconds_per_char", "error_429_rate", "error_5xx_rate", "timeout_rate")
+        if getattr(args, field) is not None
+    }
+    server = FakeArkServer(get_latency_profile(args.profile, **overrides), args.host, args.port, args.seed)
+
+    print(f"模拟ARK服务监听于 {server.api_base}（延迟配置: {args.profile}）")
+    print(f"使用方法: export ARK_API_BASE={server.api_base}")
+
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,435 @@
+"""
+LLM对冲请求模块
+
+LLM请求的耗时长尾明显：中位数远低于超时时间，但偶尔有请求一直拖到60秒超时，
+玩家行动的 p99 延迟几乎完全由这些慢请求决定。对冲请求的做法是：
+
+- 首个请求在该任务历史耗时的某个分位数（默认 p95）内仍未返回（流式请求为未收到首个数据块），
+  再向同一端点或备用端点（LLM_HEDGE_API_BASE）发送一份相同的请求；
+- 两个请求中先成功完成的一个胜出，落败的请求立即取消；
+- 对冲延迟取自首个请求自身的耗时分布（``llm.hedge.<任务>.primary_latency``）：首个请求落败或超时被取消时，
+  记录取消时已耗费的时间（真实耗时的下限），否则只有胜出请求的耗时会让分位数越来越低、对冲越来越频繁；
+- 对冲预算限制额外请求的比例：每个请求积累 ``budget_ratio`` 个令牌，每次对冲消耗一个令牌，
+  令牌不足时不再对冲，额外成本不超过请求总数的 ``budget_ratio``（另加少量突发额度）。
+
+非流式请求在异步客户端的事件循环中竞速；流式请求在线程中竞速到首个数据块，落败的响应在建立后立即关闭。
+对冲请求从密钥池中另选一个密钥（尽量避开首个请求的密钥），没有空闲额度时不对冲。
+
+通过环境变量 LLM_HEDGE_TASKS 指定启用对冲的任务类型（逗号分隔，默认不启用），
+对冲次数、胜出次数和预算余量记录到全局指标（llm.hedge.*）。
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+import itertools
+import contextvars
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple
+
+import requests
+
+from llm.model_routing import TASK_DEFAULT
+from llm.key_pool import get_api_key_pool, KeyLease
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger('llm.hedging', level='info')
+
+# 默认配置，可通过环境变量覆盖
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_MIN_DELAY = 1.0
+DEFAULT_HEDGE_BUDGET_RATIO = 0.1
+DEFAULT_HEDGE_BUDGET_BURST = 5
+
+
+class HedgeBudget:
+    """对冲预算：按请求数积累令牌，每次对冲消耗一个令牌"""
+
+    def __init__(self, ratio: float = DEFAULT_HEDGE_BUDGET_RATIO, burst: float = DEFAULT_HEDGE_BUDGET_BURST):
+        """
+        初始化对冲预算
+
+        Args:
+            ratio (float): 每个请求积累的令牌数，即长期来看对冲请求占请求总数的上限
+            burst (float): 令牌上限（允许的突发对冲次数）
+        """
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        """记录一个可对冲的请求，积累令牌"""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """尝试消耗一个令牌，预算不足时返回False"""
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class RequestHedger:
+    """对冲请求执行器"""
+
+    def __init__(self, tasks: Iterable[str] = (), percentile: float = DEFAULT_HEDGE_PERCENTILE,
+                 min_samples: int = DEFAULT_HEDGE_MIN_SAMPLES, min_delay: float = DEFAULT_HEDGE_MIN_DELAY,
+                 budget: Optional[HedgeBudget] = None, hedge_api_base: Optional[str] = None):
+        """
+        初始化对冲请求执行器
+
+        Args:
+            tasks (Iterable[str]): 启用对冲的任务类型
+            percentile (float): 对冲延迟取该任务历史耗时的分位数
+            min_samples (int): 历史样本少于该数量时不对冲（为0时使用 min_delay）
+            min_delay (float): 对冲延迟的下限（秒）
+            budget (Optional[HedgeBudget]): 对冲预算
+            hedge_api_base (Optional[str]): 对冲请求使用的备用 API 根地址，None 表示与首个请求相同
+        """
+        self.tasks: FrozenSet[str] = frozenset(tasks)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget = budget or HedgeBudget()
+        self.hedge_api_base = hedge_api_base.rstrip('/') if hedge_api_base else None
+
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='llm-hedge')
+        self.metrics = get_metrics()
+
+        if self.tasks:
+            logger.info(f"对冲请求已启用: {', '.join(sorted(self.tasks))}，分位 p{percentile}，"
+                        f"预算 {self.budget.ratio:.0%}")
+
+    def is_enabled(self, task: Optional[str]) -> bool:
+        """任务是否启用对冲"""
+        return (task or TASK_DEFAULT) in self.tasks
+
+    def hedge_delay(self, task: Optional[str], stream: bool = False) -> Optional[float]:
+        """
+        计算发出对冲请求前的等待时间
+
+        Args:
+            task (Optional[str]): 任务类型
+            stream (bool): 是否为流式请求（按首个数据块耗时计算）
+
+        Returns:
+            Optional[float]: 等待时间（秒），历史样本不足时返回None
+        """
+        observed = self.metrics.get_percentile(self._primary_metric(task, stream), self.percentile, self.min_samples)
+        if observed is None:
+            return self.min_delay if self.min_samples <= 0 else None
+        return max(self.min_delay, observed)
+
+    @staticmethod
+    def _primary_metric(task: Optional[str], stream: bool) -> str:
+        name = "primary_first_chunk_latency" if stream else "primary_latency"
+        return f"llm.hedge.{task or TASK_DEFAULT}.{name}"
+
+    def _record_primary_latency(self, task: Optional[str], stream: bool, seconds: float):
+        """记录首个请求的耗时（无论是否胜出），超时的请求记为已等待的时间"""
+        self.metrics.observe(self._primary_metric(task, stream), seconds)
+
+    def _hedge_url(self, api_url: str, context_id: Optional[str]) -> str:
+        """对冲请求的端点：上下文缓存只存在于原端点上，此时不使用备用端点"""
+        if self.hedge_api_base is None or context_id:
+            return api_url
+        return f"{self.hedge_api_base}/chat/completions"
+
+    def post_json(self, api_url: str, headers: Dict[str, str], payload: Dict[str, Any], timeout: float,
+                  task: Optional[str] = None, context_id: Optional[str] = None,
+                  lease: Optional[KeyLease] = None) -> Dict[str, Any]:
+        """
+        发送非流式请求，超过对冲延迟仍未返回时发送对冲请求
+
+        失败以 requests 的异常类型抛出，便于调用方沿用原有的错误处理。
+
+        Args:
+            api_url (str): 首个请求的端点
+            headers (Dict[str, str]): 请求头
+            payload (Dict[str, Any]): 请求负载
+            timeout (float): 总超时时间（秒）
+            task (Optional[str]): 任务类型
+            context_id (Optional[str]): 上下文缓存ID
+            lease (Optional[KeyLease]): 首个请求占用的密钥，被限流时据此标记冷却
+
+        Returns:
+            Dict[str, Any]: API 响应内容
+        """
+        from llm.async_chat import get_async_llm_client, run_coroutine_sync
+
+        self.budget.record_request()
+        delay = self.hedge_delay(task)
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        coro = self._race(get_async_llm_client(), api_url, self._hedge_url(api_url, context_id),
+                          headers, body, timeout, delay, lease, task)
+        try:
+            status, response_body = run_coroutine_sync(coro, timeout + 5)
+        except concurrent.futures.TimeoutError as e:
+            # 与 requests 的超时一致，调用方沿用原有的超时处理
+            raise requests.exceptions.Timeout(f"超过{timeout}秒未返回") from e
+
+        if status >= 400:
+            # 附带状态码和响应内容，调用方据此区分上下文失效等错误
+            response = requests.Response()
+            response.status_code = status
+            response._content = response_body
+            response.url = api_url
+            raise requests.exceptions.HTTPError(f"{status} Error: {response_body[:200]!r} for url: {api_url}",
+                                                response=response)
+        try:
+            return json.loads(response_body.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise requests.exceptions.InvalidJSONError(f"响应格式错误: {e}")
+
+    async def _race(self, client, api_url: str, hedge_url: str, headers: Dict[str, str], body: bytes,
+                    timeout: float, delay: Optional[float], lease: Optional[KeyLease],
+                    task: Optional[str] = None) -> Tuple[int, bytes]:
+        """在事件循环中执行首个请求和可能的对冲请求，返回先成功的响应"""
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        deadline = started_at + timeout
+        primary = asyncio.ensure_future(client.post_raw(api_url, headers, body))
+
+        def record_primary(future):
+            if not future.cancelled() and future.exception() is None and future.result()[0] < 400:
+                self._record_primary_latency(task, False, loop.time() - started_at)
+
+        primary.add_done_callback(record_primary)
+        pending = {primary}
+        leases = {primary: lease}
+        hedge = None
+        hedge_lease = None
+
+        failure: Optional[Tuple[int, bytes]] = None
+        error: Optional[BaseException] = None
+        try:
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                started = None if done else self._start_hedge(headers, lease)
+                if started is not None:
+                    hedge_headers, hedge_lease = started
+                    hedge = asyncio.ensure_future(client.post_raw(hedge_url, hedge_headers, body))
+                    pending.add(hedge)
+                    leases[hedge] = hedge_lease
+
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for finished in done:
+                    if finished.exception() is not None:
+                        error = finished.exception()
+                        continue
+                    status, response_body = finished.result()
+                    if status < 400:
+                        self._record_winner(hedge, finished, cancelled=len(pending))
+                        return status, response_body
+                    if status == 429 and leases[finished] is not None:
+                        leases[finished].mark_rate_limited()
+                    failure = (status, response_body)
+        finally:
+            if not primary.done():
+                # 落败或超时的首个请求记录取消时已耗费的时间（真实耗时的下限）
+                self._record_primary_latency(task, False, loop.time() - started_at)
+            for attempt in pending:
+                attempt.cancel()
+            if hedge_lease is not None:
+                get_api_key_pool().release(hedge_lease)
+
+        if failure is not None:
+            return failure
+        if error is not None:
+            raise requests.exceptions.ConnectionError(str(error))
+        raise requests.exceptions.Timeout(f"超过{timeout}秒未返回")
+
+    def open_stream(self, api_url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                    timeout: Tuple[float, float], task: Optional[str] = None, context_id: Optional[str] = None,
+                    lease: Optional[KeyLease] = None) -> Tuple[requests.Response, Iterator[bytes]]:
+        """
+        发起流式请求，超过对冲延迟仍未收到首个数据块时发送对冲请求
+
+        Args:
+            api_url (str): 首个请求的端点
+            headers (Dict[str, str]): 请求头
+            payload (Dict[str, Any]): 请求负载
+            timeout (Tuple[float, float]): (连接超时, 数据块间隔超时)
+            task (Optional[str]): 任务类型
+            context_id (Optional[str]): 上下文缓存ID
+            lease (Optional[KeyLease]): 首个请求占用的密钥
+
+        Returns:
+            Tuple[requests.Response, Iterator[bytes]]: 胜出的响应及其原始行迭代器（从首个数据块开始）
+        """
+        self.budget.record_request()
+        delay = self.hedge_delay(task, stream=True)
+        cancelled = threading.Event()
+
+        started_at = time.monotonic()
+        primary = self._executor.submit(contextvars.copy_context().run, self._open_until_first_chunk,
+                                        api_url, headers, payload, timeout, cancelled)
+
+        def record_primary(future):
+            # 落败的首个请求已在对冲胜出时按已耗费的时间记录
+            if cancelled.is_set():
+                return
+            error = future.exception()
+            if error is None or isinstance(error, requests.exceptions.Timeout):
+                self._record_primary_latency(task, True, time.monotonic() - started_at)
+
+        primary.add_done_callback(record_primary)
+        attempts = [primary]
+        hedge = None
+        hedge_lease = None
+
+        if delay is not None:
+            done, _ = wait(attempts, timeout=delay)
+            started = None if done else self._start_hedge(headers, lease)
+            if started is not None:
+                hedge_headers, hedge_lease = started
+                hedge = self._executor.submit(contextvars.copy_context().run, self._open_until_first_chunk,
+                                              self._hedge_url(api_url, context_id), hedge_headers, payload,
+                                              timeout, cancelled)
+                attempts.append(hedge)
+
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for finished in done:
+                    if finished.exception() is not None:
+                        error = finished.exception()
+                        if finished is hedge and _is_rate_limited(error):
+                            hedge_lease.mark_rate_limited()
+                        continue
+                    cancelled.set()
+                    if finished is hedge and not primary.done():
+                        self._record_primary_latency(task, True, time.monotonic() - started_at)
+                    for loser in pending:
+                        loser.add_done_callback(_close_stream)
+                    self._record_winner(hedge, finished, cancelled=len(pending))
+                    return finished.result()
+        finally:
+            # 流式对冲的密钥只在竞速期间占用（已计入请求数），胜出后不再跟踪其生成过程
+            if hedge_lease is not None:
+                get_api_key_pool().release(hedge_lease)
+
+        raise error
+
+    def _open_until_first_chunk(self, api_url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                                timeout: Tuple[float, float],
+                                cancelled: threading.Event) -> Tuple[requests.Response, Iterator[bytes]]:
+        """建立流式连接并读取到首个数据行"""
+        response = requests.post(api_url, headers=headers, json=payload, timeout=timeout, stream=True)
+        try:
+            response.raise_for_status()
+            lines = response.iter_lines(decode_unicode=False)
+            buffered = []
+            for line in lines:
+                if cancelled.is_set():
+                    break
+                if not line:
+                    continue
+                buffered.append(line)
+                if line.startswith(b'data:'):
+                    break
+        except Exception:
+            response.close()
+            raise
+        return response, itertools.chain(buffered, lines)
+
+    def _start_hedge(self, headers: Dict[str, str],
+                     lease: Optional[KeyLease]) -> Optional[Tuple[Dict[str, str], KeyLease]]:
+        """预算和密钥额度允许时开始一次对冲，返回对冲请求的请求头和占用的密钥"""
+        if not self.budget.try_acquire():
+            self.metrics.increment("llm.hedge.budget_exhausted")
+            logger.info("对冲预算不足，继续等待首个请求")
+            return None
+
+        hedge_lease = get_api_key_pool().acquire(exclude=[lease.key_id] if lease else (), wait=False)
+        if hedge_lease is None:
+            self.metrics.increment("llm.hedge.no_key")
+            logger.info("没有可用的API密钥额度，继续等待首个请求")
+            return None
+
+        self.metrics.increment("llm.hedge.sent")
+        logger.info(f"首个请求超过对冲延迟仍未返回，使用密钥 {hedge_lease.key_id} 发送对冲请求")
+        return dict(headers, Authorization=f"Bearer {hedge_lease.key}"), hedge_lease
+
+    def _record_winner(self, hedge, winner, cancelled: int):
+        if hedge is None:
+            return
+        self.metrics.increment("llm.hedge.won" if winner is hedge else "llm.hedge.lost")
+        self.metrics.increment("llm.hedge.cancelled", cancelled)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取对冲统计
+
+        Returns:
+            Dict[str, Any]: 启用的任务、对冲/胜出次数和预算余量
+        """
+        return {
+            "tasks": sorted(self.tasks),
+            "percentile": self.percentile,
+            "sent": self.metrics.get_counter("llm.hedge.sent"),
+            "won": self.metrics.get_counter("llm.hedge.won"),
+            "lost": self.metrics.get_counter("llm.hedge.lost"),
+            "cancelled": self.metrics.get_counter("llm.hedge.cancelled"),
+            "budget_exhausted": self.metrics.get_counter("llm.hedge.budget_exhausted"),
+            "budget_tokens": round(self.budget.tokens, 3)
+        }
+
+
+def _is_rate_limited(error: BaseException) -> bool:
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code == 429
+
+
+def _close_stream(future):
+    """关闭落败的流式响应"""
+    if future.exception() is None:
+        response, _ = future.result()
+        response.close()
+
+
+# 全局对冲执行器实例
+_request_hedger = None
+_request_hedger_lock = threading.Lock()
+
+
+def get_request_hedger() -> RequestHedger:
+    """
+    获取全局对冲请求执行器实例
+
+    Returns:
+        RequestHedger: 对冲请求执行器实例
+    """
+    global _request_hedger
+    if _request_hedger is None:
+        with _request_hedger_lock:
+            if _request_hedger is None:
+                tasks = [task.strip() for task in os.environ.get('LLM_HEDGE_TASKS', '').split(',') if task.strip()]
+                budget = HedgeBudget(
+                    ratio=float(os.environ.get('LLM_HEDGE_BUDGET', DEFAULT_HEDGE_BUDGET_RATIO)),
+                    burst=float(os.environ.get('LLM_HEDGE_BURST', DEFAULT_HEDGE_BUDGET_BURST))
+                )
+                _request_hedger = RequestHedger(
+                    tasks=tasks,
+                    percentile=float(os.environ.get('LLM_HEDGE_PERCENTILE', DEFAULT_HEDGE_PERCENTILE)),
+                    min_samples=int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', DEFAULT_HEDGE_MIN_SAMPLES)),
+                    min_delay=float(os.environ.get('LLM_HEDGE_MIN_DELAY', DEFAULT_HEDGE_MIN_DELAY)),
+                    budget=budget,
+                    hedge_api_base=os.environ.get('LLM_HEDGE_API_BASE') or None
+                )
+                get_metrics().register_collector("hedging", _request_hedger.get_stats)
+    return _request_hedger
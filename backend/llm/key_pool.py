@@ -0,0 +1,366 @@
+"""
+API密钥池模块
+
+单个 ARK_API_KEY 的速率限制决定了整个服务的LLM吞吐上限，增加工作线程也无济于事。
+本模块管理多个密钥（可分别指向不同的端点），每个密钥有独立的令牌桶：
+
+- 每分钟请求数（RPM）和每分钟token数（TPM）各一个令牌桶，0表示不限制；
+- 发送请求前预留输入token的估算值，请求完成后按服务返回的输出token数补记；
+- 选择当前负载最低（进行中请求数最少、令牌桶占用率最低）的可用密钥；
+- 收到 429 后该密钥进入冷却（优先使用 Retry-After），冷却期间不再被选中；
+- 所有密钥都不可用时最多等待 ``max_wait`` 秒，仍不可用则抛出 LLMOverloadedError，API层返回 429。
+
+密钥通过环境变量 ARK_API_KEYS 配置，逗号分隔，每项格式为 ``密钥[@API根地址][;rpm=N][;tpm=N]``；
+未设置时使用 ARK_API_KEY 作为唯一的密钥。默认限额由 ARK_KEY_RPM、ARK_KEY_TPM 配置。
+各密钥的利用率、请求数和 429 次数记录到全局指标（llm.api_key.*）。
+"""
+
+import os
+import math
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from llm.scheduler import LLMOverloadedError
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger('llm.key_pool', level='info')
+
+# 默认配置，可通过环境变量覆盖
+DEFAULT_KEY_RPM = 0
+DEFAULT_KEY_TPM = 0
+DEFAULT_COOLDOWN_SECONDS = 5.0
+DEFAULT_MAX_WAIT = 5.0
+
+
+class TokenBucket:
+    """按分钟限额的令牌桶，capacity 为0时不限制"""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.capacity <= 0:
+            return
+        if now > self.updated_at:
+            self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """获取 amount 个令牌需要等待的时间（秒）"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        # 超过桶容量的请求按装满计算，避免永远无法满足
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate)
+
+    def consume(self, amount: float, now: float):
+        """消耗令牌，允许透支（按实际用量补记时）"""
+        if self.capacity <= 0:
+            return
+        self._refill(now)
+        self.level -= amount
+
+    def utilization(self, now: float) -> float:
+        """当前占用率（0-1）"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        return max(0.0, min(1.0, 1 - self.level / self.capacity))
+
+
+class _KeyState:
+    """单个密钥的状态"""
+
+    def __init__(self, key_id: str, key: str, api_base: Optional[str], rpm: float, tpm: float):
+        self.key_id = key_id
+        self.key = key
+        self.api_base = api_base.rstrip('/') if api_base else None
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket = TokenBucket(tpm)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.total_requests = 0
+        self.rate_limited = 0
+
+    def wait_time(self, estimated_tokens: float, now: float) -> float:
+        cooldown = max(0.0, self.cooldown_until - now)
+        return max(cooldown,
+                   self.requests_bucket.wait_time(1, now),
+                   self.tokens_bucket.wait_time(estimated_tokens, now))
+
+    def load(self, now: float) -> float:
+        return self.in_flight + max(self.requests_bucket.utilization(now), self.tokens_bucket.utilization(now))
+
+    @property
+    def masked_key(self) -> str:
+        return f"****{self.key[-4:]}" if len(self.key) > 4 else "****"
+
+
+class KeyLease:
+    """一次请求占用的密钥"""
+
+    def __init__(self, state: _KeyState):
+        self._state = state
+        self.key_id = state.key_id
+        self.key = state.key
+        self.api_base = state.api_base
+        # 服务返回的输出token数，释放时补记到TPM令牌桶
+        self.completion_tokens = 0
+        self.retry_after: Optional[float] = None
+        self.limited = False
+
+    def mark_rate_limited(self, retry_after: Optional[float] = None):
+        """标记本次请求被限流（429），释放时密钥进入冷却"""
+        self.limited = True
+        self.retry_after = retry_after
+
+
+class ApiKeyPool:
+    """API密钥池"""
+
+    def __init__(self, entries: List[Dict[str, Any]], rpm: float = DEFAULT_KEY_RPM, tpm: float = DEFAULT_KEY_TPM,
+                 cooldown_seconds: float = DEFAULT_COOLDOWN_SECONDS, max_wait: float = DEFAULT_MAX_WAIT):
+        """
+        初始化密钥池
+
+        Args:
+            entries (List[Dict[str, Any]]): 密钥配置列表，每项包含 key，可选 api_base、rpm、tpm
+            rpm (float): 默认每分钟请求数限额，0表示不限制
+            tpm (float): 默认每分钟token数限额，0表示不限制
+            cooldown_seconds (float): 429 响应未带 Retry-After 时的冷却时间（秒）
+            max_wait (float): 没有可用密钥时的最长等待时间（秒）
+        """
+        self.cooldown_seconds = cooldown_seconds
+        self.max_wait = max_wait
+        self._states = [
+            _KeyState(f"key{index + 1}", entry["key"], entry.get("api_base"),
+                      entry.get("rpm", rpm), entry.get("tpm", tpm))
+            for index, entry in enumerate(entries)
+        ]
+        self._lock = threading.Lock()
+        self.metrics = get_metrics()
+
+        logger.info(f"API密钥池初始化完成，共 {len(self._states)} 个密钥")
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def acquire(self, estimated_tokens: float = 0, exclude: Iterable[str] = (),
+                wait: bool = True) -> Optional[KeyLease]:
+        """
+        选择负载最低的可用密钥
+
+        Args:
+            estimated_tokens (float): 预计的输入token数，预留到TPM令牌桶
+            exclude (Iterable[str]): 尽量避开的密钥ID（如对冲请求避开首个请求的密钥）
+            wait (bool): 没有可用密钥时是否等待；为False时直接返回None
+
+        Returns:
+            Optional[KeyLease]: 占用的密钥
+
+        Raises:
+            ValueError: 未配置任何密钥
+            LLMOverloadedError: 等待 max_wait 秒后仍没有可用密钥
+        """
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            lease, wait_time = self._try_acquire(estimated_tokens, exclude)
+            if lease is not None or not wait:
+                return lease
+            time.sleep(self._wait_or_raise(wait_time, deadline))
+
+    async def acquire_async(self, estimated_tokens: float = 0) -> KeyLease:
+        """
+        在事件循环中选择可用密钥，等待时不阻塞事件循环
+
+        Args:
+            estimated_tokens (float): 预计的输入token数
+
+        Returns:
+            KeyLease: 占用的密钥
+        """
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            lease, wait_time = self._try_acquire(estimated_tokens, ())
+            if lease is not None:
+                return lease
+            await asyncio.sleep(self._wait_or_raise(wait_time, deadline))
+
+    def _try_acquire(self, estimated_tokens: float, exclude: Iterable[str]) -> Tuple[Optional[KeyLease], float]:
+        """尝试立即占用密钥，返回 (密钥, 没有可用密钥时的预计等待时间)"""
+        if not self._states:
+            logger.error("未设置 ARK_API_KEY 或 ARK_API_KEYS 环境变量。请在 .env 文件中设置此变量。")
+            raise ValueError("未设置 ARK_API_KEY 环境变量。请在 .env 文件中设置此变量。")
+
+        excluded = set(exclude)
+        with self._lock:
+            now = time.monotonic()
+            candidates = [state for state in self._states if state.key_id not in excluded] or self._states
+            ready = [state for state in candidates if state.wait_time(estimated_tokens, now) <= 0]
+            if not ready:
+                return None, min(state.wait_time(estimated_tokens, now) for state in candidates)
+
+            state = min(ready, key=lambda item: item.load(now))
+            state.requests_bucket.consume(1, now)
+            state.tokens_bucket.consume(estimated_tokens, now)
+            state.in_flight += 1
+            state.total_requests += 1
+
+        self.metrics.increment(f"llm.api_key.{state.key_id}.requests")
+        return KeyLease(state), 0.0
+
+    def _wait_or_raise(self, wait_time: float, deadline: float) -> float:
+        """返回本次等待时间；超过最长等待时间时抛出 LLMOverloadedError"""
+        remaining = deadline - time.monotonic()
+        if wait_time > remaining:
+            self.metrics.increment("llm.api_key.exhausted")
+            logger.warning(f"所有API密钥均已达到限额或在冷却中，预计 {wait_time:.1f} 秒后可用")
+            raise LLMOverloadedError("LLM服务繁忙，请稍后重试", retry_after=max(1, math.ceil(wait_time)))
+        return min(wait_time, remaining) + 0.001
+
+    def release(self, lease: KeyLease):
+        """
+        释放密钥：补记输出token，被限流时进入冷却
+
+        Args:
+            lease (KeyLease): acquire 返回的密钥
+        """
+        state = lease._state
+        with self._lock:
+            now = time.monotonic()
+            state.in_flight -= 1
+            if lease.completion_tokens:
+                state.tokens_bucket.consume(lease.completion_tokens, now)
+            if lease.limited:
+                cooldown = lease.retry_after if lease.retry_after is not None else self.cooldown_seconds
+                state.cooldown_until = max(state.cooldown_until, now + cooldown)
+                state.rate_limited += 1
+
+        if lease.limited:
+            self.metrics.increment(f"llm.api_key.{state.key_id}.rate_limited")
+            logger.warning(f"API密钥 {state.key_id} 被限流，冷却 {cooldown:.1f} 秒")
+
+    @contextmanager
+    def lease(self, estimated_tokens: float = 0) -> Iterator[KeyLease]:
+        """
+        在代码块中占用一个密钥，代码块因 429 响应抛出异常时自动标记限流
+
+        Args:
+            estimated_tokens (float): 预计的输入token数
+
+        Yields:
+            KeyLease: 占用的密钥
+        """
+        lease = self.acquire(estimated_tokens)
+        try:
+            yield lease
+        except Exception as e:
+            response = getattr(e, 'response', None)
+            if response is not None and response.status_code == 429:
+                lease.mark_rate_limited(parse_retry_after(response.headers.get('Retry-After')))
+            raise
+        finally:
+            self.release(lease)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取各密钥的利用率
+
+        Returns:
+            Dict[str, Any]: 密钥ID -> 端点、进行中请求数、RPM/TPM占用率、冷却剩余时间、请求数与429次数
+        """
+        stats = {}
+        with self._lock:
+            now = time.monotonic()
+            for state in self._states:
+                stats[state.key_id] = {
+                    "key": state.masked_key,
+                    "api_base": state.api_base,
+                    "in_flight": state.in_flight,
+                    "rpm_limit": state.requests_bucket.capacity,
+                    "rpm_utilization": round(state.requests_bucket.utilization(now), 4),
+                    "tpm_limit": state.tokens_bucket.capacity,
+                    "tpm_utilization": round(state.tokens_bucket.utilization(now), 4),
+                    "cooldown_remaining": round(max(0.0, state.cooldown_until - now), 2),
+                    "requests": state.total_requests,
+                    "rate_limited": state.rate_limited
+                }
+        return stats
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数），无法解析时返回None"""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def parse_key_entries(value: str) -> List[Dict[str, Any]]:
+    """
+    解析 ARK_API_KEYS 配置
+
+    Args:
+        value (str): 逗号分隔的密钥配置，每项格式为 ``密钥[@API根地址][;rpm=N][;tpm=N]``
+
+    Returns:
+        List[Dict[str, Any]]: 密钥配置列表
+    """
+    entries = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        head, *options = item.split(';')
+        key, _, api_base = head.partition('@')
+        entry: Dict[str, Any] = {"key": key.strip()}
+        if api_base.strip():
+            entry["api_base"] = api_base.strip()
+        for option in options:
+            name, _, number = option.partition('=')
+            name = name.strip().lower()
+            if name in ("rpm", "tpm"):
+                try:
+                    entry[name] = float(number)
+                except ValueError:
+                    logger.warning(f"密钥配置中的限额无效，已忽略: {option}")
+        entries.append(entry)
+    return entries
+
+
+# 全局密钥池实例
+_api_key_pool = None
+_api_key_pool_lock = threading.Lock()
+
+
+def get_api_key_pool() -> ApiKeyPool:
+    """
+    获取全局API密钥池实例
+
+    Returns:
+        ApiKeyPool: 密钥池实例
+    """
+    global _api_key_pool
+    if _api_key_pool is None:
+        with _api_key_pool_lock:
+            if _api_key_pool is None:
+                entries = parse_key_entries(os.environ.get('ARK_API_KEYS', ''))
+                if not entries and os.environ.get('ARK_API_KEY'):
+                    entries = [{"key": os.environ['ARK_API_KEY']}]
+                _api_key_pool = ApiKeyPool(
+                    entries,
+                    rpm=float(os.environ.get('ARK_KEY_RPM', DEFAULT_KEY_RPM)),
+                    tpm=float(os.environ.get('ARK_KEY_TPM', DEFAULT_KEY_TPM)),
+                    cooldown_seconds=float(os.environ.get('ARK_KEY_COOLDOWN', DEFAULT_COOLDOWN_SECONDS)),
+                    max_wait=float(os.environ.get('ARK_KEY_MAX_WAIT', DEFAULT_MAX_WAIT))
+                )
+                get_metrics().register_collector("api_keys", _api_key_pool.get_stats)
+    return _api_key_pool
@@ -0,0 +1,234 @@
+"""
+LLM任务路由模块
+
+不同类型的LLM调用对模型和参数的要求不同：勇者/装备提取输出短小、要求稳定，
+可以使用更快、更便宜的模型和较低的温度（后台的历史摘要同理）；玩家行动和剧情推演输出长、需要叙事能力。
+本模块把任务类型映射到各自的模型路由（模型、端点、超时、最大输出token数、温度）：
+
+- 默认路由见 ``DEFAULT_ROUTES``（唯一的默认值来源，只设置模型和超时）；
+- 可选的配置文件 ``resources/llm/model_routes.json``（可由环境变量 LLM_ROUTES_FILE 指定）只需列出要覆盖的字段；
+- 环境变量 ``LLM_ROUTE_<任务>_<字段>`` 覆盖单个字段，例如 ``LLM_ROUTE_HERO_EXTRACT_MODEL``。
+
+每类任务的请求耗时分别记录到全局指标（llm.task.<任务>.latency），便于按任务观察延迟分布。
+"""
+
+import os
+import json
+import threading
+from dataclasses import dataclass, asdict, replace
+from typing import Any, Dict, Optional
+
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger('llm.model_routing', level='info')
+
+# 任务类型
+TASK_DEFAULT = "default"
+TASK_HERO_EXTRACT = "hero_extract"
+TASK_EQUIPMENT_EXTRACT = "equipment_extract"
+TASK_GAME_ACTION = "game_action"
+TASK_STORY_PROGRESSION = "story_progression"
+TASK_HISTORY_SUMMARY = "history_summary"
+TASK_GAME_ACTION_PERIOD = "game_action_period"
+TASK_GAME_ACTION_PLAN = "game_action_plan"
+TASK_NPC_REACTION = "npc_reaction"
+
+# 默认模型（与 llm/chat.py 的 DEFAULT_MODEL 一致）
+DEFAULT_ROUTE_MODEL = "ep-20250219141351-ntqmd"
+
+DEFAULT_ROUTES_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'resources', 'llm', 'model_routes.json'
+)
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """单类任务的模型路由"""
+
+    model: str = DEFAULT_ROUTE_MODEL
+    # API 根地址，None 表示使用 ARK_API_BASE
+    api_base: Optional[str] = None
+    # 非流式请求的总超时；流式请求中为两个数据块之间的最大间隔（秒）
+    timeout: float = 60.0
+    # 最大输出token数，None 表示使用服务端默认值
+    max_tokens: Optional[int] = None
+    # 采样温度，None 表示使用服务端默认值
+    temperature: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+# 默认路由只设置模型和超时；max_tokens 和 temperature 默认使用服务端的默认值，需要时通过配置文件或环境变量设置
+DEFAULT_ROUTES: Dict[str, ModelRoute] = {
+    TASK_DEFAULT: ModelRoute(),
+    TASK_HERO_EXTRACT: ModelRoute(timeout=30.0),
+    TASK_EQUIPMENT_EXTRACT: ModelRoute(timeout=30.0),
+    TASK_GAME_ACTION: ModelRoute(timeout=60.0),
+    TASK_STORY_PROGRESSION: ModelRoute(timeout=90.0),
+    TASK_HISTORY_SUMMARY: ModelRoute(timeout=60.0),
+    TASK_GAME_ACTION_PERIOD: ModelRoute(timeout=45.0),
+    TASK_GAME_ACTION_PLAN: ModelRoute(timeout=45.0),
+    TASK_NPC_REACTION: ModelRoute(timeout=30.0)
+}
+
+# 各字段从字符串配置转换的函数
+_FIELD_TYPES = {
+    "model": str,
+    "api_base": str,
+    "timeout": float,
+    "max_tokens": int,
+    "temperature": float
+}
+
+
+# 可以置空（使用默认值）的字段
+_NULLABLE_FIELDS = ("api_base", "max_tokens", "temperature")
+
+
+def _coerce_route_fields(values: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """校验并转换路由字段，忽略未知字段和无法转换的值"""
+    result = {}
+    for name, value in values.items():
+        converter = _FIELD_TYPES.get(name)
+        if converter is None:
+            logger.warning(f"忽略未知的路由字段 {name}（来源: {source}）")
+            continue
+        if value is None or value == "":
+            if name in _NULLABLE_FIELDS:
+                result[name] = None
+            continue
+        try:
+            result[name] = converter(value)
+        except (TypeError, ValueError):
+            logger.warning(f"路由字段 {name} 的值无效: {value!r}（来源: {source}）")
+    return result
+
+
+class ModelRouter:
+    """按任务类型选择模型路由"""
+
+    def __init__(self, routes_file: Optional[str] = None, environ: Optional[Dict[str, str]] = None):
+        """
+        初始化路由表
+
+        Args:
+            routes_file (Optional[str]): 路由配置文件路径，None 表示读取 LLM_ROUTES_FILE 或默认路径
+            environ (Optional[Dict[str, str]]): 用于字段覆盖的环境变量，None 表示 os.environ
+        """
+        self.routes_file = routes_file or os.environ.get('LLM_ROUTES_FILE', DEFAULT_ROUTES_FILE)
+        self._environ = environ
+        self._routes: Dict[str, ModelRoute] = {}
+        self._lock = threading.Lock()
+        self.metrics = get_metrics()
+        self.reload()
+
+    def reload(self):
+        """重新加载默认路由、配置文件和环境变量覆盖"""
+        routes = dict(DEFAULT_ROUTES)
+
+        for task, values in self._load_file().items():
+            if not isinstance(values, dict):
+                logger.warning(f"路由配置格式错误，已忽略: {task}")
+                continue
+            base = routes.get(task, routes[TASK_DEFAULT])
+            routes[task] = replace(base, **_coerce_route_fields(values, self.routes_file))
+
+        environ = os.environ if self._environ is None else self._environ
+        for task in list(routes):
+            prefix = f"LLM_ROUTE_{task.upper()}_"
+            overrides = {name: environ[prefix + name.upper()] for name in _FIELD_TYPES
+                         if prefix + name.upper() in environ}
+            if overrides:
+                routes[task] = replace(routes[task], **_coerce_route_fields(overrides, prefix + "*"))
+
+        with self._lock:
+            self._routes = routes
+
+        logger.info("模型路由: " + "，".join(f"{task} -> {route.model}" for task, route in routes.items()))
+
+    def _load_file(self) -> Dict[str, Any]:
+        if not os.path.exists(self.routes_file):
+            logger.info(f"未找到模型路由配置文件，使用默认路由: {self.routes_file}")
+            return {}
+        try:
+            with open(self.routes_file, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"读取模型路由配置失败，使用默认路由: {e}")
+            return {}
+        if not isinstance(data, dict):
+            logger.error("模型路由配置应为 任务类型 -> 路由 的对象，使用默认路由")
+            return {}
+        return data.get("routes", data)
+
+    def get_route(self, task: Optional[str] = None) -> ModelRoute:
+        """
+        获取任务对应的路由，未配置的任务使用默认路由
+
+        Args:
+            task (Optional[str]): 任务类型
+
+        Returns:
+            ModelRoute: 模型路由
+        """
+        with self._lock:
+            return self._routes.get(task or TASK_DEFAULT) or self._routes[TASK_DEFAULT]
+
+    def record_latency(self, task: Optional[str], seconds: float, stream: bool = False):
+        """
+        记录一次任务请求的耗时
+
+        Args:
+            task (Optional[str]): 任务类型
+            seconds (float): 耗时（秒）；流式请求为首个数据块的耗时
+            stream (bool): 是否为流式请求
+        """
+        name = "first_chunk_latency" if stream else "latency"
+        self.metrics.observe(f"llm.task.{task or TASK_DEFAULT}.{name}", seconds)
+
+    def record_error(self, task: Optional[str]):
+        """记录一次任务请求失败"""
+        self.metrics.increment(f"llm.task.{task or TASK_DEFAULT}.errors")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取各任务的路由配置及延迟分布
+
+        Returns:
+            Dict[str, Any]: 任务类型 -> 路由、耗时统计和失败次数
+        """
+        with self._lock:
+            routes = dict(self._routes)
+
+        return {
+            task: {
+                "route": route.to_dict(),
+                "latency": self.metrics.get_timer(f"llm.task.{task}.latency"),
+                "first_chunk_latency": self.metrics.get_timer(f"llm.task.{task}.first_chunk_latency"),
+                "errors": self.metrics.get_counter(f"llm.task.{task}.errors")
+            }
+            for task, route in routes.items()
+        }
+
+
+# 全局路由实例
+_model_router = None
+_model_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """
+    获取全局模型路由实例
+
+    Returns:
+        ModelRouter: 模型路由实例
+    """
+    global _model_router
+    if _model_router is None:
+        with _model_router_lock:
+            if _model_router is None:
+                _model_router = ModelRouter()
+                get_metrics().register_collector("model_routes", _model_router.get_stats)
+    return _model_router
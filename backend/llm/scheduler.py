@@ -0,0 +1,423 @@
+"""
+LLM请求调度模块
+
+所有LLM调用（llm/chat.py 的同步调用和 llm/async_chat.py 的异步调用）在发送前向调度器申请执行槽位：
+
+- 同时进行的请求数不超过 max_in_flight，其余请求进入有界等待队列；
+- 队列按优先级出队（玩家交互 > 普通 > 后台推演），同一优先级内按游戏轮转，
+  避免单局游戏的大量请求饿死其他玩家；
+- 预计等待时间超过请求的截止时间或队列已满时立即拒绝（LLMOverloadedError，附带建议的 Retry-After），
+  API层据此返回 429，而不是让请求排队后一起超时。
+
+请求的优先级、游戏ID和截止时间由API层通过 ``request_context`` 设置，LLM调用处无需逐层传递。
+截止时间是单次LLM调用的最长排队时间，从该调用开始排队时计算：同一请求中的多次调用各自计时，
+前一次调用耗时较长不会让后面的调用在空闲的调度器上被拒绝。
+队列深度、进行中请求数和等待时间记录到全局指标中。
+"""
+
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger('llm.scheduler', level='info')
+
+# 优先级，数值越小越优先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_BACKGROUND: "background"
+}
+
+# 默认配置，可通过环境变量覆盖
+DEFAULT_MAX_IN_FLIGHT = 16
+DEFAULT_MAX_QUEUE = 128
+
+# 各优先级请求的默认排队截止时间（秒）
+DEFAULT_DEADLINES = {
+    PRIORITY_INTERACTIVE: 30.0,
+    PRIORITY_NORMAL: 60.0,
+    PRIORITY_BACKGROUND: 300.0
+}
+
+# 单次LLM调用耗时的初始估计（秒）与平滑因子，用于预估排队时间
+INITIAL_SERVICE_TIME = 10.0
+SERVICE_TIME_ALPHA = 0.2
+
+
+class LLMOverloadedError(Exception):
+    """LLM服务繁忙，请求被调度器拒绝"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _RequestContext:
+    """当前请求的调度参数"""
+
+    def __init__(self, priority: int, game_id: Optional[str], deadline: float):
+        self.priority = priority
+        self.game_id = game_id
+        # 每次LLM调用的最长排队时间（秒）
+        self.deadline = deadline
+
+
+class _Waiter:
+    """等待执行槽位的请求"""
+
+    def __init__(self, priority: int, game_id: Optional[str]):
+        self.priority = priority
+        self.game_id = game_id
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+        # 异步等待者获得槽位时的回调（在调度器锁内调用）
+        self.on_grant = None
+
+
+_current_request: contextvars.ContextVar = contextvars.ContextVar('llm_request_context', default=None)
+
+
+class _SlotTicket:
+    """已获取的执行槽位"""
+
+    __slots__ = ('game_id', 'start_time')
+
+    def __init__(self, game_id: Optional[str], start_time: float):
+        self.game_id = game_id
+        self.start_time = start_time
+
+
+class LLMScheduler:
+    """LLM请求调度器"""
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, max_queue: int = DEFAULT_MAX_QUEUE,
+                 deadlines: Optional[Dict[int, float]] = None):
+        """
+        初始化调度器
+
+        Args:
+            max_in_flight (int): 同时进行的最大LLM请求数
+            max_queue (int): 等待队列的最大长度
+            deadlines (Optional[Dict[int, float]]): 各优先级的默认排队截止时间（秒）
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.deadlines = dict(DEFAULT_DEADLINES if deadlines is None else deadlines)
+
+        self.in_flight = 0
+        self.service_time = INITIAL_SERVICE_TIME
+
+        self._queue = []
+        self._queued = 0
+        self._game_pending: Dict[str, int] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self.metrics = get_metrics()
+
+        logger.info(f"LLM调度器初始化完成，最大并发: {max_in_flight}，队列上限: {max_queue}")
+
+    @contextmanager
+    def request_context(self, priority: int = PRIORITY_NORMAL, game_id: Optional[str] = None,
+                        deadline: Optional[float] = None):
+        """
+        设置当前请求的调度参数，作用于代码块内（包括通过 copy_context 传递的线程）发起的所有LLM调用
+
+        Args:
+            priority (int): 优先级
+            game_id (Optional[str]): 游戏ID，用于同优先级内的公平调度
+            deadline (Optional[float]): 每次LLM调用的排队截止时间（秒，从该调用开始排队时计算），默认按优先级取值
+        """
+        if deadline is None:
+            deadline = self.deadlines.get(priority, DEFAULT_DEADLINES[PRIORITY_NORMAL])
+        token = _current_request.set(_RequestContext(priority, game_id, deadline))
+        try:
+            yield
+        finally:
+            _current_request.reset(token)
+
+    def projected_wait(self, priority: int = PRIORITY_NORMAL) -> float:
+        """
+        预估新请求的排队时间（秒）
+
+        Args:
+            priority (int): 请求优先级，只有同级或更高优先级的排队请求会排在它前面
+
+        Returns:
+            float: 预估等待时间
+        """
+        with self._lock:
+            return self._projected_wait_locked(priority)
+
+    def admit(self, priority: Optional[int] = None, deadline: Optional[float] = None):
+        """
+        准入检查：预计等待时间超过截止时间或队列已满时立即拒绝
+
+        Args:
+            priority (Optional[int]): 优先级，默认取当前请求上下文
+            deadline (Optional[float]): 截止时间（秒），默认取当前请求上下文
+
+        Raises:
+            LLMOverloadedError: 请求被拒绝
+        """
+        context = _current_request.get()
+        if priority is None:
+            priority = context.priority if context else PRIORITY_NORMAL
+        if deadline is None:
+            deadline = context.deadline if context else self.deadlines.get(priority, 60.0)
+
+        with self._lock:
+            self._check_admission_locked(priority, deadline)
+
+    @contextmanager
+    def slot(self):
+        """
+        获取一个LLM执行槽位，代码块结束时释放
+
+        Raises:
+            LLMOverloadedError: 队列已满、预计等待超过截止时间或等待超时
+        """
+        ticket = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def acquire(self) -> '_SlotTicket':
+        """
+        阻塞获取一个LLM执行槽位，使用完毕后必须调用 ``release``
+
+        Returns:
+            _SlotTicket: 槽位凭据
+
+        Raises:
+            LLMOverloadedError: 队列已满、预计等待超过截止时间或等待超时
+        """
+        priority, game_id, deadline_at = self._current_request_params()
+        wait_start = time.perf_counter()
+        waiter = self._enqueue(priority, game_id, deadline_at)
+
+        if waiter is not None:
+            waiter.event.wait(max(deadline_at - time.time(), 0))
+            with self._lock:
+                if not waiter.granted:
+                    self._reject_waiter_locked(waiter)
+
+        return self._start(priority, game_id, wait_start)
+
+    async def acquire_async(self) -> '_SlotTicket':
+        """
+        在事件循环中获取一个LLM执行槽位，排队时不阻塞事件循环，使用完毕后必须调用 ``release``
+
+        Returns:
+            _SlotTicket: 槽位凭据
+
+        Raises:
+            LLMOverloadedError: 队列已满、预计等待超过截止时间或等待超时
+        """
+        priority, game_id, deadline_at = self._current_request_params()
+        wait_start = time.perf_counter()
+        waiter = self._enqueue(priority, game_id, deadline_at)
+
+        if waiter is not None:
+            loop = asyncio.get_running_loop()
+            granted = loop.create_future()
+
+            def on_grant():
+                loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+            with self._lock:
+                if waiter.granted:
+                    granted.set_result(None)
+                else:
+                    waiter.on_grant = on_grant
+            try:
+                await asyncio.wait_for(granted, max(deadline_at - time.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                with self._lock:
+                    if not waiter.granted:
+                        self._cancel_waiter_locked(waiter)
+                        raise
+                self._release(game_id, 0.0)
+                raise
+            with self._lock:
+                if not waiter.granted:
+                    self._reject_waiter_locked(waiter)
+
+        return self._start(priority, game_id, wait_start)
+
+    def release(self, ticket: '_SlotTicket'):
+        """
+        释放 ``acquire`` 获取的槽位
+
+        Args:
+            ticket (_SlotTicket): 槽位凭据
+        """
+        self._release(ticket.game_id, time.perf_counter() - ticket.start_time)
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        获取调度器当前状态
+
+        Returns:
+            Dict[str, float]: 进行中请求数、排队数和单次调用耗时估计
+        """
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queue_depth": self._queued,
+                "service_time_estimate": round(self.service_time, 3)
+            }
+
+    def _enqueue(self, priority: int, game_id: Optional[str], deadline_at: float) -> Optional[_Waiter]:
+        """申请槽位，可立即执行时返回None，否则返回排队中的等待者"""
+        with self._lock:
+            self._check_admission_locked(priority, deadline_at - time.time())
+
+            pending = self._game_pending.get(game_id, 0) if game_id else 0
+            if game_id:
+                self._game_pending[game_id] = pending + 1
+
+            if self.in_flight < self.max_in_flight and self._queued == 0:
+                self.in_flight += 1
+                self._update_gauges_locked()
+                return None
+
+            # 同一优先级内，游戏已有的排队/进行中请求越多，轮次越靠后
+            waiter = _Waiter(priority, game_id)
+            heapq.heappush(self._queue, (priority, pending, next(self._sequence), waiter))
+            self._queued += 1
+            self._dispatch_locked()
+            self._update_gauges_locked()
+            return waiter
+
+    def _current_request_params(self) -> Tuple[int, Optional[str], float]:
+        """取当前请求上下文的优先级、游戏ID和本次调用的截止时刻"""
+        context = _current_request.get()
+        priority = context.priority if context else PRIORITY_NORMAL
+        game_id = context.game_id if context else None
+        # 截止时间从本次调用开始排队时计算，不受同一请求中之前调用耗时的影响
+        deadline_at = time.time() + (context.deadline if context else self.deadlines.get(priority, 60.0))
+        return priority, game_id, deadline_at
+
+    def _start(self, priority: int, game_id: Optional[str], wait_start: float) -> '_SlotTicket':
+        """记录排队时间并返回槽位凭据"""
+        wait_time = time.perf_counter() - wait_start
+        self.metrics.observe("llm.scheduler.wait_time", wait_time)
+        self.metrics.observe(f"llm.scheduler.wait_time.{PRIORITY_NAMES.get(priority, priority)}", wait_time)
+        return _SlotTicket(game_id, time.perf_counter())
+
+    def _cancel_waiter_locked(self, waiter: _Waiter):
+        """把未获得槽位的等待者移出队列"""
+        waiter.cancelled = True
+        self._queued -= 1
+        self._release_game(waiter.game_id)
+        self._update_gauges_locked()
+
+    def _reject_waiter_locked(self, waiter: _Waiter):
+        """等待者排队超时：移出队列并拒绝"""
+        self._cancel_waiter_locked(waiter)
+        self.metrics.increment("llm.scheduler.rejected.deadline")
+        retry_after = max(1, math.ceil(self._projected_wait_locked(waiter.priority)))
+        logger.warning(f"LLM请求排队超时: 游戏 {waiter.game_id}，优先级 {PRIORITY_NAMES.get(waiter.priority)}")
+        raise LLMOverloadedError("LLM服务繁忙，请稍后重试", retry_after)
+
+    def _check_admission_locked(self, priority: int, deadline: float):
+        """检查队列容量与预计等待时间"""
+        if self._queued >= self.max_queue:
+            self.metrics.increment("llm.scheduler.rejected.queue_full")
+            retry_after = max(1, math.ceil(self._projected_wait_locked(priority)))
+            logger.warning(f"LLM请求队列已满 ({self._queued})，拒绝请求")
+            raise LLMOverloadedError("LLM服务繁忙，请稍后重试", retry_after)
+
+        projected = self._projected_wait_locked(priority)
+        # 有空闲槽位（预计等待为0）时总是允许
+        if projected > 0 and projected > deadline:
+            self.metrics.increment("llm.scheduler.rejected.projected_wait")
+            logger.warning(f"LLM请求预计等待 {projected:.1f}秒，超过截止时间 {deadline:.1f}秒，拒绝请求")
+            raise LLMOverloadedError("LLM服务繁忙，请稍后重试", max(1, math.ceil(projected)))
+
+    def _projected_wait_locked(self, priority: int) -> float:
+        """按排在前面的请求数和单次调用耗时估计排队时间"""
+        if self.in_flight < self.max_in_flight and self._queued == 0:
+            return 0.0
+        ahead = sum(1 for entry in self._queue if not entry[3].cancelled and entry[0] <= priority)
+        rounds = (ahead + 1) / self.max_in_flight
+        return rounds * self.service_time
+
+    def _dispatch_locked(self):
+        """把空闲槽位分配给队首的请求"""
+        while self.in_flight < self.max_in_flight and self._queue:
+            _, _, _, waiter = heapq.heappop(self._queue)
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            self._queued -= 1
+            self.in_flight += 1
+            waiter.event.set()
+            if waiter.on_grant is not None:
+                waiter.on_grant()
+
+    def _release(self, game_id: Optional[str], service_time: float):
+        """释放槽位并更新单次调用耗时估计"""
+        with self._lock:
+            self.in_flight -= 1
+            self.service_time = (1 - SERVICE_TIME_ALPHA) * self.service_time + SERVICE_TIME_ALPHA * service_time
+            self._release_game(game_id)
+            self._dispatch_locked()
+            self._update_gauges_locked()
+
+    def _release_game(self, game_id: Optional[str]):
+        if not game_id:
+            return
+        pending = self._game_pending.get(game_id, 0) - 1
+        if pending > 0:
+            self._game_pending[game_id] = pending
+        else:
+            self._game_pending.pop(game_id, None)
+
+    def _update_gauges_locked(self):
+        self.metrics.set_gauge("llm.scheduler.queue_depth", self._queued)
+        self.metrics.set_gauge("llm.scheduler.in_flight", self.in_flight)
+
+
+# 全局调度器实例
+_llm_scheduler = None
+_llm_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """
+    获取全局LLM调度器实例
+
+    Returns:
+        LLMScheduler: 调度器实例
+    """
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        with _llm_scheduler_lock:
+            if _llm_scheduler is None:
+                _llm_scheduler = LLMScheduler(
+                    max_in_flight=int(os.environ.get('LLM_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT)),
+                    max_queue=int(os.environ.get('LLM_MAX_QUEUE', DEFAULT_MAX_QUEUE))
+                )
+                get_metrics().register_collector("llm_scheduler", _llm_scheduler.get_stats)
+    return _llm_scheduler
@@ -4,9 +4,9 @@
 
 import os
 import json
-import re
 import sys
-from typing import Dict, List, Any, Optional
+import threading
+from typing import Dict, List, Any, Union
 
 # 添加当前目录到Python路径，支持直接运行
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -16,74 +16,88 @@ if backend_dir not in sys.path:
 
 try:
     from .chat import create_chat_completion
+    from .async_chat import create_chat_completions
+    from .model_routing import TASK_STORY_PROGRESSION
     from ..models.story_models import (
         StoryContext, StoryProgressionResult, CharacterAction,
-        LocationInfo, StoryEvent
+        LocationInfo
     )
     from ..models.common import TimeOfDay
     from ..utils.logger import get_logger
+    from ..utils.token_budget import PromptBudget
+    from ..utils.json_repair import parse_json_with_repair, JSONRepairError
+    from ..utils.resource_registry import get_resource_registry, PromptTemplate
+    from ..utils.metrics import get_metrics
 except ImportError:
     # 如果相对导入失败，尝试绝对导入
     from llm.chat import create_chat_completion
+    from llm.async_chat import create_chat_completions
+    from llm.model_routing import TASK_STORY_PROGRESSION
     from models.story_models import (
         StoryContext, StoryProgressionResult, CharacterAction,
-        LocationInfo, StoryEvent
+        LocationInfo
     )
     from models.common import TimeOfDay
     from utils.logger import get_logger
+    from utils.token_budget import PromptBudget
+    from utils.json_repair import parse_json_with_repair, JSONRepairError
+    from utils.resource_registry import get_resource_registry, PromptTemplate
+    from utils.metrics import get_metrics
 
 logger = get_logger('llm.story_engine', level='info')
 
+# 剧情推演提示模板（由资源注册表加载，修改文件后自动重新加载）
+STORY_PROMPT = 'prompts/story_progression_prompt.txt'
+
+# 批量推演时同时进行的推演数量，可通过环境变量 STORY_BATCH_CONCURRENCY 配置
+DEFAULT_BATCH_CONCURRENCY = 4
+
+
+def _compact_json(data: Any) -> str:
+    """序列化为紧凑JSON，减少提示中的空白token"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
 
 class StoryEngine:
     """剧情推演引擎"""
     
-    def __init__(self):
-        """初始化剧情引擎"""
-        self.prompt_template = self._load_prompt_template()
-        
-    def _load_prompt_template(self) -> str:
+    def __init__(self, batch_concurrency: int = DEFAULT_BATCH_CONCURRENCY):
+        """
+        初始化剧情引擎
+
+        参数:
+            batch_concurrency (int): 批量推演时同时进行的推演数量
+        """
+        self.resources = get_resource_registry()
+        self.prompt_budget = PromptBudget()
+        self.metrics = get_metrics()
+        self.batch_concurrency = max(1, batch_concurrency)
+        # 启动时加载一次，模板缺失时尽早报错
+        self._load_prompt_template()
+
+    @property
+    def prompt_template(self) -> PromptTemplate:
+        """剧情推演提示模板，文件修改后自动重新加载"""
+        return self._load_prompt_template()
+
+    def _load_prompt_template(self) -> PromptTemplate:
         """加载剧情推演提示模板"""
-        prompt_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)), 
-            'resources', 'prompts', 'story_progression_prompt.txt'
-        )
-        
         try:
-            with open(prompt_path, 'r', encoding='utf-8') as file:
-                template = file.read()
-            logger.info(f"成功加载剧情推演提示模板: {prompt_path}")
-            return template
+            return self.resources.get_template(STORY_PROMPT)
         except Exception as e:
             logger.error(f"加载剧情推演提示模板失败: {e}")
             raise
     
     def _extract_result_json(self, model_output: str) -> dict:
-        """从模型输出中提取JSON结果"""
+        """从模型输出中提取JSON结果（兼容 <推演结果> 标签和 ```json 代码块，语法缺陷时尝试修复）"""
         logger.debug(f"尝试从模型输出中提取JSON: {model_output[:500]}...")
 
-        # 尝试多种格式匹配
-        patterns = [
-            r"<推演结果>\s*```json\s*({.*?})\s*```\s*</推演结果>",
-            r"<推演结果>\s*({.*?})\s*</推演结果>",
-            r"```json\s*({.*?})\s*```",
-            r"({.*?})"
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, model_output, re.DOTALL)
-            if match:
-                json_str = match.group(1).strip()
-                logger.debug(f"找到JSON字符串: {json_str[:200]}...")
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError as e:
-                    logger.warning(f"JSON解析失败，尝试下一个模式: {e}")
-                    continue
-
-        logger.error("未找到有效的推演结果JSON内容")
-        logger.error(f"完整模型输出: {model_output}")
-        raise ValueError("未找到有效的 JSON 内容。")
+        try:
+            return parse_json_with_repair(model_output)
+        except JSONRepairError as e:
+            logger.error(f"未找到有效的推演结果JSON内容: {e}")
+            logger.error(f"完整模型输出: {model_output}")
+            raise
     
     def _format_character_actions(self, actions: List[CharacterAction]) -> str:
         """格式化角色动作为文本"""
@@ -98,7 +112,7 @@ class StoryEngine:
         return "\n".join(formatted_actions)
     
     def _format_world_history(self, history: List[str]) -> str:
-        """格式化世界历史为文本"""
+        """格式化世界历史为文本（更早的历史由前情摘要概括）"""
         if not history:
             return "无历史记录"
         
@@ -140,48 +154,159 @@ class StoryEngine:
             StoryProgressionResult: 推演结果
         """
         logger.info("开始剧情推演")
+        prompt = self._build_prompt(context)
         
-        # 格式化提示内容
+        try:
+            # 调用LLM进行推演
+            response = create_chat_completion(prompt, task=TASK_STORY_PROGRESSION)
+            result = self._parse_response(response)
+            logger.info("剧情推演成功完成")
+            return result
+            
+        except Exception as e:
+            logger.error(f"剧情推演失败: {e}")
+            raise
+
+    def progress_many(self, contexts: List[StoryContext]) -> List[Union[StoryProgressionResult, Exception]]:
+        """
+        并发推演多个地点或时间段的剧情
+
+        所有推演请求通过异步LLM客户端在同一事件循环中并发发送，同时进行的请求不超过 batch_concurrency；
+        单项失败不影响其他推演，调用方的LLM调度上下文（优先级、截止时间）会传递给每个请求。
+
+        参数:
+            contexts (List[StoryContext]): 剧情上下文列表
+
+        返回:
+            List[Union[StoryProgressionResult, Exception]]: 与输入顺序一致的结果列表，失败项为异常对象
+        """
+        if not contexts:
+            return []
+
+        logger.info(f"开始批量剧情推演，共 {len(contexts)} 项，并发: {self.batch_concurrency}")
+        with self.metrics.timer("story_engine.batch"):
+            results: List[Union[StoryProgressionResult, Exception]] = []
+            prompts = {}
+            for index, context in enumerate(contexts):
+                try:
+                    prompts[index] = self._build_prompt(context)
+                    results.append(None)
+                except Exception as e:
+                    logger.error(f"剧情推演失败: {e}")
+                    results.append(e)
+
+            responses = create_chat_completions(
+                [{"prompt": prompt, "task": TASK_STORY_PROGRESSION} for prompt in prompts.values()],
+                max_concurrency=self.batch_concurrency
+            )
+            for index, response in zip(prompts, responses):
+                try:
+                    if isinstance(response, Exception):
+                        raise response
+                    results[index] = self._parse_response(response)
+                except Exception as e:
+                    logger.error(f"剧情推演失败: {e}")
+                    results[index] = e
+
+        failures = sum(1 for result in results if isinstance(result, Exception))
+        self.metrics.increment("story_engine.batch_items", len(results))
+        self.metrics.increment("story_engine.batch_failures", failures)
+        logger.info(f"批量剧情推演完成，成功 {len(results) - failures} 项，失败 {failures} 项")
+        return results
+
+    def _build_prompt(self, context: StoryContext) -> str:
+        """由剧情上下文生成推演提示"""
+        # 格式化提示内容，结构化数据使用紧凑JSON并按分段预算截断
+        sections = self.prompt_budget.apply({
+            "location_properties": _compact_json(context.current_location.special_properties),
+            "character_actions": self._format_character_actions(context.character_actions),
+            "history_summary": f"前情摘要: {context.history_summary}" if context.history_summary else "",
+            "world_history": self._format_world_history(context.world_history),
+            "current_world_state": _compact_json(context.current_world_state),
+            "current_character_states": self._format_character_states(context.current_character_states)
+        })
+        # 前情摘要单独计算预算，放在最近历史之前
+        history_summary = sections.pop("history_summary")
+        if history_summary:
+            sections["world_history"] = history_summary + "\n" + sections["world_history"]
         prompt = self.prompt_template.format(
             current_time=context.current_time.value if isinstance(context.current_time, TimeOfDay) else context.current_time,
             location_name=context.current_location.name,
             location_description=context.current_location.description,
             current_characters=", ".join(context.current_location.current_characters),
-            location_properties=json.dumps(context.current_location.special_properties, ensure_ascii=False, indent=2),
-            character_actions=self._format_character_actions(context.character_actions),
-            world_history=self._format_world_history(context.world_history),
-            current_world_state=json.dumps(context.current_world_state, ensure_ascii=False, indent=2),
-            current_character_states=self._format_character_states(context.current_character_states)
+            **sections
         )
+        self.prompt_budget.log_usage('story_progression', sections, prompt)
         
         logger.debug(f"推演提示长度: {len(prompt)} 字符")
+        return prompt
+
+    def _parse_response(self, response: Dict[str, Any]) -> StoryProgressionResult:
+        """解析LLM响应为推演结果"""
+        content = response.get('choices', [{}])[0].get('message', {}).get('content', '')
         
-        try:
-            # 调用LLM进行推演
-            response = create_chat_completion(prompt)
-            content = response.get('choices', [{}])[0].get('message', {}).get('content', '')
-            
-            logger.info("LLM推演完成，开始解析结果")
-            logger.debug(f"LLM响应内容: {content[:500]}...")
-            
-            # 解析结果
-            result_data = self._extract_result_json(content)
-            
-            # 创建结果对象
-            result = StoryProgressionResult(
-                updated_character_states=result_data.get('updated_character_states', {}),
-                updated_world_state=result_data.get('updated_world_state', {}),
-                event_summary=result_data.get('event_summary', ''),
-                narrative_description=result_data.get('narrative_description', ''),
-                relationship_changes=result_data.get('relationship_changes', {})
-            )
-            
-            logger.info("剧情推演成功完成")
-            return result
-            
-        except Exception as e:
-            logger.error(f"剧情推演失败: {e}")
-            raise
+        logger.info("LLM推演完成，开始解析结果")
+        logger.debug(f"LLM响应内容: {content[:500]}...")
+        
+        # 解析结果
+        result_data = self._extract_result_json(content)
+        
+        # 创建结果对象
+        return StoryProgressionResult(
+            updated_character_states=result_data.get('updated_character_states', {}),
+            updated_world_state=result_data.get('updated_world_state', {}),
+            event_summary=result_data.get('event_summary', ''),
+            narrative_description=result_data.get('narrative_description', ''),
+            relationship_changes=result_data.get('relationship_changes', {})
+        )
+
+
+# 全局剧情引擎实例
+_story_engine = None
+_story_engine_lock = threading.Lock()
+
+
+def get_story_engine() -> StoryEngine:
+    """
+    获取全局剧情引擎实例
+
+    返回:
+        StoryEngine: 剧情引擎实例
+    """
+    global _story_engine
+    if _story_engine is None:
+        with _story_engine_lock:
+            if _story_engine is None:
+                _story_engine = StoryEngine(
+                    batch_concurrency=int(os.environ.get('STORY_BATCH_CONCURRENCY', DEFAULT_BATCH_CONCURRENCY))
+                )
+    return _story_engine
+
+
+def build_story_context(
+    location: LocationInfo,
+    character_actions: List[CharacterAction],
+    world_history: List[str],
+    current_time: TimeOfDay,
+    current_world_state: Dict[str, Any],
+    current_character_states: Dict[str, Dict[str, Any]],
+    history_summary: str = ""
+) -> StoryContext:
+    """
+    由 create_story_progression 的参数创建剧情上下文
+
+    返回:
+        StoryContext: 剧情上下文
+    """
+    return StoryContext(
+        current_time=current_time,
+        current_location=location,
+        character_actions=character_actions,
+        world_history=world_history,
+        current_world_state=current_world_state,
+        current_character_states=current_character_states,
+        history_summary=history_summary
+    )
 
 
 def create_story_progression(
@@ -190,7 +315,8 @@ def create_story_progression(
     world_history: List[str],
     current_time: TimeOfDay,
     current_world_state: Dict[str, Any],
-    current_character_states: Dict[str, Dict[str, Any]]
+    current_character_states: Dict[str, Dict[str, Any]],
+    history_summary: str = ""
 ) -> StoryProgressionResult:
     """
     便捷函数：创建剧情推演
@@ -202,20 +328,16 @@ def create_story_progression(
         current_time (TimeOfDay): 当前时间
         current_world_state (Dict): 当前世界状态
         current_character_states (Dict): 当前角色状态
+        history_summary (str): 最近历史之前的前情摘要（如游戏状态中 history_memory.summary）
         
     返回:
         StoryProgressionResult: 推演结果
     """
     # 创建剧情上下文
-    context = StoryContext(
-        current_time=current_time,
-        current_location=location,
-        character_actions=character_actions,
-        world_history=world_history,
-        current_world_state=current_world_state,
-        current_character_states=current_character_states
+    context = build_story_context(
+        location, character_actions, world_history, current_time,
+        current_world_state, current_character_states, history_summary
     )
     
-    # 创建推演引擎并执行推演
-    engine = StoryEngine()
-    return engine.progress_story(context)
+    # 使用全局推演引擎执行推演
+    return get_story_engine().progress_story(context)
@@ -48,6 +48,8 @@ class StoryContext:
     world_history: List[str]
     current_world_state: Dict[str, Any]
     current_character_states: Dict[str, Dict[str, Any]]
+    # 最近历史之前的前情摘要
+    history_summary: str = ""
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -56,7 +58,8 @@ class StoryContext:
             "character_actions": [action.to_dict() for action in self.character_actions],
             "world_history": self.world_history,
             "current_world_state": self.current_world_state,
-            "current_character_states": self.current_character_states
+            "current_character_states": self.current_character_states,
+            "history_summary": self.history_summary
         }
 
 
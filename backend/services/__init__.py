@@ -8,11 +8,24 @@ from .session_service import SessionService, get_session_service
 from .game_data_service import GameDataService, get_game_data_service
 from .game_action_service import GameActionService, get_game_action_service
 from .fixed_events_service import FixedEventsService, get_fixed_events_service
+from .npc_index import NpcIndex, get_npc_index
+from .npc_catalog import NpcCatalog, get_npc_catalog
+from .history_memory import HistoryMemory, get_history_memory
+from .prompt_relevance import RelevanceSelector, get_relevance_selector
+from .action_pipeline import PeriodPipeline
+from .npc_fanout import NpcFanout
+from .job_service import JobService, get_job_service
 
 __all__ = [
     'FileStorageService', 'get_storage_service',
     'SessionService', 'get_session_service',
     'GameDataService', 'get_game_data_service',
     'GameActionService', 'get_game_action_service',
-    'FixedEventsService', 'get_fixed_events_service'
+    'FixedEventsService', 'get_fixed_events_service',
+    'NpcIndex', 'get_npc_index',
+    'NpcCatalog', 'get_npc_catalog',
+    'HistoryMemory', 'get_history_memory',
+    'RelevanceSelector', 'get_relevance_selector',
+    'PeriodPipeline', 'NpcFanout',
+    'JobService', 'get_job_service'
 ]
@@ -0,0 +1,311 @@
+"""
+分时段推演流水线
+玩家行动的另一种处理模式：上午、下午、晚上各用一次较小的LLM调用推演，后一时段以前一时段结束时的状态为起点。
+
+每个时段完成后立即产出（流式接口随即推送给玩家），并作为进行中的进度保存到游戏状态的 action_progress 字段；
+某个时段多次尝试仍失败时，玩家重新提交同一行动即从失败的时段继续，已完成的时段不再重新生成。
+保存进度等后处理在后台线程中进行，与下一时段的生成同时进行。
+"""
+
+import json
+import copy
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional
+
+from llm.model_routing import TASK_GAME_ACTION_PERIOD
+from llm.scheduler import LLMOverloadedError
+from utils.stream_utils import NarrativeStreamFilter
+from utils.resource_registry import get_resource_registry
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 分时段推演提示模板（追加在完整行动提示之后）
+PERIOD_PROMPT = 'prompts/game_action_period_prompt.txt'
+
+# 游戏状态中保存进行中进度的字段
+ACTION_PROGRESS_KEY = 'action_progress'
+
+# 各时段及其中文名称，按推演顺序排列
+PERIOD_LABELS = {'morning': '上午', 'afternoon': '下午', 'evening': '晚上'}
+
+# 每个时段的最多尝试次数，可通过环境变量 GAME_ACTION_PERIOD_ATTEMPTS 配置
+DEFAULT_PERIOD_ATTEMPTS = 2
+
+# 最后一个时段额外输出整天总结
+DAY_SUMMARY_FORMAT = (',\n  "day_summary": {"narrative": "整天的总结叙述", "major_events": ["重要事件"], '
+                      '"achievements": ["成就"], "consequences": ["后果"]}')
+
+
+def _compact_json(data: Any) -> str:
+    """序列化为紧凑JSON，减少提示中的空白token"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class PeriodPipeline:
+    """分时段推演流水线"""
+
+    def __init__(self, service, max_attempts: int = DEFAULT_PERIOD_ATTEMPTS):
+        """
+        初始化流水线
+
+        Args:
+            service (GameActionService): 游戏行动服务，提供LLM调用、解析、校验和状态提交
+            max_attempts (int): 每个时段的最多尝试次数
+        """
+        self.service = service
+        self.max_attempts = max(1, max_attempts)
+        self.resources = get_resource_registry()
+        self.metrics = get_metrics()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='action-pipeline')
+
+    def run(self, game_id: str, prepared: Dict[str, Any], player_action: str,
+            stream: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        依次推演三个时段，最后组装为与单次推演相同格式的结果并提交
+
+        Args:
+            game_id (str): 游戏ID
+            prepared (Dict[str, Any]): GameActionService._prepare_action 的结果
+            player_action (str): 玩家行动描述
+            stream (bool): 是否以流式方式调用LLM并推送叙述文本
+
+        Yields:
+            Dict[str, Any]: 流式事件，type 为 narrative（叙述文本块，仅流式）、period（某个时段的结果）、
+            result（最终推演结果）或 error（处理失败）
+        """
+        game_state = prepared["game_state"]
+        day = game_state.get('day', 1)
+        periods = self._load_progress(game_state, player_action)
+        # 正在后台写入的进度
+        pending: Optional[Future] = None
+
+        try:
+            # 各时段的LLM调用在同一个请求上下文中依次进行，排队截止时间按每次调用分别计算（见 llm/scheduler.py），
+            # 前面的时段推演较慢不会让后面的时段被拒绝
+            for period, label in PERIOD_LABELS.items():
+                if period in periods:
+                    logger.info(f"沿用已完成的{label}时段: {game_id}")
+                    self.metrics.increment("game_action.pipeline.periods_resumed")
+                    yield {"type": "period", "period": period, "result": periods[period], "resumed": True}
+                    continue
+
+                period_result = None
+                for attempt in range(1, self.max_attempts + 1):
+                    with self.metrics.timer("game_action.pipeline.period"):
+                        period_result = yield from self._generate_period(game_id, prepared, period, periods, stream)
+                    if period_result:
+                        break
+                    logger.warning(f"{label}时段推演失败（第{attempt}次）: {game_id}")
+                    self.metrics.increment("game_action.pipeline.period_retries")
+
+                if not period_result:
+                    self.metrics.increment("game_action.pipeline.period_failures")
+                    yield {"type": "error", "period": period,
+                           "message": f"{label}时段推演失败，请重新提交同一行动从该时段继续"}
+                    return
+
+                periods[period] = period_result
+                yield {"type": "period", "period": period, "result": period_result}
+                # 保存进度与下一时段的生成同时进行
+                progress = self._build_progress(day, player_action, periods)
+                self._wait(pending)
+                pending = self._executor.submit(self._save_progress, game_id, progress)
+                # 提交最终结果时据此清除已保存的进度
+                game_state = {**game_state, ACTION_PROGRESS_KEY: progress}
+        finally:
+            # 进度写入完成后才能提交最终结果，避免较晚的进度写入覆盖提交时的清除
+            self._wait(pending)
+
+        action_result = self.service._validate_action_result(self._assemble(periods))
+        if not action_result or not self.service._commit_action_result(
+                game_id, game_state, action_result, prepared.get("action_id")):
+            yield {"type": "error", "message": "行动处理失败"}
+            return
+
+        self.metrics.increment("game_action.pipeline.completed")
+        yield {"type": "result", "result": action_result}
+
+    def _generate_period(self, game_id: str, prepared: Dict[str, Any], period: str,
+                         periods: Dict[str, Dict[str, Any]], stream: bool):
+        """
+        推演单个时段（生成器，流式时产出叙述文本事件）
+
+        Returns:
+            Optional[Dict[str, Any]]: 时段结果，失败为None
+        """
+        prompt = f"{prepared['user_prompt']}\n\n{self._build_period_prompt(prepared['game_state'], period, periods)}"
+
+        try:
+            response = self.service.prompt_prefix_cache.create_chat_completion(
+                game_id,
+                prefix=prepared["system_prompt"],
+                prompt=prompt,
+                stream=stream,
+                task=TASK_GAME_ACTION_PERIOD
+            )
+            if stream:
+                narrative_filter = NarrativeStreamFilter()
+                # 与前一时段的叙述之间同样以空行分隔
+                separator = narrative_filter.separator if periods else ""
+                content_parts = []
+                for chunk in response:
+                    content_parts.append(chunk)
+                    narrative_text = narrative_filter.feed(chunk)
+                    if narrative_text:
+                        yield {"type": "narrative", "text": separator + narrative_text, "period": period}
+                        separator = ""
+                content = "".join(content_parts)
+            else:
+                content = self.service._get_response_content(response)
+
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error(f"{PERIOD_LABELS[period]}时段LLM调用失败: {e}")
+            return None
+
+        result, _ = self.service._parse_llm_content(content)
+        return self._normalize_period_result(period, result)
+
+    def _normalize_period_result(self, period: str, result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """校验并整理单个时段的结果，缺少叙述时视为失败"""
+        if not isinstance(result, dict):
+            return None
+        period_data = result.get('period')
+        if not isinstance(period_data, dict) or not isinstance(period_data.get('narrative'), str):
+            logger.warning(f"{PERIOD_LABELS[period]}时段结果缺少 period.narrative")
+            return None
+
+        updated_states = result.get('updated_states')
+        if not isinstance(updated_states, dict):
+            updated_states = {}
+        npc_updates = updated_states.get('npcs')
+        if isinstance(npc_updates, dict):
+            # NPC名称在每个时段完成时就映射为ID，组装时直接按ID合并
+            self.service._validate_npc_data(npc_updates)
+        else:
+            updated_states.pop('npcs', None)
+
+        npc_actions = result.get('npc_actions')
+        normalized = {
+            "player_action": result.get('player_action', ''),
+            "npc_actions": npc_actions if isinstance(npc_actions, dict) else {},
+            "period": period_data,
+            "updated_states": updated_states
+        }
+        if isinstance(result.get('day_summary'), dict):
+            normalized["day_summary"] = result["day_summary"]
+        return normalized
+
+    def _build_period_prompt(self, game_state: Dict[str, Any], period: str,
+                             periods: Dict[str, Dict[str, Any]]) -> str:
+        """构建单个时段的推演要求：已完成时段的经过和本时段开始时的状态"""
+        previous = []
+        for name, label in PERIOD_LABELS.items():
+            if name == period:
+                break
+            period_data = periods[name]["period"]
+            previous.append(f"- {label}（{period_data.get('location', '未知地点')}）: {period_data.get('narrative', '')}")
+
+        if previous:
+            start_state = _compact_json(self._merge_updated_states(periods, until=period))
+        else:
+            start_state = "与上方游戏状态信息相同"
+
+        last_period = list(PERIOD_LABELS)[-1]
+        return self.resources.get_template(PERIOD_PROMPT).format(
+            current_day=game_state.get('day', 1),
+            period=period,
+            period_label=PERIOD_LABELS[period],
+            previous_periods="\n".join(previous) or "无（这是当天的第一个时段）",
+            period_start_state=start_state,
+            day_summary_format=DAY_SUMMARY_FORMAT if period == last_period else ""
+        )
+
+    @staticmethod
+    def _merge_updated_states(periods: Dict[str, Dict[str, Any]], until: Optional[str] = None) -> Dict[str, Any]:
+        """按时段顺序合并各时段结束时的状态（后面的时段覆盖前面的），until 为不包含在内的时段"""
+        merged: Dict[str, Dict[str, Any]] = {"player": {}, "world": {}, "npcs": {}}
+        for period in PERIOD_LABELS:
+            if period == until or period not in periods:
+                break
+            updated_states = periods[period].get("updated_states", {})
+            for key, values in merged.items():
+                updates = updated_states.get(key)
+                if not isinstance(updates, dict):
+                    continue
+                for name, value in updates.items():
+                    if isinstance(value, dict) and isinstance(values.get(name), dict):
+                        values[name] = {**values[name], **value}
+                    else:
+                        values[name] = value
+        return {key: values for key, values in merged.items() if values}
+
+    def _assemble(self, periods: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """把各时段的结果组装为与单次推演相同格式的推演结果"""
+        npc_actions: Dict[str, Dict[str, Any]] = {}
+        for period in PERIOD_LABELS:
+            for npc_id, action in periods[period]["npc_actions"].items():
+                npc_actions.setdefault(npc_id, {})[period] = action
+
+        last_period = periods[list(PERIOD_LABELS)[-1]]
+        day_summary = last_period.get("day_summary") or {
+            "narrative": "".join(periods[period]["period"]["narrative"] for period in PERIOD_LABELS),
+            "major_events": [],
+            "achievements": [],
+            "consequences": []
+        }
+
+        return {
+            "player_actions": {period: periods[period]["player_action"] for period in PERIOD_LABELS},
+            "npc_actions": npc_actions,
+            "time_progression": {period: periods[period]["period"] for period in PERIOD_LABELS},
+            "day_summary": day_summary,
+            "updated_states": self._merge_updated_states(periods)
+        }
+
+    @staticmethod
+    def _load_progress(game_state: Dict[str, Any], player_action: str) -> Dict[str, Dict[str, Any]]:
+        """读取同一天同一行动已完成的时段"""
+        progress = game_state.get(ACTION_PROGRESS_KEY)
+        if not isinstance(progress, dict):
+            return {}
+        if progress.get('day') != game_state.get('day', 1) or progress.get('action') != player_action:
+            return {}
+
+        periods = {}
+        for item in progress.get('periods') or []:
+            if isinstance(item, dict) and item.get('name') in PERIOD_LABELS and isinstance(item.get('result'), dict):
+                periods[item['name']] = item['result']
+        # 只沿用从上午开始连续完成的时段
+        completed = {}
+        for period in PERIOD_LABELS:
+            if period not in periods:
+                break
+            completed[period] = periods[period]
+        return completed
+
+    @staticmethod
+    def _build_progress(day: int, player_action: str, periods: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """构建进行中进度，时段以列表保存，整体替换旧的进度而不是与其合并"""
+        return {
+            "day": day,
+            "action": player_action,
+            "periods": [{"name": period, "result": copy.deepcopy(result)} for period, result in periods.items()]
+        }
+
+    def _save_progress(self, game_id: str, progress: Dict[str, Any]):
+        if not self.service.game_data_service.update_game_state(game_id, {ACTION_PROGRESS_KEY: progress}):
+            logger.warning(f"保存分时段推演进度失败: {game_id}")
+
+    @staticmethod
+    def _wait(future: Optional[Future]):
+        if future is None:
+            return
+        try:
+            future.result()
+        except Exception as e:
+            logger.warning(f"保存分时段推演进度异常: {e}")
+
@@ -3,69 +3,78 @@
 管理游戏中的固定事件，这些事件在特定时间必定发生
 """
 
-import os
 import json
 from typing import Dict, Any, List, Optional
 
 from models.common import TimeOfDay
+from utils.resource_registry import get_resource_registry
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 
+# 固定事件配置（由资源注册表加载，修改文件后自动重新加载）
+FIXED_EVENTS_FILE = 'events/fixed_events.json'
+
+
+def _index_fixed_events(events_list) -> Dict[str, Dict[str, Any]]:
+    """将事件列表转换为以时间为键的字典"""
+    fixed_events = {}
+    for event in events_list:
+        event_time = event.get('event_time')
+        event_description = event.get('event_description')
+
+        if event_time and event_description:
+            # 验证时间枚举是否有效
+            try:
+                time_enum = TimeOfDay(event_time)
+                fixed_events[event_time] = {
+                    'time': time_enum,
+                    'description': event_description
+                }
+                logger.debug(f"加载固定事件: {event_time}")
+            except ValueError:
+                logger.warning(f"无效的事件时间: {event_time}")
+        else:
+            logger.warning(f"固定事件配置不完整: {dict(event)}")
+
+    logger.info(f"成功加载 {len(fixed_events)} 个固定事件")
+    return fixed_events
+
+
 class FixedEventsService:
     """固定事件服务类"""
     
     def __init__(self):
         """初始化固定事件服务"""
-        self.fixed_events = {}
+        self.resources = get_resource_registry()
         self._load_fixed_events()
         logger.info("固定事件服务初始化完成")
-    
-    def _load_fixed_events(self):
+
+    @property
+    def fixed_events(self) -> Dict[str, Dict[str, Any]]:
+        """以时间为键的固定事件，配置文件修改后自动重新加载"""
+        return self._load_fixed_events()
+
+    def _load_fixed_events(self) -> Dict[str, Dict[str, Any]]:
         """加载固定事件配置"""
         try:
-            events_path = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)),
-                'resources', 'events', 'fixed_events.json'
-            )
-            
-            logger.debug(f"加载固定事件配置: {events_path}")
-            
-            with open(events_path, 'r', encoding='utf-8') as file:
-                events_list = json.load(file)
-            
-            # 将事件列表转换为以时间为键的字典
-            for event in events_list:
-                event_time = event.get('event_time')
-                event_description = event.get('event_description')
-                
-                if event_time and event_description:
-                    # 验证时间枚举是否有效
-                    try:
-                        time_enum = TimeOfDay(event_time)
-                        self.fixed_events[event_time] = {
-                            'time': time_enum,
-                            'description': event_description
-                        }
-                        logger.debug(f"加载固定事件: {event_time}")
-                    except ValueError:
-                        logger.warning(f"无效的事件时间: {event_time}")
-                else:
-                    logger.warning(f"固定事件配置不完整: {event}")
-            
-            logger.info(f"成功加载 {len(self.fixed_events)} 个固定事件")
-            
+            return self.resources.get_derived(FIXED_EVENTS_FILE, 'by_time', _index_fixed_events)
         except FileNotFoundError:
-            logger.error(f"固定事件配置文件不存在: {events_path}")
-            self.fixed_events = {}
+            logger.error(f"固定事件配置文件不存在: {FIXED_EVENTS_FILE}")
         except json.JSONDecodeError as e:
             logger.error(f"固定事件配置文件JSON格式错误: {e}")
-            self.fixed_events = {}
         except Exception as e:
             logger.error(f"加载固定事件配置失败: {e}")
-            self.fixed_events = {}
+        return {}
     
+    def get_version(self) -> int:
+        """获取固定事件配置的版本号，配置文件每次重新加载后变化"""
+        try:
+            return self.resources.get_version(FIXED_EVENTS_FILE)
+        except Exception:
+            return 0
+
     def get_fixed_event(self, time_of_day: TimeOfDay) -> Optional[str]:
         """
         获取指定时间的固定事件
@@ -206,7 +215,7 @@ class FixedEventsService:
     def reload_fixed_events(self):
         """重新加载固定事件配置"""
         logger.info("重新加载固定事件配置")
-        self.fixed_events = {}
+        self.resources.reload(FIXED_EVENTS_FILE)
         self._load_fixed_events()
 
 
@@ -5,16 +5,53 @@
 
 import os
 import json
-import re
-from typing import Dict, Any, Optional
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
 
-from llm.chat import create_chat_completion
-from services.game_data_service import get_game_data_service
+from llm.context_cache import get_prompt_prefix_cache
+from llm.scheduler import LLMOverloadedError
+from llm.model_routing import TASK_GAME_ACTION
+from services.game_data_service import STATE_REVISION_KEY, get_game_data_service
 from services.fixed_events_service import get_fixed_events_service
+from services.npc_index import NPC_TEMPLATES, NpcIndex, get_npc_index
+from services.history_memory import get_history_memory, format_history_entries, format_history_summary
+from services.prompt_relevance import RelevanceSelection, get_relevance_selector
+from services.action_pipeline import ACTION_PROGRESS_KEY, DEFAULT_PERIOD_ATTEMPTS, PeriodPipeline
+from services.npc_fanout import DEFAULT_FANOUT_CONCURRENCY, DEFAULT_MAX_NPCS, NpcFanout, DEFAULT_REACTION_DEADLINE
+from utils.stream_utils import NarrativeStreamFilter
+from utils.json_extractor import IncrementalJSONExtractor, JSONExtractionError, extract_json_object
+from utils.json_repair import repair_json, JSONRepairError
+from utils.metrics import get_metrics
+from utils.prompt_sections import get_prompt_section_cache
+from utils.resource_registry import get_resource_registry
+from utils.token_budget import PromptBudget
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 属于世界设定（游戏过程中不变）的世界字段，放入提示的固定前缀
+WORLD_LORE_KEYS = ('name', 'description', 'background', 'geography', 'lore', 'factions')
+
+# 推演结果的必需部分与时段
+REQUIRED_RESULT_KEYS = ('player_actions', 'time_progression', 'day_summary', 'updated_states')
+TIME_PERIODS = ('morning', 'afternoon', 'evening')
+
+# 提示模板（由资源注册表加载，修改文件后自动重新加载）
+SYSTEM_PROMPT = 'prompts/game_action_system_prompt.txt'
+CONTEXT_PROMPT = 'prompts/game_action_context_prompt.txt'
+USER_PROMPT = 'prompts/game_action_user_prompt.txt'
+MISSING_SECTIONS_PROMPT = 'prompts/game_action_missing_sections_prompt.txt'
+
+# 行动处理模式：single 为一次LLM调用推演整天，pipeline 为按时段分别推演（见 services/action_pipeline.py），
+# fanout 为先规划勇者的一天再并行推演各NPC的反应（见 services/npc_fanout.py）
+ACTION_MODE_SINGLE = 'single'
+ACTION_MODE_PIPELINE = 'pipeline'
+ACTION_MODE_FANOUT = 'fanout'
+ACTION_MODES = (ACTION_MODE_SINGLE, ACTION_MODE_PIPELINE, ACTION_MODE_FANOUT)
+
+# 游戏状态中记录最近已应用的行动ID（与状态变化在同一次保存中写入），恢复的异步任务据此避免重复执行
+APPLIED_ACTIONS_KEY = 'applied_actions'
+MAX_APPLIED_ACTIONS = 20
+
 
 class GameActionService:
     """游戏行动处理服务类"""
@@ -23,15 +60,38 @@ class GameActionService:
         """初始化游戏行动处理服务"""
         self.game_data_service = get_game_data_service()
         self.fixed_events_service = get_fixed_events_service()
-        logger.info("游戏行动处理服务初始化完成")
+        self.prompt_budget = PromptBudget()
+        self.prompt_prefix_cache = get_prompt_prefix_cache()
+        self.metrics = get_metrics()
+        self.resources = get_resource_registry()
+        self.section_cache = get_prompt_section_cache()
+        self.history_memory = get_history_memory()
+        self.relevance_selector = get_relevance_selector()
+        self.default_mode = os.environ.get('GAME_ACTION_MODE', ACTION_MODE_SINGLE)
+        if self.default_mode not in ACTION_MODES:
+            logger.warning(f"未知的行动处理模式: {self.default_mode}，使用 {ACTION_MODE_SINGLE}")
+            self.default_mode = ACTION_MODE_SINGLE
+        self.period_pipeline = PeriodPipeline(
+            self, max_attempts=int(os.environ.get('GAME_ACTION_PERIOD_ATTEMPTS', DEFAULT_PERIOD_ATTEMPTS))
+        )
+        self.npc_fanout = NpcFanout(
+            self,
+            max_npcs=int(os.environ.get('NPC_FANOUT_MAX_NPCS', DEFAULT_MAX_NPCS)),
+            concurrency=int(os.environ.get('NPC_FANOUT_CONCURRENCY', DEFAULT_FANOUT_CONCURRENCY)),
+            reaction_deadline=float(os.environ.get('NPC_FANOUT_DEADLINE', DEFAULT_REACTION_DEADLINE))
+        )
+        logger.info(f"游戏行动处理服务初始化完成，默认模式: {self.default_mode}")
     
-    def process_player_action(self, game_id: str, player_action: str) -> Optional[Dict[str, Any]]:
+    def process_player_action(self, game_id: str, player_action: str,
+                              mode: Optional[str] = None, action_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         处理玩家行动
 
         Args:
             game_id (str): 游戏ID
             player_action (str): 玩家行动描述
+            mode (Optional[str]): 处理模式（见 ACTION_MODES），默认取 GAME_ACTION_MODE
+            action_id (Optional[str]): 行动ID，应用成功后记入游戏状态的 applied_actions（见 is_action_applied）
 
         Returns:
             Optional[Dict[str, Any]]: 处理结果，失败返回None
@@ -41,38 +101,33 @@ class GameActionService:
         logger.debug(f"玩家行动内容: {player_action}")
 
         try:
-            # 获取当前游戏状态
-            logger.debug("获取当前游戏状态")
-            game_state = self.game_data_service.get_game_state(game_id)
-            if not game_state:
-                logger.error(f"无法获取游戏状态: {game_id}")
+            prepared = self._prepare_action(game_id, player_action, action_id)
+            if "error" in prepared:
+                return prepared.get("result")
+
+            game_state = prepared["game_state"]
+
+            runner = self._get_action_runner(mode)
+            if runner is not None:
+                logger.info(f"以 {mode or self.default_mode} 模式进行游戏推演")
+                for event in runner.run(game_id, prepared, player_action):
+                    if event["type"] == "result":
+                        logger.info(f"玩家行动处理完成: {game_id}")
+                        return event["result"]
+                    if event["type"] == "error":
+                        logger.error(f"行动推演失败: {event['message']}")
+                        return None
                 return None
 
-            logger.debug(f"游戏状态获取成功，当前第{game_state.get('day', 1)}天")
-            logger.debug(f"玩家姓名: {game_state.get('player', {}).get('name', '未知')}")
-
-            # 检查游戏是否已结束
-            logger.debug("检查游戏是否已完成")
-            if self.game_data_service.is_game_completed(game_id):
-                logger.warning(f"游戏已完成，无法处理行动: {game_id}")
-                return {"error": "游戏已完成"}
-
-            # 构建LLM提示
-            logger.debug("加载系统提示")
-            system_prompt = self._load_system_prompt()
-            logger.debug(f"系统提示长度: {len(system_prompt)} 字符")
-
-            logger.debug("构建用户提示")
-            user_prompt = self._build_user_prompt(game_state, player_action)
-            logger.debug(f"用户提示长度: {len(user_prompt)} 字符")
-
             # 调用LLM
             logger.info("调用LLM进行游戏推演")
             logger.debug("发送LLM请求...")
 
-            llm_response = create_chat_completion(
-                prompt=user_prompt,
-                system_message=system_prompt
+            llm_response = self.prompt_prefix_cache.create_chat_completion(
+                game_id,
+                prefix=prepared["system_prompt"],
+                prompt=prepared["user_prompt"],
+                task=TASK_GAME_ACTION
             )
 
             logger.debug("LLM响应接收完成")
@@ -80,64 +135,252 @@ class GameActionService:
 
             # 解析LLM响应
             logger.debug("解析LLM响应")
-            action_result = self._parse_llm_response(llm_response)
+            action_result, repaired = self._parse_llm_content(self._get_response_content(llm_response))
+            action_result = self._finalize_action_result(game_id, prepared, action_result, repaired)
             if not action_result:
                 logger.error("LLM响应解析失败")
                 return None
 
-            logger.debug("LLM响应解析成功")
-            logger.debug(f"解析结果键: {list(action_result.keys())}")
-
-            # 应用状态变化
-            logger.debug("应用状态变化")
-            success = self._apply_state_changes(game_id, game_state, action_result)
-            if not success:
-                logger.error("状态变化应用失败")
+            if not self._commit_action_result(game_id, game_state, action_result, action_id):
                 return None
 
-            logger.debug("状态变化应用成功")
-
             logger.info(f"玩家行动处理完成: {game_id}")
             return action_result
 
+        except LLMOverloadedError:
+            # LLM服务繁忙，交由API层返回 429
+            raise
         except Exception as e:
             logger.error(f"处理玩家行动异常 {game_id}: {e}")
             import traceback
             logger.debug(f"异常堆栈: {traceback.format_exc()}")
             return None
+
+    def process_player_action_stream(self, game_id: str, player_action: str,
+                                     mode: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        以流式方式处理玩家行动
+
+        LLM生成过程中逐块产出叙述文本，生成结束后解析完整JSON并提交状态变化。
+
+        Args:
+            game_id (str): 游戏ID
+            player_action (str): 玩家行动描述
+            mode (Optional[str]): 处理模式（见 ACTION_MODES），默认取 GAME_ACTION_MODE
+
+        Yields:
+            Dict[str, Any]: 流式事件，type 为 narrative（叙述文本块）、period（分时段模式下某个时段的结果）、
+            result（最终推演结果）或 error（处理失败，LLM服务繁忙时附带 retry_after）
+        """
+        logger.info(f"开始流式处理玩家行动: {game_id}")
+
+        try:
+            prepared = self._prepare_action(game_id, player_action)
+            if "error" in prepared:
+                result = prepared.get("result") or {}
+                yield {"type": "error", "message": result.get("error", prepared["error"])}
+                return
+
+            game_state = prepared["game_state"]
+
+            runner = self._get_action_runner(mode)
+            if runner is not None:
+                logger.info(f"以 {mode or self.default_mode} 模式进行流式游戏推演")
+                yield from runner.run(game_id, prepared, player_action, stream=True)
+                return
+
+            logger.info("调用流式LLM进行游戏推演")
+            narrative_filter = NarrativeStreamFilter()
+            json_extractor = IncrementalJSONExtractor()
+            content_parts = []
+
+            for chunk in self.prompt_prefix_cache.create_chat_completion(
+                game_id,
+                prefix=prepared["system_prompt"],
+                prompt=prepared["user_prompt"],
+                stream=True,
+                task=TASK_GAME_ACTION
+            ):
+                content_parts.append(chunk)
+                # 边接收边扫描JSON边界，响应结束时结果通常已解析完毕
+                json_extractor.feed(chunk)
+                narrative_text = narrative_filter.feed(chunk)
+                if narrative_text:
+                    yield {"type": "narrative", "text": narrative_text}
+
+            content = "".join(content_parts)
+            logger.debug(f"流式LLM响应接收完成，长度: {len(content)} 字符")
+
+            if json_extractor.done:
+                action_result, repaired = json_extractor.result, False
+            else:
+                action_result, repaired = self._parse_llm_content(content)
+            action_result = self._finalize_action_result(game_id, prepared, action_result, repaired)
+            if not action_result:
+                logger.error("流式LLM响应解析失败")
+                yield {"type": "error", "message": "行动处理失败"}
+                return
+
+            if not self._commit_action_result(game_id, game_state, action_result):
+                yield {"type": "error", "message": "行动处理失败"}
+                return
+
+            logger.info(f"流式玩家行动处理完成: {game_id}")
+            yield {"type": "result", "result": action_result}
+
+        except LLMOverloadedError as e:
+            logger.warning(f"LLM服务繁忙，流式行动处理被拒绝: {game_id}")
+            yield {"type": "error", "message": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            logger.error(f"流式处理玩家行动异常 {game_id}: {e}")
+            import traceback
+            logger.debug(f"异常堆栈: {traceback.format_exc()}")
+            yield {"type": "error", "message": str(e)}
+
+    def _get_action_runner(self, mode: Optional[str]):
+        """获取处理模式对应的推演流程，默认的单次推演模式返回None"""
+        mode = mode or self.default_mode
+        if mode == ACTION_MODE_PIPELINE:
+            return self.period_pipeline
+        if mode == ACTION_MODE_FANOUT:
+            return self.npc_fanout
+        return None
+
+    def _prepare_action(self, game_id: str, player_action: str, action_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        准备行动处理所需的游戏状态与提示
+
+        system_prompt 为固定前缀（系统规则、世界设定、NPC名册），同一局游戏中基本不变；
+        user_prompt 为变化后缀（属性、状态、历史、行动）。
+
+        Returns:
+            Dict[str, Any]: 包含 game_state、system_prompt、user_prompt、action_id；
+            失败时包含 error 键，result 为应返回给调用方的结果
+        """
+        # 获取当前游戏状态
+        logger.debug("获取当前游戏状态")
+        game_state = self.game_data_service.get_game_state(game_id)
+        if not game_state:
+            logger.error(f"无法获取游戏状态: {game_id}")
+            return {"error": "无法获取游戏状态", "result": None}
+
+        logger.debug(f"游戏状态获取成功，当前第{game_state.get('day', 1)}天")
+        logger.debug(f"玩家姓名: {game_state.get('player', {}).get('name', '未知')}")
+
+        # 检查游戏是否已结束
+        logger.debug("检查游戏是否已完成")
+        if self.game_data_service.is_game_completed(game_id):
+            logger.warning(f"游戏已完成，无法处理行动: {game_id}")
+            return {"error": "游戏已完成", "result": {"error": "游戏已完成"}}
+
+        # 构建LLM提示（各分段按游戏状态的修订号缓存，状态未保存过新版本时不重新渲染）
+        revision = (game_id, game_state.get(STATE_REVISION_KEY, 0))
+        with self.metrics.timer("game_action.prompt_render"):
+            logger.debug("加载系统提示")
+            system_prompt = self._build_prompt_prefix(game_state, revision)
+            logger.debug(f"系统提示长度: {len(system_prompt)} 字符")
+
+            logger.debug("构建用户提示")
+            user_prompt = self._build_user_prompt(game_state, player_action, revision)
+            logger.debug(f"用户提示长度: {len(user_prompt)} 字符")
+        logger.info(f"系统提示token估算: {self.prompt_budget.estimator.estimate(system_prompt)}")
+
+        return {
+            "game_state": game_state,
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "action_id": action_id
+        }
+
+    @staticmethod
+    def is_action_applied(game_state: Dict[str, Any], action_id: str) -> bool:
+        """
+        行动是否已应用到游戏状态
+
+        Args:
+            game_state (Dict[str, Any]): 游戏状态
+            action_id (str): 行动ID
+
+        Returns:
+            bool: 行动ID在最近已应用的行动中
+        """
+        return action_id in (game_state.get(APPLIED_ACTIONS_KEY) or [])
+
+    def _commit_action_result(self, game_id: str, game_state: Dict[str, Any], action_result: Dict[str, Any],
+                              action_id: Optional[str] = None) -> bool:
+        """应用解析后的推演结果"""
+        logger.debug("LLM响应解析成功")
+        logger.debug(f"解析结果键: {list(action_result.keys())}")
+
+        # 应用状态变化
+        logger.debug("应用状态变化")
+        success = self._apply_state_changes(game_id, game_state, action_result, action_id)
+        if not success:
+            logger.error("状态变化应用失败")
+            return False
+
+        logger.debug("状态变化应用成功")
+        return True
     
     def _load_system_prompt(self) -> str:
         """加载系统提示"""
         try:
-            prompt_path = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)),
-                'resources', 'prompts', 'game_action_system_prompt.txt'
-            )
-            
-            with open(prompt_path, 'r', encoding='utf-8') as file:
-                return file.read()
-                
+            return self.resources.get_text(SYSTEM_PROMPT)
         except Exception as e:
             logger.error(f"加载系统提示失败: {e}")
             return "你是游戏主持人，负责处理玩家行动。"
     
-    def _build_user_prompt(self, game_state: Dict[str, Any], player_action: str) -> str:
-        """构建用户提示"""
-        logger.debug("开始构建用户提示")
+    def _render_section(self, section: str, revision: Optional[Hashable], renderer: Callable[[], str],
+                        key: Hashable = None) -> str:
+        """
+        渲染依赖游戏状态的提示分段，按游戏状态的修订号缓存
+
+        Args:
+            section (str): 分段名称
+            revision (Optional[Hashable]): (游戏ID, 状态修订号)，None 表示状态不是从存档读取的，直接渲染
+            renderer (Callable[[], str]): 渲染函数
+            key (Hashable): 分段在状态之外的其他依赖，如本次行动选中的NPC
+
+        Returns:
+            str: 渲染结果
+        """
+        if revision is None:
+            return renderer()
+        return self.section_cache.render(section, (revision, key), renderer)
+
+    def _build_prompt_prefix(self, game_state: Dict[str, Any], revision: Optional[Hashable] = None) -> str:
+        """构建提示的固定前缀：系统规则 + 世界设定 + NPC名册"""
+        system_prompt = self._load_system_prompt()
 
         try:
-            # 加载用户提示模板
-            template_path = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)),
-                'resources', 'prompts', 'game_action_user_prompt.txt'
-            )
+            template = self.resources.get_template(CONTEXT_PROMPT)
+
+            sections = self.prompt_budget.apply({
+                "world_lore": self._render_section(
+                    'world_lore', revision, lambda: self._format_world_lore(game_state.get('world', {}))
+                ),
+                "npc_info": self._render_section(
+                    'npc_info', revision, lambda: self._format_npc_info(game_state.get('npc', {}))
+                )
+            })
+            context = template.format(world_lore=sections["world_lore"], npc_roster=sections["npc_info"])
+            self.prompt_budget.log_usage('game_action_prefix', sections)
 
-            logger.debug(f"模板路径: {template_path}")
+            return f"{system_prompt}\n\n{context}"
 
-            with open(template_path, 'r', encoding='utf-8') as file:
-                template = file.read()
+        except Exception as e:
+            logger.error(f"构建提示前缀失败: {e}")
+            return system_prompt
 
-            logger.debug(f"模板加载成功，长度: {len(template)} 字符")
+    def _build_user_prompt(self, game_state: Dict[str, Any], player_action: str,
+                           revision: Optional[Hashable] = None) -> str:
+        """构建用户提示，revision 为 (游戏ID, 状态修订号)，给出时依赖状态的分段按修订号缓存"""
+        logger.debug("开始构建用户提示")
+
+        try:
+            # 加载用户提示模板
+            template = self.resources.get_template(USER_PROMPT)
+            logger.debug(f"模板加载成功，长度: {len(template.source)} 字符")
 
             # 提取游戏状态信息
             player = game_state.get('player', {})
@@ -150,30 +393,64 @@ class GameActionService:
 
             # 格式化装备信息
             logger.debug("格式化装备信息")
-            equipment_info = self._format_equipment_info(player.get('equipment', {}))
+            equipment_info = self._render_section(
+                'equipment_info', revision, lambda: self._format_equipment_info(player.get('equipment', {}))
+            )
             logger.debug(f"装备信息: {equipment_info}")
 
-            # 格式化NPC信息
-            logger.debug("格式化NPC信息")
-            npc_info = self._format_npc_info(npcs)
-            logger.debug(f"NPC信息长度: {len(npc_info)} 字符")
-
             # 格式化世界信息
             logger.debug("格式化世界信息")
-            world_info = self._format_world_info(world)
+            world_info = self._render_section('world_info', revision, lambda: self._format_world_info(world))
             logger.debug(f"世界信息长度: {len(world_info)} 字符")
 
-            # 格式化历史事件
+            # 格式化历史事件（前情摘要 + 最近记录原文）
             logger.debug("格式化历史事件")
-            history_events = self._format_history_events(game_state.get('history', []))
-            logger.debug(f"历史事件数量: {len(game_state.get('history', []))}")
+            history_summary, recent_history = self.history_memory.build_prompt_sections(game_state)
+            history_events = self._render_section(
+                'history_events', revision, lambda: self._format_history_events(recent_history),
+                key=self.history_memory.recent_window
+            )
+            logger.debug(f"历史事件数量: {len(game_state.get('history', []))}，原文保留: {len(recent_history)}")
 
             # 格式化固定事件
             logger.debug("格式化固定事件")
             current_day = game_state.get('day', 1)
-            fixed_events_info = self.fixed_events_service.format_fixed_events_for_prompt(current_day)
+            fixed_events_info = self.section_cache.render(
+                'fixed_events', (current_day, self.fixed_events_service.get_version()),
+                lambda: self.fixed_events_service.format_fixed_events_for_prompt(current_day)
+            )
             logger.debug(f"当前天数固定事件: {len(fixed_events_info)} 字符")
 
+            # 按与本次行动的相关性选择完整展示的NPC和地点（其余只在固定前缀的名册中）
+            selection = self.relevance_selector.select(game_state, player_action, recent_history, fixed_events_info)
+
+            logger.debug("格式化NPC状态")
+            npc_states = self._render_section(
+                'npc_states', revision, lambda: self._format_npc_states(npcs, selection),
+                key=(tuple(selection.npc_ids), self._get_npc_templates_version())
+            )
+            location_details = self._render_section(
+                'location_details', revision,
+                lambda: self._format_location_details(world.get('locations', {}), selection),
+                key=tuple(selection.location_ids)
+            )
+            logger.debug(f"相关NPC: {len(selection.npc_ids)}/{len(npcs)}，NPC状态长度: {len(npc_states)} 字符")
+
+            # 按分段预算截断/压缩
+            sections = self.prompt_budget.apply({
+                "equipment_info": equipment_info,
+                "npc_states": npc_states,
+                "location_details": location_details,
+                "world_info": world_info,
+                "history_summary": format_history_summary(history_summary),
+                "history_events": history_events,
+                "fixed_events_info": fixed_events_info
+            })
+            # 摘要单独计算预算后放在最近记录之前，避免按末尾保留截断历史时先丢掉摘要
+            history_summary = sections.pop("history_summary")
+            if history_summary:
+                sections["history_events"] = history_summary + "\n" + sections["history_events"]
+
             # 提取玩家基本信息和属性
             player_basic_info = player.get('basic_info', {})
             player_stats = player.get('stats', {})
@@ -192,16 +469,14 @@ class GameActionService:
                 player_intelligence=player_stats.get('intelligence', 50),
                 player_agility=player_stats.get('agility', 50),
                 player_luck=player_stats.get('luck', 50),
-                equipment_info=equipment_info,
                 current_time=world.get('current_time', '上午'),
                 weather=world.get('weather', '晴天'),
-                world_info=world_info,
-                npc_info=npc_info,
-                history_events=history_events,
-                fixed_events_info=fixed_events_info,
-                player_action=player_action
+                player_action=player_action,
+                **sections
             )
 
+            self.prompt_budget.log_usage('game_action', {**sections, "player_action": player_action}, prompt)
+
             logger.debug(f"用户提示构建完成，最终长度: {len(prompt)} 字符")
             return prompt
 
@@ -213,6 +488,10 @@ class GameActionService:
     
     def _format_equipment_info(self, equipment: Dict[str, Any]) -> str:
         """格式化装备信息"""
+        return self._render_equipment_info(equipment)
+
+    @staticmethod
+    def _render_equipment_info(equipment: Dict[str, Any]) -> str:
         if not equipment:
             return "无装备"
         
@@ -224,7 +503,7 @@ class GameActionService:
         return "\n".join(equipment_lines) if equipment_lines else "无装备"
     
     def _format_npc_info(self, npcs: Dict[str, Any]) -> str:
-        """格式化NPC信息，包含详细信息用于LLM处理"""
+        """格式化NPC名册（每个NPC一行，不随游戏进程变化），完整信息见 _format_npc_states"""
         if not npcs:
             return "暂无NPC信息"
 
@@ -232,114 +511,257 @@ class GameActionService:
         npc_lines.append("## 可操作的NPC列表（只能修改这些NPC的状态，不允许新增NPC）:")
 
         for npc_id, npc_data in npcs.items():
-            name = npc_data.get('name', npc_id)
-            profession = npc_data.get('profession', '未知')
-            relationship = npc_data.get('relationship', 0)
-            age = npc_data.get('age', '未知')
-            gender = npc_data.get('gender', '未知')
+            npc_lines.append(self._render_npc_roster_entry(npc_id, npc_data))
 
-            # 获取NPC属性
-            stats = npc_data.get('stats', {})
-            strength = stats.get('strength', 0)
-            intelligence = stats.get('intelligence', 0)
-            agility = stats.get('agility', 0)
-            luck = stats.get('luck', 0)
+        npc_lines.append("**重要提醒**: 只能修改上述列表中的NPC状态，不允许创建新的NPC或修改未列出的NPC。")
 
-            # 获取描述信息
-            description = npc_data.get('description', '无描述')
+        return "\n".join(npc_lines)
 
-            npc_lines.append(f"- **{npc_id}** ({name})")
-            npc_lines.append(f"  * 职业: {profession}, 年龄: {age}, 性别: {gender}")
-            npc_lines.append(f"  * 属性: 力量{strength}, 智力{intelligence}, 敏捷{agility}, 幸运{luck}")
-            npc_lines.append(f"  * 关系值: {relationship} (-100到100，负数为敌对，正数为友好)")
-            npc_lines.append(f"  * 描述: {description}")
-            npc_lines.append("")
+    @staticmethod
+    def _render_npc_roster_entry(npc_id: str, npc_data: Dict[str, Any]) -> str:
+        name = npc_data.get('name', npc_id)
+        profession = npc_data.get('profession', '未知')
+        return f"- **{npc_id}** ({name}): {profession}"
 
-        npc_lines.append("**重要提醒**: 只能修改上述列表中的NPC状态，不允许创建新的NPC或修改未列出的NPC。")
+    def _format_npc_states(self, npcs: Dict[str, Any], selection: RelevanceSelection) -> str:
+        """格式化与本次行动相关的NPC的完整信息和当前属性，其余NPC只列出非零的关系值"""
+        if not npcs:
+            return "暂无NPC信息"
 
+        templates = self._get_npc_templates() if selection.npc_ids else {}
+        npc_lines = []
+        for npc_id in selection.npc_ids:
+            npc_data = npcs[npc_id]
+            stats = npc_data.get('stats', {})
+            relationship = npc_data.get('relationship', 0)
+            npc_lines.append(f"- {npc_id}: 力量{stats.get('strength', 0)}, 智力{stats.get('intelligence', 0)}, "
+                             f"敏捷{stats.get('agility', 0)}, 幸运{stats.get('luck', 0)}, 关系值{relationship}")
+            # 游戏状态中的NPC不保存描述，使用NPC模板中的描述
+            profile = {key: npc_data.get(key) for key in ('name', 'age', 'gender')}
+            profile['description'] = npc_data.get('description') or templates.get(npc_id, {}).get('description')
+            npc_lines.append(self._render_npc_profile(profile))
+
+        if not npc_lines:
+            npc_lines.append("本次行动未涉及特定NPC")
+
+        selected = set(selection.npc_ids)
+        others = [f"{npc_id} {npc_data.get('relationship', 0)}" for npc_id, npc_data in npcs.items()
+                  if npc_id not in selected and npc_data.get('relationship', 0)]
+        if len(selected) < len(npcs):
+            npc_lines.append(f"- 其他NPC的关系值: {', '.join(others)}（未列出的为0）" if others
+                             else "- 其他NPC的关系值均为0")
+
+        npc_lines.append("（关系值范围-100到100，负数为敌对，正数为友好）")
         return "\n".join(npc_lines)
-    
-    def _format_world_info(self, world: Dict[str, Any]) -> str:
-        """格式化世界信息"""
+
+    @staticmethod
+    def _render_npc_profile(profile: Dict[str, Any]) -> str:
+        return (f"  * {profile['name'] or '未知'}，年龄: {profile['age'] or '未知'}，"
+                f"性别: {profile['gender'] or '未知'}，{profile['description'] or '无描述'}")
+
+    def _get_npc_templates(self) -> Dict[str, Any]:
+        """获取NPC模板，加载失败时返回空字典"""
+        try:
+            return self.resources.get_json(NPC_TEMPLATES)
+        except Exception as e:
+            logger.warning(f"加载NPC模板失败: {e}")
+            return {}
+
+    def _get_npc_templates_version(self) -> Optional[int]:
+        """NPC模板的版本号（NPC描述取自模板），文件不可读时为None"""
+        try:
+            return self.resources.get_version(NPC_TEMPLATES)
+        except OSError:
+            return None
+
+    def _format_world_lore(self, world: Dict[str, Any]) -> str:
+        """格式化世界设定（地点名称和背景，游戏过程中基本不变）"""
+        lore = {key: world[key] for key in WORLD_LORE_KEYS if key in world}
+        location_names = [loc_info.get('name', loc_id) for loc_id, loc_info in world.get('locations', {}).items()]
+        return self._render_world_lore(location_names, lore)
+
+    @staticmethod
+    def _render_world_lore(location_names: List[str], lore: Dict[str, Any]) -> str:
         world_lines = []
-        
-        # 添加地点信息
-        locations = world.get('locations', {})
-        if locations:
-            world_lines.append("- 可访问地点:")
-            for loc_id, loc_info in locations.items():
-                world_lines.append(f"  * {loc_info.get('name', loc_id)}: {loc_info.get('description', '无描述')}")
-        
+
+        # 地点只列名称，相关地点的详细信息在用户提示中
+        if location_names:
+            world_lines.append(f"- 可访问地点: {'、'.join(location_names)}")
+
+        for key, value in lore.items():
+            world_lines.append(f"- {key}: {value}")
+
+        return "\n".join(world_lines) if world_lines else "暂无世界设定"
+
+    def _format_location_details(self, locations: Dict[str, Any], selection: RelevanceSelection) -> str:
+        """格式化与本次行动相关的地点的详细信息"""
+        if not selection.location_ids:
+            return "本次行动未涉及特定地点"
+
+        return "\n".join(
+            self._render_location_detail(location_id, locations[location_id]) for location_id in selection.location_ids
+        )
+
+    @staticmethod
+    def _render_location_detail(location_id: str, location: Dict[str, Any]) -> str:
+        line = f"- {location.get('name', location_id)}: {location.get('description', '无描述')}"
+        services = location.get('available_services')
+        if services:
+            line += f"（可进行: {'、'.join(services)}）"
+        return line
+
+    def _format_world_info(self, world: Dict[str, Any]) -> str:
+        """格式化世界信息（随游戏进程变化的部分）"""
         # 添加其他世界信息
-        for key, value in world.items():
-            if key not in ['current_time', 'weather', 'locations', 'current_day']:
-                world_lines.append(f"- {key}: {value}")
-        
-        return "\n".join(world_lines) if world_lines else ""
+        dynamic = [(key, value) for key, value in world.items()
+                   if key not in ['current_time', 'weather', 'locations', 'current_day'] and key not in WORLD_LORE_KEYS]
+        return "\n".join(f"- {key}: {value}" for key, value in dynamic)
     
-    def _format_history_events(self, history: list) -> str:
-        """格式化历史事件"""
-        if not history:
+    def _format_history_events(self, recent_events: list) -> str:
+        """格式化原文保留的最近历史事件（更早的事件由前情摘要概括）"""
+        if not recent_events:
             return "暂无历史事件"
-        
-        # 只显示最近的5个事件
-        recent_events = history[-5:] if len(history) > 5 else history
-        
-        event_lines = []
-        for i, event in enumerate(recent_events, 1):
-            event_lines.append(f"{i}. {event}")
-        
-        return "\n".join(event_lines)
+
+        return format_history_entries(recent_events)
     
-    def _parse_llm_response(self, llm_response: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """解析LLM响应"""
-        logger.debug("开始解析LLM响应")
+    def _get_response_content(self, llm_response: Dict[str, Any]) -> str:
+        """提取LLM响应中的文本内容，没有内容时返回空字符串"""
+        logger.debug("提取LLM响应内容")
+        choices = llm_response.get('choices', [])
+        logger.debug(f"响应选择数量: {len(choices)}")
+
+        if not choices:
+            logger.error("LLM响应中没有choices")
+            return ""
+
+        content = choices[0].get('message', {}).get('content', '')
+        if not content:
+            logger.error("LLM响应内容为空")
+            logger.debug(f"完整响应结构: {llm_response}")
+        return content
+
+    def _parse_llm_content(self, content: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        解析LLM生成的文本内容，JSON有语法缺陷或被截断时尝试修复
+
+        Returns:
+            Tuple[Optional[Dict[str, Any]], bool]: (解析结果，失败为None；是否经过修复)
+        """
+        if not content:
+            return None, False
+
+        logger.debug(f"LLM原始响应长度: {len(content)} 字符")
+        logger.debug(f"LLM原始响应前500字符: {content[:500]}...")
 
         try:
-            # 提取响应内容
-            logger.debug("提取LLM响应内容")
-            choices = llm_response.get('choices', [])
-            logger.debug(f"响应选择数量: {len(choices)}")
+            return extract_json_object(content), False
+        except JSONExtractionError as e:
+            logger.warning(f"JSON解析失败，尝试修复: {e}")
 
-            if not choices:
-                logger.error("LLM响应中没有choices")
-                return None
+        try:
+            return repair_json(content), True
+        except JSONRepairError as e:
+            logger.error(f"JSON修复失败: {e}")
+            logger.error(f"解析失败的JSON内容: {content[:1000]}...")
+            return None, False
+
+    def _finalize_action_result(self, game_id: str, prepared: Dict[str, Any],
+                                action_result: Optional[Dict[str, Any]], repaired: bool) -> Optional[Dict[str, Any]]:
+        """
+        补全缺失部分并校验推演结果
 
-            message = choices[0].get('message', {})
-            content = message.get('content', '')
+        修复后的输出或补全缺失部分后可用的结果，省去了玩家重新提交时的一次完整LLM调用。
+        """
+        if not action_result:
+            return None
 
-            if not content:
-                logger.error("LLM响应内容为空")
-                logger.debug(f"完整响应结构: {llm_response}")
-                return None
+        action_result, completed = self._complete_missing_sections(game_id, prepared, action_result)
+        action_result = self._validate_action_result(action_result)
 
-            logger.debug(f"LLM原始响应长度: {len(content)} 字符")
-            logger.debug(f"LLM原始响应前500字符: {content[:500]}...")
+        if action_result and (repaired or completed):
+            self.metrics.increment("game_action.llm_calls_saved")
+        return action_result
 
-            # 尝试提取JSON部分
-            logger.debug("尝试提取JSON内容")
-            json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(1)
-                logger.debug("找到JSON代码块")
-            else:
-                # 如果没有代码块，尝试直接解析整个内容
-                json_str = content.strip()
-                logger.debug("未找到JSON代码块，尝试解析整个内容")
+    def _find_missing_sections(self, result: Dict[str, Any]) -> List[str]:
+        """找出推演结果中缺失或格式错误的部分"""
+        missing = [key for key in REQUIRED_RESULT_KEYS if key not in result]
 
-            logger.debug(f"待解析JSON长度: {len(json_str)} 字符")
-            logger.debug(f"待解析JSON前200字符: {json_str[:200]}...")
+        time_progression = result.get('time_progression')
+        if 'time_progression' in result and not isinstance(time_progression, dict):
+            missing.append('time_progression')
+        elif isinstance(time_progression, dict):
+            missing.extend(
+                f"time_progression.{period}" for period in TIME_PERIODS
+                if not isinstance(time_progression.get(period), dict)
+            )
+        return missing
+
+    def _complete_missing_sections(self, game_id: str, prepared: Dict[str, Any],
+                                   result: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """
+        只向模型补问缺失的部分，而不是重新生成整个回合
 
-            # 解析JSON
-            logger.debug("开始JSON解析")
-            result = json.loads(json_str)
+        补问失败、超时或被调度器拒绝时沿用不完整的结果（缺失部分按默认值处理），不让已修复的部分结果变成失败。
+
+        Returns:
+            Tuple[Dict[str, Any], bool]: (推演结果，是否成功补全)
+        """
+        missing = self._find_missing_sections(result)
+        if not missing:
+            return result, False
 
+        logger.warning(f"推演结果缺少: {missing}，向模型补问缺失部分")
+        self.metrics.increment("game_action.section_requests")
+
+        try:
+            followup = self.resources.get_template(MISSING_SECTIONS_PROMPT).format(
+                missing_sections="、".join(missing),
+                partial_result=json.dumps(result, ensure_ascii=False, separators=(',', ':'))
+            )
+            llm_response = self.prompt_prefix_cache.create_chat_completion(
+                game_id,
+                prefix=prepared["system_prompt"],
+                prompt=f"{prepared['user_prompt']}\n\n{followup}",
+                task=TASK_GAME_ACTION
+            )
+            supplement, _ = self._parse_llm_content(self._get_response_content(llm_response))
+            if not supplement:
+                return result, False
+
+        except LLMOverloadedError as e:
+            # 补问被调度器拒绝时不让整个行动失败，缺失部分按默认值处理
+            logger.warning(f"补问缺失部分被调度器拒绝，沿用已修复的结果，缺失部分按默认值处理: {missing}: {e}")
+            self.metrics.increment("game_action.section_requests.rejected")
+            return result, False
+        except Exception as e:
+            logger.error(f"补问缺失部分失败（{type(e).__name__}），沿用已修复的结果，缺失部分按默认值处理: {missing}: {e}")
+            return result, False
+
+        merged = dict(result)
+        for key, value in supplement.items():
+            if key == 'time_progression' and isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key] = {**merged[key], **{period: data for period, data in value.items()
+                                                 if not isinstance(merged[key].get(period), dict)}}
+            elif key not in merged or key in missing:
+                merged[key] = value
+
+        still_missing = self._find_missing_sections(merged)
+        if still_missing:
+            logger.warning(f"补问后仍缺少: {still_missing}")
+            return merged, False
+
+        self.metrics.increment("game_action.section_requests.succeeded")
+        logger.info("缺失部分补全成功")
+        return merged, True
+
+    def _validate_action_result(self, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """校验解析出的推演结果"""
+        try:
             logger.debug("LLM响应解析成功")
             logger.debug(f"解析结果顶级键: {list(result.keys())}")
 
             # 验证必需的键
-            required_keys = ['player_actions', 'time_progression', 'day_summary', 'updated_states']
-            missing_keys = [key for key in required_keys if key not in result]
+            missing_keys = [key for key in REQUIRED_RESULT_KEYS if key not in result]
             if missing_keys:
                 logger.warning(f"解析结果缺少必需键: {missing_keys}")
 
@@ -351,10 +773,6 @@ class GameActionService:
 
             return result
 
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON解析失败: {e}")
-            logger.error(f"解析失败的JSON内容: {json_str[:1000]}...")
-            return None
         except Exception as e:
             logger.error(f"解析LLM响应异常: {e}")
             import traceback
@@ -365,9 +783,7 @@ class GameActionService:
         """验证时间推演格式"""
         logger.debug("验证时间推演格式")
 
-        required_periods = ['morning', 'afternoon', 'evening']
-
-        for period in required_periods:
+        for period in TIME_PERIODS:
             if period not in time_progression:
                 logger.warning(f"时间推演缺少 {period} 时段")
                 continue
@@ -401,76 +817,61 @@ class GameActionService:
         logger.debug("时间推演格式验证完成")
 
     def _validate_npc_data(self, npc_updates: Dict[str, Any]):
-        """验证NPC数据，确保只包含预定义的NPC"""
+        """验证NPC数据，将名称、别名及其书写变体映射为NPC ID，移除无法识别的NPC"""
         logger.debug("验证NPC数据")
 
-        # 加载预定义的NPC列表
-        predefined_npcs = self._get_predefined_npc_ids()
-        logger.debug(f"预定义NPC列表: {predefined_npcs}")
-
+        npc_index = self._get_npc_index()
+        resolved: Dict[str, Any] = {}
         invalid_npcs = []
-        for npc_identifier in npc_updates.keys():
-            # 检查是否为预定义的NPC ID
-            if npc_identifier not in predefined_npcs:
-                # 检查是否为中文名称，尝试映射到NPC ID
-                npc_id = self._find_npc_id_by_name(npc_identifier)
-                if not npc_id:
-                    invalid_npcs.append(npc_identifier)
-                    logger.warning(f"发现未定义的NPC: {npc_identifier}")
+        for npc_identifier, npc_data in npc_updates.items():
+            npc_id = npc_index.resolve(npc_identifier)
+            if not npc_id:
+                invalid_npcs.append(npc_identifier)
+                logger.warning(f"发现未定义的NPC: {npc_identifier}")
+                continue
+
+            if npc_id != npc_identifier:
+                logger.info(f"NPC标识映射: {npc_identifier} -> {npc_id}")
+                self.metrics.increment("game_action.npc_updates.remapped")
+
+            if npc_id not in resolved:
+                resolved[npc_id] = npc_data
+            elif isinstance(resolved[npc_id], dict) and isinstance(npc_data, dict):
+                # 同一NPC以ID和名称各出现一次时合并，以ID为键的更新优先
+                if npc_identifier == npc_id:
+                    resolved[npc_id] = {**resolved[npc_id], **npc_data}
+                else:
+                    resolved[npc_id] = {**npc_data, **resolved[npc_id]}
+            elif npc_identifier == npc_id:
+                resolved[npc_id] = npc_data
 
         if invalid_npcs:
-            logger.warning(f"LLM响应包含未定义的NPC: {invalid_npcs}")
-            # 从更新数据中移除无效的NPC
-            for invalid_npc in invalid_npcs:
-                npc_updates.pop(invalid_npc, None)
-                logger.debug(f"已移除无效NPC: {invalid_npc}")
+            logger.warning(f"LLM响应包含未定义的NPC，已移除: {invalid_npcs}")
+            self.metrics.increment("game_action.npc_updates.dropped", len(invalid_npcs))
 
+        npc_updates.clear()
+        npc_updates.update(resolved)
         logger.debug("NPC数据验证完成")
 
-    def _get_predefined_npc_ids(self) -> set:
-        """获取预定义的NPC ID列表"""
+    def _get_npc_index(self) -> NpcIndex:
+        """获取NPC身份索引，NPC模板加载失败时返回空索引"""
         try:
-            import json
-            import os
-
-            npc_template_path = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)),
-                'resources', 'npc', 'npc_templates.json'
-            )
-
-            with open(npc_template_path, 'r', encoding='utf-8') as file:
-                npc_templates = json.load(file)
-                return set(npc_templates.keys())
+            return get_npc_index()
 
         except Exception as e:
             logger.error(f"加载NPC模板失败: {e}")
-            return set()
-
-    def _find_npc_id_by_name(self, npc_name: str) -> Optional[str]:
-        """通过中文名称查找NPC ID"""
-        try:
-            import json
-            import os
+            return NpcIndex(())
 
-            npc_template_path = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)),
-                'resources', 'npc', 'npc_templates.json'
-            )
-
-            with open(npc_template_path, 'r', encoding='utf-8') as file:
-                npc_templates = json.load(file)
-
-                for npc_id, npc_data in npc_templates.items():
-                    if npc_data.get('name') == npc_name:
-                        return npc_id
-
-                return None
+    def _get_predefined_npc_ids(self) -> frozenset:
+        """获取预定义的NPC ID列表"""
+        return self._get_npc_index().ids
 
-        except Exception as e:
-            logger.error(f"查找NPC ID失败: {e}")
-            return None
+    def _find_npc_id_by_name(self, npc_name: str) -> Optional[str]:
+        """通过中文名称（或别名、书写变体）查找NPC ID"""
+        return self._get_npc_index().resolve(npc_name)
 
-    def _apply_state_changes(self, game_id: str, current_state: Dict[str, Any], action_result: Dict[str, Any]) -> bool:
+    def _apply_state_changes(self, game_id: str, current_state: Dict[str, Any], action_result: Dict[str, Any],
+                             action_id: Optional[str] = None) -> bool:
         """应用状态变化"""
         logger.debug("开始应用状态变化")
 
@@ -505,6 +906,15 @@ class GameActionService:
                 state_updates['world'] = self._merge_world_updates(current_world, updated_world)
                 logger.debug("世界状态合并完成")
 
+            # 记录勇者当天最后所在的地点，供下一次行动选择相关的NPC和地点
+            time_progression = action_result.get('time_progression', {})
+            last_location = next((time_progression[period].get('location') for period in reversed(TIME_PERIODS)
+                                  if isinstance(time_progression.get(period), dict)
+                                  and isinstance(time_progression[period].get('location'), str)
+                                  and time_progression[period].get('location')), None)
+            if last_location:
+                state_updates.setdefault('world', {})['current_location'] = last_location
+
             # 更新NPC状态
             if 'npcs' in updated_states:
                 logger.debug("处理NPC状态更新")
@@ -527,7 +937,20 @@ class GameActionService:
                 history.append(new_history_entry)
                 logger.debug(f"添加历史记录: {new_history_entry[:100]}...")
 
+            # 已并入前情摘要的旧记录按配置移入冷存储
+            history, memory_updates = self.history_memory.archive(game_id, current_state, history)
             state_updates['history'] = history
+            if memory_updates:
+                state_updates['history_memory'] = memory_updates
+
+            # 当天的行动已完成，清除分时段推演的进行中进度
+            if current_state.get(ACTION_PROGRESS_KEY):
+                state_updates[ACTION_PROGRESS_KEY] = None
+
+            # 行动ID与状态变化一起保存，不会出现状态已更新而行动未记录的情况
+            if action_id:
+                applied = list(current_state.get(APPLIED_ACTIONS_KEY) or []) + [action_id]
+                state_updates[APPLIED_ACTIONS_KEY] = applied[-MAX_APPLIED_ACTIONS:]
             logger.debug(f"历史记录总数: {len(history)}")
 
             # 应用更新
@@ -538,6 +961,9 @@ class GameActionService:
 
             if success:
                 logger.debug("状态变化应用成功")
+                # 滑出原文窗口的记录在后台并入前情摘要，不占用本次请求的时间
+                memory = {**(current_state.get('history_memory') or {}), **state_updates.get('history_memory', {})}
+                self.history_memory.schedule_summary(game_id, {"history": history, "history_memory": memory})
             else:
                 logger.error("状态变化应用失败")
 
@@ -584,26 +1010,13 @@ class GameActionService:
     def _merge_npc_updates(self, current_npcs: Dict[str, Any], npc_updates: Dict[str, Any]) -> Dict[str, Any]:
         """合并NPC状态更新，只允许更新预定义的NPC"""
         merged = current_npcs.copy()
-
-        # 获取预定义的NPC ID列表
-        predefined_npcs = self._get_predefined_npc_ids()
-        logger.debug(f"预定义NPC列表: {predefined_npcs}")
-
-        # 创建中文名称到NPC ID的映射
-        name_to_id_mapping = {}
-        for npc_id, npc_data in current_npcs.items():
-            if isinstance(npc_data, dict) and 'name' in npc_data:
-                name_to_id_mapping[npc_data['name']] = npc_id
-
-        logger.debug(f"NPC名称映射: {name_to_id_mapping}")
+        npc_index = self._get_npc_index()
 
         for npc_identifier, npc_data in npc_updates.items():
-            # 尝试通过中文名称找到对应的NPC ID
-            target_npc_id = name_to_id_mapping.get(npc_identifier, npc_identifier)
-
-            # 验证NPC是否为预定义的NPC
-            if target_npc_id not in predefined_npcs:
-                logger.warning(f"尝试更新未定义的NPC: {npc_identifier} (映射到: {target_npc_id})")
+            # 通过ID、中文名称或别名找到对应的预定义NPC
+            target_npc_id = npc_index.resolve(npc_identifier)
+            if not target_npc_id:
+                logger.warning(f"尝试更新未定义的NPC: {npc_identifier}")
                 logger.warning(f"忽略此NPC更新，只允许更新预定义的NPC")
                 continue
 
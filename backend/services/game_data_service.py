@@ -3,6 +3,8 @@
 提供游戏状态管理、数据操作等高级功能
 """
 
+import threading
+import weakref
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 
@@ -12,6 +14,9 @@ from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 游戏状态的修订号，每次 update_game_state 保存时加一，提示分段缓存据此判断状态是否变化
+STATE_REVISION_KEY = 'state_revision'
+
 
 class GameDataService:
     """游戏数据服务类"""
@@ -19,7 +24,19 @@ class GameDataService:
     def __init__(self):
         """初始化游戏数据服务"""
         self.session_service = get_session_service()
+        # 每局游戏一把锁，保证状态的读取-合并-保存不与后台任务（如历史摘要）的写入交错；
+        # 只保存弱引用，没有调用方持有时锁随之回收，删除或过期清理的游戏不会一直占用
+        self._state_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        self._state_locks_lock = threading.Lock()
         logger.info("游戏数据服务初始化完成")
+
+    def _get_state_lock(self, game_id: str) -> threading.Lock:
+        """获取游戏状态的写锁"""
+        with self._state_locks_lock:
+            lock = self._state_locks.get(game_id)
+            if lock is None:
+                lock = self._state_locks[game_id] = threading.Lock()
+            return lock
     
     def create_new_game(self, initial_data: Dict[str, Any]) -> Optional[str]:
         """
@@ -121,38 +138,40 @@ class GameDataService:
         logger.debug(f"状态更新键: {list(state_updates.keys())}")
 
         try:
-            # 获取当前游戏数据
-            logger.debug("获取当前游戏数据")
-            game_data = self.session_service.get_session_data(game_id)
-            if not game_data:
-                logger.error(f"无法获取游戏数据: {game_id}")
-                return False
-
-            logger.debug(f"当前游戏数据获取成功，数据键: {list(game_data.keys())}")
-
-            # 合并状态更新
-            current_state = game_data.get("game_state", {})
-            logger.debug(f"当前状态键: {list(current_state.keys())}")
-            logger.debug("开始合并状态更新")
-
-            updated_state = merge_game_state_updates(current_state, state_updates)
-            logger.debug(f"状态合并完成，更新后状态键: {list(updated_state.keys())}")
-
-            # 更新游戏数据
-            game_data["game_state"] = updated_state
-            logger.debug("游戏数据中的状态已更新")
-
-            # 保存更新后的数据
-            logger.debug("保存更新后的游戏数据")
-            success = self.session_service.update_session_data(game_id, game_data)
-
-            if success:
-                logger.debug(f"游戏状态更新成功: {game_id}")
-                logger.debug(f"更新后天数: {updated_state.get('day', '未知')}")
-            else:
-                logger.error(f"游戏状态更新失败: {game_id}")
+            with self._get_state_lock(game_id):
+                # 获取当前游戏数据
+                logger.debug("获取当前游戏数据")
+                game_data = self.session_service.get_session_data(game_id)
+                if not game_data:
+                    logger.error(f"无法获取游戏数据: {game_id}")
+                    return False
+
+                logger.debug(f"当前游戏数据获取成功，数据键: {list(game_data.keys())}")
+
+                # 合并状态更新
+                current_state = game_data.get("game_state", {})
+                logger.debug(f"当前状态键: {list(current_state.keys())}")
+                logger.debug("开始合并状态更新")
+
+                updated_state = merge_game_state_updates(current_state, state_updates)
+                updated_state[STATE_REVISION_KEY] = current_state.get(STATE_REVISION_KEY, 0) + 1
+                logger.debug(f"状态合并完成，更新后状态键: {list(updated_state.keys())}")
+
+                # 更新游戏数据
+                game_data["game_state"] = updated_state
+                logger.debug("游戏数据中的状态已更新")
+
+                # 保存更新后的数据
+                logger.debug("保存更新后的游戏数据")
+                success = self.session_service.update_session_data(game_id, game_data)
+
+                if success:
+                    logger.debug(f"游戏状态更新成功: {game_id}")
+                    logger.debug(f"更新后天数: {updated_state.get('day', '未知')}")
+                else:
+                    logger.error(f"游戏状态更新失败: {game_id}")
 
-            return success
+                return success
 
         except Exception as e:
             logger.error(f"更新游戏状态异常 {game_id}: {e}")
@@ -0,0 +1,381 @@
+"""
+分层历史记忆
+游戏状态中的 history 每次行动追加一整天的叙述。提示中只原文保留最近几条记录，
+更早的记录由后台的低成本LLM调用滚动压缩为前情摘要，使提示中的长期上下文大小有上限；
+可选地把已摘要的原始记录移入冷存储（按游戏ID的JSONL归档文件），不再随游戏状态读写。
+
+游戏状态中的 history_memory 字段：
+    summary    - 前情摘要
+    summarized - 摘要已覆盖的记录条数（从第一条起算，包括已归档的记录）
+    archived   - 已移入冷存储的记录条数，history 列表的第一条即第 archived + 1 条记录
+"""
+
+import os
+import json
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm.scheduler import get_llm_scheduler, PRIORITY_BACKGROUND
+from llm.model_routing import TASK_HISTORY_SUMMARY
+from services.file_storage_service import get_storage_service
+from utils.resource_registry import get_resource_registry
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 游戏状态中记录摘要进度的字段
+MEMORY_KEY = 'history_memory'
+
+# 摘要提示模板（由资源注册表加载）
+HISTORY_SUMMARY_PROMPT = 'prompts/history_summary_prompt.txt'
+
+# 原文保留的最近记录条数与摘要的最大字数
+DEFAULT_RECENT_WINDOW = 5
+DEFAULT_SUMMARY_MAX_CHARS = 800
+
+
+def get_history_memory_state(game_state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    读取游戏状态中的摘要进度，缺失或格式错误的字段取默认值
+
+    Args:
+        game_state (Dict[str, Any]): 游戏状态
+
+    Returns:
+        Dict[str, Any]: summary、summarized、archived
+    """
+    memory = game_state.get(MEMORY_KEY)
+    if not isinstance(memory, dict):
+        memory = {}
+    summary = memory.get('summary')
+    return {
+        "summary": summary if isinstance(summary, str) else "",
+        "summarized": max(0, int(memory.get('summarized') or 0)),
+        "archived": max(0, int(memory.get('archived') or 0))
+    }
+
+
+def get_history_length(game_state: Dict[str, Any]) -> int:
+    """
+    获取历史记录总条数（包括已移入冷存储的记录）
+
+    Args:
+        game_state (Dict[str, Any]): 游戏状态
+
+    Returns:
+        int: 记录总条数
+    """
+    return get_history_memory_state(game_state)["archived"] + len(game_state.get('history', []))
+
+
+def select_recent_history(history: List[str], memory: Dict[str, Any],
+                          recent_window: int = DEFAULT_RECENT_WINDOW) -> List[str]:
+    """
+    选择提示中原文保留的记录
+
+    没有摘要时保留最近 recent_window 条；有摘要时从摘要覆盖范围之后开始保留，
+    摘要落后（后台摘要尚未完成）时最多保留 2 × recent_window 条，保证提示大小有上限。
+
+    Args:
+        history (List[str]): 游戏状态中的历史记录
+        memory (Dict[str, Any]): get_history_memory_state 的结果
+        recent_window (int): 原文保留的最近记录条数
+
+    Returns:
+        List[str]: 原文保留的记录
+    """
+    recent_window = max(1, recent_window)
+    if not memory["summary"]:
+        return history[-recent_window:]
+
+    covered = memory["summarized"] - memory["archived"]
+    start = max(min(covered, len(history) - recent_window), len(history) - 2 * recent_window, 0)
+    return history[start:]
+
+
+def format_history_entries(entries: List[str]) -> str:
+    """按序号逐行格式化历史记录"""
+    return "\n".join(f"{i}. {event}" for i, event in enumerate(entries, 1))
+
+
+def format_history_summary(summary: str) -> str:
+    """格式化提示中的前情摘要行"""
+    return f"前情摘要: {summary}" if summary else ""
+
+
+class HistoryMemory:
+    """分层历史记忆服务"""
+
+    def __init__(self, recent_window: int = DEFAULT_RECENT_WINDOW,
+                 summary_max_chars: int = DEFAULT_SUMMARY_MAX_CHARS,
+                 cold_storage: bool = False, archive_dir: Optional[str] = None, max_workers: int = 2):
+        """
+        初始化历史记忆服务
+
+        Args:
+            recent_window (int): 提示中原文保留的最近记录条数
+            summary_max_chars (int): 前情摘要的最大字数
+            cold_storage (bool): 是否把已摘要的记录移入冷存储
+            archive_dir (Optional[str]): 冷存储目录，None 表示数据目录下的 history
+            max_workers (int): 后台摘要线程数
+        """
+        self.recent_window = max(1, recent_window)
+        self.summary_max_chars = max(100, summary_max_chars)
+        self.cold_storage = cold_storage
+        self.archive_dir = archive_dir or os.path.join(get_storage_service().base_dir, 'history')
+
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._archive_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='history-summary')
+        self.resources = get_resource_registry()
+        self.metrics = get_metrics()
+        logger.info(f"历史记忆服务初始化完成，原文窗口: {self.recent_window}条，冷存储: {self.cold_storage}")
+
+    def build_prompt_sections(self, game_state: Dict[str, Any]) -> Tuple[str, List[str]]:
+        """
+        获取提示中的前情摘要和原文保留的记录
+
+        Args:
+            game_state (Dict[str, Any]): 游戏状态
+
+        Returns:
+            Tuple[str, List[str]]: (前情摘要, 原文保留的记录)
+        """
+        memory = get_history_memory_state(game_state)
+        history = game_state.get('history', [])
+        return memory["summary"], select_recent_history(history, memory, self.recent_window)
+
+    def _pending_range(self, game_state: Dict[str, Any]) -> Tuple[int, int]:
+        """需要并入摘要的记录范围（按总序号，左闭右开）：摘要覆盖范围之后、原文窗口之前"""
+        memory = get_history_memory_state(game_state)
+        end = get_history_length(game_state) - self.recent_window
+        return max(memory["summarized"], memory["archived"]), end
+
+    def needs_summary(self, game_state: Dict[str, Any]) -> bool:
+        """是否有滑出原文窗口、尚未并入摘要的记录"""
+        start, end = self._pending_range(game_state)
+        return end > start
+
+    def schedule_summary(self, game_id: str, game_state: Optional[Dict[str, Any]] = None) -> Optional[Future]:
+        """
+        需要时在后台更新前情摘要，同一局游戏同时只有一个摘要任务
+
+        Args:
+            game_id (str): 游戏ID
+            game_state (Optional[Dict[str, Any]]): 最新的游戏状态，用于判断是否需要摘要；None 时直接提交
+
+        Returns:
+            Optional[Future]: 摘要任务（结果为是否更新了摘要），无需摘要时返回None
+        """
+        if game_state is not None and not self.needs_summary(game_state):
+            return None
+
+        with self._lock:
+            future = self._in_flight.get(game_id)
+            if future is not None:
+                self.metrics.increment("history_memory.deduplicated")
+                return future
+            future = self._in_flight[game_id] = Future()
+
+        self.metrics.increment("history_memory.scheduled")
+        self._executor.submit(contextvars.copy_context().run, self._run, game_id, future)
+        return future
+
+    def _run(self, game_id: str, future: Future):
+        """在后台线程中更新摘要，使用后台优先级，不与玩家交互请求争抢"""
+        try:
+            with get_llm_scheduler().request_context(PRIORITY_BACKGROUND, game_id=game_id):
+                updated = self.update_summary(game_id)
+        except Exception as e:
+            self.metrics.increment("history_memory.failed")
+            logger.warning(f"更新前情摘要失败 {game_id}: {e}")
+            self._finish(game_id, future)
+            future.set_exception(e)
+            return
+        self._finish(game_id, future)
+        future.set_result(updated)
+
+    def _finish(self, game_id: str, future: Future):
+        """任务结束前移出进行中列表，等待结果的调用方随后可以提交新的摘要任务"""
+        with self._lock:
+            if self._in_flight.get(game_id) is future:
+                del self._in_flight[game_id]
+
+    def update_summary(self, game_id: str) -> bool:
+        """
+        把滑出原文窗口的记录并入前情摘要
+
+        Args:
+            game_id (str): 游戏ID
+
+        Returns:
+            bool: 是否更新了摘要
+
+        Raises:
+            Exception: LLM调用失败
+        """
+        from services.game_data_service import get_game_data_service
+
+        game_data_service = get_game_data_service()
+        game_state = game_data_service.get_game_state(game_id)
+        if not game_state:
+            return False
+
+        start, end = self._pending_range(game_state)
+        if end <= start:
+            return False
+
+        memory = get_history_memory_state(game_state)
+        history = game_state.get('history', [])
+        new_entries = history[start - memory["archived"]:end - memory["archived"]]
+        if not new_entries:
+            return False
+
+        summary = self._summarize(memory["summary"], new_entries)
+        if not summary:
+            self.metrics.increment("history_memory.empty")
+            return False
+
+        # 只写入摘要字段，深度合并保留期间可能由行动写入的 archived
+        success = game_data_service.update_game_state(game_id, {
+            MEMORY_KEY: {"summary": summary, "summarized": end}
+        })
+        if success:
+            self.metrics.increment("history_memory.summarized_entries", len(new_entries))
+            logger.info(f"前情摘要已更新 {game_id}: 覆盖前 {end} 条记录，摘要 {len(summary)} 字")
+        return success
+
+    def _summarize(self, previous_summary: str, new_entries: List[str]) -> str:
+        """调用LLM把新记录并入已有摘要"""
+        from llm.chat import create_chat_completion
+
+        prompt = self.resources.get_template(HISTORY_SUMMARY_PROMPT).format(
+            previous_summary=previous_summary or "（暂无）",
+            new_entries="\n".join(new_entries),
+            max_chars=self.summary_max_chars
+        )
+        with self.metrics.timer("history_memory.summary_latency"):
+            response = create_chat_completion(prompt, task=TASK_HISTORY_SUMMARY)
+        content = response.get('choices', [{}])[0].get('message', {}).get('content', '') or ''
+        # 模型偶尔超出字数要求，截断保证提示大小有上限
+        return content.strip()[:self.summary_max_chars]
+
+    def archive(self, game_id: str, game_state: Dict[str, Any], history: List[str]) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        把已并入摘要且不在原文窗口内的记录移入冷存储（未启用冷存储时原样返回）
+
+        Args:
+            game_id (str): 游戏ID
+            game_state (Dict[str, Any]): 当前游戏状态（用于读取摘要进度）
+            history (List[str]): 即将写入的历史记录
+
+        Returns:
+            Tuple[List[str], Dict[str, Any]]: (保留在游戏状态中的记录, 需要合并到 history_memory 的字段)
+        """
+        if not self.cold_storage:
+            return history, {}
+
+        memory = get_history_memory_state(game_state)
+        archived = memory["archived"]
+        end = min(memory["summarized"], archived + len(history) - self.recent_window)
+        count = end - archived
+        if count <= 0:
+            return history, {}
+
+        try:
+            self._append_archive(game_id, archived, history[:count])
+        except OSError as e:
+            logger.warning(f"写入历史记录冷存储失败，记录保留在游戏状态中 {game_id}: {e}")
+            return history, {}
+
+        self.metrics.increment("history_memory.archived_entries", count)
+        logger.info(f"已将 {count} 条历史记录移入冷存储 {game_id}")
+        return history[count:], {"archived": end}
+
+    def _archive_path(self, game_id: str) -> str:
+        return os.path.join(self.archive_dir, f"{game_id}.jsonl")
+
+    def _append_archive(self, game_id: str, first_index: int, entries: List[str]):
+        """追加归档记录，每行记录总序号，重复写入（如状态保存失败后重试）在读取时去重"""
+        with self._archive_lock:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            with open(self._archive_path(game_id), 'a', encoding='utf-8') as file:
+                for offset, entry in enumerate(entries):
+                    file.write(json.dumps({"index": first_index + offset, "entry": entry}, ensure_ascii=False) + "\n")
+
+    def load_full_history(self, game_id: str, game_state: Dict[str, Any]) -> List[str]:
+        """
+        获取完整的历史记录（冷存储中的记录加上游戏状态中的记录）
+
+        Args:
+            game_id (str): 游戏ID
+            game_state (Dict[str, Any]): 游戏状态
+
+        Returns:
+            List[str]: 按时间顺序的全部记录
+        """
+        history = list(game_state.get('history', []))
+        archived = get_history_memory_state(game_state)["archived"]
+        if not archived:
+            return history
+
+        entries: Dict[int, str] = {}
+        try:
+            with self._archive_lock, open(self._archive_path(game_id), 'r', encoding='utf-8') as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record.get("index", archived) < archived:
+                        entries[record["index"]] = record.get("entry", "")
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取历史记录冷存储失败 {game_id}: {e}")
+
+        if len(entries) < archived:
+            logger.warning(f"冷存储中的历史记录不完整 {game_id}: {len(entries)}/{archived}")
+        return [entries[index] for index in sorted(entries)] + history
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取历史记忆统计
+
+        Returns:
+            Dict[str, Any]: 配置和进行中的摘要任务数
+        """
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {
+            "recent_window": self.recent_window,
+            "summary_max_chars": self.summary_max_chars,
+            "cold_storage": self.cold_storage,
+            "in_flight": in_flight
+        }
+
+
+# 全局历史记忆服务实例
+_history_memory = None
+_history_memory_lock = threading.Lock()
+
+
+def get_history_memory() -> HistoryMemory:
+    """
+    获取全局历史记忆服务实例
+
+    Returns:
+        HistoryMemory: 历史记忆服务实例
+    """
+    global _history_memory
+    if _history_memory is None:
+        with _history_memory_lock:
+            if _history_memory is None:
+                _history_memory = HistoryMemory(
+                    recent_window=int(os.environ.get('HISTORY_RECENT_WINDOW', DEFAULT_RECENT_WINDOW)),
+                    summary_max_chars=int(os.environ.get('HISTORY_SUMMARY_MAX_CHARS', DEFAULT_SUMMARY_MAX_CHARS)),
+                    cold_storage=os.environ.get('HISTORY_COLD_STORAGE', '0').lower() in ('1', 'true', 'yes')
+                )
+                get_metrics().register_collector("history_memory", _history_memory.get_stats)
+    return _history_memory
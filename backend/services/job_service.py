@@ -0,0 +1,374 @@
+"""
+异步任务服务
+把耗时的LLM处理（玩家行动、剧情推演）放到后台工作线程池中执行，
+客户端通过任务ID轮询或订阅任务状态，不必在整个LLM调用期间占用HTTP连接。
+
+任务记录保存在磁盘上的任务表中（每个任务一个JSON文件），服务重启后未完成的任务会重新排队执行。
+多个工作进程共享任务表时，每个任务由持有租约的进程执行：租约是任务旁的 .lease 文件，
+持有者定期更新其修改时间作为心跳，只有租约过期（持有者已退出）的任务才会被其他进程恢复。
+"""
+
+import os
+import time
+import uuid
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Set
+
+from utils.file_utils import atomic_write_file, safe_read_file, delete_file, ensure_directory_exists
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+# 默认工作线程数与已完成任务的保留时间（秒）
+DEFAULT_JOB_WORKERS = 8
+DEFAULT_JOB_RETENTION = 24 * 3600
+
+# 任务租约的过期时间（秒），持有者每隔三分之一过期时间续约一次
+DEFAULT_JOB_LEASE_TIMEOUT = 30.0
+
+
+class JobFailedError(Exception):
+    """任务处理失败，message 作为任务的错误信息返回给客户端"""
+
+
+class JobService:
+    """异步任务服务类"""
+
+    def __init__(self, jobs_dir: str = "backend/data/jobs", max_workers: int = DEFAULT_JOB_WORKERS,
+                 lease_timeout: float = DEFAULT_JOB_LEASE_TIMEOUT):
+        """
+        初始化异步任务服务
+
+        Args:
+            jobs_dir (str): 任务表目录
+            max_workers (int): 工作线程数
+            lease_timeout (float): 任务租约的过期时间（秒）
+        """
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self.lease_timeout = lease_timeout
+        # 租约持有者标识，区分同一任务表上的不同进程和服务实例
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        ensure_directory_exists(jobs_dir)
+
+        self._leases: Set[str] = set()
+        self._leases_lock = threading.Lock()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._condition = threading.Condition()
+        self.metrics = get_metrics()
+
+        logger.info(f"异步任务服务初始化完成，任务目录: {jobs_dir}，工作线程: {max_workers}")
+
+    def register_handler(self, job_type: str, handler: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """
+        注册任务处理函数
+
+        处理函数接收任务参数，返回任务结果；抛出 JobFailedError 表示处理失败。
+
+        Args:
+            job_type (str): 任务类型，如 game_action、story_progress
+            handler (Callable): 处理函数
+        """
+        self._handlers[job_type] = handler
+
+    def submit_job(self, job_type: str, params: Dict[str, Any], game_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        提交任务
+
+        Args:
+            job_type (str): 任务类型
+            params (Dict[str, Any]): 任务参数（需可JSON序列化）
+            game_id (Optional[str]): 关联的游戏ID
+
+        Returns:
+            Dict[str, Any]: 任务记录
+        """
+        if job_type not in self._handlers:
+            raise ValueError(f"未注册的任务类型: {job_type}")
+
+        now = datetime.now().isoformat()
+        job_id = f"job_{uuid.uuid4().hex}"
+        # 先取得租约再写入任务表，其他进程恢复任务时不会把刚提交的任务当作无主任务
+        self._acquire_lease(job_id)
+        job = {
+            "job_id": job_id,
+            "type": job_type,
+            "game_id": game_id,
+            "status": JOB_QUEUED,
+            "params": params,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        self._save_job(job)
+        self.metrics.increment(f"jobs.submitted.{job_type}")
+
+        logger.info(f"提交异步任务: {job['job_id']}，类型: {job_type}，游戏: {game_id}")
+        self._executor.submit(self._run_job, job["job_id"])
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取任务记录
+
+        Args:
+            job_id (str): 任务ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 任务记录，不存在返回None
+        """
+        if not self._is_valid_job_id(job_id):
+            return None
+        file_path = self._get_job_path(job_id)
+        if not os.path.exists(file_path):
+            return None
+        return safe_read_file(file_path)
+
+    def wait_for_update(self, job_id: str, last_updated_at: Optional[str], timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        等待任务状态变化
+
+        Args:
+            job_id (str): 任务ID
+            last_updated_at (Optional[str]): 调用方已知的最后更新时间
+            timeout (float): 最长等待时间（秒）
+
+        Returns:
+            Optional[Dict[str, Any]]: 最新的任务记录
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                job = self.get_job(job_id)
+                if job is None or job.get("updated_at") != last_updated_at:
+                    return job
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return job
+                self._condition.wait(remaining)
+
+    def resume_pending_jobs(self) -> int:
+        """
+        重新排队服务重启前未完成的任务
+
+        只恢复没有租约或租约已过期的任务，仍由其他存活进程执行的任务保持不变。
+
+        Returns:
+            int: 重新排队的任务数
+        """
+        resumed = 0
+        for filename in os.listdir(self.jobs_dir):
+            if not filename.endswith('.json'):
+                continue
+            job = safe_read_file(os.path.join(self.jobs_dir, filename))
+            if not job or job.get("status") in FINISHED_STATUSES:
+                continue
+            if job.get("type") not in self._handlers:
+                logger.warning(f"任务类型未注册，无法恢复: {job.get('job_id')}")
+                continue
+            if not self._acquire_lease(job["job_id"]):
+                logger.debug(f"任务由其他进程执行中，跳过: {job['job_id']}")
+                continue
+
+            self._update_job(job, status=JOB_QUEUED)
+            self._executor.submit(self._run_job, job["job_id"])
+            resumed += 1
+
+        if resumed:
+            logger.info(f"重新排队 {resumed} 个未完成的异步任务")
+        return resumed
+
+    def purge_finished_jobs(self, max_age_seconds: int = DEFAULT_JOB_RETENTION) -> int:
+        """
+        删除已完成且超过保留时间的任务记录
+
+        Args:
+            max_age_seconds (int): 保留时间（秒）
+
+        Returns:
+            int: 删除的任务数
+        """
+        deleted_count = 0
+        now = time.time()
+        for filename in os.listdir(self.jobs_dir):
+            if not filename.endswith('.json'):
+                continue
+            file_path = os.path.join(self.jobs_dir, filename)
+            job = safe_read_file(file_path)
+            if job and job.get("status") not in FINISHED_STATUSES:
+                continue
+            if now - os.path.getmtime(file_path) > max_age_seconds and delete_file(file_path):
+                deleted_count += 1
+
+        logger.info(f"异步任务清理完成，删除了 {deleted_count} 个任务记录")
+        return deleted_count
+
+    @staticmethod
+    def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+        """返回给客户端的任务信息（不含任务参数）"""
+        return {key: value for key, value in job.items() if key != "params"}
+
+    def _run_job(self, job_id: str):
+        """在工作线程中执行任务，结束后释放租约"""
+        try:
+            self._execute_job(job_id)
+        finally:
+            self._release_lease(job_id)
+
+    def _execute_job(self, job_id: str):
+        job = self.get_job(job_id)
+        if not job or job.get("status") in FINISHED_STATUSES:
+            return
+
+        handler = self._handlers[job["type"]]
+        queued_at = datetime.fromisoformat(job["updated_at"])
+        self.metrics.observe("jobs.queue_time", (datetime.now() - queued_at).total_seconds())
+
+        job = self._update_job(job, status=JOB_RUNNING)
+        start_time = time.perf_counter()
+        logger.info(f"开始执行异步任务: {job_id}")
+
+        try:
+            result = handler(job["params"])
+            self._update_job(job, status=JOB_SUCCEEDED, result=result)
+            self.metrics.increment(f"jobs.succeeded.{job['type']}")
+            logger.info(f"异步任务完成: {job_id}，耗时: {time.perf_counter() - start_time:.2f}秒")
+        except JobFailedError as e:
+            self._update_job(job, status=JOB_FAILED, error=str(e))
+            self.metrics.increment(f"jobs.failed.{job['type']}")
+            logger.warning(f"异步任务失败: {job_id}，{e}")
+        except Exception as e:
+            self._update_job(job, status=JOB_FAILED, error=str(e))
+            self.metrics.increment(f"jobs.failed.{job['type']}")
+            logger.error(f"异步任务异常: {job_id}，{e}")
+            import traceback
+            logger.debug(f"异常堆栈: {traceback.format_exc()}")
+        finally:
+            self.metrics.observe(f"jobs.run_time.{job['type']}", time.perf_counter() - start_time)
+
+    def _update_job(self, job: Dict[str, Any], **changes) -> Dict[str, Any]:
+        """更新任务记录并通知等待者"""
+        job = {**job, **changes, "updated_at": datetime.now().isoformat()}
+        self._save_job(job)
+        with self._condition:
+            self._condition.notify_all()
+        return job
+
+    def _acquire_lease(self, job_id: str) -> bool:
+        """
+        取得任务租约
+
+        租约文件以独占方式创建；已存在但超过过期时间未续约时，先原子地改名移走再重新创建，
+        多个进程同时接管同一个过期租约时只有一个改名成功。
+
+        Returns:
+            bool: 是否取得租约
+        """
+        lease_path = self._get_lease_path(job_id)
+        try:
+            age = time.time() - os.path.getmtime(lease_path)
+        except FileNotFoundError:
+            age = None
+        if age is not None:
+            if age < self.lease_timeout:
+                return False
+            stale_path = f"{lease_path}.{uuid.uuid4().hex}"
+            try:
+                os.rename(lease_path, stale_path)
+            except FileNotFoundError:
+                return False
+            delete_file(stale_path)
+            logger.info(f"任务租约已过期，接管任务: {job_id}")
+
+        try:
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(self.owner_id)
+
+        with self._leases_lock:
+            self._leases.add(job_id)
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = threading.Thread(
+                    target=self._heartbeat_loop, name='job-lease-heartbeat', daemon=True
+                )
+                self._heartbeat_thread.start()
+        return True
+
+    def _release_lease(self, job_id: str):
+        with self._leases_lock:
+            self._leases.discard(job_id)
+        try:
+            os.remove(self._get_lease_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _heartbeat_loop(self):
+        """定期续约本进程持有的所有任务租约"""
+        while True:
+            time.sleep(self.lease_timeout / 3)
+            with self._leases_lock:
+                job_ids = list(self._leases)
+            for job_id in job_ids:
+                try:
+                    os.utime(self._get_lease_path(job_id))
+                except FileNotFoundError:
+                    with self._leases_lock:
+                        if job_id in self._leases:
+                            logger.warning(f"任务租约丢失: {job_id}")
+
+    def _save_job(self, job: Dict[str, Any]):
+        if not atomic_write_file(self._get_job_path(job["job_id"]), job):
+            logger.error(f"保存任务记录失败: {job['job_id']}")
+
+    def _get_job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _get_lease_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.lease")
+
+    @staticmethod
+    def _is_valid_job_id(job_id: str) -> bool:
+        """任务ID只允许 job_ 前缀加十六进制字符，防止路径穿越"""
+        return bool(job_id) and job_id.startswith("job_") and all(
+            c in "0123456789abcdef" for c in job_id[4:]
+        ) and len(job_id) == 36
+
+
+# 全局异步任务服务实例
+_job_service = None
+_job_service_lock = threading.Lock()
+
+
+def get_job_service() -> JobService:
+    """
+    获取全局异步任务服务实例
+
+    Returns:
+        JobService: 异步任务服务实例
+    """
+    global _job_service
+    if _job_service is None:
+        with _job_service_lock:
+            if _job_service is None:
+                max_workers = int(os.environ.get('JOB_WORKERS', DEFAULT_JOB_WORKERS))
+                lease_timeout = float(os.environ.get('JOB_LEASE_TIMEOUT', DEFAULT_JOB_LEASE_TIMEOUT))
+                _job_service = JobService(max_workers=max_workers, lease_timeout=lease_timeout)
+    return _job_service
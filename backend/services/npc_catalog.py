@@ -0,0 +1,125 @@
+"""
+NPC目录
+由NPC模板构建一次的不可变目录，保存每个NPC序列化后的初始数据和ID索引；
+NPC接口直接读取目录，创建新游戏时复制一份作为游戏状态中的NPC，不再每次读取模板并构建NPC对象
+"""
+
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple
+
+from models import NPC
+from services.npc_index import NPC_TEMPLATES
+from utils.resource_registry import get_resource_registry, freeze, thaw
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class NpcCatalog:
+    """不可变的NPC目录"""
+
+    __slots__ = ('_npcs',)
+
+    def __init__(self, npcs: Mapping[str, Mapping[str, Any]]):
+        """
+        初始化目录
+
+        Args:
+            npcs (Mapping[str, Mapping[str, Any]]): NPC ID -> 不可变的NPC数据（与 NPC.to_dict() 格式相同）
+        """
+        self._npcs = MappingProxyType(dict(npcs))
+
+    @classmethod
+    def from_templates(cls, templates: Mapping[str, Any]) -> 'NpcCatalog':
+        """
+        由NPC模板构建目录，格式错误的模板跳过并记录日志
+
+        Args:
+            templates (Mapping[str, Any]): 不可变的NPC模板数据
+
+        Returns:
+            NpcCatalog: NPC目录
+        """
+        npcs = {}
+        for npc_id, npc_data in templates.items():
+            try:
+                npc = NPC(
+                    name=npc_data['name'],
+                    age=npc_data['age'],
+                    gender=npc_data['gender'],
+                    profession=npc_data['profession']
+                )
+                for stat_name, stat_value in npc_data['stats'].items():
+                    npc.update_stats(stat_name, stat_value)
+            except (KeyError, TypeError, AttributeError) as e:
+                logger.error(f"NPC模板格式错误，已跳过: {npc_id}: {e!r}")
+                continue
+
+            # 与勇者的关系值初始为0（后续通过RelationshipGraph管理），事件在游戏过程中动态添加
+            npc.update_relationship(0)
+            npc.events = []
+            npcs[npc_id] = freeze(npc.to_dict())
+
+        logger.info(f"NPC目录构建完成，共 {len(npcs)} 个NPC")
+        return cls(npcs)
+
+    def __contains__(self, npc_id: object) -> bool:
+        return npc_id in self._npcs
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._npcs)
+
+    def __len__(self) -> int:
+        return len(self._npcs)
+
+    def ids(self) -> Tuple[str, ...]:
+        """获取所有NPC ID（按模板顺序）"""
+        return tuple(self._npcs)
+
+    def get(self, npc_id: str) -> Optional[Mapping[str, Any]]:
+        """
+        获取NPC的不可变数据
+
+        Args:
+            npc_id (str): NPC ID
+
+        Returns:
+            Optional[Mapping[str, Any]]: NPC数据，不存在时为None
+        """
+        return self._npcs.get(npc_id)
+
+    def copy_npc(self, npc_id: str) -> Optional[Dict[str, Any]]:
+        """
+        复制NPC数据，供调用方修改或序列化
+
+        Args:
+            npc_id (str): NPC ID
+
+        Returns:
+            Optional[Dict[str, Any]]: NPC数据副本，不存在时为None
+        """
+        npc = self._npcs.get(npc_id)
+        return thaw(npc) if npc is not None else None
+
+    def copy_all(self) -> Dict[str, Dict[str, Any]]:
+        """
+        复制所有NPC数据，用作新游戏状态中的NPC
+
+        Returns:
+            Dict[str, Dict[str, Any]]: NPC ID -> NPC数据副本
+        """
+        return {npc_id: thaw(npc) for npc_id, npc in self._npcs.items()}
+
+
+def get_npc_catalog() -> NpcCatalog:
+    """
+    获取基于当前NPC模板的目录，模板文件修改后自动重建
+
+    Returns:
+        NpcCatalog: NPC目录
+
+    Raises:
+        OSError: 模板文件不存在或无法读取
+        json.JSONDecodeError: 模板JSON格式错误
+    """
+    return get_resource_registry().get_derived(NPC_TEMPLATES, 'catalog', NpcCatalog.from_templates)
@@ -0,0 +1,299 @@
+"""
+NPC反应并行推演
+玩家行动的另一种处理模式：一次较快的调用只规划勇者自己的一天，并列出勇者接触的NPC；
+随后为每个接触的NPC并行发起一次小的反应推演，最后按确定的规则把NPC的行动、反应和关系变化合并进结果。
+
+单次推演的输出长度随NPC数量增长，这里总耗时约为规划调用加上最慢的一次NPC反应调用。
+NPC反应请求通过异步LLM客户端并发发送，与同步调用一样经过调度器槽位和密钥池。
+"""
+
+import copy
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from llm.async_chat import create_chat_completions
+from llm.model_routing import TASK_GAME_ACTION_PLAN, TASK_NPC_REACTION
+from llm.scheduler import get_llm_scheduler, LLMOverloadedError, PRIORITY_INTERACTIVE
+from services.action_pipeline import PERIOD_LABELS
+from utils.stream_utils import NarrativeStreamFilter
+from utils.resource_registry import get_resource_registry
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 提示模板（规划提示追加在完整行动提示之后）
+PLAN_PROMPT = 'prompts/game_action_plan_prompt.txt'
+NPC_REACTION_PROMPT = 'prompts/npc_reaction_prompt.txt'
+
+NPC_REACTION_SYSTEM_MESSAGE = "你是《五日勇者》游戏的NPC模拟器，根据NPC的设定模拟其行动和对勇者的反应。"
+
+# 默认最多推演反应的NPC数量，以及同时进行的反应推演数量
+DEFAULT_MAX_NPCS = 6
+DEFAULT_FANOUT_CONCURRENCY = 6
+
+# 反应推演的排队截止时间（秒），与规划调用所在的请求上下文分开计算
+DEFAULT_REACTION_DEADLINE = 30.0
+
+# 单次反应的关系变化范围与关系值范围
+RELATIONSHIP_CHANGE_RANGE = (-10, 10)
+RELATIONSHIP_RANGE = (-100, 100)
+
+
+def _clamp(value: int, bounds: Tuple[int, int]) -> int:
+    return max(bounds[0], min(bounds[1], value))
+
+
+def _parse_relationship_change(value: Any) -> int:
+    """解析关系变化值，无法解析时为0"""
+    try:
+        return _clamp(int(round(float(value))), RELATIONSHIP_CHANGE_RANGE)
+    except (TypeError, ValueError):
+        return 0
+
+
+class NpcFanout:
+    """NPC反应并行推演"""
+
+    def __init__(self, service, max_npcs: int = DEFAULT_MAX_NPCS, concurrency: int = DEFAULT_FANOUT_CONCURRENCY,
+                 reaction_deadline: float = DEFAULT_REACTION_DEADLINE):
+        """
+        初始化
+
+        Args:
+            service (GameActionService): 游戏行动服务，提供LLM调用、解析、校验和状态提交
+            max_npcs (int): 最多推演反应的NPC数量
+            concurrency (int): 同时进行的反应推演数量
+            reaction_deadline (float): 反应推演的排队截止时间（秒）
+        """
+        self.service = service
+        self.max_npcs = max(1, max_npcs)
+        self.concurrency = max(1, concurrency)
+        self.reaction_deadline = reaction_deadline
+        self.resources = get_resource_registry()
+        self.metrics = get_metrics()
+
+    def run(self, game_id: str, prepared: Dict[str, Any], player_action: str,
+            stream: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        规划勇者的一天，并行推演NPC反应，合并后提交
+
+        Args:
+            game_id (str): 游戏ID
+            prepared (Dict[str, Any]): GameActionService._prepare_action 的结果
+            player_action (str): 玩家行动描述
+            stream (bool): 是否以流式方式调用规划并推送叙述文本
+
+        Yields:
+            Dict[str, Any]: 流式事件，type 为 narrative（叙述文本块，仅流式）、result（最终推演结果）或 error（处理失败）
+        """
+        game_state = prepared["game_state"]
+
+        with self.metrics.timer("game_action.fanout.plan"):
+            plan = yield from self._plan_day(game_id, prepared, stream)
+        if not plan:
+            yield {"type": "error", "message": "行动处理失败"}
+            return
+
+        interactions = self._resolve_interactions(plan.get('npc_interactions'), game_state.get('npc', {}))
+        logger.info(f"勇者今天接触的NPC: {list(interactions)}")
+
+        with self.metrics.timer("game_action.fanout.reactions"):
+            reactions = self._react_all(game_id, game_state, plan, interactions)
+
+        action_result = self.service._validate_action_result(
+            self.merge(plan, interactions, reactions, game_state.get('npc', {}))
+        )
+        if not action_result or not self.service._commit_action_result(
+                game_id, game_state, action_result, prepared.get("action_id")):
+            yield {"type": "error", "message": "行动处理失败"}
+            return
+
+        self.metrics.increment("game_action.fanout.completed")
+        yield {"type": "result", "result": action_result}
+
+    def _plan_day(self, game_id: str, prepared: Dict[str, Any], stream: bool):
+        """
+        规划勇者的一天（生成器，流式时产出叙述文本事件）
+
+        Returns:
+            Optional[Dict[str, Any]]: 规划结果，失败为None
+        """
+        plan_prompt = self.resources.get_template(PLAN_PROMPT).format(max_npcs=self.max_npcs)
+        response = self.service.prompt_prefix_cache.create_chat_completion(
+            game_id,
+            prefix=prepared["system_prompt"],
+            prompt=f"{prepared['user_prompt']}\n\n{plan_prompt}",
+            stream=stream,
+            task=TASK_GAME_ACTION_PLAN
+        )
+        if stream:
+            narrative_filter = NarrativeStreamFilter()
+            content_parts = []
+            for chunk in response:
+                content_parts.append(chunk)
+                narrative_text = narrative_filter.feed(chunk)
+                if narrative_text:
+                    yield {"type": "narrative", "text": narrative_text}
+            content = "".join(content_parts)
+        else:
+            content = self.service._get_response_content(response)
+
+        plan, _ = self.service._parse_llm_content(content)
+        if not isinstance(plan, dict) or not isinstance(plan.get('time_progression'), dict):
+            logger.error("勇者一天的规划解析失败")
+            return None
+        return plan
+
+    def _resolve_interactions(self, interactions: Any, npcs: Dict[str, Any]) -> Dict[str, str]:
+        """把规划中接触的NPC映射为NPC ID，时段无效时按晚上处理，最多保留 max_npcs 个"""
+        if isinstance(interactions, list):
+            interactions = {npc: None for npc in interactions}
+        if not isinstance(interactions, dict):
+            return {}
+
+        resolved: Dict[str, str] = {}
+        for identifier, period in interactions.items():
+            npc_id = self.service._find_npc_id_by_name(identifier)
+            if not npc_id or npc_id not in npcs or npc_id in resolved:
+                continue
+            resolved[npc_id] = period if period in PERIOD_LABELS else list(PERIOD_LABELS)[-1]
+            if len(resolved) >= self.max_npcs:
+                break
+        return resolved
+
+    def _react_all(self, game_id: str, game_state: Dict[str, Any], plan: Dict[str, Any],
+                   interactions: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """并行推演各NPC的反应，失败或被调度器拒绝的NPC不参与合并（只提交规划的结果）"""
+        if not interactions:
+            return {}
+
+        player_day = self._format_player_day(plan)
+        prompts = {}
+        for npc_id, period in interactions.items():
+            try:
+                prompts[npc_id] = self._reaction_prompt(game_state, npc_id, period, player_day)
+            except Exception as e:
+                logger.error(f"NPC {npc_id} 的反应推演失败: {e}")
+
+        # 反应推演在独立的请求上下文中排队，截止时间不受规划调用耗时的影响；
+        # 所有反应请求通过异步LLM客户端在同一事件循环中并发发送
+        with get_llm_scheduler().request_context(PRIORITY_INTERACTIVE, game_id, self.reaction_deadline):
+            responses = create_chat_completions([
+                {"prompt": prompt, "system_message": NPC_REACTION_SYSTEM_MESSAGE, "task": TASK_NPC_REACTION}
+                for prompt in prompts.values()
+            ], max_concurrency=self.concurrency)
+
+        reactions = {}
+        for npc_id, response in zip(prompts, responses):
+            if isinstance(response, LLMOverloadedError):
+                logger.warning(f"NPC {npc_id} 的反应推演被调度器拒绝，本回合不更新该NPC: {response}")
+                self.metrics.increment("game_action.fanout.reactions_rejected")
+                continue
+            if isinstance(response, Exception):
+                logger.error(f"NPC {npc_id} 的反应推演失败: {response}")
+                continue
+            try:
+                reaction = self._parse_reaction(response)
+            except Exception as e:
+                logger.error(f"NPC {npc_id} 的反应解析失败: {e}")
+                reaction = None
+            if reaction:
+                reactions[npc_id] = reaction
+        self.metrics.increment("game_action.fanout.reaction_failures", len(interactions) - len(reactions))
+        self.metrics.increment("game_action.fanout.reactions", len(interactions))
+        return reactions
+
+    def _reaction_prompt(self, game_state: Dict[str, Any], npc_id: str, period: str, player_day: str) -> str:
+        """生成单个NPC的反应推演提示"""
+        npc_data = game_state.get('npc', {}).get(npc_id, {})
+        template = self.service._get_npc_templates().get(npc_id, {})
+        return self.resources.get_template(NPC_REACTION_PROMPT).format(
+            npc_id=npc_id,
+            npc_name=npc_data.get('name') or template.get('name') or npc_id,
+            npc_profession=npc_data.get('profession') or template.get('profession') or '未知',
+            npc_description=npc_data.get('description') or template.get('description') or '无描述',
+            relationship=npc_data.get('relationship', 0),
+            current_day=game_state.get('day', 1),
+            player_day=player_day,
+            interaction_label=PERIOD_LABELS[period]
+        )
+
+    def _parse_reaction(self, response: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """解析单个NPC的反应推演结果"""
+        reaction, _ = self.service._parse_llm_content(self.service._get_response_content(response))
+        return reaction if isinstance(reaction, dict) else None
+
+    @staticmethod
+    def _format_player_day(plan: Dict[str, Any]) -> str:
+        """格式化勇者一天的经历，作为各NPC反应推演的共同输入"""
+        player_actions = plan.get('player_actions') if isinstance(plan.get('player_actions'), dict) else {}
+        lines = []
+        for period, label in PERIOD_LABELS.items():
+            period_data = plan['time_progression'].get(period)
+            if not isinstance(period_data, dict):
+                continue
+            action = player_actions.get(period, '')
+            lines.append(f"- {label}（{period_data.get('location', '未知地点')}）: {action}。{period_data.get('narrative', '')}")
+        return "\n".join(lines) or "无"
+
+    @staticmethod
+    def merge(plan: Dict[str, Any], interactions: Dict[str, str], reactions: Dict[str, Dict[str, Any]],
+              npcs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按确定的规则合并规划和各NPC的反应
+
+        - NPC的三个时段行动放入 npc_actions
+        - 反应作为一条对话事件追加到接触时段的 events，关系变化记入该时段的 state_changes.relationships
+        - updated_states.npcs 为当前关系值加上关系变化（限制在-100到100）
+
+        Args:
+            plan (Dict[str, Any]): 勇者一天的规划
+            interactions (Dict[str, str]): NPC ID -> 接触时段
+            reactions (Dict[str, Dict[str, Any]]): NPC ID -> 反应推演结果
+            npcs (Dict[str, Any]): 游戏状态中的NPC
+
+        Returns:
+            Dict[str, Any]: 与单次推演相同格式的推演结果
+        """
+        result = copy.deepcopy(plan)
+        result.pop('npc_interactions', None)
+        time_progression = result['time_progression']
+        npc_actions: Dict[str, Any] = {}
+        npc_updates: Dict[str, Any] = {}
+
+        # 按接触顺序合并，结果与各反应推演完成的先后无关
+        for npc_id, period in interactions.items():
+            reaction = reactions.get(npc_id)
+            if not reaction:
+                continue
+
+            actions = reaction.get('actions')
+            if isinstance(actions, dict):
+                npc_actions[npc_id] = {name: actions[name] for name in PERIOD_LABELS if name in actions}
+
+            change = _parse_relationship_change(reaction.get('relationship_change'))
+            period_data = time_progression.get(period)
+            if isinstance(period_data, dict):
+                if isinstance(reaction.get('reaction'), str) and reaction['reaction']:
+                    npc_name = npcs.get(npc_id, {}).get('name', npc_id)
+                    events = period_data.get('events')
+                    if not isinstance(events, list):
+                        events = period_data['events'] = []
+                    events.append({"type": "dialogue", "description": f"{npc_name}: {reaction['reaction']}",
+                                   "location": period_data.get('location', '')})
+                state_changes = period_data.get('state_changes')
+                if not isinstance(state_changes, dict):
+                    state_changes = period_data['state_changes'] = {}
+                if not isinstance(state_changes.get('relationships'), dict):
+                    state_changes['relationships'] = {}
+                state_changes['relationships'][npc_id] = change
+
+            current = npcs.get(npc_id, {}).get('relationship', 0)
+            npc_updates[npc_id] = {"relationship": _clamp(current + change, RELATIONSHIP_RANGE)}
+
+        result['npc_actions'] = npc_actions
+        updated_states = result.get('updated_states')
+        if not isinstance(updated_states, dict):
+            updated_states = result['updated_states'] = {}
+        updated_states['npcs'] = npc_updates
+        return result
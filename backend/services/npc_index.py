@@ -0,0 +1,256 @@
+"""
+NPC身份索引
+将LLM输出中的NPC标识（ID、中文名、别名及其书写变体）解析为预定义的NPC ID
+"""
+
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from utils.resource_registry import get_resource_registry
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# NPC模板（由资源注册表加载，修改文件后索引自动重建）
+NPC_TEMPLATES = 'npc/npc_templates.json'
+
+# 名称前后可去掉的敬称与修饰，按长度从长到短匹配
+HONORIFIC_PREFIXES = ('尊敬的', '亲爱的', '年轻的', '那位', '这位')
+HONORIFIC_SUFFIXES = ('大人', '殿下', '陛下', '阁下', '先生', '小姐', '女士', '老爷', '大师', '老师', '们')
+
+# 名称中忽略的分隔符（空白、下划线、连字符、间隔号等）
+_SEPARATORS = re.compile(r'[\s_\-·・.。]+')
+
+
+def normalize_npc_name(name: str) -> str:
+    """
+    规范化NPC名称：统一全角/半角（NFKC）、转为小写并去掉空白和分隔符
+
+    Args:
+        name (str): 原始名称或ID
+
+    Returns:
+        str: 规范化后的名称
+    """
+    normalized = unicodedata.normalize('NFKC', str(name or '')).lower()
+    return _SEPARATORS.sub('', normalized)
+
+
+def strip_honorifics(name: str) -> str:
+    """
+    去掉规范化名称前后的敬称，去掉后为空时保留原名称
+
+    Args:
+        name (str): 规范化后的名称
+
+    Returns:
+        str: 去掉敬称后的名称
+    """
+    stripped = name
+    changed = True
+    while changed:
+        changed = False
+        for prefix in HONORIFIC_PREFIXES:
+            if stripped.startswith(prefix) and len(stripped) > len(prefix):
+                stripped = stripped[len(prefix):]
+                changed = True
+        for suffix in HONORIFIC_SUFFIXES:
+            if stripped.endswith(suffix) and len(stripped) > len(suffix):
+                stripped = stripped[:-len(suffix)]
+                changed = True
+    return stripped
+
+
+def max_edit_distance(name: str) -> int:
+    """
+    名称允许的最大编辑距离：两字名称只接受精确匹配（如"王子"与"王后"只差一个字），
+    三到五个字符允许一处差异，更长的名称（如英文ID）允许两处
+
+    Args:
+        name (str): 规范化后的名称
+
+    Returns:
+        int: 最大编辑距离
+    """
+    if len(name) <= 2:
+        return 0
+    if len(name) <= 5:
+        return 1
+    return 2
+
+
+def bounded_edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    计算编辑距离，超过上限时提前返回 limit + 1
+
+    Args:
+        a (str): 字符串a
+        b (str): 字符串b
+        limit (int): 距离上限
+
+    Returns:
+        int: 编辑距离，超过上限时为 limit + 1
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+
+    previous = list(range(len(a) + 1))
+    for j, char_b in enumerate(b, 1):
+        current = [j] + [0] * len(a)
+        row_min = j
+        for i, char_a in enumerate(a, 1):
+            current[i] = min(previous[i] + 1, current[i - 1] + 1, previous[i - 1] + (char_a != char_b))
+            row_min = min(row_min, current[i])
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+class NpcIndex:
+    """NPC身份索引（不可变，NPC模板修改后整体重建）"""
+
+    def __init__(self, entries: Iterable[Tuple[str, str, Iterable[str]]]):
+        """
+        构建索引
+
+        Args:
+            entries (Iterable[Tuple[str, str, Iterable[str]]]): (NPC ID, 中文名, 别名列表)
+        """
+        # NPC ID -> 中文名
+        self.names: Dict[str, str] = {}
+        aliases_map: Dict[str, Optional[str]] = {}
+        normalized: Dict[str, Optional[str]] = {}
+        stripped: Dict[str, Optional[str]] = {}
+
+        for npc_id, name, aliases in entries:
+            self.names[npc_id] = name
+            for identifier in (npc_id, name, *aliases):
+                if not identifier:
+                    continue
+                self._add_unique(aliases_map, identifier, npc_id)
+                self._add_unique(normalized, normalize_npc_name(identifier), npc_id)
+                self._add_unique(stripped, strip_honorifics(normalize_npc_name(identifier)), npc_id)
+
+        # ID与中文名优先于别名，避免别名覆盖其他NPC的正式名称
+        exact = {identifier: npc_id for identifier, npc_id in aliases_map.items() if npc_id}
+        for npc_id, name in self.names.items():
+            exact[npc_id] = npc_id
+            exact[name] = npc_id
+
+        # 预定义的NPC ID集合
+        self.ids = frozenset(self.names)
+        self._exact = exact
+        self._normalized = {key: npc_id for key, npc_id in normalized.items() if npc_id}
+        self._stripped = {key: npc_id for key, npc_id in stripped.items() if npc_id}
+        self.metrics = get_metrics()
+
+    @staticmethod
+    def _add_unique(mapping: Dict[str, Optional[str]], key: str, npc_id: str):
+        """加入映射，同一规范化形式对应多个NPC时标记为歧义（None）"""
+        if not key:
+            return
+        if key in mapping and mapping[key] != npc_id:
+            mapping[key] = None
+        else:
+            mapping[key] = npc_id
+
+    @classmethod
+    def from_templates(cls, templates: Dict[str, Any]) -> 'NpcIndex':
+        """
+        从NPC模板构建索引
+
+        Args:
+            templates (Dict[str, Any]): NPC ID -> 模板数据
+
+        Returns:
+            NpcIndex: NPC索引
+        """
+        index = cls(
+            (npc_id, data.get('name', ''), data.get('aliases', ()))
+            for npc_id, data in templates.items()
+        )
+        logger.info(f"NPC索引构建完成: {len(index.names)} 个NPC，{len(index._normalized)} 个规范化名称")
+        return index
+
+    def __contains__(self, npc_id: str) -> bool:
+        return npc_id in self.names
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def resolve(self, identifier: Any) -> Optional[str]:
+        """
+        将NPC标识解析为预定义的NPC ID
+
+        依次尝试：精确匹配ID/名称/别名，规范化后匹配，去掉敬称和修饰语后匹配，有界编辑距离匹配（候选唯一时）。
+
+        Args:
+            identifier (Any): LLM输出中的NPC标识
+
+        Returns:
+            Optional[str]: NPC ID，无法确定时返回None
+        """
+        if not isinstance(identifier, str) or not identifier:
+            return None
+
+        npc_id = self._exact.get(identifier)
+        if npc_id:
+            self.metrics.increment("npc_index.exact")
+            return npc_id
+
+        normalized = normalize_npc_name(identifier)
+        stripped = strip_honorifics(normalized)
+        npc_id = self._normalized.get(normalized) or self._stripped.get(stripped)
+        if not npc_id and '的' in stripped:
+            # "智慧的长老"之类带修饰语的称呼，取最后一个"的"之后的部分
+            stripped = strip_honorifics(stripped.rsplit('的', 1)[1]) or stripped
+            npc_id = self._stripped.get(stripped)
+        if npc_id:
+            self.metrics.increment("npc_index.normalized")
+            logger.debug(f"NPC标识规范化匹配: {identifier} -> {npc_id}")
+            return npc_id
+
+        npc_id = self._fuzzy_match(stripped)
+        if npc_id:
+            self.metrics.increment("npc_index.fuzzy")
+            logger.info(f"NPC标识近似匹配: {identifier} -> {npc_id}")
+            return npc_id
+
+        self.metrics.increment("npc_index.unresolved")
+        return None
+
+    def _fuzzy_match(self, name: str) -> Optional[str]:
+        """在规范化名称中查找编辑距离最小且唯一的NPC"""
+        limit = max_edit_distance(name)
+        if limit == 0:
+            return None
+
+        best_distance = limit + 1
+        best_ids = set()
+        for candidate, npc_id in self._stripped.items():
+            # 距离上限取两者中较严格的一个，避免长名称近似匹配到两字名称
+            candidate_limit = min(limit, max_edit_distance(candidate))
+            distance = bounded_edit_distance(name, candidate, candidate_limit)
+            if distance > candidate_limit:
+                continue
+            if distance < best_distance:
+                best_distance, best_ids = distance, {npc_id}
+            elif distance == best_distance:
+                best_ids.add(npc_id)
+
+        return next(iter(best_ids)) if len(best_ids) == 1 else None
+
+
+def get_npc_index() -> NpcIndex:
+    """
+    获取基于当前NPC模板的索引，模板文件修改后自动重建
+
+    Returns:
+        NpcIndex: NPC索引
+    """
+    return get_resource_registry().get_derived(NPC_TEMPLATES, 'index', NpcIndex.from_templates)
@@ -0,0 +1,287 @@
+"""
+提示相关性选择
+按玩家行动、当前地点、当天固定事件和最近历史为NPC和地点打分，
+只有得分最高的若干个（以及玩家行动中点名的）在行动提示中给出完整信息，其余只出现在一行式名册中。
+
+名称匹配使用预先构建的关键词索引：NPC的ID、中文名、别名和地点的ID、名称编译为一个正则表达式，
+每段文本只扫描一次；索引按NPC和地点的基本信息缓存，游戏过程中不会重复构建。
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from services.npc_index import NPC_TEMPLATES, get_npc_index
+from utils.prompt_sections import make_state_key
+from utils.resource_registry import get_resource_registry
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 默认完整展示的NPC和地点数量（点名的NPC和当前地点不占名额限制），0 表示全部完整展示
+DEFAULT_NPC_TOP_K = 6
+DEFAULT_LOCATION_TOP_K = 3
+
+# 各来源中出现一次名称的得分
+SOURCE_WEIGHTS = {
+    "action": 3.0,
+    "location": 2.0,
+    "fixed_events": 2.0,
+    "history": 1.0
+}
+
+# 地点得分按比例传递给该地点的常驻NPC（notable_npcs）
+LOCATION_NPC_WEIGHT = 0.5
+
+# 参与打分的最近历史条数，越早的记录权重越低
+HISTORY_ENTRIES = 3
+
+# 最多缓存的关键词索引数量
+MAX_CACHED_INDEXES = 64
+
+# 英文ID前后不能紧跟字母数字，避免 inn 匹配到 innkeeper
+_ASCII_TERM = re.compile(r'^[A-Za-z0-9_]+$')
+
+NPC = "npc"
+LOCATION = "location"
+
+
+@dataclass
+class RelevanceSelection:
+    """相关性选择结果"""
+
+    # 完整展示的NPC ID，按得分从高到低
+    npc_ids: List[str] = field(default_factory=list)
+    # 完整展示的地点ID，按得分从高到低
+    location_ids: List[str] = field(default_factory=list)
+    # 玩家行动中点名的NPC ID
+    named_npc_ids: FrozenSet[str] = frozenset()
+
+
+class RelevanceIndex:
+    """NPC与地点名称的关键词索引（不可变）"""
+
+    def __init__(self, npcs: Dict[str, Any], locations: Dict[str, Any],
+                 aliases: Dict[str, Iterable[str]], resolve_npc=None):
+        """
+        构建索引
+
+        Args:
+            npcs (Dict[str, Any]): NPC ID -> NPC数据（使用 name）
+            locations (Dict[str, Any]): 地点ID -> 地点数据（使用 name、notable_npcs）
+            aliases (Dict[str, Iterable[str]]): NPC ID -> 别名
+            resolve_npc (Callable[[str], Optional[str]]): 将地点常驻NPC的称呼解析为NPC ID
+        """
+        terms: Dict[str, Set[Tuple[str, str]]] = {}
+
+        def add(term: Any, target: Tuple[str, str]):
+            if isinstance(term, str) and len(term) >= 2:
+                terms.setdefault(term, set()).add(target)
+
+        for npc_id, npc_data in npcs.items():
+            for term in (npc_id, npc_data.get('name'), *aliases.get(npc_id, ())):
+                add(term, (NPC, npc_id))
+        for location_id, location_data in locations.items():
+            for term in (location_id, location_data.get('name')):
+                add(term, (LOCATION, location_id))
+
+        # 地点ID -> 常驻NPC ID
+        self.location_npcs: Dict[str, Tuple[str, ...]] = {}
+        if resolve_npc is not None:
+            for location_id, location_data in locations.items():
+                resident_ids = {resolve_npc(name) for name in location_data.get('notable_npcs', ())}
+                self.location_npcs[location_id] = tuple(sorted(npc_id for npc_id in resident_ids if npc_id in npcs))
+
+        self._terms = {term: frozenset(targets) for term, targets in terms.items()}
+        # 较长的名称优先匹配（如"村长家"优先于"村长"）
+        patterns = [
+            rf'(?<![A-Za-z0-9_]){re.escape(term)}(?![A-Za-z0-9_])' if _ASCII_TERM.match(term) else re.escape(term)
+            for term in sorted(self._terms, key=len, reverse=True)
+        ]
+        self._pattern = re.compile("|".join(patterns)) if patterns else None
+
+    def match(self, text: str) -> List[Tuple[str, str]]:
+        """
+        找出文本中提到的NPC和地点
+
+        Args:
+            text (str): 文本
+
+        Returns:
+            List[Tuple[str, str]]: 每次提及对应的 (类型, ID)，同一名称出现多次时重复计入
+        """
+        if not text or self._pattern is None:
+            return []
+        hits = []
+        for found in self._pattern.finditer(text):
+            hits.extend(self._terms[found.group()])
+        return hits
+
+
+class RelevanceSelector:
+    """提示相关性选择器"""
+
+    def __init__(self, npc_top_k: int = DEFAULT_NPC_TOP_K, location_top_k: int = DEFAULT_LOCATION_TOP_K):
+        """
+        初始化选择器
+
+        Args:
+            npc_top_k (int): 完整展示的NPC数量，0 表示全部
+            location_top_k (int): 完整展示的地点数量，0 表示全部
+        """
+        self.npc_top_k = max(0, npc_top_k)
+        self.location_top_k = max(0, location_top_k)
+        self.resources = get_resource_registry()
+        self.metrics = get_metrics()
+        self._indexes: "OrderedDict[Any, RelevanceIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_index(self, npcs: Dict[str, Any], locations: Dict[str, Any]) -> RelevanceIndex:
+        """
+        获取NPC和地点的关键词索引，基本信息未变化时复用已构建的索引
+
+        Args:
+            npcs (Dict[str, Any]): 游戏状态中的NPC
+            locations (Dict[str, Any]): 游戏状态中的地点
+
+        Returns:
+            RelevanceIndex: 关键词索引
+        """
+        try:
+            templates_version = self.resources.get_version(NPC_TEMPLATES)
+        except OSError:
+            templates_version = 0
+        key = (
+            templates_version,
+            make_state_key([(npc_id, data.get('name')) for npc_id, data in npcs.items()]),
+            make_state_key([(location_id, data.get('name'), data.get('notable_npcs'))
+                            for location_id, data in locations.items()])
+        )
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+
+        index = RelevanceIndex(npcs, locations, self._load_aliases(), self._resolve_npc)
+        self.metrics.increment("prompt_relevance.index_builds")
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > MAX_CACHED_INDEXES:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _load_aliases(self) -> Dict[str, Iterable[str]]:
+        """从NPC模板读取别名，模板不可用时没有别名"""
+        try:
+            templates = self.resources.get_json(NPC_TEMPLATES)
+        except Exception as e:
+            logger.warning(f"读取NPC别名失败: {e}")
+            return {}
+        return {npc_id: data.get('aliases', ()) for npc_id, data in templates.items()}
+
+    @staticmethod
+    def _resolve_npc(name: str) -> Optional[str]:
+        try:
+            return get_npc_index().resolve(name)
+        except Exception:
+            return None
+
+    def select(self, game_state: Dict[str, Any], player_action: str,
+               recent_history: Iterable[str] = (), fixed_events: str = "") -> RelevanceSelection:
+        """
+        选择需要在提示中完整展示的NPC和地点
+
+        Args:
+            game_state (Dict[str, Any]): 游戏状态
+            player_action (str): 玩家行动
+            recent_history (Iterable[str]): 提示中的最近历史记录
+            fixed_events (str): 当天固定事件文本
+
+        Returns:
+            RelevanceSelection: 选择结果
+        """
+        npcs = game_state.get('npc', {})
+        world = game_state.get('world', {})
+        locations = world.get('locations', {})
+        index = self.get_index(npcs, locations)
+
+        npc_scores: Dict[str, float] = {}
+        location_scores: Dict[str, float] = {}
+
+        def score(text: str, weight: float) -> Set[str]:
+            named = set()
+            for kind, target_id in index.match(text):
+                scores = npc_scores if kind == NPC else location_scores
+                scores[target_id] = scores.get(target_id, 0.0) + weight
+                if kind == NPC:
+                    named.add(target_id)
+            return named
+
+        named_npc_ids = frozenset(score(player_action, SOURCE_WEIGHTS["action"]))
+        score(fixed_events, SOURCE_WEIGHTS["fixed_events"])
+        history = list(recent_history)[-HISTORY_ENTRIES:]
+        for age, entry in enumerate(reversed(history)):
+            score(entry, SOURCE_WEIGHTS["history"] / (age + 1))
+
+        # 当前地点（ID或名称）
+        current_location = world.get('current_location')
+        current_location_ids = set()
+        if isinstance(current_location, str) and current_location:
+            current_location_ids = {target_id for kind, target_id in index.match(current_location) if kind == LOCATION}
+            if current_location in locations:
+                current_location_ids.add(current_location)
+            for location_id in current_location_ids:
+                location_scores[location_id] = location_scores.get(location_id, 0.0) + SOURCE_WEIGHTS["location"]
+
+        for location_id, location_score in location_scores.items():
+            for npc_id in index.location_npcs.get(location_id, ()):
+                npc_scores[npc_id] = npc_scores.get(npc_id, 0.0) + LOCATION_NPC_WEIGHT * location_score
+
+        npc_ids = self._top(npcs, npc_scores, self.npc_top_k, named_npc_ids)
+        location_ids = self._top(locations, location_scores, self.location_top_k, current_location_ids)
+
+        self.metrics.increment("prompt_relevance.npcs_full", len(npc_ids))
+        self.metrics.increment("prompt_relevance.npcs_roster_only", len(npcs) - len(npc_ids))
+        logger.debug(f"相关NPC: {npc_ids}，相关地点: {location_ids}")
+        return RelevanceSelection(npc_ids=npc_ids, location_ids=location_ids, named_npc_ids=named_npc_ids)
+
+    @staticmethod
+    def _top(candidates: Dict[str, Any], scores: Dict[str, float], top_k: int, required: Iterable[str]) -> List[str]:
+        """按得分取前 top_k 个（得分相同时保持原顺序），再加上必须展示的候选"""
+        if top_k == 0:
+            return list(candidates)
+
+        order = {candidate_id: position for position, candidate_id in enumerate(candidates)}
+        ranked = sorted((candidate_id for candidate_id, value in scores.items() if value > 0 and candidate_id in order),
+                        key=lambda candidate_id: (-scores[candidate_id], order[candidate_id]))
+        selected = ranked[:top_k]
+        selected += [candidate_id for candidate_id in ranked[top_k:] if candidate_id in required]
+        return selected
+
+
+# 全局相关性选择器实例
+_relevance_selector = None
+_relevance_selector_lock = threading.Lock()
+
+
+def get_relevance_selector() -> RelevanceSelector:
+    """
+    获取全局提示相关性选择器实例
+
+    Returns:
+        RelevanceSelector: 相关性选择器实例
+    """
+    global _relevance_selector
+    if _relevance_selector is None:
+        with _relevance_selector_lock:
+            if _relevance_selector is None:
+                _relevance_selector = RelevanceSelector(
+                    npc_top_k=int(os.environ.get('PROMPT_NPC_TOP_K', DEFAULT_NPC_TOP_K)),
+                    location_top_k=int(os.environ.get('PROMPT_LOCATION_TOP_K', DEFAULT_LOCATION_TOP_K))
+                )
+    return _relevance_selector
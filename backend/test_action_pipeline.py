@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+测试分时段推演流水线
+验证按时段分别推演、流式推送各时段结果、失败时段的重试与从进度继续，以及结果组装
+"""
+
+import os
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from llm.fake_ark_server import get_latency_profile
+from llm.scheduler import get_llm_scheduler, PRIORITY_INTERACTIVE
+from services import get_game_data_service
+from services.action_pipeline import ACTION_PROGRESS_KEY, PeriodPipeline
+from services.game_action_service import GameActionService, ACTION_MODE_PIPELINE
+from test_fake_ark_server import fake_ark, _create_game
+
+
+def test_pipeline_mode():
+    """测试分时段模式：三次较小的调用，结果格式与单次推演相同"""
+    print("\n=== 测试分时段推演 ===")
+
+    service = GameActionService()
+    game_data_service = get_game_data_service()
+
+    with fake_ark(get_latency_profile("instant")) as server:
+        game_id = _create_game()
+        result = service.process_player_action(game_id, "拜见国王", mode=ACTION_MODE_PIPELINE)
+        assert server.stats.get("requests", 0) == 3
+
+    assert result is not None
+    assert set(result["time_progression"]) == {"morning", "afternoon", "evening"}
+    assert set(result["player_actions"]) == {"morning", "afternoon", "evening"}
+    assert result["day_summary"]["narrative"]
+    assert all(set(actions) == {"morning", "afternoon", "evening"} for actions in result["npc_actions"].values())
+    assert result["updated_states"]["world"]["current_time"] == "evening"
+
+    game_state = game_data_service.get_game_state(game_id)
+    assert len(game_state["history"]) == 1
+    assert not game_state.get(ACTION_PROGRESS_KEY), "完成后清除进行中进度"
+
+    print("✓ 分时段推演测试通过")
+
+
+def test_pipeline_stream():
+    """测试流式分时段推演：每个时段完成后立即推送"""
+    print("\n=== 测试流式分时段推演 ===")
+
+    service = GameActionService()
+    with fake_ark(get_latency_profile("instant")):
+        game_id = _create_game()
+        events = list(service.process_player_action_stream(game_id, "拜见国王", mode=ACTION_MODE_PIPELINE))
+
+    types = [event["type"] for event in events]
+    assert types[-1] == "result" and "error" not in types
+    periods = [event["period"] for event in events if event["type"] == "period"]
+    assert periods == ["morning", "afternoon", "evening"]
+    # 每个时段的叙述先于该时段的结果事件推送
+    assert types.index("narrative") < types.index("period")
+    narrative = "".join(event["text"] for event in events if event["type"] == "narrative")
+    for period_event in (event for event in events if event["type"] == "period"):
+        assert period_event["result"]["period"]["narrative"] in narrative
+
+    print("✓ 流式分时段推演测试通过")
+
+
+def test_retry_and_resume():
+    """测试失败的时段先重试，仍失败时保存已完成的时段，重新提交后从失败的时段继续"""
+    print("\n=== 测试重试与继续 ===")
+
+    service = GameActionService()
+    pipeline = service.period_pipeline
+    normalize = pipeline._normalize_period_result
+    failures = {"evening": 2}
+
+    def flaky(period, result):
+        if failures.get(period):
+            failures[period] -= 1
+            return None
+        return normalize(period, result)
+
+    game_data_service = get_game_data_service()
+    with fake_ark(get_latency_profile("instant")) as server:
+        game_id = _create_game()
+
+        pipeline._normalize_period_result = flaky
+        try:
+            assert service.process_player_action(game_id, "拜见国王", mode=ACTION_MODE_PIPELINE) is None
+        finally:
+            del pipeline._normalize_period_result
+        assert server.stats.get("requests", 0) == 2 + pipeline.max_attempts
+
+        game_state = game_data_service.get_game_state(game_id)
+        progress = game_state[ACTION_PROGRESS_KEY]
+        assert [item["name"] for item in progress["periods"]] == ["morning", "afternoon"]
+        assert not game_state["history"]
+
+        # 不同的行动不沿用进度
+        assert PeriodPipeline._load_progress(game_state, "去森林") == {}
+
+        # 重新提交同一行动：只推演晚上
+        events = list(service.process_player_action_stream(game_id, "拜见国王", mode=ACTION_MODE_PIPELINE))
+        assert server.stats.get("requests", 0) == 3 + pipeline.max_attempts
+        resumed = [event["period"] for event in events if event["type"] == "period" and event.get("resumed")]
+        assert resumed == ["morning", "afternoon"]
+        assert events[-1]["type"] == "result"
+
+    game_state = game_data_service.get_game_state(game_id)
+    assert len(game_state["history"]) == 1 and not game_state.get(ACTION_PROGRESS_KEY)
+
+    print("✓ 重试与继续测试通过")
+
+
+def test_slow_periods_within_deadline():
+    """测试前面的时段推演耗时超过请求的排队截止时间时，后面的时段仍可执行"""
+    print("\n=== 测试较慢的时段 ===")
+
+    service = GameActionService()
+    with fake_ark(get_latency_profile("instant", first_token_latency=0.3)) as server:
+        game_id = _create_game()
+        with get_llm_scheduler().request_context(PRIORITY_INTERACTIVE, game_id, deadline=0.2):
+            result = service.process_player_action(game_id, "拜见国王", mode=ACTION_MODE_PIPELINE)
+        assert server.stats.get("requests", 0) == 3
+
+    assert result is not None and set(result["time_progression"]) == {"morning", "afternoon", "evening"}
+
+    print("✓ 较慢的时段测试通过")
+
+
+def test_merge_updated_states():
+    """测试各时段结束时的状态按顺序合并"""
+    print("\n=== 测试状态合并 ===")
+
+    periods = {
+        "morning": {"updated_states": {"player": {"hp": 90, "mp": 80}, "npcs": {"king": {"relationship": 2}}}},
+        "afternoon": {"updated_states": {"player": {"hp": 70}, "npcs": {"princess": {"relationship": 5}}}},
+        "evening": {"updated_states": {"world": {"weather": "雨天"}, "npcs": {"king": {"relationship": 4}}}}
+    }
+    merged = PeriodPipeline._merge_updated_states(periods)
+    assert merged == {
+        "player": {"hp": 70, "mp": 80},
+        "world": {"weather": "雨天"},
+        "npcs": {"king": {"relationship": 4}, "princess": {"relationship": 5}}
+    }
+    assert PeriodPipeline._merge_updated_states(periods, until="afternoon") == {
+        "player": {"hp": 90, "mp": 80}, "npcs": {"king": {"relationship": 2}}
+    }
+
+    print("✓ 状态合并测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试分时段推演流水线...")
+
+    try:
+        test_pipeline_mode()
+        test_pipeline_stream()
+        test_retry_and_resume()
+        test_slow_periods_within_deadline()
+        test_merge_updated_states()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+测试流式行动处理
+验证叙述文本过滤器、SSE数据解析以及 /api/game/action/stream 接口
+"""
+
+import json
+
+from llm.chat import parse_stream_line
+from utils.stream_utils import NarrativeStreamFilter, format_sse_event
+
+
+SAMPLE_OUTPUT = json.dumps({
+    "player_actions": {"morning": "前往铁匠铺"},
+    "time_progression": {
+        "morning": {"narrative": "清晨，勇者推开了铁匠铺的门。", "location": "铁匠铺"},
+        "afternoon": {"narrative": "午后，他说：\"我需要一把剑\"。", "location": "广场"}
+    },
+    "day_summary": {"narrative": "忙碌的一天"}
+}, ensure_ascii=False)
+
+
+def _split_chunks(text: str, size: int):
+    """把文本切成固定大小的块，模拟流式输出"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_narrative_filter():
+    """测试叙述文本过滤器"""
+    print("\n=== 测试叙述文本过滤器 ===")
+
+    for size in (1, 3, 7, len(SAMPLE_OUTPUT)):
+        narrative_filter = NarrativeStreamFilter()
+        output = "".join(narrative_filter.feed(chunk) for chunk in _split_chunks("```json\n" + SAMPLE_OUTPUT, size))
+        print(f"块大小 {size}: {output!r}")
+        assert output == "清晨，勇者推开了铁匠铺的门。\n\n午后，他说：\"我需要一把剑\"。\n\n忙碌的一天"
+
+    # unicode转义
+    narrative_filter = NarrativeStreamFilter()
+    output = narrative_filter.feed('{"narrative": "\\u52c7\\u8005"}')
+    assert output == "勇者"
+
+    # 代理对（emoji）跨块到达时组合为一个字符，不成对的代理项输出为替换字符
+    text = json.dumps({"narrative": "勇者😀出发"})
+    for size in (1, 5, len(text)):
+        narrative_filter = NarrativeStreamFilter()
+        assert "".join(narrative_filter.feed(chunk) for chunk in _split_chunks(text, size)) == "勇者😀出发"
+    narrative_filter = NarrativeStreamFilter()
+    assert narrative_filter.feed('{"narrative": "\\ud83d\\n\\ude00\\ud83d"}') == "\ufffd\n\ufffd\ufffd"
+
+    print("✓ 叙述文本过滤器测试通过")
+
+
+def test_parse_stream_line():
+    """测试SSE数据行解析"""
+    print("\n=== 测试SSE数据行解析 ===")
+
+    chunk = {"choices": [{"delta": {"content": "你好"}}]}
+    assert parse_stream_line("data: " + json.dumps(chunk, ensure_ascii=False)) == "你好"
+    assert parse_stream_line("data: [DONE]") is None
+    assert parse_stream_line(": keep-alive") is None
+    assert parse_stream_line('data: {"choices": [{"delta": {}}]}') is None
+
+    event = format_sse_event("narrative", {"text": "勇者"})
+    assert event == 'event: narrative\ndata: {"text": "勇者"}\n\n'
+
+    print("✓ SSE数据行解析测试通过")
+
+
+def test_action_stream_endpoint():
+    """测试流式行动接口的参数校验"""
+    print("\n=== 测试流式行动接口 ===")
+
+    from flask import Flask
+    from api.game_api import game_bp
+
+    app = Flask(__name__)
+    app.register_blueprint(game_bp, url_prefix='/api/game')
+    client = app.test_client()
+
+    response = client.post('/api/game/action/stream', json={"action": "探索"})
+    assert response.status_code == 400
+
+    response = client.post('/api/game/action/stream', json={"game_id": "game_invalid", "action": "探索"})
+    assert response.status_code == 404
+
+    print("✓ 流式行动接口测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试流式行动处理")
+    print("=" * 50)
+
+    try:
+        test_narrative_filter()
+        test_parse_stream_line()
+        test_action_stream_endpoint()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有流式行动处理测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
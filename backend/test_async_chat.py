@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+测试异步LLM客户端
+使用本地替身HTTP服务验证并发上限、结果顺序、错误处理以及经过LLM调度器的准入控制，无需真实API密钥
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from llm import scheduler as scheduler_module
+from llm.async_chat import AsyncLLMClient, run_coroutine_sync
+from llm.scheduler import LLMScheduler, LLMOverloadedError, PRIORITY_INTERACTIVE
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """替身 ARK 接口：延迟后回显用户提示"""
+
+    delay = 0.2
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        prompt = payload["messages"][-1]["content"]
+
+        with self.lock:
+            _StandInHandler.active += 1
+            _StandInHandler.max_active = max(_StandInHandler.max_active, _StandInHandler.active)
+        time.sleep(self.delay)
+        with self.lock:
+            _StandInHandler.active -= 1
+
+        if prompt == "fail":
+            self.send_response(500)
+            self.end_headers()
+            return
+
+        body = json.dumps({
+            "choices": [{"message": {"role": "assistant", "content": f"回复:{prompt}"}}]
+        }, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_stand_in_server():
+    """启动替身服务，返回 (server, api_url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/v3/chat/completions"
+
+
+def test_concurrent_fan_out():
+    """测试并发请求与并发上限"""
+    print("\n=== 测试异步并发请求 ===")
+
+    server, api_url = _start_stand_in_server()
+    try:
+        _StandInHandler.max_active = 0
+        client = AsyncLLMClient(max_concurrency=10, use_aiohttp=False)
+        requests = [{"prompt": f"问题{i}", "system_message": "系统", "api_url": api_url} for i in range(40)]
+
+        start_time = time.time()
+        results = run_coroutine_sync(client.gather_chat_completions(requests))
+        elapsed = time.time() - start_time
+
+        print(f"40个请求耗时: {elapsed:.2f}秒，服务端最大并发: {_StandInHandler.max_active}")
+        assert [r["choices"][0]["message"]["content"] for r in results] == [f"回复:问题{i}" for i in range(40)]
+        assert _StandInHandler.max_active <= 10
+        # 串行需要 8 秒，限制并发为10时约 0.8 秒
+        assert elapsed < 4
+    finally:
+        server.shutdown()
+
+    print("✓ 异步并发请求测试通过")
+
+
+def test_error_isolation():
+    """测试单个请求失败不影响其他请求"""
+    print("\n=== 测试错误隔离 ===")
+
+    server, api_url = _start_stand_in_server()
+    try:
+        client = AsyncLLMClient(max_concurrency=4, use_aiohttp=False)
+        requests = [
+            {"prompt": "正常", "system_message": "系统", "api_url": api_url},
+            {"prompt": "fail", "system_message": "系统", "api_url": api_url}
+        ]
+        results = asyncio.run(client.gather_chat_completions(requests))
+
+        assert results[0]["choices"][0]["message"]["content"] == "回复:正常"
+        assert isinstance(results[1], Exception)
+        print(f"失败请求返回异常: {results[1]}")
+    finally:
+        server.shutdown()
+
+    print("✓ 错误隔离测试通过")
+
+
+def test_timeout():
+    """测试请求超时"""
+    print("\n=== 测试请求超时 ===")
+
+    server, api_url = _start_stand_in_server()
+    try:
+        client = AsyncLLMClient(max_concurrency=1, timeout=0.05, use_aiohttp=False)
+        try:
+            run_coroutine_sync(client.create_chat_completion("慢请求", "系统", api_url=api_url))
+            raise AssertionError("应当超时")
+        except Exception as e:
+            assert "超时" in str(e)
+            print(f"超时异常: {e}")
+    finally:
+        server.shutdown()
+
+    print("✓ 请求超时测试通过")
+
+
+def test_scheduler_slots():
+    """测试异步请求经过全局调度器：同时进行的请求不超过调度器槽位数，调度器繁忙时拒绝"""
+    print("\n=== 测试调度器准入 ===")
+
+    server, api_url = _start_stand_in_server()
+    original = scheduler_module._llm_scheduler
+    try:
+        _StandInHandler.max_active = 0
+        scheduler = LLMScheduler(max_in_flight=2, max_queue=16)
+        scheduler.service_time = 0.2
+        scheduler_module._llm_scheduler = scheduler
+        client = AsyncLLMClient(max_concurrency=10, use_aiohttp=False)
+        requests = [{"prompt": f"问题{i}", "system_message": "系统", "api_url": api_url} for i in range(6)]
+
+        with scheduler.request_context(PRIORITY_INTERACTIVE, "game_a", deadline=10):
+            results = run_coroutine_sync(client.gather_chat_completions(requests))
+        assert [r["choices"][0]["message"]["content"] for r in results] == [f"回复:问题{i}" for i in range(6)]
+        assert _StandInHandler.max_active <= 2, f"调度器槽位为2，服务端并发 {_StandInHandler.max_active}"
+        assert scheduler.get_stats()["in_flight"] == 0 and scheduler.get_stats()["queue_depth"] == 0
+
+        # 调度器已满且不能排队时，请求以 LLMOverloadedError 返回，不发送到服务端
+        busy = LLMScheduler(max_in_flight=1, max_queue=0)
+        busy.in_flight = 1
+        scheduler_module._llm_scheduler = busy
+        results = run_coroutine_sync(client.gather_chat_completions(requests[:2]))
+        assert all(isinstance(result, LLMOverloadedError) for result in results)
+
+        # 排队超过截止时间的请求被拒绝，并移出队列
+        queued = LLMScheduler(max_in_flight=1, max_queue=4)
+        queued.in_flight = 1
+        scheduler_module._llm_scheduler = queued
+        with queued.request_context(PRIORITY_INTERACTIVE, "game_a", deadline=0.1):
+            queued.service_time = 0.05
+            results = run_coroutine_sync(client.gather_chat_completions(requests[:1]))
+        assert isinstance(results[0], LLMOverloadedError)
+        assert queued.get_stats()["queue_depth"] == 0
+    finally:
+        scheduler_module._llm_scheduler = original
+        server.shutdown()
+
+    print("✓ 调度器准入测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试异步LLM客户端")
+    print("=" * 50)
+
+    try:
+        test_concurrent_fan_out()
+        test_error_isolation()
+        test_timeout()
+        test_scheduler_slots()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有异步LLM客户端测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+测试提示前缀缓存
+使用本地替身服务模拟 ARK 上下文缓存接口，验证按游戏创建/复用上下文、前缀变化后重建以及命中率统计
+"""
+
+import os
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from llm.context_cache import PromptPrefixCache
+
+
+class _ContextStandInHandler(BaseHTTPRequestHandler):
+    """替身 ARK 接口：支持创建上下文、基于上下文对话和普通对话"""
+
+    contexts = {}
+    requests = []
+    lock = threading.Lock()
+    # 上下文对话端点返回的错误状态码（模拟服务繁忙等非上下文失效的错误）
+    fail_status = None
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length).decode('utf-8'))
+
+        with self.lock:
+            _ContextStandInHandler.requests.append((self.path, payload))
+
+            if self.path.endswith('/context/create'):
+                context_id = f"ctx-{len(self.contexts) + 1}"
+                _ContextStandInHandler.contexts[context_id] = payload["messages"][0]["content"]
+                return self._send_json({"id": context_id, "mode": payload.get("mode")})
+
+            if self.path.endswith('/context/chat/completions'):
+                if self.fail_status:
+                    return self._send_json({"error": "server busy"}, status=self.fail_status)
+                prefix = self.contexts.get(payload.get("context_id"))
+                if prefix is None:
+                    return self._send_json({"error": "context not found"}, status=404)
+            else:
+                prefix = payload["messages"][0]["content"]
+
+        prompt = payload["messages"][-1]["content"]
+        if payload.get("stream"):
+            return self._send_stream(f"{prefix}|{prompt}")
+        return self._send_json({
+            "choices": [{"message": {"role": "assistant", "content": f"{prefix}|{prompt}"}}]
+        })
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, content):
+        chunk = json.dumps({"choices": [{"delta": {"content": content}}]}, ensure_ascii=False)
+        body = f"data: {chunk}\n\ndata: [DONE]\n\n".encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_stand_in_server():
+    """启动替身服务，返回 (server, api_base)"""
+    _ContextStandInHandler.contexts = {}
+    _ContextStandInHandler.requests = []
+    _ContextStandInHandler.fail_status = None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _ContextStandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/v3"
+
+
+def _content(result):
+    return result["choices"][0]["message"]["content"]
+
+
+def test_context_cache_per_game():
+    """测试启用上下文缓存时按游戏复用上下文"""
+    print("\n=== 测试上下文缓存 ===")
+
+    server, api_base = _start_stand_in_server()
+    try:
+        cache = PromptPrefixCache(enabled=True, api_base=api_base)
+        hits_before = cache.metrics.get_counter("llm.prompt_prefix.hit")
+
+        assert _content(cache.create_chat_completion("game_a", "规则A", "第1天")) == "规则A|第1天"
+        assert _content(cache.create_chat_completion("game_a", "规则A", "第2天")) == "规则A|第2天"
+        assert _content(cache.create_chat_completion("game_b", "规则B", "第1天")) == "规则B|第1天"
+
+        paths = [path for path, _ in _ContextStandInHandler.requests]
+        assert paths.count("/api/v3/context/create") == 2
+        assert paths.count("/api/v3/context/chat/completions") == 3
+
+        # 基于上下文的请求只发送变化后缀
+        context_payloads = [p for path, p in _ContextStandInHandler.requests if path.endswith('/context/chat/completions')]
+        assert all(len(p["messages"]) == 1 and p["messages"][0]["role"] == "user" for p in context_payloads)
+
+        # 前缀变化后重建上下文
+        assert _content(cache.create_chat_completion("game_a", "规则A2", "第3天")) == "规则A2|第3天"
+        paths = [path for path, _ in _ContextStandInHandler.requests]
+        assert paths.count("/api/v3/context/create") == 3
+
+        # 上下文失效时退回完整提示
+        _ContextStandInHandler.contexts.clear()
+        assert _content(cache.create_chat_completion("game_a", "规则A2", "第4天")) == "规则A2|第4天"
+        assert _ContextStandInHandler.requests[-1][0] == "/api/v3/chat/completions"
+
+        assert cache.metrics.get_counter("llm.prompt_prefix.hit") - hits_before == 2
+        stats = cache.get_stats()
+        assert stats["context_cache_enabled"] and stats["hit_latency"]["count"] >= 2
+        print(f"前缀统计: {stats}")
+    finally:
+        server.shutdown()
+
+    print("✓ 上下文缓存测试通过")
+
+
+def test_context_fallback_only_on_expiry():
+    """测试只在上下文失效时改用完整提示（包括流式请求），服务端错误不重发完整提示"""
+    print("\n=== 测试上下文失效重试 ===")
+
+    from llm.chat import _record_usage
+    from utils.token_budget import get_token_estimator
+
+    server, api_base = _start_stand_in_server()
+    try:
+        cache = PromptPrefixCache(enabled=True, api_base=api_base)
+        assert _content(cache.create_chat_completion("game_s", "规则S", "第1天")) == "规则S|第1天"
+
+        # 流式请求：上下文失效时改用完整提示
+        _ContextStandInHandler.contexts.clear()
+        assert "".join(cache.create_chat_completion("game_s", "规则S", "第2天", stream=True)) == "规则S|第2天"
+        assert _ContextStandInHandler.requests[-1][0] == "/api/v3/chat/completions"
+
+        # 服务端错误直接抛出，不重发完整提示
+        cache.create_chat_completion("game_s", "规则S", "第3天")
+        for status in (500, 503):
+            _ContextStandInHandler.fail_status = status
+            request_count = len(_ContextStandInHandler.requests)
+            for stream in (False, True):
+                try:
+                    result = cache.create_chat_completion("game_s", "规则S", "第4天", stream=stream)
+                    if stream:
+                        list(result)
+                    assert False, "服务端错误应当抛出"
+                except Exception as e:
+                    assert str(status) in str(e)
+            paths = [path for path, _ in _ContextStandInHandler.requests[request_count:]]
+            assert paths == ["/api/v3/context/chat/completions"] * 2, paths
+    finally:
+        server.shutdown()
+
+    # 带上下文ID的请求不用于校准token估算
+    estimator = get_token_estimator()
+    scale, samples = estimator.scale, estimator.calibration_samples
+    _record_usage({"context_id": "ctx-1", "messages": [{"role": "user", "content": "第1天"}]},
+                  {"prompt_tokens": 5000, "completion_tokens": 10})
+    assert (estimator.scale, estimator.calibration_samples) == (scale, samples)
+
+    print("✓ 上下文失效重试测试通过")
+
+
+def test_prefix_tracking_without_context_cache():
+    """测试未启用上下文缓存时发送完整提示并统计命中"""
+    print("\n=== 测试前缀命中统计 ===")
+
+    server, api_base = _start_stand_in_server()
+    try:
+        cache = PromptPrefixCache(enabled=False, api_base=api_base)
+        hits_before = cache.metrics.get_counter("llm.prompt_prefix.hit")
+
+        for day in range(1, 4):
+            assert _content(cache.create_chat_completion("game_c", "规则C", f"第{day}天")) == f"规则C|第{day}天"
+
+        paths = {path for path, _ in _ContextStandInHandler.requests}
+        assert paths == {"/api/v3/chat/completions"}
+        assert cache.metrics.get_counter("llm.prompt_prefix.hit") - hits_before == 2
+    finally:
+        server.shutdown()
+
+    print("✓ 前缀命中统计测试通过")
+
+
+def test_prompt_layout():
+    """测试行动提示的前缀不随玩家状态和行动变化"""
+    print("\n=== 测试提示前缀布局 ===")
+
+    from services.game_action_service import get_game_action_service
+
+    service = get_game_action_service()
+    game_state = {
+        "day": 1,
+        "player": {"basic_info": {"name": "艾伦"}, "stats": {"hp": 100}},
+        "world": {
+            "current_time": "上午", "weather": "晴天", "name": "艾尔德兰",
+            "locations": {"village": {"name": "村庄", "description": "平静的小村庄"}}
+        },
+        "npc": {"king": {"name": "国王", "profession": "国王", "stats": {"strength": 40}, "relationship": 0}},
+        "history": []
+    }
+
+    prefix_day1 = service._build_prompt_prefix(game_state)
+    game_state["day"] = 2
+    game_state["player"]["stats"]["hp"] = 60
+    game_state["npc"]["king"]["relationship"] = 20
+    game_state["history"] = ["拜见了国王"]
+    prefix_day2 = service._build_prompt_prefix(game_state)
+
+    assert prefix_day1 == prefix_day2
+    assert "可操作的NPC列表" in prefix_day1 and "村庄" in prefix_day1
+
+    user_prompt = service._build_user_prompt(game_state, "前往王城")
+    assert "关系值20" in user_prompt and "前往王城" in user_prompt
+
+    print("✓ 提示前缀布局测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试提示前缀缓存")
+    print("=" * 50)
+
+    try:
+        test_context_cache_per_game()
+        test_context_fallback_only_on_expiry()
+        test_prefix_tracking_without_context_cache()
+        test_prompt_layout()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有提示前缀缓存测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
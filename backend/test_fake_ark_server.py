@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+测试本地模拟 ARK 服务
+验证固定响应符合各类提示的输出格式、流式输出以及 429/5xx/超时注入
+"""
+
+import os
+from contextlib import contextmanager
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from llm.chat import create_chat_completion
+from llm.async_chat import AsyncLLMClient, run_coroutine_sync
+from llm.fake_ark_server import FakeArkServer, LatencyProfile, build_content, get_latency_profile
+from utils.text_analyzer import extract_result_json
+
+
+@contextmanager
+def fake_ark(profile: LatencyProfile = None):
+    """启动模拟服务并临时把 ARK_API_BASE 指向它"""
+    original = os.environ.get("ARK_API_BASE")
+    with FakeArkServer(profile, seed=42) as server:
+        os.environ["ARK_API_BASE"] = server.api_base
+        try:
+            yield server
+        finally:
+            if original is None:
+                os.environ.pop("ARK_API_BASE", None)
+            else:
+                os.environ["ARK_API_BASE"] = original
+
+
+def _create_game():
+    from services import get_game_data_service
+
+    return get_game_data_service().create_new_game({
+        "player": {"name": "测试勇者", "stats": {"hp": 90, "mp": 80, "strength": 15}},
+        "world": {"current_time": "上午", "weather": "晴天"},
+        "npc": {
+            "king": {"name": "国王", "profession": "国王", "relationship": 0, "stats": {"strength": 40}},
+            "princess": {"name": "公主", "profession": "公主", "relationship": 0, "stats": {"strength": 20}}
+        },
+        "history": []
+    })
+
+
+def test_canned_responses():
+    """测试各类提示的固定响应格式"""
+    print("\n=== 测试固定响应格式 ===")
+
+    import random
+    rng = random.Random(0)
+
+    story = build_content([{"role": "user", "content": "请放在<推演结果></推演结果>标签中"}], rng)
+    assert "narrative_description" in story and story.startswith("<推演结果>")
+
+    hero = extract_result_json(build_content([{"role": "user", "content": "放在<提取结果>中"}], rng))
+    assert "stats" in hero
+    equipment = extract_result_json(build_content([{"role": "user", "content": '<提取结果> "head"'}], rng))
+    assert "hands" in equipment
+    combined = extract_result_json(build_content([{"role": "user", "content": '<提取结果> "hero_info"'}], rng))
+    assert set(combined) == {"hero_info", "equipment"}
+
+    print("✓ 固定响应格式测试通过")
+
+
+def test_game_action_against_fake_server():
+    """测试行动处理（普通与流式）可直接使用模拟服务"""
+    print("\n=== 测试行动处理 ===")
+
+    from services import get_game_action_service
+
+    service = get_game_action_service()
+    with fake_ark(get_latency_profile("instant")) as server:
+        game_id = _create_game()
+
+        result = service.process_player_action(game_id, "拜见国王")
+        assert result is not None
+        assert set(result["time_progression"]) == {"morning", "afternoon", "evening"}
+        assert set(result["updated_states"]["npcs"]) <= {"king", "princess"}
+
+        events = list(service.process_player_action_stream(game_id, "和公主聊天"))
+        assert any(event["type"] == "narrative" for event in events)
+        assert events[-1]["type"] == "result"
+
+        assert server.stats["completions"] == 2
+
+    print("✓ 行动处理测试通过")
+
+
+def test_fault_injection():
+    """测试 429、5xx 和超时注入"""
+    print("\n=== 测试故障注入 ===")
+
+    with fake_ark(LatencyProfile(error_429_rate=1.0)) as server:
+        try:
+            create_chat_completion("你好", "系统")
+            assert False, "应当抛出异常"
+        except Exception as e:
+            assert "429" in str(e)
+        assert server.stats["errors_429"] == 1
+
+    with fake_ark(LatencyProfile(error_5xx_rate=1.0)) as server:
+        try:
+            create_chat_completion("你好", "系统")
+            assert False, "应当抛出异常"
+        except Exception as e:
+            assert "LLM服务调用失败" in str(e)
+
+    with fake_ark(LatencyProfile(timeout_rate=1.0, timeout_seconds=2.0)) as server:
+        client = AsyncLLMClient(max_concurrency=2, timeout=0.3)
+        try:
+            run_coroutine_sync(client.create_chat_completion("你好", "系统"))
+            assert False, "应当超时"
+        except Exception as e:
+            assert "超时" in str(e)
+
+    print("✓ 故障注入测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试本地模拟 ARK 服务")
+    print("=" * 50)
+
+    try:
+        test_canned_responses()
+        test_game_action_against_fake_server()
+        test_fault_injection()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有模拟服务测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
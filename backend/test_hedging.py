@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+测试LLM对冲请求
+使用两个本地模拟服务（慢的主端点和快的备用端点）验证对冲胜出、预算限制和流式首块对冲
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from llm import hedging
+from llm.chat import create_chat_completion
+from llm.hedging import RequestHedger, HedgeBudget
+from llm.model_routing import TASK_GAME_ACTION
+from llm.fake_ark_server import FakeArkServer, get_latency_profile
+from utils.metrics import get_metrics
+from test_fake_ark_server import fake_ark
+
+# 主端点的固定首字延迟（秒）
+SLOW_LATENCY = 0.8
+
+
+@contextmanager
+def hedged_servers(budget: HedgeBudget = None, min_delay: float = 0.1, task: str = TASK_GAME_ACTION):
+    """启动慢的主端点和快的备用端点，并临时替换全局对冲执行器"""
+    original = hedging._request_hedger
+    with fake_ark(get_latency_profile("instant", first_token_latency=SLOW_LATENCY)) as primary:
+        with FakeArkServer(get_latency_profile("instant"), seed=7) as alternate:
+            hedging._request_hedger = RequestHedger(
+                tasks=[task], min_samples=0, min_delay=min_delay,
+                budget=budget or HedgeBudget(ratio=1.0, burst=5), hedge_api_base=alternate.api_base
+            )
+            try:
+                yield primary, alternate
+            finally:
+                hedging._request_hedger = original
+
+
+def test_hedge_wins_over_slow_primary():
+    """测试主请求过慢时对冲请求胜出"""
+    print("\n=== 测试对冲请求胜出 ===")
+
+    metrics = get_metrics()
+    won = metrics.get_counter("llm.hedge.won")
+    cancelled = metrics.get_counter("llm.hedge.cancelled")
+
+    primary_latency = "llm.hedge.game_action.primary_latency"
+    samples = metrics.get_timer(primary_latency)["count"]
+
+    with hedged_servers() as (primary, alternate):
+        start_time = time.perf_counter()
+        result = create_chat_completion("你好", "系统", task=TASK_GAME_ACTION)
+        elapsed = time.perf_counter() - start_time
+
+        assert result["choices"][0]["message"]["content"].startswith("模拟回复")
+        assert elapsed < SLOW_LATENCY, f"对冲后耗时应低于主端点延迟: {elapsed:.2f}s"
+        assert alternate.stats.get("completions") == 1
+
+        # 落败的首个请求立即取消，记录取消时已耗费的时间，对冲延迟不会因只记录胜出请求而越来越短
+        assert metrics.get_timer(primary_latency)["count"] == samples + 1
+        assert 0.1 <= metrics.get_percentile(primary_latency, 100) < SLOW_LATENCY
+        assert hedging._request_hedger.hedge_delay(TASK_GAME_ACTION) >= 0.1
+
+    assert metrics.get_counter("llm.hedge.won") == won + 1
+    assert metrics.get_counter("llm.hedge.cancelled") == cancelled + 1
+
+    print(f"✓ 对冲请求胜出测试通过（耗时 {elapsed:.2f}s）")
+
+
+def test_no_hedge_for_fast_primary():
+    """测试主请求在对冲延迟内返回时不发送对冲请求"""
+    print("\n=== 测试快速请求不对冲 ===")
+
+    metrics = get_metrics()
+    sent = metrics.get_counter("llm.hedge.sent")
+    original = hedging._request_hedger
+    hedging._request_hedger = RequestHedger(tasks=[TASK_GAME_ACTION], min_samples=0, min_delay=0.5)
+    try:
+        with fake_ark(get_latency_profile("instant")) as server:
+            create_chat_completion("你好", "系统", task=TASK_GAME_ACTION)
+            assert server.stats.get("completions") == 1
+    finally:
+        hedging._request_hedger = original
+
+    assert metrics.get_counter("llm.hedge.sent") == sent
+
+    print("✓ 快速请求不对冲测试通过")
+
+
+def test_hedge_budget():
+    """测试预算耗尽后不再对冲"""
+    print("\n=== 测试对冲预算 ===")
+
+    metrics = get_metrics()
+    sent = metrics.get_counter("llm.hedge.sent")
+    exhausted = metrics.get_counter("llm.hedge.budget_exhausted")
+
+    # 突发额度为1且不再积累：只有第一次请求能对冲（使用独立的任务，不受其他测试记录的首个请求耗时影响）
+    with hedged_servers(budget=HedgeBudget(ratio=0.0, burst=1), task="hedge_budget") as (primary, alternate):
+        create_chat_completion("第一次", "系统", task="hedge_budget")
+        start_time = time.perf_counter()
+        create_chat_completion("第二次", "系统", task="hedge_budget")
+        elapsed = time.perf_counter() - start_time
+
+        assert elapsed >= SLOW_LATENCY, "预算耗尽后应等待主请求完成"
+        assert alternate.stats.get("completions") == 1
+
+    assert metrics.get_counter("llm.hedge.sent") == sent + 1
+    assert metrics.get_counter("llm.hedge.budget_exhausted") == exhausted + 1
+
+    budget = HedgeBudget(ratio=0.5, burst=1)
+    assert budget.try_acquire() and not budget.try_acquire()
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_acquire()
+
+    print("✓ 对冲预算测试通过")
+
+
+def test_stream_hedge_on_first_chunk():
+    """测试流式请求在首个数据块前对冲"""
+    print("\n=== 测试流式对冲 ===")
+
+    metrics = get_metrics()
+    won = metrics.get_counter("llm.hedge.won")
+
+    with hedged_servers() as (primary, alternate):
+        start_time = time.perf_counter()
+        chunks = list(create_chat_completion("你好", "系统", stream=True, task=TASK_GAME_ACTION))
+        elapsed = time.perf_counter() - start_time
+
+        assert "".join(chunks).startswith("模拟回复")
+        assert elapsed < SLOW_LATENCY, f"对冲后耗时应低于主端点延迟: {elapsed:.2f}s"
+
+    assert metrics.get_counter("llm.hedge.won") == won + 1
+
+    print(f"✓ 流式对冲测试通过（耗时 {elapsed:.2f}s）")
+
+
+def test_timeout_translated():
+    """测试等待对冲结果超时时抛出 requests 的超时异常，调用方原有的超时处理可以捕获"""
+    print("\n=== 测试超时异常转换 ===")
+
+    import requests
+    from llm import async_chat
+
+    run_coroutine_sync = async_chat.run_coroutine_sync
+    async_chat.run_coroutine_sync = lambda coro, timeout=None: run_coroutine_sync(coro, 0.1)
+    try:
+        with hedged_servers(min_delay=5) as (primary, alternate):
+            hedger = hedging._request_hedger
+            try:
+                hedger.post_json(primary.api_base + "/chat/completions", {"Content-Type": "application/json"},
+                                 {"model": "ep-x", "messages": [{"role": "user", "content": "你好"}]},
+                                 timeout=10, task=TASK_GAME_ACTION)
+                raise AssertionError("应当超时")
+            except requests.exceptions.Timeout as e:
+                print(f"超时异常: {e!r}")
+
+            # 经过 chat 的超时处理，转换为统一的超时提示
+            async_chat.run_coroutine_sync = lambda coro, timeout=None: run_coroutine_sync(coro, 0.1)
+            try:
+                create_chat_completion("你好", "系统", task=TASK_GAME_ACTION)
+                raise AssertionError("应当超时")
+            except Exception as e:
+                assert "超时" in str(e), e
+    finally:
+        async_chat.run_coroutine_sync = run_coroutine_sync
+
+    print("✓ 超时异常转换测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试LLM对冲请求...")
+
+    try:
+        test_hedge_wins_over_slow_primary()
+        test_no_hedge_for_fast_primary()
+        test_hedge_budget()
+        test_stream_hedge_on_first_chunk()
+        test_timeout_translated()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+测试勇者信息预取
+验证 /api/game/start 发起的后台提取可被 /api/hero/analyze 和 /api/world/create 复用，以及预取失败时的回退
+"""
+
+import os
+import uuid
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from flask import Flask
+from api import register_blueprints
+from llm.fake_ark_server import LatencyProfile, get_latency_profile
+from utils.hero_prefetch import HeroProfilePrefetcher
+from utils.metrics import get_metrics
+from test_fake_ark_server import fake_ark
+
+
+def _player_response():
+    # 每次使用不同的输入，避免命中磁盘上的提取缓存
+    return f"我是来自北方的剑士艾伦，二十五岁，手持长剑。({uuid.uuid4().hex[:8]})"
+
+
+def test_start_then_analyze():
+    """测试开场白回应后发起预取，分析接口复用进行中的结果"""
+    print("\n=== 测试预取复用 ===")
+
+    app = Flask(__name__)
+    register_blueprints(app)
+    client = app.test_client()
+    metrics = get_metrics()
+
+    with fake_ark(get_latency_profile("fast")) as server:
+        text = _player_response()
+        response = client.post('/api/game/start', json={"playerResponse": text})
+        assert response.get_json()["prefetch_started"] is True
+
+        # 重复提交不会再次预取
+        assert client.post('/api/game/start', json={"playerResponse": text}).get_json()["prefetch_started"] is False
+
+        hits_before = metrics.get_counter("hero_prefetch.hit_in_flight") + metrics.get_counter("hero_prefetch.hit_done")
+        response = client.post('/api/hero/analyze', json={"playerResponse": text})
+        assert response.status_code == 200
+        assert response.get_json()["status"] == "success"
+
+        response = client.post('/api/world/create', json={"playerResponse": text})
+        assert response.status_code == 200
+
+        hits_after = metrics.get_counter("hero_prefetch.hit_in_flight") + metrics.get_counter("hero_prefetch.hit_done")
+        assert hits_after - hits_before == 2
+        # 两个接口共享一次预取：一次勇者信息提取和一次装备提取
+        assert server.stats["completions"] == 2, server.stats
+
+    print("✓ 预取复用测试通过")
+
+
+def test_failed_prefetch_falls_back():
+    """测试预取失败时重新提取"""
+    print("\n=== 测试预取失败回退 ===")
+
+    prefetcher = HeroProfilePrefetcher(ttl_seconds=60)
+    text = _player_response()
+
+    with fake_ark(LatencyProfile(error_5xx_rate=1.0)):
+        assert prefetcher.prefetch(text)
+        try:
+            prefetcher.get_or_extract(text)
+            assert False, "服务失败时应抛出异常"
+        except Exception:
+            pass
+        assert not prefetcher.has_prefetch(text)
+
+    with fake_ark(get_latency_profile("instant")) as server:
+        hero_info, equipment = prefetcher.get_or_extract(text)
+        assert hero_info["name"] and isinstance(equipment, dict)
+        assert server.stats["completions"] == 2
+
+    print("✓ 预取失败回退测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试勇者信息预取")
+    print("=" * 50)
+
+    try:
+        test_start_then_analyze()
+        test_failed_prefetch_falls_back()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有预取测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
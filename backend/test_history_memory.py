@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+测试分层历史记忆
+验证原文窗口的选择、提示中的前情摘要、后台滚动摘要以及冷存储归档与完整历史读取
+"""
+
+import os
+import shutil
+import tempfile
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from flask import Flask
+from api import register_blueprints
+from llm.fake_ark_server import get_latency_profile
+from services import get_game_data_service
+from services.game_action_service import GameActionService
+from services.history_memory import (
+    HistoryMemory, get_history_memory_state, get_history_length, select_recent_history
+)
+from test_fake_ark_server import fake_ark, _create_game
+
+
+def _entries(count, start=1):
+    return [f"第{day}天: 勇者在村庄里度过了第{day}天" for day in range(start, start + count)]
+
+
+def test_select_recent_history():
+    """测试原文窗口：有摘要时从摘要覆盖范围之后开始，摘要落后时最多保留两倍窗口"""
+    print("\n=== 测试原文窗口 ===")
+
+    history = _entries(12)
+    assert select_recent_history(history, get_history_memory_state({}), 5) == history[-5:]
+
+    memory = {"summary": "前情", "summarized": 7, "archived": 0}
+    assert select_recent_history(history, memory, 5) == history[7:]
+
+    # 摘要只覆盖了前2条，最多保留最近10条
+    memory = {"summary": "前情", "summarized": 2, "archived": 0}
+    assert select_recent_history(history, memory, 5) == history[2:]
+    memory = {"summary": "前情", "summarized": 1, "archived": 0}
+    assert select_recent_history(history, memory, 5) == history[-10:]
+
+    # 已归档的记录不在列表中，按总序号计算
+    memory = {"summary": "前情", "summarized": 9, "archived": 7}
+    assert select_recent_history(history[7:], memory, 5) == history[7:]
+    assert get_history_length({"history": history[7:], "history_memory": memory}) == 12
+
+    print("✓ 原文窗口测试通过")
+
+
+def test_prompt_includes_summary():
+    """测试行动提示包含前情摘要，已被摘要覆盖的记录不再原文出现"""
+    print("\n=== 测试提示中的前情摘要 ===")
+
+    service = GameActionService()
+    history = _entries(8)
+    game_state = {
+        "day": 9,
+        "player": {"basic_info": {"name": "测试勇者"}, "stats": {"hp": 100}, "equipment": {}},
+        "world": {"current_time": "上午", "weather": "晴天"},
+        "npc": {},
+        "history": history
+    }
+
+    prompt = service._build_user_prompt(game_state, "探索村庄")
+    assert "前情摘要" not in prompt
+    assert history[2] not in prompt and history[3] in prompt
+
+    game_state["history_memory"] = {"summary": "勇者与村长结为好友", "summarized": 3}
+    prompt = service._build_user_prompt(game_state, "探索村庄")
+    assert "前情摘要: 勇者与村长结为好友" in prompt
+    assert prompt.index("前情摘要") < prompt.index(history[3])
+    assert history[2] not in prompt
+
+    print("✓ 提示中的前情摘要测试通过")
+
+
+def test_background_summary():
+    """测试滑出原文窗口的记录在后台并入摘要，只写入摘要字段"""
+    print("\n=== 测试后台滚动摘要 ===")
+
+    memory = HistoryMemory(recent_window=5)
+    game_data_service = get_game_data_service()
+
+    with fake_ark(get_latency_profile("instant")) as server:
+        game_id = _create_game()
+        history = _entries(8)
+        game_data_service.update_game_state(game_id, {"history": history})
+        game_state = game_data_service.get_game_state(game_id)
+
+        assert memory.schedule_summary(game_id, {"history": history[:5]}) is None, "窗口内的记录不需要摘要"
+        future = memory.schedule_summary(game_id, game_state)
+        assert future.result(timeout=10) is True
+        assert server.stats.get("requests", 0) == 1
+
+        game_state = game_data_service.get_game_state(game_id)
+        state = get_history_memory_state(game_state)
+        assert state["summary"] and len(state["summary"]) <= memory.summary_max_chars
+        assert state["summarized"] == 3
+        assert game_state["history"] == history, "摘要不修改原始记录"
+        assert memory.schedule_summary(game_id, game_state) is None
+
+        # 新增记录后只把新滑出窗口的记录并入摘要
+        game_data_service.update_game_state(game_id, {"history": history + _entries(2, start=9)})
+        assert memory.schedule_summary(game_id).result(timeout=10) is True
+        assert get_history_memory_state(game_data_service.get_game_state(game_id))["summarized"] == 5
+
+    print("✓ 后台滚动摘要测试通过")
+
+
+def test_state_locks_released():
+    """测试游戏状态锁在没有调用方持有时回收，不随游戏数量增长"""
+    print("\n=== 测试状态锁回收 ===")
+
+    game_data_service = get_game_data_service()
+    lock = game_data_service._get_state_lock("game-lock")
+    assert game_data_service._get_state_lock("game-lock") is lock, "持有期间同一游戏使用同一把锁"
+
+    before = len(game_data_service._state_locks)
+    for index in range(100):
+        with game_data_service._get_state_lock(f"game-lock-{index}"):
+            pass
+    assert len(game_data_service._state_locks) == before
+    del lock
+    assert "game-lock" not in game_data_service._state_locks
+
+    print("✓ 状态锁回收测试通过")
+
+
+def test_cold_storage():
+    """测试已摘要的记录移入冷存储，完整历史接口仍返回全部记录"""
+    print("\n=== 测试冷存储 ===")
+
+    archive_dir = tempfile.mkdtemp()
+    try:
+        memory = HistoryMemory(recent_window=3, cold_storage=True, archive_dir=archive_dir)
+        history = _entries(8)
+        game_state = {"history": history, "history_memory": {"summary": "前情", "summarized": 4}}
+
+        kept, updates = memory.archive("game-cold", game_state, list(history))
+        assert kept == history[4:] and updates == {"archived": 4}
+
+        game_state = {"history": kept, "history_memory": {"summary": "前情", "summarized": 4, "archived": 4}}
+        assert memory.load_full_history("game-cold", game_state) == history
+        assert get_history_length(game_state) == 8
+
+        # 状态保存失败后重复归档，读取时按序号去重
+        memory.archive("game-cold", {"history": history, "history_memory": {"summarized": 4}}, list(history))
+        assert memory.load_full_history("game-cold", game_state) == history
+
+        # 摘要尚未覆盖或仍在原文窗口内的记录不归档
+        assert memory.archive("game-cold", game_state, list(kept)) == (kept, {})
+        assert HistoryMemory(cold_storage=False).archive("game-cold", game_state, list(kept)) == (kept, {})
+    finally:
+        shutil.rmtree(archive_dir, ignore_errors=True)
+
+    print("✓ 冷存储测试通过")
+
+
+def test_history_api():
+    """测试完整历史接口"""
+    print("\n=== 测试历史接口 ===")
+
+    app = Flask(__name__)
+    register_blueprints(app)
+    client = app.test_client()
+
+    game_id = _create_game()
+    get_game_data_service().update_game_state(game_id, {
+        "history": _entries(2), "history_memory": {"summary": "前情", "summarized": 0}
+    })
+    data = client.get(f'/api/game/session/{game_id}/history').get_json()
+    assert data["status"] == "success"
+    assert data["history"] == _entries(2) and data["summary"] == "前情"
+    assert client.get('/api/game/session/missing-game/history').status_code == 404
+
+    print("✓ 历史接口测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试分层历史记忆...")
+
+    try:
+        test_select_recent_history()
+        test_prompt_includes_summary()
+        test_background_summary()
+        test_state_locks_released()
+        test_cold_storage()
+        test_history_api()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
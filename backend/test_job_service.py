@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+测试异步任务服务
+验证行动处理和剧情推演的 202 异步模式、任务查询与SSE订阅、服务重启后的任务恢复，以及多进程共享任务表时的租约
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from flask import Flask
+from api import register_blueprints
+from services.job_service import JobService, JobFailedError, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED
+from llm.fake_ark_server import get_latency_profile
+from test_fake_ark_server import fake_ark, _create_game
+
+
+def _create_client():
+    app = Flask(__name__)
+    register_blueprints(app)
+    return app.test_client()
+
+
+def _wait_for_job(client, job_id, timeout=10):
+    """轮询任务直到结束"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').get_json()["job"]
+        if job["status"] in (JOB_SUCCEEDED, JOB_FAILED):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"任务未在 {timeout} 秒内结束: {job_id}")
+
+
+def test_async_game_action():
+    """测试行动处理的异步模式与轮询"""
+    print("\n=== 测试异步行动处理 ===")
+
+    client = _create_client()
+    with fake_ark(get_latency_profile("instant")):
+        game_id = _create_game()
+
+        response = client.post('/api/game/action', json={"game_id": game_id, "action": "拜见国王"},
+                               headers={"Prefer": "respond-async"})
+        assert response.status_code == 202
+        data = response.get_json()
+        assert response.headers["Location"] == data["status_url"]
+
+        job = _wait_for_job(client, data["job_id"])
+        assert job["status"] == JOB_SUCCEEDED, job
+        assert "params" not in job
+        assert set(job["result"]["result"]["time_progression"]) == {"morning", "afternoon", "evening"}
+        assert len(job["result"]["updated_game_state"]["history"]) == 1
+
+        # 未声明异步时仍为同步处理
+        response = client.post('/api/game/action', json={"game_id": game_id, "action": "和公主聊天"})
+        assert response.status_code == 200
+
+    assert client.get('/api/jobs/job_notexist').status_code == 404
+
+    print("✓ 异步行动处理测试通过")
+
+
+def test_job_events_and_story_progress():
+    """测试SSE订阅与剧情推演的异步模式"""
+    print("\n=== 测试任务事件订阅 ===")
+
+    client = _create_client()
+    with fake_ark(get_latency_profile("fast")):
+        response = client.post('/api/story/progress', json={
+            "async": True,
+            "location": {"name": "王城", "current_characters": ["国王"]},
+            "character_actions": [{"character_name": "国王", "action_description": "召见勇者", "location": "王城"}],
+            "current_time": "D1Morning"
+        })
+        assert response.status_code == 202
+        events_url = response.get_json()["events_url"]
+
+        body = client.get(events_url).get_data(as_text=True)
+        statuses = [json.loads(line[len("data: "):])["status"]
+                    for line in body.splitlines() if line.startswith("data: ")]
+        print(f"状态序列: {statuses}")
+        assert statuses[-1] == JOB_SUCCEEDED
+        final = json.loads([line for line in body.splitlines() if line.startswith("data: ")][-1][len("data: "):])
+        assert final["result"] and final["error"] is None
+
+    print("✓ 任务事件订阅测试通过")
+
+
+def test_resume_after_restart():
+    """测试重启后未完成任务重新执行，已完成的行动不会重复执行"""
+    print("\n=== 测试重启恢复 ===")
+
+    jobs_dir = tempfile.mkdtemp(prefix="jobs_")
+    calls = []
+
+    def handler(params):
+        calls.append(params["value"])
+        if params["value"] < 0:
+            raise JobFailedError("参数错误")
+        return {"double": params["value"] * 2}
+
+    # 模拟重启前写入任务表、执行到一半的任务
+    service = JobService(jobs_dir=jobs_dir, max_workers=2)
+    service.register_handler("double", handler)
+    pending = {
+        "job_id": "job_" + "a" * 32, "type": "double", "game_id": None, "status": JOB_RUNNING,
+        "params": {"value": 21}, "result": None, "error": None,
+        "created_at": "2025-01-01T00:00:00", "updated_at": "2025-01-01T00:00:00"
+    }
+    with open(os.path.join(jobs_dir, f"{pending['job_id']}.json"), 'w', encoding='utf-8') as f:
+        json.dump(pending, f)
+
+    restarted = JobService(jobs_dir=jobs_dir, max_workers=2)
+    restarted.register_handler("double", handler)
+    assert restarted.resume_pending_jobs() == 1
+    job = restarted.wait_for_update(pending["job_id"], None, 5)
+    while job["status"] not in (JOB_SUCCEEDED, JOB_FAILED):
+        job = restarted.wait_for_update(pending["job_id"], job["updated_at"], 5)
+    assert job["status"] == JOB_SUCCEEDED and job["result"] == {"double": 42}
+
+    failed = restarted.submit_job("double", {"value": -1})
+    time.sleep(0.2)
+    assert restarted.get_job(failed["job_id"])["error"] == "参数错误"
+    assert restarted.resume_pending_jobs() == 0
+    assert calls == [21, -1]
+
+    assert restarted.purge_finished_jobs(max_age_seconds=0) == 2
+    assert restarted.get_job(pending["job_id"]) is None
+
+    # 行动任务：行动ID已记入游戏状态说明行动在重启前处理完毕
+    from api.game_api import run_game_action_job
+    from services import get_game_data_service
+    with fake_ark(get_latency_profile("instant")) as server:
+        game_id = _create_game()
+        params = {"game_id": game_id, "action": "拜见国王", "action_id": "action_resume"}
+        run_game_action_job(params)
+        # 叙述为空时历史不增长，仍能识别已处理的行动
+        get_game_data_service().update_game_state(game_id, {"history": []})
+        try:
+            run_game_action_job(params)
+            assert False, "不应重复执行"
+        except JobFailedError:
+            pass
+        assert server.stats["completions"] == 1
+
+    print("✓ 重启恢复测试通过")
+
+
+def test_job_leases():
+    """测试只恢复没有租约或租约过期的任务，其他存活进程执行中的任务不重复执行"""
+    print("\n=== 测试任务租约 ===")
+
+    jobs_dir = tempfile.mkdtemp(prefix="jobs_")
+    calls = []
+
+    def handler(params):
+        calls.append(params["value"])
+        return {"value": params["value"]}
+
+    # 另一个进程持有租约、仍在执行的任务
+    job_id = "job_" + "b" * 32
+    with open(os.path.join(jobs_dir, f"{job_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "job_id": job_id, "type": "echo", "game_id": None, "status": JOB_RUNNING,
+            "params": {"value": 1}, "result": None, "error": None,
+            "created_at": "2025-01-01T00:00:00", "updated_at": "2025-01-01T00:00:00"
+        }, f)
+    lease_path = os.path.join(jobs_dir, f"{job_id}.lease")
+    with open(lease_path, 'w', encoding='utf-8') as f:
+        f.write("other-worker")
+
+    service = JobService(jobs_dir=jobs_dir, max_workers=2, lease_timeout=1.0)
+    service.register_handler("echo", handler)
+    assert service.resume_pending_jobs() == 0, "租约有效的任务不恢复"
+
+    # 持有者退出后租约不再续约，过期后由本进程接管
+    expired = time.time() - 2
+    os.utime(lease_path, (expired, expired))
+    assert service.resume_pending_jobs() == 1
+    assert service.resume_pending_jobs() == 0, "接管后由本进程持有租约"
+    job = service.wait_for_update(job_id, None, 5)
+    while job["status"] not in (JOB_SUCCEEDED, JOB_FAILED):
+        job = service.wait_for_update(job_id, job["updated_at"], 5)
+    assert job["status"] == JOB_SUCCEEDED and calls == [1]
+
+    # 新提交的任务在执行期间持有租约并定期续约，其他服务实例不会恢复
+    started, release = threading.Event(), threading.Event()
+
+    def slow_handler(params):
+        started.set()
+        release.wait(5)
+        return {}
+
+    service.register_handler("slow", slow_handler)
+    other = JobService(jobs_dir=jobs_dir, max_workers=1, lease_timeout=1.0)
+    other.register_handler("slow", slow_handler)
+    slow = service.submit_job("slow", {})
+    assert started.wait(5)
+    time.sleep(1.5)
+    assert other.resume_pending_jobs() == 0, "心跳续约的租约不会过期"
+    release.set()
+    deadline = time.time() + 5
+    while os.path.exists(os.path.join(jobs_dir, f"{slow['job_id']}.lease")) and time.time() < deadline:
+        time.sleep(0.05)
+    assert service.get_job(slow["job_id"])["status"] == JOB_SUCCEEDED
+    assert not os.path.exists(lease_path), "任务结束后释放租约"
+
+    print("✓ 任务租约测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试异步任务服务")
+    print("=" * 50)
+
+    try:
+        test_async_game_action()
+        test_job_events_and_story_progress()
+        test_resume_after_restart()
+        test_job_leases()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有异步任务测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
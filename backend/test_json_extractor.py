@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+测试LLM输出JSON提取器
+验证各种包裹格式、嵌套对象、字符串中的特殊字符以及按任意位置切分的增量输入
+"""
+
+import json
+
+from utils.json_extractor import IncrementalJSONExtractor, JSONExtractionError, extract_json_object
+
+NESTED = {
+    "narrative_description": "国王说：\"{勇者}\"，请收下这把剑。\\n",
+    "updated_character_states": {"国王": {"mood": "满意", "stats": {"hp": 90}}},
+    "relationship_changes": {"国王": 5},
+    "events": [{"type": "dialogue", "tags": ["}", "{"]}]
+}
+
+
+def _wrapped_outputs():
+    payload = json.dumps(NESTED, ensure_ascii=False, indent=2)
+    return {
+        "纯JSON": payload,
+        "推演结果标签": f"<推演结果>\n{payload}\n</推演结果>",
+        "标签加代码块": f"<推演结果>\n```json\n{payload}\n```\n</推演结果>",
+        "提取结果标签": f"分析如下：\n<提取结果>{payload}</提取结果>",
+        "代码块": f"好的，推演结果如下：\n```json\n{payload}\n```\n以上。",
+        "前置花括号说明": f"请按 {{格式}} 输出。\n{payload}\n后记 }} 结束"
+    }
+
+
+def test_formats():
+    """测试各种包裹格式和嵌套对象"""
+    print("\n=== 测试包裹格式 ===")
+
+    for name, output in _wrapped_outputs().items():
+        assert extract_json_object(output) == NESTED, name
+        print(f"✓ {name}")
+
+    print("✓ 包裹格式测试通过")
+
+
+def test_incremental_chunks():
+    """测试在任意位置切分的增量输入"""
+    print("\n=== 测试增量输入 ===")
+
+    output = _wrapped_outputs()["标签加代码块"]
+    for size in (1, 2, 3, 7, 64):
+        extractor = IncrementalJSONExtractor()
+        results = [extractor.feed(output[i:i + size]) for i in range(0, len(output), size)]
+        assert [r for r in results if r is not None] == [NESTED], size
+        assert extractor.done and extractor.finish() == NESTED
+
+    # 对象闭合后即得到结果，后续输入被忽略
+    extractor = IncrementalJSONExtractor()
+    assert extractor.feed('<推演结果>{"a": {"b": 1}}') == {"a": {"b": 1}}
+    assert extractor.feed('</推演结果>{"c": 2}') is None
+    assert extractor.result == {"a": {"b": 1}}
+
+    print("✓ 增量输入测试通过")
+
+
+def test_errors():
+    """测试截断和无JSON的输出"""
+    print("\n=== 测试异常输出 ===")
+
+    truncated = IncrementalJSONExtractor()
+    truncated.feed('<推演结果>{"narrative": "清晨的阳光", "events": [1, 2')
+    assert truncated.pending.startswith('{"narrative"')
+    try:
+        truncated.finish()
+        assert False, "截断的输出应当报错"
+    except JSONExtractionError as e:
+        assert "截断" in str(e)
+
+    for output in ("没有任何JSON", "{不是JSON}", '["列表"]'):
+        try:
+            extract_json_object(output)
+            assert False, output
+        except ValueError:
+            pass
+
+    print("✓ 异常输出测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试JSON提取器")
+    print("=" * 50)
+
+    try:
+        test_formats()
+        test_incremental_chunks()
+        test_errors()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有JSON提取器测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
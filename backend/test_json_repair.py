@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+测试LLM输出JSON修复
+验证常见语法缺陷的修复、截断输出的补全，以及行动处理中只补问缺失部分
+"""
+
+import os
+import random
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from utils.json_repair import repair_json, parse_json_with_repair, JSONRepairError
+from utils.metrics import get_metrics
+from llm.fake_ark_server import build_game_action_content, get_latency_profile
+from test_fake_ark_server import fake_ark, _create_game
+
+
+def test_syntax_defects():
+    """测试多余逗号、未转义引号和换行"""
+    print("\n=== 测试语法缺陷修复 ===")
+
+    assert repair_json('{"a": 1, "b": [1, 2,],}') == {"a": 1, "b": [1, 2]}
+    assert repair_json('<推演结果>{"n": "国王说："快走"，然后离开", "x": 1}</推演结果>') == \
+        {"n": '国王说："快走"，然后离开', "x": 1}
+    assert repair_json('{"a": "第一行\n第二行"}') == {"a": "第一行\n第二行"}
+    assert parse_json_with_repair('```json\n{"ok": true}\n```') == {"ok": True}
+
+    try:
+        repair_json("没有JSON")
+        assert False, "应当无法修复"
+    except JSONRepairError:
+        pass
+
+    print("✓ 语法缺陷修复测试通过")
+
+
+def test_truncated_output():
+    """测试截断输出的补全"""
+    print("\n=== 测试截断补全 ===")
+
+    cases = {
+        '{"a": {"b": [1, 2': {"a": {"b": [1, 2]}},
+        '{"a": {"b": "未完': {"a": {"b": "未完"}},
+        '{"a": 1, "b': {"a": 1},
+        '{"a": 1, "b":': {"a": 1, "b": None},
+        '{"a": [1, tr': {"a": [1]},
+        '{"a": 1, "b": {"c": "d"}, ': {"a": 1, "b": {"c": "d"}}
+    }
+    for text, expected in cases.items():
+        assert repair_json(text) == expected, text
+
+    # 任意位置截断的真实输出都能得到一个对象
+    content = build_game_action_content("", "第1天", random.Random(1))
+    for cut in range(content.index('{') + 1, len(content), 37):
+        assert isinstance(repair_json(content[:cut]), dict), cut
+
+    print("✓ 截断补全测试通过")
+
+
+def test_complete_missing_sections():
+    """测试截断的行动结果只补问缺失部分"""
+    print("\n=== 测试补问缺失部分 ===")
+
+    from services import get_game_action_service
+
+    service = get_game_action_service()
+    metrics = get_metrics()
+    saved_before = metrics.get_counter("game_action.llm_calls_saved")
+
+    with fake_ark(get_latency_profile("instant")) as server:
+        game_id = _create_game()
+        prepared = service._prepare_action(game_id, "拜见国王")
+
+        content = build_game_action_content("", prepared["user_prompt"], random.Random(2))
+        # 输出在 updated_states 之前被截断：修复得到其余部分，只补问 updated_states
+        truncated = content[:content.index('"updated_states"')]
+        partial, repaired = service._parse_llm_content(truncated)
+        assert repaired and "day_summary" in partial and "updated_states" not in partial
+
+        result = service._finalize_action_result(game_id, prepared, partial, repaired)
+        assert result is not None and "updated_states" in result
+        assert set(result["time_progression"]) == {"morning", "afternoon", "evening"}
+        assert server.stats["completions"] == 1
+
+    assert metrics.get_counter("game_action.llm_calls_saved") == saved_before + 1
+
+    print("✓ 补问缺失部分测试通过")
+
+
+def test_missing_sections_request_rejected():
+    """测试补问被调度器拒绝时沿用已修复的部分结果，而不是让整个行动失败"""
+    print("\n=== 测试补问被拒绝 ===")
+
+    from services.game_action_service import GameActionService
+    from llm.scheduler import LLMOverloadedError
+
+    service = GameActionService()
+    metrics = get_metrics()
+    rejected_before = metrics.get_counter("game_action.section_requests.rejected")
+
+    with fake_ark(get_latency_profile("instant")):
+        game_id = _create_game()
+        prepared = service._prepare_action(game_id, "拜见国王")
+        content = build_game_action_content("", prepared["user_prompt"], random.Random(2))
+        partial, repaired = service._parse_llm_content(content[:content.index('"updated_states"')])
+
+        def rejected(*args, **kwargs):
+            raise LLMOverloadedError("LLM服务繁忙，请稍后重试", 5)
+
+        service.prompt_prefix_cache.create_chat_completion = rejected
+        try:
+            result = service._finalize_action_result(game_id, prepared, partial, repaired)
+        finally:
+            del service.prompt_prefix_cache.create_chat_completion
+
+    assert result is not None and "updated_states" not in result
+    assert set(result["time_progression"]) == {"morning", "afternoon", "evening"}
+    assert metrics.get_counter("game_action.section_requests.rejected") == rejected_before + 1
+
+    print("✓ 补问被拒绝测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试JSON修复")
+    print("=" * 50)
+
+    try:
+        test_syntax_defects()
+        test_truncated_output()
+        test_complete_missing_sections()
+        test_missing_sections_request_rejected()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有JSON修复测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+测试API密钥池
+验证配置解析、按负载选择密钥、RPM/TPM令牌桶限额以及 429 后的冷却
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from llm import key_pool
+from llm.chat import create_chat_completion
+from llm.key_pool import ApiKeyPool, TokenBucket, parse_key_entries
+from llm.scheduler import LLMOverloadedError
+from llm.fake_ark_server import LatencyProfile, get_latency_profile
+from test_fake_ark_server import fake_ark
+
+
+@contextmanager
+def temporary_pool(pool: ApiKeyPool):
+    """临时替换全局密钥池"""
+    original = key_pool._api_key_pool
+    key_pool._api_key_pool = pool
+    try:
+        yield pool
+    finally:
+        key_pool._api_key_pool = original
+
+
+def test_parse_key_entries():
+    """测试 ARK_API_KEYS 配置解析"""
+    print("\n=== 测试密钥配置解析 ===")
+
+    entries = parse_key_entries("key-a, key-b@http://127.0.0.1:9000/api/v3;rpm=100;tpm=5000,,key-c;rpm=abc")
+    assert entries == [
+        {"key": "key-a"},
+        {"key": "key-b", "api_base": "http://127.0.0.1:9000/api/v3", "rpm": 100.0, "tpm": 5000.0},
+        {"key": "key-c"}
+    ]
+
+    print("✓ 密钥配置解析测试通过")
+
+
+def test_token_bucket():
+    """测试令牌桶的等待时间与透支"""
+    print("\n=== 测试令牌桶 ===")
+
+    now = time.monotonic()
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(60, now) == 0
+    bucket.consume(60, now)
+    # 每秒补充1个令牌
+    assert abs(bucket.wait_time(1, now) - 1.0) < 0.01
+    # 超过容量的请求按装满计算
+    assert abs(bucket.wait_time(1000, now) - 60.0) < 0.01
+    bucket.consume(30, now)
+    assert bucket.utilization(now) == 1.0
+
+    unlimited = TokenBucket(0)
+    unlimited.consume(10 ** 6, now)
+    assert unlimited.wait_time(10 ** 6, now) == 0 and unlimited.utilization(now) == 0
+
+    print("✓ 令牌桶测试通过")
+
+
+def test_least_loaded_selection():
+    """测试选择负载最低的密钥"""
+    print("\n=== 测试按负载选择密钥 ===")
+
+    pool = ApiKeyPool([{"key": "key-a"}, {"key": "key-b"}], rpm=60)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.key, second.key} == {"key-a", "key-b"}, "进行中的请求应分散到不同密钥"
+    pool.release(first)
+    pool.release(second)
+
+    # RPM占用率低的密钥优先
+    third = pool.acquire()
+    pool.release(third)
+    fourth = pool.acquire()
+    pool.release(fourth)
+    assert third.key != fourth.key
+
+    # 对冲请求避开指定密钥
+    lease = pool.acquire(exclude=["key1"])
+    assert lease.key_id == "key2"
+    pool.release(lease)
+
+    stats = pool.get_stats()
+    assert stats["key1"]["requests"] + stats["key2"]["requests"] == 5
+    assert stats["key1"]["key"] == "****ey-a"
+
+    print("✓ 按负载选择密钥测试通过")
+
+
+def test_rate_limits():
+    """测试RPM/TPM限额用尽时等待或拒绝"""
+    print("\n=== 测试限额 ===")
+
+    pool = ApiKeyPool([{"key": "key-a", "rpm": 1}], max_wait=0.1)
+    pool.release(pool.acquire())
+    try:
+        pool.acquire()
+        assert False, "RPM用尽时应当拒绝"
+    except LLMOverloadedError as e:
+        assert e.retry_after >= 1
+
+    assert pool.acquire(wait=False) is None
+
+    # TPM：预留输入token并补记输出token
+    pool = ApiKeyPool([{"key": "key-a"}], tpm=600, max_wait=0.1)
+    lease = pool.acquire(estimated_tokens=300)
+    lease.completion_tokens = 300
+    pool.release(lease)
+    assert pool.get_stats()["key1"]["tpm_utilization"] > 0.99
+    try:
+        pool.acquire(estimated_tokens=100)
+        assert False, "TPM用尽时应当拒绝"
+    except LLMOverloadedError:
+        pass
+
+    # 等待时间在 max_wait 内时阻塞等待
+    pool = ApiKeyPool([{"key": "key-a", "rpm": 600}], max_wait=1.0)
+    pool.release(pool.acquire(estimated_tokens=0))
+    for _ in range(599):
+        pool.release(pool.acquire())
+    start_time = time.perf_counter()
+    pool.release(pool.acquire())
+    assert time.perf_counter() - start_time >= 0.05
+
+    print("✓ 限额测试通过")
+
+
+def test_cooldown_after_429():
+    """测试 429 后密钥进入冷却，后续请求使用其他密钥"""
+    print("\n=== 测试 429 冷却 ===")
+
+    pool = ApiKeyPool([{"key": "key-a"}, {"key": "key-b"}], cooldown_seconds=30)
+    with temporary_pool(pool):
+        with fake_ark(LatencyProfile(error_429_rate=1.0, retry_after=30)):
+            try:
+                create_chat_completion("你好", "系统")
+                assert False, "应当抛出异常"
+            except Exception as e:
+                assert "429" in str(e)
+
+        stats = pool.get_stats()
+        limited = [key_id for key_id, item in stats.items() if item["rate_limited"]]
+        assert len(limited) == 1 and stats[limited[0]]["cooldown_remaining"] > 20
+
+        with fake_ark(get_latency_profile("instant")):
+            for _ in range(3):
+                create_chat_completion("你好", "系统")
+
+        stats = pool.get_stats()
+        healthy = next(key_id for key_id in stats if key_id not in limited)
+        assert stats[healthy]["requests"] == 3
+        assert stats[limited[0]]["requests"] == 1
+
+    print("✓ 429 冷却测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试API密钥池...")
+
+    try:
+        test_parse_key_entries()
+        test_token_bucket()
+        test_least_loaded_selection()
+        test_rate_limits()
+        test_cooldown_after_429()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
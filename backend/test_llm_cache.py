@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+测试LLM响应缓存
+验证缓存键规范化、内存LRU、磁盘持久化、TTL过期以及并发请求合并
+"""
+
+import time
+import shutil
+import tempfile
+import threading
+
+from utils.llm_cache import LLMResponseCache
+
+
+def _create_cache(**kwargs) -> LLMResponseCache:
+    """在临时目录中创建缓存实例"""
+    cache_dir = tempfile.mkdtemp(prefix="llm_cache_test_")
+    return LLMResponseCache(cache_dir=cache_dir, **kwargs)
+
+
+def test_cache_key():
+    """测试缓存键"""
+    print("\n=== 测试缓存键 ===")
+
+    key = LLMResponseCache.make_key("hero_info", "模板{player_input}", "我是  勇者，手持长剑")
+    # 全角字符与多余空白不影响缓存键
+    assert key == LLMResponseCache.make_key("hero_info", "模板{player_input}", " 我是 勇者,手持长剑 ")
+    # 模板、类型或版本不同时缓存键不同
+    assert key != LLMResponseCache.make_key("hero_info", "新模板{player_input}", "我是 勇者，手持长剑")
+    assert key != LLMResponseCache.make_key("equipment", "模板{player_input}", "我是 勇者，手持长剑")
+    assert key != LLMResponseCache.make_key("hero_info", "模板{player_input}", "我是 勇者，手持长剑", version="2")
+
+    print("✓ 缓存键测试通过")
+
+
+def test_memory_and_disk():
+    """测试内存LRU与磁盘持久化"""
+    print("\n=== 测试内存与磁盘缓存 ===")
+
+    cache = _create_cache(max_memory_entries=2)
+    try:
+        cache.set("a", {"name": "勇者"})
+        cache.set("b", {"name": "法师"})
+        cache.set("c", {"name": "盗贼"})
+
+        # a 已被挤出内存，但仍可从磁盘读取
+        assert cache.get("a") == {"name": "勇者"}
+        stats = cache.get_stats()
+        print(f"缓存统计: {stats}")
+        assert stats["disk_hits"] == 1
+        assert stats["memory_entries"] == 2
+
+        # 新实例可读取磁盘上的缓存
+        reloaded = LLMResponseCache(cache_dir=cache.cache_dir)
+        assert reloaded.get("c") == {"name": "盗贼"}
+
+        # 返回的是副本，修改不影响缓存
+        value = cache.get("b")
+        value["name"] = "被修改"
+        assert cache.get("b") == {"name": "法师"}
+    finally:
+        shutil.rmtree(cache.cache_dir, ignore_errors=True)
+
+    print("✓ 内存与磁盘缓存测试通过")
+
+
+def test_ttl_expiry():
+    """测试TTL过期"""
+    print("\n=== 测试TTL过期 ===")
+
+    cache = _create_cache()
+    try:
+        cache.set("short", {"v": 1}, ttl_seconds=0.05)
+        assert cache.get("short") == {"v": 1}
+        time.sleep(0.1)
+        assert cache.get("short") is None
+        assert cache.purge_expired() == 0
+    finally:
+        shutil.rmtree(cache.cache_dir, ignore_errors=True)
+
+    print("✓ TTL过期测试通过")
+
+
+def test_single_flight():
+    """测试并发相同请求只计算一次"""
+    print("\n=== 测试并发请求合并 ===")
+
+    cache = _create_cache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"name": "勇者"}
+
+    results = []
+    try:
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        print(f"计算次数: {len(calls)}，结果数: {len(results)}")
+        assert len(calls) == 1
+        assert results == [{"name": "勇者"}] * 8
+
+        # 计算失败不会被缓存
+        def failing():
+            raise ValueError("未找到提取结果")
+
+        try:
+            cache.get_or_compute("bad", failing)
+            raise AssertionError("应当抛出异常")
+        except ValueError:
+            pass
+        assert cache.get("bad") is None
+
+        # 读取缓存未命中之后、登记计算之前，先前的计算恰好写入结果并结束：不应再次计算
+        cache.set("late", {"name": "公主"})
+        cache.get = lambda key: None
+        assert cache.get_or_compute("late", compute) == {"name": "公主"}
+        assert len(calls) == 1
+    finally:
+        shutil.rmtree(cache.cache_dir, ignore_errors=True)
+
+    print("✓ 并发请求合并测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试LLM响应缓存")
+    print("=" * 50)
+
+    try:
+        test_cache_key()
+        test_memory_and_disk()
+        test_ttl_expiry()
+        test_single_flight()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有LLM响应缓存测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+测试LLM请求调度器
+验证并发上限、优先级、按游戏轮转、提前拒绝以及API层的 429 响应
+"""
+
+import time
+import threading
+
+from llm import scheduler as scheduler_module
+from llm.scheduler import (
+    LLMScheduler, LLMOverloadedError,
+    PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+)
+
+
+def _run_in_order(scheduler, requests, hold=0.05, deadline=10):
+    """依次发起请求（每个请求在独立线程中排队），返回获得槽位的顺序"""
+    order = []
+    lock = threading.Lock()
+
+    def worker(label, priority, game_id):
+        with scheduler.request_context(priority, game_id, deadline=deadline):
+            with scheduler.slot():
+                with lock:
+                    order.append(label)
+                time.sleep(hold)
+
+    threads = []
+    for label, priority, game_id in requests:
+        thread = threading.Thread(target=worker, args=(label, priority, game_id))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+
+    for thread in threads:
+        thread.join()
+    return order
+
+
+def test_max_in_flight():
+    """测试同时进行的请求数不超过上限"""
+    print("\n=== 测试并发上限 ===")
+
+    scheduler = LLMScheduler(max_in_flight=2, max_queue=16)
+    scheduler.service_time = 0.05
+    active = [0, 0]
+    lock = threading.Lock()
+
+    def worker():
+        with scheduler.request_context(deadline=10):
+            with scheduler.slot():
+                with lock:
+                    active[0] += 1
+                    active[1] = max(active[1], active[0])
+                time.sleep(0.05)
+                with lock:
+                    active[0] -= 1
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert active[1] == 2
+    assert scheduler.get_stats()["in_flight"] == 0 and scheduler.get_stats()["queue_depth"] == 0
+
+    print("✓ 并发上限测试通过")
+
+
+def test_priority_and_fairness():
+    """测试优先级和同优先级内按游戏轮转"""
+    print("\n=== 测试优先级与公平调度 ===")
+
+    scheduler = LLMScheduler(max_in_flight=1, max_queue=16)
+    scheduler.service_time = 0.05
+    order = _run_in_order(scheduler, [
+        ("hold", PRIORITY_INTERACTIVE, "game_x"),
+        ("bg", PRIORITY_BACKGROUND, "game_x"),
+        ("a1", PRIORITY_INTERACTIVE, "game_a"),
+        ("a2", PRIORITY_INTERACTIVE, "game_a"),
+        ("a3", PRIORITY_INTERACTIVE, "game_a"),
+        ("b1", PRIORITY_INTERACTIVE, "game_b"),
+    ], hold=0.2)
+    print(f"执行顺序: {order}")
+
+    assert order[0] == "hold"
+    assert order[-1] == "bg"
+    assert order.index("b1") < order.index("a2")
+
+    print("✓ 优先级与公平调度测试通过")
+
+
+def test_early_rejection():
+    """测试预计等待超过截止时间或队列已满时立即拒绝"""
+    print("\n=== 测试提前拒绝 ===")
+
+    scheduler = LLMScheduler(max_in_flight=1, max_queue=1)
+    scheduler.service_time = 10.0
+
+    release = threading.Event()
+
+    def holder():
+        with scheduler.slot():
+            release.wait(5)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    time.sleep(0.05)
+
+    try:
+        start_time = time.time()
+        with scheduler.request_context(PRIORITY_INTERACTIVE, "game_a", deadline=1):
+            scheduler.admit()
+        assert False, "应当拒绝"
+    except LLMOverloadedError as e:
+        assert e.retry_after >= 10
+        assert time.time() - start_time < 0.5
+
+    # 截止时间足够长时允许排队，队列满后拒绝
+    waiter = threading.Thread(target=lambda: _run_in_order(scheduler, [("w", PRIORITY_INTERACTIVE, "game_b")], 0, 60))
+    waiter.start()
+    time.sleep(0.05)
+    try:
+        with scheduler.request_context(PRIORITY_INTERACTIVE, "game_c", deadline=60):
+            with scheduler.slot():
+                pass
+        assert False, "队列已满时应当拒绝"
+    except LLMOverloadedError:
+        pass
+
+    release.set()
+    thread.join()
+    waiter.join()
+    assert scheduler.metrics.get_counter("llm.scheduler.rejected.queue_full") >= 1
+
+    print("✓ 提前拒绝测试通过")
+
+
+def test_deadline_per_call():
+    """测试截止时间按每次调用计算：第一次调用超过截止时间后，同一请求的后续调用仍可执行"""
+    print("\n=== 测试每次调用的截止时间 ===")
+
+    scheduler = LLMScheduler(max_in_flight=1, max_queue=4)
+
+    with scheduler.request_context(PRIORITY_INTERACTIVE, "game_a", deadline=0.5):
+        with scheduler.slot():
+            time.sleep(0.6)
+        scheduler.admit()
+        with scheduler.slot():
+            pass
+
+    # 有空闲槽位时，即使截止时间已不为正也不拒绝
+    with scheduler.request_context(PRIORITY_INTERACTIVE, "game_a", deadline=0):
+        with scheduler.slot():
+            pass
+
+    assert scheduler.get_stats()["in_flight"] == 0
+
+    print("✓ 每次调用的截止时间测试通过")
+
+
+def test_overloaded_response():
+    """测试API层在调度器繁忙时返回 429 和 Retry-After"""
+    print("\n=== 测试 429 响应 ===")
+
+    from flask import Flask
+    from api.hero_api import hero_bp
+
+    app = Flask(__name__)
+    app.register_blueprint(hero_bp, url_prefix='/api/hero')
+    client = app.test_client()
+
+    original = scheduler_module._llm_scheduler
+    busy = LLMScheduler(max_in_flight=1, max_queue=0)
+    busy.in_flight = 1
+    scheduler_module._llm_scheduler = busy
+    try:
+        response = client.post('/api/hero/analyze', json={"playerResponse": "我是剑士"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert response.get_json()["retry_after"] >= 1
+    finally:
+        scheduler_module._llm_scheduler = original
+
+    print("✓ 429 响应测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试LLM请求调度器")
+    print("=" * 50)
+
+    try:
+        test_max_in_flight()
+        test_priority_and_fairness()
+        test_early_rejection()
+        test_deadline_per_call()
+        test_overloaded_response()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有调度器测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
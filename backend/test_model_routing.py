@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+测试LLM任务路由
+验证配置文件与环境变量覆盖、请求负载中的路由参数以及按任务记录的延迟分布
+"""
+
+import os
+import json
+import tempfile
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from llm import model_routing
+from llm.chat import create_chat_completion, _build_payload
+from llm.model_routing import (
+    ModelRouter, ModelRoute, DEFAULT_ROUTES,
+    TASK_DEFAULT, TASK_HERO_EXTRACT, TASK_GAME_ACTION, TASK_STORY_PROGRESSION
+)
+from llm.fake_ark_server import get_latency_profile
+from utils.metrics import get_metrics
+from test_fake_ark_server import fake_ark
+
+
+def _write_routes(routes):
+    handle = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8')
+    with handle:
+        json.dump(routes, handle)
+    return handle.name
+
+
+def test_route_overrides():
+    """测试默认路由、配置文件与环境变量覆盖"""
+    print("\n=== 测试路由配置 ===")
+
+    routes_file = _write_routes({
+        "hero_extract": {"model": "ep-fast", "temperature": 0.1, "unknown_field": 1},
+        "npc_summary": {"model": "ep-cheap", "max_tokens": 256},
+        "game_action": {"timeout": "not-a-number"}
+    })
+    try:
+        router = ModelRouter(routes_file, environ={
+            "LLM_ROUTE_GAME_ACTION_MODEL": "ep-large",
+            "LLM_ROUTE_STORY_PROGRESSION_MAX_TOKENS": ""
+        })
+
+        hero = router.get_route(TASK_HERO_EXTRACT)
+        assert hero.model == "ep-fast" and hero.temperature == 0.1
+        # 配置文件未指定的字段保留默认路由的值
+        assert hero.max_tokens == DEFAULT_ROUTES[TASK_HERO_EXTRACT].max_tokens
+
+        # 新增的任务类型基于默认路由
+        assert router.get_route("npc_summary") == ModelRoute(model="ep-cheap", max_tokens=256)
+
+        # 无效值被忽略，环境变量覆盖单个字段
+        action = router.get_route(TASK_GAME_ACTION)
+        assert action.model == "ep-large" and action.timeout == DEFAULT_ROUTES[TASK_GAME_ACTION].timeout
+        assert router.get_route(TASK_STORY_PROGRESSION).max_tokens is None
+
+        # 未配置的任务使用默认路由
+        assert router.get_route("unknown") == router.get_route(TASK_DEFAULT)
+        assert router.get_route(None) == router.get_route(TASK_DEFAULT)
+    finally:
+        os.unlink(routes_file)
+
+    print("✓ 路由配置测试通过")
+
+
+def test_payload_uses_route():
+    """测试请求负载包含路由的采样参数"""
+    print("\n=== 测试请求负载 ===")
+
+    route = ModelRoute(model="ep-x", max_tokens=128, temperature=0.3)
+    payload = _build_payload("你好", "系统", route.model, route=route)
+    assert payload["model"] == "ep-x"
+    assert payload["max_tokens"] == 128 and payload["temperature"] == 0.3
+
+    payload = _build_payload("你好", "系统", "ep-y", route=ModelRoute())
+    assert "max_tokens" not in payload and "temperature" not in payload
+
+    # 未配置时默认路由不设置采样参数，使用服务端默认值
+    router = ModelRouter(os.path.join(tempfile.gettempdir(), "missing_routes.json"), environ={})
+    for task in DEFAULT_ROUTES:
+        route = router.get_route(task)
+        assert route.max_tokens is None and route.temperature is None, task
+    payload = _build_payload("你好", "系统", "ep-y", route=router.get_route(TASK_GAME_ACTION))
+    assert "max_tokens" not in payload and "temperature" not in payload
+
+    print("✓ 请求负载测试通过")
+
+
+def test_task_latency_against_fake_server():
+    """测试请求按任务路由到对应模型并分别记录延迟"""
+    print("\n=== 测试按任务记录延迟 ===")
+
+    routes_file = _write_routes({
+        "hero_extract": {"model": "ep-extract"},
+        "story_progression": {"model": "ep-story"}
+    })
+    original_router = model_routing._model_router
+    model_routing._model_router = ModelRouter(routes_file, environ={})
+    metrics = get_metrics()
+    try:
+        with fake_ark(get_latency_profile("instant")):
+            before_hero = metrics.get_timer("llm.task.hero_extract.latency")["count"]
+            before_story = metrics.get_timer("llm.task.story_progression.latency")["count"]
+
+            assert create_chat_completion("你好", "系统", task=TASK_HERO_EXTRACT)["model"] == "ep-extract"
+            assert create_chat_completion("你好", "系统", task=TASK_STORY_PROGRESSION)["model"] == "ep-story"
+            assert create_chat_completion("你好", "系统", task=TASK_STORY_PROGRESSION)["model"] == "ep-story"
+            # 显式指定的模型优先于路由
+            assert create_chat_completion("你好", "系统", model="ep-manual",
+                                          task=TASK_HERO_EXTRACT)["model"] == "ep-manual"
+
+            chunks = list(create_chat_completion("你好", "系统", stream=True, task=TASK_HERO_EXTRACT))
+            assert "".join(chunks).startswith("模拟回复")
+
+        assert metrics.get_timer("llm.task.hero_extract.latency")["count"] == before_hero + 3
+        assert metrics.get_timer("llm.task.story_progression.latency")["count"] == before_story + 2
+        assert metrics.get_timer("llm.task.hero_extract.first_chunk_latency")["count"] >= 1
+
+        stats = model_routing._model_router.get_stats()
+        assert stats[TASK_STORY_PROGRESSION]["route"]["model"] == "ep-story"
+        assert stats[TASK_STORY_PROGRESSION]["latency"]["count"] >= 2
+    finally:
+        model_routing._model_router = original_router
+        os.unlink(routes_file)
+
+    print("✓ 按任务记录延迟测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试LLM任务路由...")
+
+    try:
+        test_route_overrides()
+        test_payload_uses_route()
+        test_task_latency_against_fake_server()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+测试NPC目录
+验证目录只在模板修改时构建、返回的副本互不影响，以及NPC接口和创建世界直接使用目录
+"""
+
+import os
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from flask import Flask
+from api import register_blueprints
+from models import NPC
+from services.npc_catalog import NpcCatalog, get_npc_catalog
+from utils.resource_registry import get_resource_registry, freeze
+from utils.metrics import get_metrics
+
+
+def test_catalog():
+    """测试目录内容与NPC对象序列化结果一致，副本可以修改且互不影响"""
+    print("\n=== 测试NPC目录 ===")
+
+    catalog = get_npc_catalog()
+    assert get_npc_catalog() is catalog, "模板未修改时复用同一目录"
+    templates = get_resource_registry().get_json('npc/npc_templates.json')
+    assert catalog.ids() == tuple(templates) and len(catalog) == len(templates)
+
+    npc_id = catalog.ids()[0]
+    template = templates[npc_id]
+    npc = NPC(template['name'], template['age'], template['gender'], template['profession'])
+    for stat_name, stat_value in template['stats'].items():
+        npc.update_stats(stat_name, stat_value)
+    assert catalog.copy_npc(npc_id) == npc.to_dict()
+
+    first = catalog.copy_all()
+    first[npc_id]["relationship"] = 50
+    first[npc_id]["stats"]["strength"] = 999
+    first[npc_id]["events"].append({"time_of_day": "D1Morning", "description": "测试"})
+    second = catalog.copy_all()
+    assert second[npc_id] == npc.to_dict(), "修改副本不影响目录"
+    assert catalog.get("不存在") is None and catalog.copy_npc("不存在") is None
+
+    print("✓ NPC目录测试通过")
+
+
+def test_invalid_template_skipped():
+    """测试格式错误的模板跳过，其余NPC照常构建"""
+    print("\n=== 测试格式错误的模板 ===")
+
+    catalog = NpcCatalog.from_templates(freeze({
+        "guard": {"name": "卫兵", "age": 30, "gender": "男", "profession": "卫兵", "stats": {"strength": 60}},
+        "broken": {"name": "缺少字段"}
+    }))
+    assert catalog.ids() == ("guard",)
+    assert catalog.get("guard")["stats"]["strength"] == 60 and catalog.get("guard")["relationship"] == 0
+
+    print("✓ 格式错误的模板测试通过")
+
+
+def test_npc_endpoints():
+    """测试NPC接口返回目录中的数据，重复请求不再读取模板"""
+    print("\n=== 测试NPC接口 ===")
+
+    app = Flask(__name__)
+    register_blueprints(app)
+    client = app.test_client()
+    catalog = get_npc_catalog()
+
+    npcs = client.get('/api/npcs/').get_json()
+    assert npcs == catalog.copy_all()
+
+    npc_id = catalog.ids()[0]
+    response = client.get(f'/api/npcs/{npc_id}')
+    assert response.status_code == 200 and response.get_json()["npc"] == catalog.copy_npc(npc_id)
+    assert response.headers['ETag']
+    assert client.get('/api/npcs/不存在').status_code == 404
+
+    response = client.put(f'/api/npcs/{npc_id}/relationship', json={"relationship": 30})
+    data = response.get_json()
+    assert data["old_relationship"] == 0 and data["npc"]["relationship"] == 30
+    assert catalog.get(npc_id)["relationship"] == 0, "不修改目录"
+
+    metrics = get_metrics()
+    loads = metrics.get_counter("resources.loads") + metrics.get_counter("resources.reloads")
+    for _ in range(3):
+        client.get('/api/npcs/')
+        client.get(f'/api/npcs/{npc_id}')
+    assert metrics.get_counter("resources.loads") + metrics.get_counter("resources.reloads") == loads
+
+    print("✓ NPC接口测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试NPC目录...")
+
+    try:
+        test_catalog()
+        test_invalid_template_skipped()
+        test_npc_endpoints()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
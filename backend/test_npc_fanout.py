@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+测试NPC反应并行推演
+验证先规划勇者的一天再并行推演NPC反应、单个NPC失败时的部分合并，以及确定性的合并规则
+"""
+
+import os
+import time
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from llm.fake_ark_server import get_latency_profile
+from llm import scheduler as scheduler_module
+from llm.scheduler import get_llm_scheduler, LLMScheduler, PRIORITY_INTERACTIVE
+from services import get_game_data_service
+from services.game_action_service import GameActionService, ACTION_MODE_FANOUT
+from services.npc_fanout import NpcFanout
+from utils.metrics import get_metrics
+from test_fake_ark_server import fake_ark, _create_game
+
+
+def _make_plan():
+    return {
+        "player_actions": {"morning": "拜见国王", "afternoon": "陪公主散步", "evening": "休息"},
+        "npc_interactions": {"king": "morning", "princess": "afternoon"},
+        "time_progression": {
+            period: {"narrative": f"{period}的经历", "location": "王宫", "events": [], "state_changes": {}}
+            for period in ("morning", "afternoon", "evening")
+        },
+        "day_summary": {"narrative": "忙碌的一天"},
+        "updated_states": {"player": {"hp": 90}, "world": {"weather": "晴天"}}
+    }
+
+
+def test_fanout_mode():
+    """测试并行模式：一次规划加每个NPC一次反应推演，反应推演同时进行"""
+    print("\n=== 测试NPC反应并行推演 ===")
+
+    service = GameActionService()
+    game_data_service = get_game_data_service()
+
+    with fake_ark(get_latency_profile("instant", first_token_latency=0.3)) as server:
+        game_id = _create_game()
+        started = time.time()
+        result = service.process_player_action(game_id, "拜见国王和公主", mode=ACTION_MODE_FANOUT)
+        elapsed = time.time() - started
+        assert server.stats.get("requests", 0) == 3, "一次规划加两个NPC的反应"
+
+    assert result is not None
+    assert elapsed < 3 * 0.3, f"NPC反应应并行推演，耗时 {elapsed:.2f}秒"
+    assert set(result["npc_actions"]) == {"king", "princess"}
+    assert all(set(actions) == {"morning", "afternoon", "evening"} for actions in result["npc_actions"].values())
+    assert result["updated_states"]["npcs"] == {"king": {"relationship": 2}, "princess": {"relationship": 2}}
+    assert "npc_interactions" not in result
+    events = [event["description"] for period in result["time_progression"].values() for event in period["events"]]
+    assert any("国王: 国王对勇者点头致意" in event for event in events)
+
+    npcs = game_data_service.get_game_state(game_id)["npc"]
+    assert npcs["king"]["relationship"] == 2 and npcs["princess"]["relationship"] == 2
+
+    print("✓ NPC反应并行推演测试通过")
+
+
+def test_partial_failure_and_stream():
+    """测试单个NPC的反应推演失败时其余结果照常合并，流式模式推送规划的叙述"""
+    print("\n=== 测试部分失败与流式推送 ===")
+
+    service = GameActionService()
+    fanout = service.npc_fanout
+    reaction_prompt = fanout._reaction_prompt
+
+    def flaky(game_state, npc_id, period, player_day):
+        if npc_id == "princess":
+            raise RuntimeError("反应推演失败")
+        return reaction_prompt(game_state, npc_id, period, player_day)
+
+    with fake_ark(get_latency_profile("instant")) as server:
+        game_id = _create_game()
+        fanout._reaction_prompt = flaky
+        try:
+            events = list(service.process_player_action_stream(game_id, "拜见国王和公主", mode=ACTION_MODE_FANOUT))
+        finally:
+            del fanout._reaction_prompt
+        assert server.stats.get("requests", 0) == 2, "失败的NPC不发送反应请求"
+
+    assert events[0]["type"] == "narrative" and events[-1]["type"] == "result"
+    result = events[-1]["result"]
+    assert set(result["npc_actions"]) == {"king"}
+    assert result["updated_states"]["npcs"] == {"king": {"relationship": 2}}
+
+    print("✓ 部分失败与流式推送测试通过")
+
+
+def test_reactions_rejected():
+    """测试规划耗时超过请求的截止时间后反应推演仍可执行，反应被调度器拒绝时只提交规划的结果"""
+    print("\n=== 测试反应推演被拒绝 ===")
+
+    service = GameActionService()
+    fanout = service.npc_fanout
+
+    with fake_ark(get_latency_profile("instant", first_token_latency=0.3)):
+        game_id = _create_game()
+        with get_llm_scheduler().request_context(PRIORITY_INTERACTIVE, game_id, deadline=0.2):
+            result = service.process_player_action(game_id, "拜见国王和公主", mode=ACTION_MODE_FANOUT)
+        assert result is not None and set(result["npc_actions"]) == {"king", "princess"}
+
+        # 调度器已满且不能排队：规划调用之后的反应请求全部被拒绝
+        original = scheduler_module._llm_scheduler
+        busy = LLMScheduler(max_in_flight=1, max_queue=0)
+        plan_day = fanout._plan_day
+
+        def plan_then_busy(*args):
+            plan = yield from plan_day(*args)
+            busy.in_flight = 1
+            scheduler_module._llm_scheduler = busy
+            return plan
+
+        fanout._plan_day = plan_then_busy
+        rejected = get_metrics().get_counter("game_action.fanout.reactions_rejected")
+        try:
+            result = service.process_player_action(game_id, "拜见国王和公主", mode=ACTION_MODE_FANOUT)
+        finally:
+            del fanout._plan_day
+            scheduler_module._llm_scheduler = original
+        assert get_metrics().get_counter("game_action.fanout.reactions_rejected") == rejected + 2
+
+    assert result is not None, "反应推演被拒绝时不应让整个行动失败"
+    assert result["npc_actions"] == {} and result["updated_states"]["npcs"] == {}
+    assert result["day_summary"]["narrative"]
+
+    print("✓ 反应推演被拒绝测试通过")
+
+
+def test_merge():
+    """测试合并规则：关系变化限制范围，反应记入接触时段，结果与完成顺序无关"""
+    print("\n=== 测试合并规则 ===")
+
+    plan = _make_plan()
+    interactions = {"king": "morning", "princess": "afternoon", "prince": "evening"}
+    reactions = {
+        "princess": {"actions": {"morning": "读书", "afternoon": "散步", "evening": "休息", "night": "多余"},
+                     "reaction": "很开心", "relationship_change": 50},
+        "king": {"reaction": "表示赞许", "relationship_change": "3"}
+    }
+    npcs = {"king": {"name": "国王", "relationship": 99}, "princess": {"name": "公主", "relationship": 0},
+            "prince": {"name": "王子", "relationship": 5}}
+
+    merged = NpcFanout.merge(plan, interactions, reactions, npcs)
+    assert list(merged["updated_states"]["npcs"]) == ["king", "princess"], "按接触顺序合并，失败的NPC不更新"
+    assert merged["updated_states"]["npcs"]["king"] == {"relationship": 100}
+    assert merged["updated_states"]["npcs"]["princess"] == {"relationship": 10}
+    assert merged["npc_actions"] == {"princess": {"morning": "读书", "afternoon": "散步", "evening": "休息"}}
+    assert merged["time_progression"]["morning"]["state_changes"]["relationships"] == {"king": 3}
+    assert merged["time_progression"]["afternoon"]["events"][0]["description"] == "公主: 很开心"
+    assert "npc_interactions" not in merged and "npc_interactions" in plan, "不修改原规划"
+    assert NpcFanout.merge(plan, interactions, dict(reversed(list(reactions.items()))), npcs) == merged
+
+    print("✓ 合并规则测试通过")
+
+
+def test_resolve_interactions():
+    """测试接触的NPC映射为ID，无效时段按晚上处理，数量不超过上限"""
+    print("\n=== 测试接触NPC解析 ===")
+
+    fanout = NpcFanout(GameActionService(), max_npcs=2)
+    npcs = {"king": {}, "princess": {}, "prince": {}}
+    assert fanout._resolve_interactions({"国王": "morning", "路人": "afternoon", "公主": "夜里", "王子": "evening"},
+                                        npcs) == {"king": "morning", "princess": "evening"}
+    assert fanout._resolve_interactions(["king"], npcs) == {"king": "evening"}
+    assert fanout._resolve_interactions("king", npcs) == {}
+
+    print("✓ 接触NPC解析测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试NPC反应并行推演...")
+
+    try:
+        test_fanout_mode()
+        test_partial_failure_and_stream()
+        test_reactions_rejected()
+        test_merge()
+        test_resolve_interactions()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+测试NPC身份索引
+验证名称规范化、别名、敬称和修饰语、有界编辑距离匹配，以及行动结果中NPC更新的重新映射
+"""
+
+import os
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from services.npc_index import NpcIndex, normalize_npc_name, strip_honorifics, bounded_edit_distance, get_npc_index
+from services.game_action_service import GameActionService
+
+
+def test_normalization():
+    """测试名称规范化与编辑距离"""
+    print("\n=== 测试名称规范化 ===")
+
+    assert normalize_npc_name("Ｖｉｌｌａｇｅ　Elder") == "villageelder"
+    assert normalize_npc_name("village_elder") == "villageelder"
+    assert strip_honorifics("尊敬的国王陛下") == "国王"
+    assert strip_honorifics("铁匠们") == "铁匠"
+    # 去掉敬称后为空时保留原名称
+    assert strip_honorifics("陛下") == "陛下"
+
+    assert bounded_edit_distance("骑士队长", "骑士对长", 1) == 1
+    assert bounded_edit_distance("kitten", "sitting", 2) == 3
+    assert bounded_edit_distance("a", "abcdef", 2) == 3
+
+    print("✓ 名称规范化测试通过")
+
+
+def test_resolve():
+    """测试ID、名称、别名、变体与近似匹配"""
+    print("\n=== 测试NPC标识解析 ===")
+
+    index = get_npc_index()
+    cases = {
+        "king": "king",
+        "国王": "king",
+        "陛下": "king",
+        "国王陛下": "king",
+        "ＫＩＮＧ": "king",
+        "Village Elder": "village_elder",
+        "村长大人": "village_elder",
+        "智慧的长老": "village_elder",
+        "旅馆老板": "innkeeper",
+        "骑士对长": "knight_captain",
+        "knight captian": "knight_captain",
+        "王后": "queen",
+        "王子": "prince"
+    }
+    for identifier, expected in cases.items():
+        assert index.resolve(identifier) == expected, f"{identifier} -> {index.resolve(identifier)}"
+
+    # 两字名称不做近似匹配，无法确定的标识不映射
+    for identifier in ("王母", "不存在的NPC", "", None, 42):
+        assert index.resolve(identifier) is None, identifier
+
+    assert len(index) == len(index.ids) and "king" in index
+
+    print("✓ NPC标识解析测试通过")
+
+
+def test_ambiguous_aliases():
+    """测试多个NPC共用的别名不参与匹配"""
+    print("\n=== 测试歧义别名 ===")
+
+    index = NpcIndex([
+        ("mage", "法师", ["魔法师"]),
+        ("royal_mage", "王室法师", ["魔法师", "宫廷法师"])
+    ])
+    assert index.resolve("魔法师") is None
+    assert index.resolve("宫廷法师") == "royal_mage"
+    assert index.resolve("宫廷法帅") == "royal_mage"
+    # 近似匹配有多个候选时不映射
+    assert NpcIndex([("a", "黑骑士甲", []), ("b", "黑骑士乙", [])]).resolve("黑骑士丙") is None
+
+    print("✓ 歧义别名测试通过")
+
+
+def test_validate_and_merge_remap():
+    """测试NPC更新按名称重新映射而不是被丢弃"""
+    print("\n=== 测试NPC更新映射 ===")
+
+    service = GameActionService()
+    npc_updates = {
+        "国王陛下": {"relationship": 10},
+        "princess": {"relationship": 5},
+        "公主": {"relationship": 99, "mood": "开心"},
+        "旅馆老板": 15,
+        "fake_npc": {"relationship": 20}
+    }
+    service._validate_npc_data(npc_updates)
+    assert npc_updates == {
+        "king": {"relationship": 10},
+        "princess": {"relationship": 5, "mood": "开心"},
+        "innkeeper": 15
+    }, npc_updates
+
+    current_npcs = {
+        "king": {"name": "国王", "relationship": 0},
+        "village_elder": {"name": "村长", "relationship": 0}
+    }
+    merged = service._merge_npc_updates(current_npcs, {"村长大人": {"relationship": 120}, "fake_npc": 5})
+    assert merged["village_elder"]["relationship"] == 100
+    assert set(merged) == {"king", "village_elder"}
+
+    print("✓ NPC更新映射测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试NPC身份索引...")
+
+    try:
+        test_normalization()
+        test_resolve()
+        test_ambiguous_aliases()
+        test_validate_and_merge_remap()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
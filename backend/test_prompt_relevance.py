@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+测试提示相关性选择
+验证关键词索引、按行动/地点/固定事件/历史打分选出的NPC和地点，以及行动提示只完整展示相关的NPC
+"""
+
+import os
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from api.world_api import generate_world_info
+from services.npc_catalog import get_npc_catalog
+from services.game_action_service import GameActionService
+from services.prompt_relevance import RelevanceIndex, RelevanceSelector
+from utils.resource_registry import get_resource_registry
+from utils.token_budget import get_token_estimator
+
+
+def _make_game_state(**world_updates):
+    world = generate_world_info({}).to_dict()
+    world.update(world_updates)
+    return {
+        "day": 1,
+        "player": {"basic_info": {"name": "测试勇者"}, "stats": {"hp": 100, "mp": 100}, "equipment": {}},
+        "world": world,
+        "npc": get_npc_catalog().copy_all(),
+        "history": []
+    }
+
+
+def test_keyword_index():
+    """测试关键词索引：别名、较长名称优先、英文ID的边界"""
+    print("\n=== 测试关键词索引 ===")
+
+    index = RelevanceIndex(
+        {"village_elder": {"name": "村长"}, "innkeeper": {"name": "旅店老板"}, "king": {"name": "国王"}},
+        {"house": {"name": "村长家", "notable_npcs": ["村长"]}, "inn": {"name": "旅馆"}},
+        {"king": ["陛下"]},
+        resolve_npc=lambda name: {"村长": "village_elder"}.get(name)
+    )
+    assert index.match("拜见陛下") == [("npc", "king")]
+    assert index.match("去村长家") == [("location", "house")]
+    assert index.match("和村长聊天") == [("npc", "village_elder")]
+    assert index.match("ask the innkeeper") == [("npc", "innkeeper")]
+    assert index.match("stay at the inn") == [("location", "inn")]
+    assert index.location_npcs == {"house": ("village_elder",), "inn": ()}
+
+    print("✓ 关键词索引测试通过")
+
+
+def test_selection():
+    """测试打分与选择：点名的NPC总是完整展示，其余按得分取前k个"""
+    print("\n=== 测试相关性选择 ===")
+
+    selector = RelevanceSelector(npc_top_k=2, location_top_k=1)
+    game_state = _make_game_state()
+
+    selection = selector.select(game_state, "拜见国王、公主和王子，再去铁匠铺")
+    assert selection.named_npc_ids == {"king", "princess", "prince"}
+    assert selection.npc_ids == ["king", "princess", "prince"], "点名的NPC超出名额时也完整展示"
+    assert selection.location_ids == ["blacksmith"]
+
+    # 地点的常驻NPC按地点得分加分
+    selection = RelevanceSelector(npc_top_k=4).select(game_state, "拜见国王、公主和王子，再去铁匠铺")
+    assert selection.npc_ids == ["king", "princess", "prince", "blacksmith"]
+
+    # 历史和固定事件中提到的NPC参与打分，越近的历史权重越高
+    selection = selector.select(game_state, "四处走走", ["第1天: 与修女交谈", "第2天: 拜访了神父"])
+    assert selection.npc_ids == ["priest", "nun"] and not selection.named_npc_ids
+
+    # 当前地点总是完整展示
+    game_state = _make_game_state(current_location="旅馆")
+    selection = selector.select(game_state, "拜见国王")
+    assert "inn" in selection.location_ids
+    assert selection.npc_ids[0] == "king" and "innkeeper" in selection.npc_ids
+
+    # top_k 为0时全部完整展示
+    everything = RelevanceSelector(npc_top_k=0, location_top_k=0).select(game_state, "拜见国王")
+    assert everything.npc_ids == list(game_state["npc"])
+    assert selector.get_index(game_state["npc"], game_state["world"]["locations"]) is \
+        selector.get_index(game_state["npc"], game_state["world"]["locations"])
+
+    print("✓ 相关性选择测试通过")
+
+
+def test_prompt_uses_selection():
+    """测试行动提示只完整展示相关的NPC和地点，名册仍列出全部NPC"""
+    print("\n=== 测试行动提示 ===")
+
+    service = GameActionService()
+    game_state = _make_game_state()
+    npcs = game_state["npc"]
+    templates = get_resource_registry().get_json('npc/npc_templates.json')
+
+    prefix = service._build_prompt_prefix(game_state)
+    prompt = service._build_user_prompt(game_state, "去铁匠铺拜见国王")
+    for npc_id in npcs:
+        assert f"**{npc_id}**" in prefix
+    assert templates["king"]["description"] in prompt
+    assert templates["scholar"]["description"] not in prompt + prefix
+    assert "售卖各种武器" in prompt and "售卖各种武器" not in prefix
+
+    # 与全部完整展示相比提示更短
+    full = GameActionService()
+    full.relevance_selector = RelevanceSelector(npc_top_k=0, location_top_k=0)
+    estimator = get_token_estimator()
+    assert estimator.estimate(prompt) < estimator.estimate(full._build_user_prompt(game_state, "去铁匠铺拜见国王"))
+
+    # 未完整展示的NPC仍然可以被更新
+    updates = {"scholar": {"relationship": 5}, "图书馆学者": {"relationship": 6}, "路人": {"relationship": 1}}
+    service._validate_npc_data(updates)
+    assert updates == {"scholar": {"relationship": 5}}
+
+    # 其他NPC的非零关系值仍然列出
+    game_state["npc"]["scholar"]["relationship"] = 12
+    assert "scholar 12" in service._build_user_prompt(game_state, "去铁匠铺拜见国王")
+
+    print("✓ 行动提示测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试提示相关性选择...")
+
+    try:
+        test_keyword_index()
+        test_selection()
+        test_prompt_uses_selection()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+测试提示分段渲染缓存
+验证子状态键、LRU淘汰、固定事件按版本键缓存、依赖状态的分段按状态修订号缓存，以及行动提示与不经缓存的结果一致
+"""
+
+import os
+import copy
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from utils.prompt_sections import PromptSectionCache, make_state_key
+from services.game_action_service import GameActionService
+from api.world_api import generate_world_info
+from services.npc_catalog import get_npc_catalog
+from utils.metrics import get_metrics
+
+
+def _make_game_state():
+    return {
+        "day": 1,
+        "player": {
+            "basic_info": {"name": "测试勇者"},
+            "stats": {"hp": 100, "mp": 100},
+            "equipment": {"weapon": "铁剑", "armor": None}
+        },
+        "world": generate_world_info({}).to_dict(),
+        "npc": get_npc_catalog().copy_all(),
+        "history": ["第1天: 抵达村庄"]
+    }
+
+
+def test_state_keys():
+    """测试子状态键"""
+    print("\n=== 测试子状态键 ===")
+
+    assert make_state_key({"a": [1, {"b": 2}]}) == make_state_key({"a": [1, {"b": 2}]})
+    assert make_state_key({"a": 1}) != make_state_key({"a": 1.0})
+    assert make_state_key({"a": 1}) != make_state_key({"a": True})
+    # 渲染结果依赖键顺序，顺序不同的字典不共用片段
+    assert make_state_key({"a": 1, "b": 2}) != make_state_key({"b": 2, "a": 1})
+    hash(make_state_key({"a": [{"b": [1, 2]}]}))
+
+    print("✓ 子状态键测试通过")
+
+
+def test_cache_hits_and_eviction():
+    """测试命中统计与LRU淘汰"""
+    print("\n=== 测试缓存命中与淘汰 ===")
+
+    cache = PromptSectionCache(max_entries=2)
+    calls = []
+
+    def render(value):
+        return cache.render('npc_state', ("value", value), lambda: calls.append(value) or f"v{value}")
+
+    assert render(1) == "v1" and render(1) == "v1"
+    render(2)
+    render(3)
+    assert render(1) == "v1"
+    assert calls == [1, 2, 3, 1], "超出容量的最久未用片段应被淘汰"
+
+    stats = cache.get_stats()
+    assert stats["entries"] == 2
+    assert stats["sections"]["npc_state"] == {"hits": 1, "misses": 4, "hit_rate": 0.2}
+
+    print("✓ 缓存命中与淘汰测试通过")
+
+
+def test_fixed_events_cached_by_version():
+    """测试固定事件片段按天数和配置版本缓存，状态变化后的提示与不经缓存的渲染一致"""
+    print("\n=== 测试按版本键缓存 ===")
+
+    service = GameActionService()
+    service.section_cache = PromptSectionCache()
+    game_state = _make_game_state()
+
+    first_prompt = service._build_user_prompt(game_state, "拜见国王")
+    next_state = copy.deepcopy(game_state)
+    next_state["player"]["stats"]["hp"] = 80
+    next_state["npc"]["king"]["relationship"] = 30
+    prompt = service._build_user_prompt(next_state, "拜见国王")
+
+    sections = service.section_cache.get_stats()["sections"]
+    assert set(sections) == {"fixed_events"}, "随状态变化的分段直接渲染，不经过缓存"
+    assert sections["fixed_events"]["hits"] == 1 and sections["fixed_events"]["misses"] == 1
+    assert "关系值30" in prompt and prompt != first_prompt
+
+    next_state["day"] = 2
+    service._build_user_prompt(next_state, "拜见国王")
+    assert service.section_cache.get_stats()["sections"]["fixed_events"]["misses"] == 2, "天数变化后重新渲染"
+
+    class _NoCache:
+        def render(self, section, version, renderer):
+            return renderer()
+
+    uncached = GameActionService()
+    uncached.section_cache = _NoCache()
+    next_state["day"] = 1
+    assert uncached._build_user_prompt(next_state, "拜见国王") == prompt
+
+    print("✓ 按版本键缓存测试通过")
+
+
+def test_sections_cached_by_revision():
+    """测试依赖状态的分段按 (游戏ID, 状态修订号) 缓存，保存状态后重新渲染"""
+    print("\n=== 测试按状态修订号缓存 ===")
+
+    from test_fake_ark_server import _create_game
+    from services import get_game_data_service
+
+    service = GameActionService()
+    service.section_cache = PromptSectionCache()
+    game_id = _create_game()
+    calls = []
+    format_npc_info = service._format_npc_info
+    service._format_npc_info = lambda npcs: calls.append(1) or format_npc_info(npcs)
+
+    first = service._prepare_action(game_id, "拜见国王")
+    second = service._prepare_action(game_id, "拜见国王")
+    assert second["user_prompt"] == first["user_prompt"] and second["system_prompt"] == first["system_prompt"]
+    assert len(calls) == 1, "修订号未变化时不重新渲染"
+    sections = service.section_cache.get_stats()["sections"]
+    for section in ('world_lore', 'npc_info', 'equipment_info', 'world_info', 'history_events',
+                    'npc_states', 'location_details'):
+        assert sections[section] == {"hits": 1, "misses": 1, "hit_rate": 0.5}, section
+
+    game_data_service = get_game_data_service()
+    revision = game_data_service.get_game_state(game_id).get("state_revision", 0)
+    game_data_service.update_game_state(game_id, {"npc": {"king": {"relationship": 30}}})
+    assert game_data_service.get_game_state(game_id)["state_revision"] == revision + 1
+
+    third = service._prepare_action(game_id, "拜见国王")
+    assert len(calls) == 2 and "关系值30" in third["user_prompt"]
+    # 与不经缓存的渲染结果一致
+    assert third["user_prompt"] == service._build_user_prompt(third["game_state"], "拜见国王")
+
+    print("✓ 按状态修订号缓存测试通过")
+
+
+def test_cache_avoids_rerender():
+    """测试版本键不变时重复请求只渲染一次"""
+    print("\n=== 测试缓存避免重复渲染 ===")
+
+    fixed_events = GameActionService().fixed_events_service
+    cache = PromptSectionCache()
+    calls = []
+
+    def direct():
+        calls.append(1)
+        return fixed_events.format_fixed_events_for_prompt(2)
+
+    rendered = {cache.render('fixed_events', (2, fixed_events.get_version()), direct) for _ in range(500)}
+    assert rendered == {fixed_events.format_fixed_events_for_prompt(2)}
+    assert len(calls) == 1
+    assert cache.get_stats()["sections"]["fixed_events"]["hits"] == 499
+
+    print("✓ 缓存避免重复渲染测试通过")
+
+
+def test_render_time_metric():
+    """测试提示渲染耗时指标"""
+    print("\n=== 测试渲染耗时指标 ===")
+
+    from test_fake_ark_server import _create_game
+
+    metrics = get_metrics()
+    before = metrics.get_timer("game_action.prompt_render")["count"]
+    service = GameActionService()
+    prepared = service._prepare_action(_create_game(), "拜见国王和公主")
+    assert "拜见国王和公主" in prepared["user_prompt"]
+    assert metrics.get_timer("game_action.prompt_render")["count"] == before + 1
+    assert "fixed_events" in metrics.snapshot()["prompt_sections"]["sections"]
+
+    print("✓ 渲染耗时指标测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试提示分段渲染缓存...")
+
+    try:
+        test_state_keys()
+        test_cache_hits_and_eviction()
+        test_fixed_events_cached_by_version()
+        test_sections_cached_by_revision()
+        test_cache_avoids_rerender()
+        test_render_time_metric()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+测试资源注册表
+验证预编译模板与 str.format 一致、不可变JSON、按修改时间热重载以及热路径不再重复读取文件
+"""
+
+import os
+import json
+import shutil
+import tempfile
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from utils.resource_registry import ResourceRegistry, PromptTemplate, RESOURCES_DIR, thaw, get_resource_registry
+from utils.metrics import get_metrics
+
+
+def _write(path, content):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+
+def _touch_later(path, content):
+    """写入新内容并推后修改时间，避免文件系统时间精度导致修改未被发现"""
+    stat = os.stat(path)
+    _write(path, content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_template_matches_format():
+    """测试预编译模板的渲染结果与 str.format 一致"""
+    print("\n=== 测试预编译模板 ===")
+
+    prompts_dir = os.path.join(RESOURCES_DIR, 'prompts')
+    for filename in os.listdir(prompts_dir):
+        with open(os.path.join(prompts_dir, filename), 'r', encoding='utf-8') as file:
+            source = file.read()
+        template = PromptTemplate(source)
+        if template.fields and not all(field.isidentifier() for field in template.fields):
+            continue
+        values = {field: f"<{field}:{index}>" for index, field in enumerate(sorted(template.fields))}
+        assert template.format(**values) == source.format(**values), filename
+
+    template = PromptTemplate('{{"a": {x}}} {y} {z:>3} {w!r}')
+    assert template.format(x=1, y="二", z=7, w="q") == '{{"a": {x}}} {y} {z:>3} {w!r}'.format(x=1, y="二", z=7, w="q")
+    try:
+        template.format(x=1)
+        assert False, "缺少字段时应当抛出 KeyError"
+    except KeyError:
+        pass
+
+    print("✓ 预编译模板测试通过")
+
+
+def test_hot_reload():
+    """测试文件修改后按修改时间重新加载，未修改时不重新读取"""
+    print("\n=== 测试热重载 ===")
+
+    base_dir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(base_dir, 'npc'))
+        json_path = os.path.join(base_dir, 'npc', 'templates.json')
+        text_path = os.path.join(base_dir, 'greeting.txt')
+        _write(json_path, json.dumps({"king": {"name": "国王", "tags": ["王室"]}}))
+        _write(text_path, "你好，{name}")
+
+        registry = ResourceRegistry(base_dir, check_interval=0)
+        data = registry.get_json('npc/templates.json')
+        assert data["king"]["tags"] == ("王室",)
+        try:
+            data["king"]["name"] = "篡位者"
+            assert False, "注册表中的数据应当不可修改"
+        except TypeError:
+            pass
+        copy = thaw(data)
+        copy["king"]["name"] = "篡位者"
+        assert registry.get_json('npc/templates.json')["king"]["name"] == "国王"
+
+        builds = []
+        ids = registry.get_derived('npc/templates.json', 'ids', lambda t: builds.append(1) or frozenset(t))
+        assert registry.get_derived('npc/templates.json', 'ids', frozenset) is ids and len(builds) == 1
+
+        template = registry.get_template('greeting.txt')
+        assert template.format(name="勇者") == "你好，勇者"
+        assert registry.get_template('greeting.txt') is template
+
+        version = registry.get_version('npc/templates.json')
+        _touch_later(json_path, json.dumps({"king": {"name": "国王"}, "princess": {"name": "公主"}}))
+        assert registry.get_derived('npc/templates.json', 'ids', frozenset) == {"king", "princess"}
+        assert registry.get_version('npc/templates.json') == version + 1
+
+        _touch_later(text_path, "欢迎，{name}")
+        assert registry.get_template('greeting.txt').format(name="勇者") == "欢迎，勇者"
+
+        # 文件暂时不可读时继续使用已加载的内容
+        os.remove(text_path)
+        assert registry.get_text('greeting.txt') == "欢迎，{name}"
+        try:
+            registry.get_text('missing.txt')
+            assert False, "从未加载过的缺失文件应当抛出异常"
+        except FileNotFoundError:
+            pass
+
+        # 检查间隔内不检查修改时间
+        cached = ResourceRegistry(base_dir, check_interval=60)
+        cached.get_json('npc/templates.json')
+        _touch_later(json_path, json.dumps({}))
+        assert len(cached.get_json('npc/templates.json')) == 2
+        cached.reload('npc/templates.json')
+        assert len(cached.get_json('npc/templates.json')) == 0
+
+        stats = registry.get_stats()
+        assert stats['npc/templates.json']['version'] == version + 1
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    print("✓ 热重载测试通过")
+
+
+def test_hot_paths_use_registry():
+    """测试游戏行动的提示构建和NPC校验不再每次读取文件"""
+    print("\n=== 测试热路径 ===")
+
+    from services.game_action_service import GameActionService
+    from api.world_api import load_world_description
+    from services.npc_catalog import get_npc_catalog
+
+    service = GameActionService()
+    game_state = {
+        "day": 1,
+        "player": {"name": "测试勇者", "stats": {"hp": 100}, "equipment": {}},
+        "world": {"name": "测试世界", "current_time": "morning", "weather": "晴天"},
+        "npc": {},
+        "history": []
+    }
+
+    service._build_prompt_prefix(game_state)
+    service._build_user_prompt(game_state, "探索村庄")
+    predefined = service._get_predefined_npc_ids()
+    load_world_description()
+    catalog = get_npc_catalog()
+
+    metrics = get_metrics()
+    loads = metrics.get_counter("resources.loads")
+    for _ in range(3):
+        prefix = service._build_prompt_prefix(game_state)
+        prompt = service._build_user_prompt(game_state, "探索村庄")
+        assert service._get_predefined_npc_ids() is predefined
+        assert load_world_description()["world_name"]
+        assert get_npc_catalog() is catalog
+    assert metrics.get_counter("resources.loads") == loads, "资源应当只加载一次"
+
+    assert "测试世界" in prefix and "探索村庄" in prompt
+    assert service._find_npc_id_by_name(catalog.get(next(iter(predefined)))['name']) in predefined
+
+    # 返回给调用方的世界描述可以修改，不影响注册表
+    world_desc = load_world_description()
+    world_desc["world_name"] = "已修改"
+    assert load_world_description()["world_name"] != "已修改"
+    assert "prompts/game_action_user_prompt.txt" in get_resource_registry().get_stats()
+
+    print("✓ 热路径测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试资源注册表...")
+
+    try:
+        test_template_matches_format()
+        test_hot_reload()
+        test_hot_paths_use_registry()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
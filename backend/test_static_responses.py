@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+测试静态内容响应缓存
+验证开场白、世界描述、NPC列表和固定事件接口返回缓存的字节、压缩版本、强ETag与304，以及资源文件修改后重新构建
+"""
+
+import os
+import json
+import gzip
+import shutil
+import tempfile
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from flask import Flask
+from api import register_blueprints
+from utils.resource_registry import ResourceRegistry
+from utils.static_responses import StaticResponseCache, get_static_response_cache, MIN_COMPRESS_SIZE
+from utils.metrics import get_metrics
+
+
+def _client():
+    app = Flask(__name__)
+    register_blueprints(app)
+    return app.test_client()
+
+
+def test_static_endpoints():
+    """测试各静态内容接口返回与原来相同的数据，并带缓存头"""
+    print("\n=== 测试静态内容接口 ===")
+
+    client = _client()
+    for url in ('/api/game/prologue', '/api/world/description', '/api/npcs/', '/api/events/fixed',
+                '/api/events/fixed/day/1', '/api/events/fixed/time/D1Morning', '/api/events/fixed/summary',
+                '/api/events/fixed/format?day=2', '/api/events/time-enum'):
+        response = client.get(url)
+        assert response.status_code == 200, url
+        assert response.headers['ETag'].startswith('"'), "强ETag"
+        assert 'max-age=' in response.headers['Cache-Control']
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert response.get_json() is not None, url
+
+    assert client.get('/api/game/prologue').get_json()["prologue"]
+    assert client.get('/api/world/description').get_json()["data"]["world_name"]
+    assert client.get('/api/events/fixed/day/1').get_json()["day"] == 1
+    assert client.get('/api/events/fixed/format?day=3').get_json()["current_day"] == 3
+    # 参数校验在缓存之前
+    assert client.get('/api/events/fixed/day/9').status_code == 400
+    assert client.get('/api/events/fixed/time/noon').status_code == 400
+
+    print("✓ 静态内容接口测试通过")
+
+
+def test_cached_bytes_and_conditional_requests():
+    """测试重复请求直接返回缓存的字节、按 Accept-Encoding 压缩，以及 If-None-Match 返回 304"""
+    print("\n=== 测试缓存与条件请求 ===")
+
+    client = _client()
+    metrics = get_metrics()
+    first = client.get('/api/world/description')
+    builds = metrics.get_counter("static_cache.builds")
+    second = client.get('/api/world/description')
+    assert metrics.get_counter("static_cache.builds") == builds, "未修改时不重新构建"
+    assert first.data == second.data and first.headers['ETag'] == second.headers['ETag']
+    assert len(first.data) >= MIN_COMPRESS_SIZE
+
+    compressed = client.get('/api/world/description', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['ETag'] != first.headers['ETag'], "不同编码的强ETag不同"
+    assert gzip.decompress(compressed.data) == first.data
+
+    for etag in (first.headers['ETag'], compressed.headers['ETag'], '*'):
+        response = client.get('/api/world/description', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+        assert response.status_code == 304 and not response.data
+        assert response.headers['ETag'] == compressed.headers['ETag']
+    assert client.get('/api/world/description', headers={'If-None-Match': '"other"'}).status_code == 200
+
+    assert get_static_response_cache().get_stats()["entries"] > 0
+
+    print("✓ 缓存与条件请求测试通过")
+
+
+def test_invalidated_by_resource_change():
+    """测试资源文件修改后重新构建响应，ETag随之变化"""
+    print("\n=== 测试资源修改后失效 ===")
+
+    base_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(base_dir, 'data.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({"value": 1}, file)
+
+        cache = StaticResponseCache(max_age=60)
+        cache.resources = ResourceRegistry(base_dir=base_dir, check_interval=0)
+        calls = []
+
+        app = Flask(__name__)
+
+        @app.route('/data')
+        def data():
+            def build():
+                calls.append(1)
+                return dict(cache.resources.get_json('data.json'))
+            return cache.respond('data', ('data.json',), build)
+
+        client = app.test_client()
+        first = client.get('/data')
+        assert client.get('/data').headers['ETag'] == first.headers['ETag'] and len(calls) == 1
+        assert first.headers['Cache-Control'] == 'public, max-age=60'
+        # 很小的响应不压缩
+        assert 'Content-Encoding' not in client.get('/data', headers={'Accept-Encoding': 'gzip, br'}).headers
+
+        stat = os.stat(path)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({"value": 2}, file)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        second = client.get('/data', headers={'If-None-Match': first.headers['ETag']})
+        assert second.status_code == 200 and second.get_json() == {"value": 2}
+        assert second.headers['ETag'] != first.headers['ETag'] and len(calls) == 2
+    finally:
+        shutil.rmtree(base_dir)
+
+    print("✓ 资源修改后失效测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试静态内容响应缓存...")
+
+    try:
+        test_static_endpoints()
+        test_cached_bytes_and_conditional_requests()
+        test_invalidated_by_resource_change()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+测试批量剧情推演
+验证全局推演引擎复用、有并发上限的批量推演、部分失败的结果报告以及批量推演接口
+"""
+
+import os
+import time
+
+os.environ.setdefault("ARK_API_KEY", "test-key")
+
+from flask import Flask
+from api import register_blueprints
+from llm.fake_ark_server import get_latency_profile
+from llm.story_engine import StoryEngine, build_story_context, get_story_engine
+from models import CharacterAction, LocationInfo, StoryProgressionResult, TimeOfDay
+from test_fake_ark_server import fake_ark
+
+
+def _make_context(name):
+    return build_story_context(
+        location=LocationInfo(name=name, description=f"{name}的描述", current_characters=["勇者"],
+                              special_properties={}),
+        character_actions=[CharacterAction(character_name="勇者", action_description=f"在{name}闲逛", location=name)],
+        world_history=["第一天上午：勇者来到了村庄"],
+        current_time=TimeOfDay.D1Morning,
+        current_world_state={"weather": "晴天"},
+        current_character_states={"勇者": {"stats": {"hp": 100}, "relationship": 0}}
+    )
+
+
+def _make_item(name):
+    return {
+        "location": {"name": name, "description": f"{name}的描述", "current_characters": ["勇者"]},
+        "character_actions": [{"character_name": "勇者", "action_description": f"在{name}闲逛", "location": name}],
+        "current_time": "D1Morning"
+    }
+
+
+def test_shared_engine():
+    """测试全局推演引擎只创建一次"""
+    print("\n=== 测试全局推演引擎 ===")
+
+    assert get_story_engine() is get_story_engine()
+    assert get_story_engine().prompt_template is get_story_engine().prompt_template
+
+    print("✓ 全局推演引擎测试通过")
+
+
+def test_progress_many():
+    """测试批量推演：结果与输入顺序一致，同时进行的推演不超过并发上限，单项失败不影响其他项"""
+    print("\n=== 测试批量推演 ===")
+
+    engine = StoryEngine(batch_concurrency=2)
+    assert engine.progress_many([]) == []
+
+    build_prompt = engine._build_prompt
+
+    def failing(context):
+        if context.current_location.name == "废墟":
+            raise RuntimeError("推演失败")
+        return build_prompt(context)
+
+    engine._build_prompt = failing
+    names = ["村庄中心", "铁匠铺", "废墟", "旅馆", "教堂"]
+    with fake_ark(get_latency_profile("instant", first_token_latency=0.2)) as server:
+        started = time.time()
+        results = engine.progress_many([_make_context(name) for name in names])
+        elapsed = time.time() - started
+
+    assert len(results) == len(names)
+    assert isinstance(results[2], RuntimeError) and str(results[2]) == "推演失败"
+    for index in (0, 1, 3, 4):
+        assert isinstance(results[index], StoryProgressionResult)
+        assert results[index].narrative_description
+    assert server.stats.get("requests", 0) == 4
+    # 4 个请求、并发上限为2：至少需要两轮，但少于串行的四轮
+    assert 2 * 0.2 <= elapsed < 4 * 0.2, f"批量推演应以并发2执行，耗时 {elapsed:.2f}秒"
+
+    print("✓ 批量推演测试通过")
+
+
+def test_batch_api():
+    """测试批量推演接口"""
+    print("\n=== 测试批量推演接口 ===")
+
+    app = Flask(__name__)
+    register_blueprints(app)
+    client = app.test_client()
+
+    assert client.post('/api/story/progress/batch', json={"items": []}).status_code == 400
+    assert client.post('/api/story/progress/batch', json={"items": ["村庄"]}).status_code == 400
+
+    with fake_ark(get_latency_profile("instant")):
+        response = client.post('/api/story/progress/batch', json={"items": [_make_item("广场"), _make_item("码头")]})
+        data = response.get_json()
+        assert response.status_code == 200 and data["status"] == "success"
+        assert [item["index"] for item in data["results"]] == [0, 1]
+        assert all("event_summary" in item["result"] for item in data["results"])
+
+        # 部分失败
+        engine = get_story_engine()
+        build_prompt = engine._build_prompt
+
+        def failing(context):
+            if context.current_location.name == "码头":
+                raise RuntimeError("推演失败")
+            return build_prompt(context)
+
+        engine._build_prompt = failing
+        try:
+            data = client.post('/api/story/progress/batch',
+                               json={"items": [_make_item("广场"), _make_item("码头")]}).get_json()
+        finally:
+            del engine._build_prompt
+        assert data["status"] == "partial" and data["succeeded"] == 1 and data["failed"] == 1
+        assert data["results"][1] == {"index": 1, "status": "error", "message": "推演失败"}
+
+    print("✓ 批量推演接口测试通过")
+
+
+def main():
+    """运行所有测试"""
+    print("开始测试批量剧情推演...")
+
+    try:
+        test_shared_engine()
+        test_progress_many()
+        test_batch_api()
+        print("\n🎉 所有测试通过！")
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 """
 测试超时修复效果的脚本
+
+需要先启动后端服务。无需真实API密钥时，可先启动本地模拟 ARK 服务并让后端指向它：
+    python -m llm.fake_ark_server --profile slow
+    ARK_API_BASE=http://127.0.0.1:8765/api/v3 ARK_API_KEY=test-key python app.py
 """
 
 import requests
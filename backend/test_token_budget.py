@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+测试token估算与提示分段预算
+"""
+
+import json
+
+from utils.token_budget import TokenEstimator, PromptBudget, TRUNCATED_MARK
+
+
+def test_token_estimator():
+    """测试token估算与校准"""
+    print("\n=== 测试token估算 ===")
+
+    estimator = TokenEstimator()
+    assert estimator.estimate("") == 0
+    assert estimator.estimate("abcdefgh") == 2
+    assert estimator.estimate("勇者勇者勇者勇者勇者") == 7
+    assert estimator.estimate("勇者hero") == 3
+
+    # 服务返回的实际token数是估算值的两倍
+    estimator.calibrate("勇者勇者勇者勇者勇者", 14)
+    assert abs(estimator.scale - 2.0) < 1e-6
+    assert estimator.estimate("勇者勇者勇者勇者勇者") == 14
+
+    print("✓ token估算测试通过")
+
+
+def test_prompt_budget():
+    """测试分段预算截断策略"""
+    print("\n=== 测试分段预算 ===")
+
+    budget = PromptBudget(
+        budgets={"npc_info": 30, "history_events": 30},
+        strategies={"history_events": "tail"},
+        estimator=TokenEstimator()
+    )
+    lines = [f"第{i}天：勇者前往铁匠铺购买了长剑" for i in range(1, 11)]
+    text = "\n".join(lines)
+
+    head = budget.fit("npc_info", text)
+    assert head.startswith(lines[0]) and head.endswith(TRUNCATED_MARK)
+    assert budget.estimator.estimate(head) <= 30 + 10
+
+    tail = budget.fit("history_events", text)
+    assert tail.startswith(TRUNCATED_MARK) and tail.endswith(lines[-1])
+
+    # 未设置预算或未超出预算的分段保持不变
+    sections = budget.apply({"world_info": text, "npc_info": "国王"})
+    assert sections == {"world_info": text, "npc_info": "国王"}
+
+    usage = budget.log_usage("test", sections)
+    assert set(usage) == {"world_info", "npc_info"}
+
+    print("✓ 分段预算测试通过")
+
+
+def test_budget_edge_cases():
+    """测试预算不足一个字符时整行丢弃，以及JSON分段按条目整体截断、结果仍是合法JSON"""
+    print("\n=== 测试截断边界 ===")
+
+    budget = PromptBudget(
+        budgets={"npc_info": 1, "history_events": 1, "current_world_state": 40, "location_properties": 5},
+        strategies={"history_events": "tail", "current_world_state": "json", "location_properties": "json"},
+        estimator=TokenEstimator()
+    )
+    line = "勇者前往铁匠铺购买了长剑" * 5
+    # 预算小于截断提示本身时，不能因为 line[-0:] 而保留整行
+    assert budget.fit("npc_info", line) == TRUNCATED_MARK
+    assert budget.fit("history_events", line) == TRUNCATED_MARK
+
+    state = {f"地点{i}": {"天气": "晴天", "人数": i} for i in range(20)}
+    fitted = budget.fit("current_world_state", json.dumps(state, ensure_ascii=False, separators=(',', ':')))
+    data_line, mark = fitted.split("\n")
+    data = json.loads(data_line)
+    assert mark == TRUNCATED_MARK
+    assert 0 < len(data) < len(state) and list(data) == list(state)[:len(data)]
+    assert all(data[name] == state[name] for name in data), "保留的条目完整"
+    assert budget.estimator.estimate(fitted) <= 40
+
+    # 单个条目也放不下时保留空对象；非JSON内容不截断
+    assert json.loads(budget.fit("location_properties", json.dumps({"描述": "很长的描述" * 20})).split("\n")[0]) == {}
+    assert budget.fit("location_properties", "不是JSON" * 20) == "不是JSON" * 20
+
+    print("✓ 截断边界测试通过")
+
+
+def main():
+    """主测试函数"""
+    print("开始测试token估算与提示分段预算")
+    print("=" * 50)
+
+    try:
+        test_token_estimator()
+        test_prompt_budget()
+        test_budget_edge_cases()
+
+        print("\n" + "=" * 50)
+        print("✓ 所有token预算测试通过！")
+
+    except Exception as e:
+        print(f"\n✗ 测试过程中发生异常: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
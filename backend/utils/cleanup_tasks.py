@@ -41,6 +41,12 @@ class CleanupTaskManager:
         # 每天凌晨4点清理过期备份文件
         schedule.every().day.at("04:00").do(self._cleanup_old_backups)
         
+        # 每天凌晨5点清理过期的LLM提取缓存
+        schedule.every().day.at("05:00").do(self._cleanup_extraction_cache)
+        
+        # 每天凌晨5点半清理已完成的异步任务记录
+        schedule.every().day.at("05:30").do(self._cleanup_finished_jobs)
+        
         # 每小时检查一次存储空间使用情况
         schedule.every().hour.do(self._check_storage_usage)
         
@@ -182,6 +188,34 @@ class CleanupTaskManager:
         except Exception as e:
             logger.error(f"清理过期备份文件异常: {e}")
     
+    def _cleanup_extraction_cache(self):
+        """清理过期的LLM提取缓存"""
+        try:
+            logger.info("开始清理过期LLM提取缓存")
+            
+            from utils.llm_cache import get_extraction_cache
+            deleted_count = get_extraction_cache().purge_expired()
+            
+            # 记录清理统计
+            self._log_cleanup_stats("extraction_cache", deleted_count)
+            
+        except Exception as e:
+            logger.error(f"清理过期LLM提取缓存异常: {e}")
+    
+    def _cleanup_finished_jobs(self):
+        """清理已完成的异步任务记录"""
+        try:
+            logger.info("开始清理已完成的异步任务")
+            
+            from services.job_service import get_job_service
+            deleted_count = get_job_service().purge_finished_jobs()
+            
+            # 记录清理统计
+            self._log_cleanup_stats("jobs", deleted_count)
+            
+        except Exception as e:
+            logger.error(f"清理已完成的异步任务异常: {e}")
+    
     def _check_storage_usage(self):
         """检查存储空间使用情况"""
         try:
@@ -263,7 +297,7 @@ class CleanupTaskManager:
         手动运行清理任务
         
         Args:
-            task_type (str): 清理任务类型 ("all", "games", "logs", "backups")
+            task_type (str): 清理任务类型 ("all", "games", "logs", "backups", "cache", "jobs")
             
         Returns:
             Dict[str, Any]: 清理结果统计
@@ -288,6 +322,16 @@ class CleanupTaskManager:
                 results["old_backups"] = "completed"
                 logger.info("手动清理过期备份完成")
             
+            if task_type in ["all", "cache"]:
+                self._cleanup_extraction_cache()
+                results["extraction_cache"] = "completed"
+                logger.info("手动清理过期LLM提取缓存完成")
+            
+            if task_type in ["all", "jobs"]:
+                self._cleanup_finished_jobs()
+                results["finished_jobs"] = "completed"
+                logger.info("手动清理已完成的异步任务完成")
+            
             logger.info(f"手动清理任务完成: {task_type}")
             return results
             
@@ -0,0 +1,171 @@
+"""
+勇者信息预取
+玩家提交开场白回应（/api/game/start）后，在后台提前提取勇者信息和装备，
+随后的 /api/world/create 和 /api/hero/analyze 直接取用已完成或进行中的结果，
+把提取的LLM延迟隐藏在前端的过渡动画之后。
+
+预取结果按规范化后的输入文本保存在短时内存表中，过期或提取失败时调用方退回到正常提取。
+"""
+
+import os
+import copy
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from llm.scheduler import get_llm_scheduler, PRIORITY_NORMAL
+from utils.llm_cache import normalize_cache_input
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 预取结果的默认有效期（秒）与最多保留的条目数
+DEFAULT_PREFETCH_TTL = 300
+DEFAULT_PREFETCH_MAX_ENTRIES = 256
+
+
+class HeroProfilePrefetcher:
+    """勇者信息预取器"""
+
+    def __init__(self, ttl_seconds: int = DEFAULT_PREFETCH_TTL,
+                 max_entries: int = DEFAULT_PREFETCH_MAX_ENTRIES, max_workers: int = 4):
+        """
+        初始化预取器
+
+        Args:
+            ttl_seconds (int): 预取结果有效期（秒）
+            max_entries (int): 最多保留的预取条目数
+            max_workers (int): 后台预取线程数
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries: "OrderedDict[str, Tuple[float, Future]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hero-prefetch')
+        self.metrics = get_metrics()
+
+    def prefetch(self, text: str) -> bool:
+        """
+        在后台开始提取勇者信息
+
+        Args:
+            text (str): 玩家输入的文本
+
+        Returns:
+            bool: 是否新开始了一次预取（已有有效的预取结果时返回False）
+        """
+        if not text or not text.strip():
+            return False
+
+        key = normalize_cache_input(text)
+        with self._lock:
+            self._evict_expired_locked()
+            if key in self._entries:
+                return False
+
+            future = Future()
+            self._entries[key] = (time.time() + self.ttl_seconds, future)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        self.metrics.increment("hero_prefetch.started")
+        logger.info("开始后台预取勇者信息")
+        self._executor.submit(contextvars.copy_context().run, self._run, text, future)
+        return True
+
+    def has_prefetch(self, text: str) -> bool:
+        """
+        是否有已完成或进行中的有效预取
+
+        Args:
+            text (str): 玩家输入的文本
+
+        Returns:
+            bool: 存在且未失败的预取
+        """
+        return self._get_future(text) is not None
+
+    def get_or_extract(self, text: str) -> Tuple[dict, dict]:
+        """
+        获取勇者信息和装备，优先使用预取结果（进行中时等待其完成）
+
+        Args:
+            text (str): 玩家输入的文本
+
+        Returns:
+            Tuple[dict, dict]: (勇者信息, 装备信息)
+        """
+        future = self._get_future(text)
+        if future is not None:
+            self.metrics.increment("hero_prefetch.hit_done" if future.done() else "hero_prefetch.hit_in_flight")
+            start_time = time.perf_counter()
+            try:
+                hero_info, equipment = future.result()
+                self.metrics.observe("hero_prefetch.wait_time", time.perf_counter() - start_time)
+                return copy.deepcopy(hero_info), copy.deepcopy(equipment)
+            except Exception as e:
+                logger.warning(f"预取的勇者信息提取失败，重新提取: {e}")
+        else:
+            self.metrics.increment("hero_prefetch.miss")
+
+        from utils.text_analyzer import extract_hero_profile
+        return extract_hero_profile(text)
+
+    def _run(self, text: str, future: Future):
+        """在后台线程中执行提取，推测性请求使用普通优先级，不与玩家交互请求争抢"""
+        from utils.text_analyzer import extract_hero_profile
+
+        try:
+            with get_llm_scheduler().request_context(PRIORITY_NORMAL):
+                future.set_result(extract_hero_profile(text))
+        except Exception as e:
+            self.metrics.increment("hero_prefetch.failed")
+            future.set_exception(e)
+
+    def _get_future(self, text: str) -> Optional[Future]:
+        if not text:
+            return None
+        key = normalize_cache_input(text)
+        with self._lock:
+            self._evict_expired_locked()
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        future = entry[1]
+        if future.done() and future.exception() is not None:
+            return None
+        return future
+
+    def _evict_expired_locked(self):
+        now = time.time()
+        expired = [key for key, (expires_at, future) in self._entries.items()
+                   if expires_at < now and future.done()]
+        for key in expired:
+            del self._entries[key]
+
+
+# 全局预取器实例
+_hero_prefetcher = None
+_hero_prefetcher_lock = threading.Lock()
+
+
+def get_hero_prefetcher() -> HeroProfilePrefetcher:
+    """
+    获取全局勇者信息预取器实例
+
+    Returns:
+        HeroProfilePrefetcher: 预取器实例
+    """
+    global _hero_prefetcher
+    if _hero_prefetcher is None:
+        with _hero_prefetcher_lock:
+            if _hero_prefetcher is None:
+                _hero_prefetcher = HeroProfilePrefetcher(
+                    ttl_seconds=int(os.environ.get('HERO_PREFETCH_TTL', DEFAULT_PREFETCH_TTL))
+                )
+    return _hero_prefetcher
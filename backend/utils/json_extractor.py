@@ -0,0 +1,182 @@
+"""
+LLM输出JSON提取工具
+在一次线性扫描中找到模型输出里第一个完整的顶层JSON对象。
+
+模型输出通常形如 ``<推演结果>```json {...} ```</推演结果>``、``<提取结果>{...}</提取结果>``
+或直接输出JSON。提取器不依赖这些包裹格式：跳过对象之前的任意文本（标签、代码块标记、说明文字），
+按括号深度跟踪对象边界并正确处理字符串内的括号和转义，因此嵌套对象不会被截断。
+
+提取器可以增量使用：流式输出时逐块调用 ``feed``，扫描状态随输出推进，
+响应结束时只需处理最后一块，无需再扫描整段文本。
+对比原有正则级联的耗时与正确率见 benchmark_json_extraction.py。
+"""
+
+import re
+import json
+from typing import Any, Dict, List, Optional
+
+# 对象内需要关注的记号：括号，或一整个字符串（字符串在本块内未结束时第1组为空）
+_OBJECT_TOKENS = re.compile(r'[{}]|"[^"\\]*(?:\\.[^"\\]*)*(")?', re.DOTALL)
+# 字符串内需要关注的字符：结束引号和转义符
+_STRING_CHARS = re.compile(r'["\\]')
+
+_DECODER = json.JSONDecoder()
+
+
+class JSONExtractionError(ValueError):
+    """模型输出中没有可解析的JSON对象"""
+
+
+class IncrementalJSONExtractor:
+    """
+    增量JSON对象提取器
+
+    逐块输入模型输出，第一个可解析的顶层JSON对象闭合时即得到结果。
+    括号配平但无法解析的候选（例如说明文字中的花括号）会被跳过，继续向后查找。
+    """
+
+    def __init__(self):
+        self.result: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[json.JSONDecodeError] = None
+
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._candidate: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        """是否已经得到结果"""
+        return self.result is not None
+
+    @property
+    def pending(self) -> str:
+        """当前未闭合的候选对象文本（输出被截断时可用于修复）"""
+        return "".join(self._candidate)
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """
+        输入一块模型输出
+
+        Args:
+            chunk (str): 新增的输出文本
+
+        Returns:
+            Optional[Dict[str, Any]]: 本块中闭合的JSON对象；尚未闭合或已得到结果时返回None
+        """
+        if self.done or not chunk:
+            return None
+
+        pos = 0
+        length = len(chunk)
+        # 当前候选对象在本块中的起点
+        start = 0 if self._depth else None
+
+        while pos < length:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+                match = _STRING_CHARS.search(chunk, pos)
+                if not match:
+                    break
+                pos = match.end()
+                if match.group() == '\\':
+                    self._escape = True
+                else:
+                    self._in_string = False
+                continue
+
+            if self._depth == 0:
+                # 对象之外的文本（标签、代码块标记、说明文字）只需找下一个左括号
+                pos = chunk.find('{', pos)
+                if pos < 0:
+                    break
+                start = pos
+                self._depth = 1
+                pos += 1
+                continue
+
+            match = _OBJECT_TOKENS.search(chunk, pos)
+            if not match:
+                break
+            token = match.group()
+            pos = match.end()
+
+            if token == '{':
+                self._depth += 1
+            elif token == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._candidate.append(chunk[start:pos])
+                    result = self._try_parse()
+                    if result is not None:
+                        return result
+                    start = None
+            elif match.group(1) is None:
+                # 字符串跨块，剩余部分按字符串状态继续扫描
+                self._in_string = True
+
+        if self._depth and start is not None:
+            self._candidate.append(chunk[start:])
+        return None
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        结束输入并返回结果
+
+        Returns:
+            Dict[str, Any]: 提取到的JSON对象
+
+        Raises:
+            JSONExtractionError: 输出中没有完整且可解析的JSON对象
+        """
+        if self.result is not None:
+            return self.result
+        if self._depth:
+            raise JSONExtractionError("JSON内容不完整，输出可能被截断。")
+        if self.last_error is not None:
+            raise JSONExtractionError(f"JSON解析失败: {self.last_error}")
+        raise JSONExtractionError("未找到有效的 JSON 内容。")
+
+    def _try_parse(self) -> Optional[Dict[str, Any]]:
+        text = "".join(self._candidate)
+        self._candidate = []
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError as e:
+            self.last_error = e
+            return None
+        if not isinstance(value, dict):
+            return None
+        self.result = value
+        return value
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """
+    从模型输出中提取第一个完整的顶层JSON对象
+
+    Args:
+        text (str): 模型输出
+
+    Returns:
+        Dict[str, Any]: JSON对象
+
+    Raises:
+        JSONExtractionError: 未找到可解析的JSON对象
+    """
+    # 常见情况下第一个左括号就是结果的起点，直接交给C实现的解码器，一次扫描即可完成
+    start = text.find('{')
+    if start >= 0:
+        try:
+            value, _ = _DECODER.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except json.JSONDecodeError:
+            pass
+
+    extractor = IncrementalJSONExtractor()
+    extractor.feed(text)
+    return extractor.finish()
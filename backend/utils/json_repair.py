@@ -0,0 +1,214 @@
+"""
+LLM输出JSON修复工具
+模型输出的JSON偶尔有语法缺陷，整次推演因此失败后玩家只能重新提交，需要再付出一次完整的LLM调用。
+本模块在放弃之前尝试修复常见问题：
+
+- 对象或数组末尾多余的逗号；
+- 中文叙述中未转义的双引号（引号后面不是 , } ] : 时视为字符串内容）；
+- 字符串中未转义的换行和制表符；
+- 输出被截断：补全未闭合的字符串，丢弃残缺的键值，按嵌套顺序补齐括号。
+
+修复尝试与成功次数记录到全局指标（json_repair.*）。
+"""
+
+import json
+from typing import Any, Dict, List
+
+from utils.json_extractor import JSONExtractionError, extract_json_object
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 字符串中需要转义的控制字符
+_CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+# 结束引号之后允许出现的字符
+_STRING_TERMINATORS = ',}]:'
+
+
+class JSONRepairError(ValueError):
+    """JSON无法修复"""
+
+
+def _next_significant(text: str, pos: int) -> str:
+    """返回 pos 之后第一个非空白字符，没有时返回空字符串"""
+    length = len(text)
+    while pos < length and text[pos] in ' \t\r\n':
+        pos += 1
+    return text[pos] if pos < length else ''
+
+
+def _repair_text(text: str) -> str:
+    """逐字符修复JSON文本"""
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    escape = False
+
+    for pos, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+                out.append(char)
+            elif char == '\\':
+                escape = True
+                out.append(char)
+            elif char == '"':
+                following = _next_significant(text, pos + 1)
+                if following == '' or following in _STRING_TERMINATORS:
+                    in_string = False
+                    out.append(char)
+                else:
+                    # 字符串内容中的引号，例如 "国王说："快走""
+                    out.append('\\"')
+            elif char in _CONTROL_ESCAPES:
+                out.append(_CONTROL_ESCAPES[char])
+            else:
+                out.append(char)
+            continue
+
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+            out.append(char)
+        elif char in '}]':
+            _strip_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                break
+        else:
+            out.append(char)
+
+    # 输出被截断：补全字符串并丢弃残缺的键值
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    if stack:
+        _drop_incomplete_tail(out, stack[-1])
+        out.extend(reversed(stack))
+
+    return "".join(out)
+
+
+def _strip_trailing_comma(out: List[str]):
+    """去掉右括号前多余的逗号"""
+    index = len(out) - 1
+    while index >= 0 and out[index] in (' ', '\t', '\r', '\n'):
+        index -= 1
+    if index >= 0 and out[index] == ',':
+        del out[index]
+
+
+def _drop_incomplete_tail(out: List[str], closer: str):
+    """截断时去掉末尾不完整的元素（悬空的逗号、冒号、没有值的键或残缺的字面量）"""
+    text = "".join(out).rstrip()
+
+    if text.endswith(','):
+        text = text[:-1]
+    elif text.endswith(':'):
+        text += ' null'
+    elif text.endswith('"'):
+        # 对象中紧跟在 { 或 , 之后的字符串是没有值的键
+        before = text[:_string_start(text)].rstrip()
+        if closer == '}' and before and before[-1] in '{,':
+            text = before[:-1] if before.endswith(',') else before
+    elif text and text[-1] not in '{[]}':
+        # 截断在数字或字面量中间（如 tru、12.）
+        token_start = len(text)
+        while token_start > 0 and text[token_start - 1] not in ' \t\r\n,:[{':
+            token_start -= 1
+        if not _is_literal(text[token_start:]):
+            before = text[:token_start].rstrip()
+            text = before + ' null' if before.endswith(':') else before.rstrip(',')
+
+    out[:] = [text]
+
+
+def _string_start(text: str) -> int:
+    """返回以引号结尾的文本中最后一个字符串的起始引号位置"""
+    index = len(text) - 2
+    while index >= 0:
+        if text[index] == '"':
+            backslashes = 0
+            probe = index - 1
+            while probe >= 0 and text[probe] == '\\':
+                backslashes += 1
+                probe -= 1
+            if backslashes % 2 == 0:
+                return index
+        index -= 1
+    return 0
+
+
+def _is_literal(token: str) -> bool:
+    """判断截断处的片段是否是完整的数字或字面量"""
+    if token in ('true', 'false', 'null'):
+        return True
+    try:
+        json.loads(token)
+        return True
+    except ValueError:
+        return False
+
+
+def repair_json(text: str) -> Dict[str, Any]:
+    """
+    修复并解析模型输出中的JSON对象
+
+    Args:
+        text (str): 模型输出（可以包含标签、代码块等包裹内容）
+
+    Returns:
+        Dict[str, Any]: 修复后的JSON对象
+
+    Raises:
+        JSONRepairError: 无法修复
+    """
+    metrics = get_metrics()
+    metrics.increment("json_repair.attempts")
+
+    start = text.find('{')
+    if start < 0:
+        metrics.increment("json_repair.failed")
+        raise JSONRepairError("输出中没有JSON对象，无法修复。")
+
+    try:
+        value = json.loads(_repair_text(text[start:]))
+    except json.JSONDecodeError as e:
+        metrics.increment("json_repair.failed")
+        logger.warning(f"JSON修复失败: {e}")
+        raise JSONRepairError(f"JSON修复失败: {e}")
+
+    if not isinstance(value, dict):
+        metrics.increment("json_repair.failed")
+        raise JSONRepairError("修复结果不是JSON对象。")
+
+    metrics.increment("json_repair.succeeded")
+    logger.info("JSON修复成功")
+    return value
+
+
+def parse_json_with_repair(text: str) -> Dict[str, Any]:
+    """
+    提取模型输出中的JSON对象，解析失败时尝试修复
+
+    Args:
+        text (str): 模型输出
+
+    Returns:
+        Dict[str, Any]: JSON对象
+
+    Raises:
+        JSONRepairError: 提取和修复都失败
+    """
+    try:
+        return extract_json_object(text)
+    except JSONExtractionError as e:
+        logger.warning(f"JSON提取失败，尝试修复: {e}")
+    return repair_json(text)
@@ -0,0 +1,284 @@
+"""
+LLM响应缓存
+为确定性的LLM提取调用提供内存LRU + 磁盘两级缓存，支持TTL和并发请求合并（single-flight）
+"""
+
+import os
+import re
+import copy
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from utils.file_utils import atomic_write_file, safe_read_file, delete_file
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 默认缓存有效期：7天，与游戏存档有效期一致
+DEFAULT_CACHE_TTL = 7 * 24 * 3600
+
+
+def normalize_cache_input(text: str) -> str:
+    """
+    规范化缓存输入文本
+
+    统一全角/半角字符（NFKC），折叠连续空白并去掉首尾空白，
+    使仅在格式上不同的玩家输入命中同一缓存项。
+
+    Args:
+        text (str): 原始文本
+
+    Returns:
+        str: 规范化后的文本
+    """
+    normalized = unicodedata.normalize('NFKC', text or '')
+    return re.sub(r'\s+', ' ', normalized).strip()
+
+
+class _InFlightCall:
+    """正在进行中的计算，供并发的相同请求等待共享结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class LLMResponseCache:
+    """LLM响应缓存类"""
+
+    def __init__(self, cache_dir: str = "backend/data/cache/llm",
+                 max_memory_entries: int = 256, ttl_seconds: int = DEFAULT_CACHE_TTL):
+        """
+        初始化LLM响应缓存
+
+        Args:
+            cache_dir (str): 磁盘缓存目录
+            max_memory_entries (int): 内存LRU最多保留的条目数
+            ttl_seconds (int): 默认有效期（秒）
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, _InFlightCall] = {}
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "shared_in_flight": 0
+        }
+
+        logger.info(f"LLM响应缓存初始化完成，目录: {cache_dir}，内存容量: {max_memory_entries}，TTL: {ttl_seconds}秒")
+
+    @staticmethod
+    def make_key(namespace: str, prompt_template: str, text: str, version: str = "") -> str:
+        """
+        生成缓存键
+
+        Args:
+            namespace (str): 调用类型，如 hero_info、equipment
+            prompt_template (str): 提示模板内容，模板修改后缓存自动失效
+            text (str): 输入文本，会先做规范化
+            version (str): 额外的版本号，输出格式变化时手动提升
+
+        Returns:
+            str: 缓存键（sha256十六进制）
+        """
+        template_version = hashlib.sha256(prompt_template.encode('utf-8')).hexdigest()[:16]
+        raw_key = "\0".join([namespace, version, template_version, normalize_cache_input(text)])
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        读取缓存，先查内存再查磁盘
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            Optional[Any]: 缓存值的副本，未命中或已过期返回None
+        """
+        now = time.time()
+
+        with self._lock:
+            value = self._get_memory_locked(key, now)
+            if value is not None:
+                return value
+
+        file_path = self._get_file_path(key)
+        if os.path.exists(file_path):
+            data = safe_read_file(file_path)
+            if data and data.get("expires_at", 0) > now:
+                value = data.get("value")
+                self._remember(key, data["expires_at"], value)
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                return copy.deepcopy(value)
+            # 过期或损坏的缓存文件直接删除
+            delete_file(file_path)
+
+        return None
+
+    def _get_memory_locked(self, key: str, now: float) -> Optional[Any]:
+        """读取内存缓存（调用方持有 self._lock），未命中或已过期返回None"""
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        self.stats["memory_hits"] += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None):
+        """
+        写入缓存（内存和磁盘）
+
+        Args:
+            key (str): 缓存键
+            value (Any): 可JSON序列化的缓存值
+            ttl_seconds (Optional[int]): 有效期，默认使用缓存的TTL
+        """
+        expires_at = time.time() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        self._remember(key, expires_at, copy.deepcopy(value))
+
+        if not atomic_write_file(self._get_file_path(key), {"expires_at": expires_at, "value": value}):
+            logger.warning(f"写入磁盘缓存失败: {key}")
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl_seconds: Optional[int] = None) -> Any:
+        """
+        读取缓存，未命中时计算并写入
+
+        同一时刻对同一键的多个请求只会触发一次计算，其余请求等待并共享结果。
+        计算抛出的异常会传递给所有等待者，且不会被缓存。
+
+        Args:
+            key (str): 缓存键
+            compute (Callable[[], Any]): 未命中时调用的计算函数
+            ttl_seconds (Optional[int]): 有效期
+
+        Returns:
+            Any: 缓存值或计算结果的副本
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            # 先前的计算可能在上面读取缓存之后才写入结果并结束，在登记新的计算前重新检查；
+            # 计算结果先写入内存再移除进行中的记录，二者在同一把锁下检查不会遗漏
+            value = self._get_memory_locked(key, time.time())
+            if value is not None:
+                return value
+            in_flight = self._in_flight.get(key)
+            is_leader = in_flight is None
+            if is_leader:
+                in_flight = _InFlightCall()
+                self._in_flight[key] = in_flight
+            else:
+                self.stats["shared_in_flight"] += 1
+
+        if not is_leader:
+            logger.debug(f"等待进行中的相同请求: {key[:12]}")
+            in_flight.event.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return copy.deepcopy(in_flight.value)
+
+        try:
+            with self._lock:
+                self.stats["misses"] += 1
+            value = compute()
+            self.set(key, value, ttl_seconds)
+            in_flight.value = value
+            return copy.deepcopy(value)
+        except BaseException as e:
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            in_flight.event.set()
+
+    def purge_expired(self) -> int:
+        """
+        删除磁盘上已过期的缓存文件
+
+        Returns:
+            int: 删除的文件数量
+        """
+        deleted_count = 0
+        now = time.time()
+
+        if not os.path.exists(self.cache_dir):
+            return deleted_count
+
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith('.json'):
+                    continue
+                file_path = os.path.join(root, filename)
+                data = safe_read_file(file_path)
+                if not data or data.get("expires_at", 0) <= now:
+                    if delete_file(file_path):
+                        deleted_count += 1
+
+        logger.info(f"LLM响应缓存清理完成，删除了 {deleted_count} 个过期文件")
+        return deleted_count
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计信息
+
+        Returns:
+            Dict[str, Any]: 命中、未命中次数及内存条目数
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        return stats
+
+    def _remember(self, key: str, expires_at: float, value: Any):
+        """写入内存LRU"""
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _get_file_path(self, key: str) -> str:
+        """获取缓存键对应的磁盘文件路径"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+
+# 全局提取缓存实例
+_extraction_cache = None
+
+
+def get_extraction_cache() -> LLMResponseCache:
+    """
+    获取全局LLM提取结果缓存实例
+
+    Returns:
+        LLMResponseCache: 缓存实例
+    """
+    global _extraction_cache
+    if _extraction_cache is None:
+        ttl_seconds = int(os.environ.get('EXTRACTION_CACHE_TTL', DEFAULT_CACHE_TTL))
+        _extraction_cache = LLMResponseCache(
+            cache_dir="backend/data/cache/extraction",
+            ttl_seconds=ttl_seconds
+        )
+        get_metrics().register_collector("extraction_cache", _extraction_cache.get_stats)
+    return _extraction_cache
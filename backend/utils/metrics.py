@@ -0,0 +1,192 @@
+"""
+运行指标统计
+提供进程内的计数器、仪表和耗时统计，供 /api/metrics 接口查询
+"""
+
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 每个耗时指标保留的最近样本数，用于计算分位数
+DEFAULT_WINDOW_SIZE = 1024
+
+
+class _TimerStats:
+    """单个耗时指标的统计数据"""
+
+    def __init__(self, window_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window_size)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def percentile(self, percent: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50": round(self.percentile(50), 4),
+            "p95": round(self.percentile(95), 4),
+            "max": round(self.max, 4)
+        }
+
+
+class MetricsRegistry:
+    """运行指标注册表"""
+
+    def __init__(self, window_size: int = DEFAULT_WINDOW_SIZE):
+        """
+        初始化指标注册表
+
+        Args:
+            window_size (int): 每个耗时指标保留的最近样本数
+        """
+        self.window_size = window_size
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timers: Dict[str, _TimerStats] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1):
+        """增加计数器"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        """设置仪表当前值"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        """
+        记录一次耗时（秒）
+
+        Args:
+            name (str): 指标名
+            value (float): 耗时
+        """
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = _TimerStats(self.window_size)
+                self._timers[name] = timer
+            timer.observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """统计代码块耗时的上下文管理器"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time)
+
+    def register_collector(self, name: str, collector: Callable[[], Dict[str, Any]]):
+        """
+        注册统计信息收集函数，查询指标时一并返回
+
+        Args:
+            name (str): 收集项名称
+            collector (Callable[[], Dict[str, Any]]): 返回统计信息字典的函数
+        """
+        with self._lock:
+            self._collectors[name] = collector
+
+    def get_counter(self, name: str) -> float:
+        """获取计数器当前值"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def get_timer(self, name: str) -> Dict[str, Any]:
+        """获取耗时指标的统计摘要"""
+        with self._lock:
+            timer = self._timers.get(name)
+            return timer.summary() if timer else _TimerStats(1).summary()
+
+    def get_percentile(self, name: str, percent: float, min_samples: int = 1) -> Optional[float]:
+        """
+        获取耗时指标最近样本的分位数
+
+        Args:
+            name (str): 指标名
+            percent (float): 分位（0-100）
+            min_samples (int): 最少样本数，不足时返回None
+
+        Returns:
+            Optional[float]: 分位数（秒）
+        """
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None or len(timer.samples) < max(1, min_samples):
+                return None
+            return timer.percentile(percent)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        获取所有指标的快照
+
+        Returns:
+            Dict[str, Any]: 包含 counters、gauges、timers 和各收集项的统计信息
+        """
+        with self._lock:
+            result = {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timers": {name: timer.summary() for name, timer in self._timers.items()}
+            }
+            collectors = dict(self._collectors)
+
+        for name, collector in collectors.items():
+            try:
+                result[name] = collector()
+            except Exception as e:
+                logger.warning(f"收集统计信息失败 {name}: {e}")
+                result[name] = {"error": str(e)}
+
+        return result
+
+    def reset(self):
+        """清空计数器、仪表和耗时统计（保留收集函数）"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timers.clear()
+
+
+# 全局指标注册表实例
+_metrics_registry = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """
+    获取全局指标注册表实例
+
+    Returns:
+        MetricsRegistry: 指标注册表实例
+    """
+    global _metrics_registry
+    if _metrics_registry is None:
+        with _metrics_lock:
+            if _metrics_registry is None:
+                _metrics_registry = MetricsRegistry()
+    return _metrics_registry
@@ -0,0 +1,137 @@
+"""
+提示分段渲染缓存
+按调用方给出的版本键记忆渲染结果，版本键未变化时直接复用已渲染的文本片段。
+
+版本键必须比渲染本身便宜得多：依赖游戏状态的分段以 (游戏ID, 状态修订号) 为键，修订号由
+update_game_state 在每次保存时加一；固定事件以天数加配置文件版本号为键。由游戏状态逐层转换得到的键
+（make_state_key）与渲染一个小分段的开销相当，只适合构建开销更大的缓存。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 默认最多缓存的片段数
+DEFAULT_MAX_ENTRIES = 4096
+
+
+def make_state_key(value: Any) -> Hashable:
+    """
+    将子状态转换为可哈希的键：字典转为保留键顺序的元组（渲染结果依赖顺序），列表转为元组；
+    需要遍历整个子状态，只适合构建开销远大于此的缓存（如关键词索引）
+
+    Args:
+        value (Any): JSON结构的子状态
+
+    Returns:
+        Hashable: 内容相同的子状态得到相等的键
+    """
+    if isinstance(value, dict):
+        return ('{',) + tuple((key, make_state_key(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return ('[',) + tuple(make_state_key(item) for item in value)
+    if isinstance(value, bool) or (isinstance(value, float) and value.is_integer()):
+        # True、1.0 与 1 相等但渲染结果不同，需要区分
+        return (type(value).__name__, value)
+    return value
+
+
+class PromptSectionCache:
+    """提示分段渲染缓存（进程内LRU）"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        初始化缓存
+
+        Args:
+            max_entries (int): 最多缓存的片段数
+        """
+        self.max_entries = max(1, max_entries)
+        self._fragments: "OrderedDict[tuple, str]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        logger.info(f"提示分段缓存初始化完成，容量: {self.max_entries}")
+
+    def render(self, section: str, version: Hashable, renderer: Callable[[], str]) -> str:
+        """
+        渲染分段，版本键与之前某次渲染相同时直接返回缓存的片段
+
+        Args:
+            section (str): 分段名称，如 fixed_events
+            version (Hashable): 分段内容的版本键，渲染结果只能由它决定
+            renderer (Callable[[], str]): 渲染函数
+
+        Returns:
+            str: 渲染结果
+        """
+        key = (section, version)
+        with self._lock:
+            stats = self._stats.setdefault(section, {"hits": 0, "misses": 0})
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                stats["hits"] += 1
+                return fragment
+            stats["misses"] += 1
+
+        fragment = renderer()
+
+        with self._lock:
+            self._fragments[key] = fragment
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        """清空缓存的片段和命中统计"""
+        with self._lock:
+            self._fragments.clear()
+            self._stats.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取各分段的命中统计
+
+        Returns:
+            Dict[str, Any]: 缓存片段数，以及分段名称 -> 命中/未命中次数和命中率
+        """
+        with self._lock:
+            sections = {
+                section: {
+                    **stats,
+                    "hit_rate": round(stats["hits"] / (stats["hits"] + stats["misses"]), 4)
+                    if stats["hits"] + stats["misses"] else 0.0
+                }
+                for section, stats in self._stats.items()
+            }
+            return {"entries": len(self._fragments), "sections": sections}
+
+
+# 全局提示分段缓存实例
+_prompt_section_cache = None
+_prompt_section_cache_lock = threading.Lock()
+
+
+def get_prompt_section_cache() -> PromptSectionCache:
+    """
+    获取全局提示分段缓存实例
+
+    Returns:
+        PromptSectionCache: 提示分段缓存实例
+    """
+    global _prompt_section_cache
+    if _prompt_section_cache is None:
+        with _prompt_section_cache_lock:
+            if _prompt_section_cache is None:
+                _prompt_section_cache = PromptSectionCache(
+                    int(os.environ.get('PROMPT_SECTION_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
+                )
+                get_metrics().register_collector("prompt_sections", _prompt_section_cache.get_stats)
+    return _prompt_section_cache
@@ -0,0 +1,295 @@
+"""
+资源注册表
+统一加载 resources 目录下的提示模板、NPC模板、世界描述和固定事件，
+解析结果缓存为不可变对象，格式模板预先编译；按文件修改时间廉价地重新校验，修改文件后无需重启即可生效
+"""
+
+import os
+import json
+import time
+import string
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 资源根目录
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'resources')
+
+# 两次检查同一文件修改时间的最小间隔（秒），0 表示每次访问都检查
+DEFAULT_CHECK_INTERVAL = 1.0
+
+
+def freeze(value: Any) -> Any:
+    """
+    将JSON数据递归转换为不可变对象：字典转为只读映射，列表转为元组
+
+    Args:
+        value (Any): JSON数据
+
+    Returns:
+        Any: 不可变的数据
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """
+    复制出可修改、可序列化的普通字典和列表，用于写入游戏状态或返回给接口
+
+    Args:
+        value (Any): 不可变的数据
+
+    Returns:
+        Any: 普通字典/列表组成的数据副本
+    """
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+class PromptTemplate:
+    """预编译的格式模板，渲染结果与 str.format 一致"""
+
+    __slots__ = ('source', 'fields', '_parts', '_simple')
+
+    def __init__(self, source: str):
+        """
+        解析模板
+
+        Args:
+            source (str): 模板文本，语法与 str.format 相同
+
+        Raises:
+            ValueError: 模板语法错误
+        """
+        self.source = source
+        parts: List[Tuple[str, Optional[str]]] = []
+        simple = True
+        for literal, field, format_spec, conversion in string.Formatter().parse(source):
+            if field is not None and (format_spec or conversion or not field.isidentifier()):
+                simple = False
+            parts.append((literal, field))
+        self._parts = tuple(parts)
+        self._simple = simple
+        self.fields = frozenset(field for _, field in parts if field)
+
+    def format(self, **values: Any) -> str:
+        """
+        渲染模板
+
+        Raises:
+            KeyError: 缺少模板字段
+        """
+        if not self._simple:
+            return self.source.format(**values)
+        pieces = []
+        for literal, field in self._parts:
+            pieces.append(literal)
+            if field is not None:
+                value = values[field]
+                pieces.append(value if isinstance(value, str) else format(value))
+        return "".join(pieces)
+
+    def __str__(self) -> str:
+        return self.source
+
+
+class _ResourceEntry:
+    """单个资源文件的缓存"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.signature: Optional[Tuple[int, int]] = None
+        self.text: Optional[str] = None
+        self.version = 0
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+        self.derived: Dict[str, Any] = {}
+
+
+class ResourceRegistry:
+    """资源注册表"""
+
+    def __init__(self, base_dir: Optional[str] = None, check_interval: Optional[float] = None):
+        """
+        初始化资源注册表
+
+        Args:
+            base_dir (Optional[str]): 资源根目录，None 表示 backend/resources
+            check_interval (Optional[float]): 修改时间检查间隔（秒），None 表示读取 RESOURCE_CHECK_INTERVAL
+        """
+        if check_interval is None:
+            try:
+                check_interval = float(os.environ.get('RESOURCE_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL))
+            except ValueError:
+                check_interval = DEFAULT_CHECK_INTERVAL
+        self.base_dir = base_dir or RESOURCES_DIR
+        self.check_interval = max(0.0, check_interval)
+        self._entries: Dict[str, _ResourceEntry] = {}
+        self._lock = threading.RLock()
+        self.metrics = get_metrics()
+        logger.info(f"资源注册表初始化完成，目录: {self.base_dir}，检查间隔: {self.check_interval}秒")
+
+    def _entry(self, name: str) -> _ResourceEntry:
+        """获取资源的最新缓存，文件修改后重新读取"""
+        entry = self._entries.get(name)
+        if entry is None:
+            entry = self._entries[name] = _ResourceEntry(os.path.join(self.base_dir, name))
+
+        now = time.monotonic()
+        if entry.text is not None and now - entry.checked_at < self.check_interval:
+            return entry
+
+        entry.checked_at = now
+        try:
+            stat = os.stat(entry.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == entry.signature:
+                return entry
+            with open(entry.path, 'r', encoding='utf-8') as file:
+                text = file.read()
+        except OSError as e:
+            if entry.text is None:
+                raise
+            # 编辑过程中文件可能短暂不可读，继续使用上一次加载的内容
+            logger.warning(f"重新读取资源文件失败，继续使用已加载的版本: {name}: {e}")
+            return entry
+
+        reloaded = entry.text is not None
+        entry.signature = signature
+        entry.text = text
+        entry.version += 1
+        entry.loaded_at = time.time()
+        entry.derived = {}
+        self.metrics.increment("resources.reloads" if reloaded else "resources.loads")
+        if reloaded:
+            logger.info(f"资源文件已修改，重新加载: {name}")
+        else:
+            logger.debug(f"加载资源文件: {name}")
+        return entry
+
+    def _derive(self, name: str, key: str, builder: Callable[[str], Any]) -> Any:
+        """获取基于资源文本构建的对象，文件未修改时直接返回缓存"""
+        with self._lock:
+            entry = self._entry(name)
+            if key not in entry.derived:
+                entry.derived[key] = builder(entry.text)
+            return entry.derived[key]
+
+    def get_text(self, name: str) -> str:
+        """
+        获取文本资源
+
+        Args:
+            name (str): 相对于资源根目录的路径，如 prompts/system_prompt.txt
+
+        Returns:
+            str: 文件内容
+
+        Raises:
+            OSError: 文件不存在或无法读取
+        """
+        with self._lock:
+            return self._entry(name).text
+
+    def get_template(self, name: str) -> PromptTemplate:
+        """
+        获取预编译的格式模板
+
+        Raises:
+            OSError: 文件不存在或无法读取
+            ValueError: 模板语法错误
+        """
+        return self._derive(name, 'template', PromptTemplate)
+
+    def get_json(self, name: str) -> Any:
+        """
+        获取JSON资源，返回不可变对象（只读映射和元组），需要修改时使用 thaw() 复制
+
+        Raises:
+            OSError: 文件不存在或无法读取
+            json.JSONDecodeError: JSON格式错误
+        """
+        return self._derive(name, 'json', lambda text: freeze(json.loads(text)))
+
+    def get_derived(self, name: str, key: str, builder: Callable[[Any], Any]) -> Any:
+        """
+        获取由JSON资源派生的对象（如ID集合、索引），文件修改后重新构建
+
+        Args:
+            name (str): 资源路径
+            key (str): 派生对象的名称，同一资源下唯一
+            builder (Callable[[Any], Any]): 以不可变JSON数据为参数的构建函数，结果应视为只读
+
+        Returns:
+            Any: 派生对象
+        """
+        return self._derive(name, f'derived:{key}', lambda text: builder(self.get_json(name)))
+
+    def get_version(self, name: str) -> int:
+        """获取资源的版本号，每次重新加载后加一"""
+        with self._lock:
+            return self._entry(name).version
+
+    def reload(self, name: Optional[str] = None):
+        """
+        强制下次访问时重新读取资源
+
+        Args:
+            name (Optional[str]): 资源路径，None 表示全部资源
+        """
+        with self._lock:
+            entries = [self._entries[name]] if name in self._entries else (
+                list(self._entries.values()) if name is None else [])
+            for entry in entries:
+                entry.signature = None
+                entry.checked_at = 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取已加载资源的版本信息
+
+        Returns:
+            Dict[str, Any]: 资源路径 -> 版本号、大小和加载时间
+        """
+        with self._lock:
+            return {
+                name: {
+                    "version": entry.version,
+                    "size": entry.signature[1] if entry.signature else None,
+                    "loaded_at": entry.loaded_at
+                }
+                for name, entry in self._entries.items() if entry.text is not None
+            }
+
+
+# 全局资源注册表实例
+_resource_registry = None
+_resource_registry_lock = threading.Lock()
+
+
+def get_resource_registry() -> ResourceRegistry:
+    """
+    获取全局资源注册表实例
+
+    Returns:
+        ResourceRegistry: 资源注册表实例
+    """
+    global _resource_registry
+    if _resource_registry is None:
+        with _resource_registry_lock:
+            if _resource_registry is None:
+                _resource_registry = ResourceRegistry()
+                get_metrics().register_collector("resources", _resource_registry.get_stats)
+    return _resource_registry
@@ -0,0 +1,208 @@
+"""
+静态内容响应缓存
+开场白、世界描述、NPC列表、固定事件等内容只在部署或修改资源文件时变化，
+这里把接口响应预先序列化为字节，连同gzip/brotli压缩版本和强ETag一起缓存在内存中；
+依赖的资源文件修改后（资源注册表中的版本变化）重新构建，请求处理只需比较版本号并返回缓存的字节
+"""
+
+import os
+import gzip
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from flask import Response, current_app, request
+
+from utils.resource_registry import get_resource_registry
+from utils.metrics import get_metrics
+from utils.logger import get_logger
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只提供gzip压缩版本
+    brotli = None
+
+logger = get_logger(__name__)
+
+# 浏览器和CDN缓存响应的时间（秒）
+DEFAULT_MAX_AGE = 86400
+
+# 最多缓存的响应数，超出后新的响应照常构建但不缓存
+DEFAULT_MAX_ENTRIES = 256
+
+# 小于该字节数的响应不压缩
+MIN_COMPRESS_SIZE = 256
+
+# 按优先级排列的压缩格式
+ENCODINGS = ('br', 'gzip')
+
+
+class _CachedResponse:
+    """单个接口响应的缓存"""
+
+    __slots__ = ('versions', 'etag', 'bodies', 'etags')
+
+    def __init__(self, versions: Tuple[Optional[int], ...], body: bytes):
+        self.versions = versions
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        # 编码 -> 响应体，identity 为未压缩的版本
+        self.bodies: Dict[str, bytes] = {'identity': body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.bodies['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.bodies['br'] = brotli.compress(body)
+        # 不同编码的响应体不同，强ETag各不相同
+        self.etags = {encoding: self.etag if encoding == 'identity' else f'"{digest}-{encoding}"'
+                      for encoding in self.bodies}
+
+
+class StaticResponseCache:
+    """静态内容响应缓存"""
+
+    def __init__(self, max_age: Optional[int] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        初始化响应缓存
+
+        Args:
+            max_age (Optional[int]): Cache-Control 的 max-age（秒），None 表示读取 STATIC_CACHE_MAX_AGE
+            max_entries (int): 最多缓存的响应数
+        """
+        if max_age is None:
+            try:
+                max_age = int(os.environ.get('STATIC_CACHE_MAX_AGE', DEFAULT_MAX_AGE))
+            except ValueError:
+                max_age = DEFAULT_MAX_AGE
+        self.max_age = max(0, max_age)
+        self.max_entries = max(1, max_entries)
+        self.resources = get_resource_registry()
+        self.metrics = get_metrics()
+        self._entries: Dict[str, _CachedResponse] = {}
+        self._lock = threading.Lock()
+
+    def respond(self, key: str, resources: Sequence[str], builder: Callable[[], Any]) -> Response:
+        """
+        返回缓存的响应，依赖的资源文件修改后重新构建
+
+        Args:
+            key (str): 缓存键，同一接口的不同参数使用不同的键
+            resources (Sequence[str]): 响应依赖的资源文件（相对于资源根目录），为空表示内容只随代码变化
+            builder (Callable[[], Any]): 构建响应数据的函数，返回可序列化为JSON的对象
+
+        Returns:
+            Response: 根据 Accept-Encoding 选择压缩版本的响应，If-None-Match 匹配时为 304
+
+        Raises:
+            Exception: builder 抛出的异常，此时不缓存
+        """
+        entry = self._get_entry(key, resources, builder)
+        encoding = self._choose_encoding(entry)
+
+        headers = {
+            'ETag': entry.etags[encoding],
+            'Cache-Control': f'public, max-age={self.max_age}',
+            'Vary': 'Accept-Encoding'
+        }
+        if self._not_modified(entry):
+            self.metrics.increment("static_cache.not_modified")
+            return Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(entry.bodies[encoding], mimetype='application/json', headers=headers)
+
+    def _get_entry(self, key: str, resources: Sequence[str], builder: Callable[[], Any]) -> _CachedResponse:
+        """获取最新的缓存响应，资源版本变化或尚未缓存时构建"""
+        versions = self._get_versions(resources)
+        entry = self._entries.get(key)
+        if entry is not None and entry.versions == versions:
+            self.metrics.increment("static_cache.hits")
+            return entry
+
+        # 同时到达的请求可能各自构建一次，结果相同，不必加锁等待
+        body = current_app.json.response(builder()).get_data()
+        entry = _CachedResponse(versions, body)
+        with self._lock:
+            if key in self._entries or len(self._entries) < self.max_entries:
+                self._entries[key] = entry
+        self.metrics.increment("static_cache.builds")
+        logger.debug(f"构建静态响应: {key}，{len(body)} 字节")
+        return entry
+
+    def _get_versions(self, resources: Sequence[str]) -> Tuple[Optional[int], ...]:
+        """获取各资源的当前版本，文件不可读时为None（文件恢复后版本变化，重新构建）"""
+        versions = []
+        for name in resources:
+            try:
+                versions.append(self.resources.get_version(name))
+            except OSError:
+                versions.append(None)
+        return tuple(versions)
+
+    @staticmethod
+    def _choose_encoding(entry: _CachedResponse) -> str:
+        """按客户端接受的编码选择压缩版本"""
+        accept_encodings = request.accept_encodings
+        for encoding in ENCODINGS:
+            if encoding in entry.bodies and accept_encodings[encoding] > 0:
+                return encoding
+        return 'identity'
+
+    @staticmethod
+    def _not_modified(entry: _CachedResponse) -> bool:
+        """If-None-Match 是否匹配（弱比较，任一编码版本的ETag均视为匹配）"""
+        if_none_match = request.if_none_match
+        if not if_none_match:
+            return False
+        return if_none_match.star_tag or any(
+            if_none_match.contains_weak(etag.strip('"')) for etag in entry.etags.values()
+        )
+
+    def invalidate(self, key: Optional[str] = None):
+        """
+        清除缓存的响应
+
+        Args:
+            key (Optional[str]): 缓存键，None 表示全部
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict[str, Any]: 缓存的响应数和各编码版本的总字节数
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+        sizes: Dict[str, int] = {}
+        for entry in entries:
+            for encoding, body in entry.bodies.items():
+                sizes[encoding] = sizes.get(encoding, 0) + len(body)
+        return {"entries": len(entries), "bytes": sizes, "brotli": brotli is not None}
+
+
+# 全局响应缓存实例
+_static_response_cache = None
+_static_response_cache_lock = threading.Lock()
+
+
+def get_static_response_cache() -> StaticResponseCache:
+    """
+    获取全局静态内容响应缓存实例
+
+    Returns:
+        StaticResponseCache: 响应缓存实例
+    """
+    global _static_response_cache
+    if _static_response_cache is None:
+        with _static_response_cache_lock:
+            if _static_response_cache is None:
+                _static_response_cache = StaticResponseCache()
+                get_metrics().register_collector("static_cache", _static_response_cache.get_stats)
+    return _static_response_cache
@@ -0,0 +1,177 @@
+"""
+流式输出工具函数
+提供从LLM流式JSON输出中提取叙述文本、SSE事件格式化等功能
+"""
+
+import json
+from typing import Any, Iterable, List, Optional
+
+from utils.json_utils import GameJSONEncoder
+
+# JSON字符串中的简单转义字符
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t'
+}
+
+# 非叙述字符串最多保留的长度，只用于识别键名
+_MAX_KEY_LENGTH = 64
+
+# UTF-16代理项范围：\uD800-\uDBFF 为高位代理，\uDC00-\uDFFF 为低位代理，成对表示一个补充平面字符（如emoji）
+_HIGH_SURROGATES = range(0xD800, 0xDC00)
+_LOW_SURROGATES = range(0xDC00, 0xE000)
+
+
+class NarrativeStreamFilter:
+    """
+    叙述文本流式过滤器
+
+    LLM以JSON格式输出推演结果，本过滤器逐块接收原始输出，
+    只把指定键（默认 ``narrative``）对应的字符串值实时吐出，
+    使玩家无需等待完整JSON生成即可看到叙述内容。
+    """
+
+    def __init__(self, keys: Iterable[str] = ('narrative',), separator: str = "\n\n"):
+        """
+        初始化过滤器
+
+        Args:
+            keys (Iterable[str]): 需要输出其字符串值的键名
+            separator (str): 多段叙述之间插入的分隔符
+        """
+        self.keys = set(keys)
+        self.separator = separator
+
+        self._in_string = False
+        self._escape = False
+        self._unicode_digits: Optional[List[str]] = None
+        # 等待与下一个低位代理组合的高位代理
+        self._high_surrogate: Optional[int] = None
+        self._string_buffer: List[str] = []
+        self._last_string: Optional[str] = None
+        self._expect_value = False
+        self._emitting = False
+        self._emitted_segments = 0
+
+    def feed(self, chunk: str) -> str:
+        """
+        输入一块LLM原始输出
+
+        Args:
+            chunk (str): 原始文本块
+
+        Returns:
+            str: 本块中属于叙述字段的文本（可能为空字符串）
+        """
+        output = []
+
+        for char in chunk:
+            if self._in_string:
+                self._consume_string_char(char, output)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_buffer = []
+                if self._expect_value:
+                    self._emitting = True
+                    self._expect_value = False
+                    if self._emitted_segments > 0 and self.separator:
+                        output.append(self.separator)
+                    self._emitted_segments += 1
+            elif char == ':':
+                self._expect_value = self._last_string in self.keys
+                self._last_string = None
+            elif not char.isspace():
+                self._expect_value = False
+                self._last_string = None
+
+        return "".join(output)
+
+    def _consume_string_char(self, char: str, output: List[str]):
+        """处理字符串内部的字符"""
+        if self._unicode_digits is not None:
+            self._unicode_digits.append(char)
+            if len(self._unicode_digits) == 4:
+                try:
+                    code = int("".join(self._unicode_digits), 16)
+                except ValueError:
+                    code = None
+                self._unicode_digits = None
+                self._append_code_point(code, output)
+            return
+
+        if self._escape:
+            self._escape = False
+            if char == 'u':
+                self._unicode_digits = []
+            else:
+                self._flush_high_surrogate(output)
+                self._append_string_char(_SIMPLE_ESCAPES.get(char, char), output)
+            return
+
+        if char == '\\':
+            self._escape = True
+            return
+
+        self._flush_high_surrogate(output)
+        if char == '"':
+            self._in_string = False
+            if self._emitting:
+                self._emitting = False
+                self._last_string = None
+            else:
+                self._last_string = "".join(self._string_buffer)
+        else:
+            self._append_string_char(char, output)
+
+    def _append_code_point(self, code: Optional[int], output: List[str]):
+        """写入 \\uXXXX 转义解码出的字符，高位代理暂存到下一个转义，与低位代理组合后再输出"""
+        if code is not None and code in _LOW_SURROGATES and self._high_surrogate is not None:
+            high, self._high_surrogate = self._high_surrogate, None
+            self._append_string_char(chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00)), output)
+            return
+
+        self._flush_high_surrogate(output)
+        if code is None:
+            return
+        if code in _HIGH_SURROGATES:
+            self._high_surrogate = code
+        elif code in _LOW_SURROGATES:
+            self._append_string_char('\ufffd', output)
+        else:
+            self._append_string_char(chr(code), output)
+
+    def _flush_high_surrogate(self, output: List[str]):
+        """没有配对低位代理的高位代理输出为替换字符（单独的代理项无法编码为UTF-8）"""
+        if self._high_surrogate is not None:
+            self._high_surrogate = None
+            self._append_string_char('\ufffd', output)
+
+    def _append_string_char(self, text: str, output: List[str]):
+        """将字符串内容写入输出或键名缓冲区"""
+        if self._emitting:
+            output.append(text)
+        elif len(self._string_buffer) < _MAX_KEY_LENGTH:
+            self._string_buffer.append(text)
+
+
+def format_sse_event(event: str, data: Any) -> str:
+    """
+    格式化一条 Server-Sent Events 消息
+
+    Args:
+        event (str): 事件名称
+        data (Any): 事件数据，会被序列化为JSON
+
+    Returns:
+        str: SSE格式的消息文本
+    """
+    payload = json.dumps(data, ensure_ascii=False, cls=GameJSONEncoder)
+    return f"event: {event}\ndata: {payload}\n\n"
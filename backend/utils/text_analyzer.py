@@ -3,34 +3,54 @@
 """
 
 import os
-import re
 import logging
-import json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional, Tuple
 from llm.chat import create_chat_completion
+from llm.model_routing import get_model_router, TASK_HERO_EXTRACT, TASK_EQUIPMENT_EXTRACT
+from utils.llm_cache import get_extraction_cache
+from utils.json_extractor import extract_json_object
+from utils.resource_registry import get_resource_registry
 
-HERO_INFO_PROMPT_TEMPLATE = None
-hero_info_prompt_template_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'resources', 'prompts', 'analyze_prologue_hero_info_prompt.txt')
-with open(hero_info_prompt_template_path, 'r', encoding='utf-8') as file:
-    HERO_INFO_PROMPT_TEMPLATE = file.read()
-EQUIPMENT_PROMPT_TEMPLATE = None
-equipment_prompt_template_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'resources', 'prompts', 'analyze_prologue_equiment_prompt.txt')
-with open(equipment_prompt_template_path, 'r', encoding='utf-8') as file:
-    EQUIPMENT_PROMPT_TEMPLATE = file.read()
+# 提取提示模板（由资源注册表加载，修改文件后自动重新加载）
+HERO_INFO_PROMPT = 'prompts/analyze_prologue_hero_info_prompt.txt'
+EQUIPMENT_PROMPT = 'prompts/analyze_prologue_equiment_prompt.txt'
+COMBINED_PROMPT = 'prompts/analyze_prologue_combined_prompt.txt'
 
 logger = logging.getLogger(__name__)
 
+# 提取结果格式的版本号，修改输出结构时提升以使旧缓存失效
+EXTRACTION_CACHE_VERSION = "1"
+
+# 勇者信息提取模式：
+#   sequential - 依次调用勇者信息和装备提取
+#   concurrent - 在线程池中并发调用两个提取
+#   combined   - 使用一个合并提示，一次调用同时提取
+EXTRACTION_MODES = ('sequential', 'concurrent', 'combined')
+DEFAULT_EXTRACTION_MODE = os.environ.get('HERO_EXTRACTION_MODE', 'concurrent')
+
+# 提取调用使用的有界线程池
+_extraction_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('EXTRACTION_MAX_WORKERS', 8)),
+    thread_name_prefix='hero-extraction'
+)
+
+def _cache_version(task: str) -> str:
+    """缓存版本包含任务路由的模型，切换模型后旧的提取结果不再命中"""
+    return f"{EXTRACTION_CACHE_VERSION}:{get_model_router().get_route(task).model}"
+
 # 提取 JSON 的函数
 def extract_result_json(model_output: str) -> dict:
-    match = re.search(r"<提取结果>\s*({.*?})\s*</提取结果>", model_output, re.DOTALL)
-    if not match:
-        raise ValueError("未找到 <提取结果> 标签中的 JSON 内容。")
-    json_str = match.group(1)
-    return json.loads(json_str)
+    """从 <提取结果> 标签（或代码块、纯JSON）中提取JSON对象"""
+    return extract_json_object(model_output)
 
 
 def extract_hero_info(text):
     """
     从玩家输入中提取勇者信息，调用大模型进行提取
+
+    相同输入的提取结果会被缓存，并发的相同请求只调用一次大模型。
     
     参数:
         text (str): 玩家输入的文本
@@ -38,8 +58,15 @@ def extract_hero_info(text):
     返回:
         dict: 包含勇者信息的字典
     """
-    prompt = HERO_INFO_PROMPT_TEMPLATE.format(player_input=text)
-    response = create_chat_completion(prompt)
+    cache = get_extraction_cache()
+    key = cache.make_key('hero_info', get_resource_registry().get_text(HERO_INFO_PROMPT), text, _cache_version(TASK_HERO_EXTRACT))
+    return cache.get_or_compute(key, lambda: _extract_hero_info_uncached(text))
+
+
+def _extract_hero_info_uncached(text):
+    """调用大模型提取勇者信息（不经过缓存）"""
+    prompt = get_resource_registry().get_template(HERO_INFO_PROMPT).format(player_input=text)
+    response = create_chat_completion(prompt, task=TASK_HERO_EXTRACT)
     # 从API响应中提取内容
     content = response.get('choices', [{}])[0].get('message', {}).get('content', '')
     logger.info(f"提取勇者信息的响应内容: {content}")
@@ -48,6 +75,8 @@ def extract_hero_info(text):
 def extract_equipment(text):
     """
     从玩家输入中提取装备信息，调用大模型进行提取
+
+    相同输入的提取结果会被缓存，并发的相同请求只调用一次大模型。
     
     参数:
         text (str): 玩家输入的文本
@@ -55,8 +84,15 @@ def extract_equipment(text):
     返回:
         dict: 包含装备信息的字典
     """
-    prompt = EQUIPMENT_PROMPT_TEMPLATE.format(player_input=text)
-    response = create_chat_completion(prompt)
+    cache = get_extraction_cache()
+    key = cache.make_key('equipment', get_resource_registry().get_text(EQUIPMENT_PROMPT), text, _cache_version(TASK_EQUIPMENT_EXTRACT))
+    return cache.get_or_compute(key, lambda: _extract_equipment_uncached(text))
+
+
+def _extract_equipment_uncached(text):
+    """调用大模型提取装备信息（不经过缓存）"""
+    prompt = get_resource_registry().get_template(EQUIPMENT_PROMPT).format(player_input=text)
+    response = create_chat_completion(prompt, task=TASK_EQUIPMENT_EXTRACT)
     # 从API响应中提取内容
     content = response.get('choices', [{}])[0].get('message', {}).get('content', '')
     logger.info(f"提取装备信息的响应内容: {content}")
@@ -64,9 +100,69 @@ def extract_equipment(text):
 
 
 
+def extract_combined(text):
+    """
+    使用合并提示，一次调用大模型同时提取勇者信息和装备信息
+
+    参数:
+        text (str): 玩家输入的文本
+
+    返回:
+        dict: 包含 hero_info 和 equipment 两个键的字典
+    """
+    cache = get_extraction_cache()
+    key = cache.make_key('combined', get_resource_registry().get_text(COMBINED_PROMPT), text, _cache_version(TASK_HERO_EXTRACT))
+    return cache.get_or_compute(key, lambda: _extract_combined_uncached(text))
+
+
+def _extract_combined_uncached(text):
+    """调用大模型同时提取勇者信息和装备信息（不经过缓存）"""
+    prompt = get_resource_registry().get_template(COMBINED_PROMPT).format(player_input=text)
+    response = create_chat_completion(prompt, task=TASK_HERO_EXTRACT)
+    content = response.get('choices', [{}])[0].get('message', {}).get('content', '')
+    logger.info(f"合并提取的响应内容: {content}")
+    result = extract_result_json(content)
+    if not isinstance(result.get('hero_info'), dict) or not isinstance(result.get('equipment'), dict):
+        raise ValueError("合并提取结果缺少 hero_info 或 equipment 字段。")
+    return result
+
+
+def extract_hero_profile(text, mode: Optional[str] = None) -> Tuple[dict, dict]:
+    """
+    提取勇者信息和装备信息
+
+    参数:
+        text (str): 玩家输入的文本
+        mode (str, optional): 提取模式，sequential / concurrent / combined，
+            默认使用环境变量 HERO_EXTRACTION_MODE（未设置时为 concurrent）
+
+    返回:
+        Tuple[dict, dict]: (勇者信息, 装备信息)
+    """
+    mode = mode or DEFAULT_EXTRACTION_MODE
+    if mode not in EXTRACTION_MODES:
+        logger.warning(f"未知的提取模式 {mode}，使用 concurrent")
+        mode = 'concurrent'
+
+    logger.info(f"开始提取勇者信息，模式: {mode}")
+
+    if mode == 'sequential':
+        return extract_hero_info(text), extract_equipment(text)
+
+    if mode == 'combined':
+        result = extract_combined(text)
+        return result['hero_info'], result['equipment']
+
+    # 复制当前上下文，使工作线程中的LLM调用沿用请求的调度参数（优先级、截止时间）
+    hero_future = _extraction_executor.submit(contextvars.copy_context().run, extract_hero_info, text)
+    equipment_future = _extraction_executor.submit(contextvars.copy_context().run, extract_equipment, text)
+    # 等两个提取都结束再返回或抛出异常，避免一个失败时另一个仍在后台占用LLM请求
+    wait([hero_future, equipment_future])
+    return hero_future.result(), equipment_future.result()
+
+
 if __name__ == '__main__':
     text = "一位衣着堂皇的女子，头戴金冠，身穿华丽的长裙，手持权杖，站在教堂门前。"
-    hero_info = extract_hero_info(text)
-    equipment = extract_equipment(text)
+    hero_info, equipment = extract_hero_profile(text)
     print(hero_info)
     print(equipment)
@@ -0,0 +1,271 @@
+"""
+Token估算与提示分段预算
+提供适用于中英文混合文本的快速token估算（可根据LLM返回的usage校准），
+以及按提示分段设置token预算、超出时截断/压缩的功能
+"""
+
+import json
+import math
+import threading
+from typing import Any, Dict, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 估算参数：每个中日韩字符约0.7个token，其他字符约4个字符一个token
+DEFAULT_CJK_TOKENS_PER_CHAR = 0.7
+DEFAULT_ASCII_CHARS_PER_TOKEN = 4.0
+
+# 校准系数的平滑因子与取值范围
+CALIBRATION_ALPHA = 0.2
+CALIBRATION_RANGE = (0.3, 3.0)
+
+# 截断提示
+TRUNCATED_MARK = "……（内容过长，已截断）"
+
+
+def _compact_json(data: Any) -> str:
+    """序列化为与提示中相同的紧凑JSON"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+class TokenEstimator:
+    """
+    Token估算器
+
+    UTF-8编码下，基本多文种平面中 U+0800 以上的字符（包括中文）占3字节，ASCII字符占1字节，
+    因此 (字节数 - 字符数) / 2 即可近似得到中文字符数，整个估算只需一次C层面的编码操作。
+    """
+
+    def __init__(self, cjk_tokens_per_char: float = DEFAULT_CJK_TOKENS_PER_CHAR,
+                 ascii_chars_per_token: float = DEFAULT_ASCII_CHARS_PER_TOKEN):
+        """
+        初始化估算器
+
+        Args:
+            cjk_tokens_per_char (float): 每个中文字符对应的token数
+            ascii_chars_per_token (float): 每个token对应的非中文字符数
+        """
+        self.cjk_tokens_per_char = cjk_tokens_per_char
+        self.ascii_chars_per_token = ascii_chars_per_token
+        self.scale = 1.0
+        self.calibration_samples = 0
+        self._lock = threading.Lock()
+
+    def estimate_raw(self, text: str) -> float:
+        """未经校准的token估算值"""
+        if not text:
+            return 0.0
+        char_count = len(text)
+        cjk_count = min(char_count, (len(text.encode('utf-8', errors='replace')) - char_count) / 2)
+        other_count = char_count - cjk_count
+        return cjk_count * self.cjk_tokens_per_char + other_count / self.ascii_chars_per_token
+
+    def estimate(self, text: str) -> int:
+        """
+        估算文本的token数
+
+        Args:
+            text (str): 文本
+
+        Returns:
+            int: 估算的token数
+        """
+        if not text:
+            return 0
+        return int(math.ceil(self.estimate_raw(text) * self.scale))
+
+    def calibrate(self, text: str, reported_tokens: int):
+        """
+        根据LLM服务返回的实际token数校准估算系数
+
+        Args:
+            text (str): 实际发送的文本
+            reported_tokens (int): 服务返回的 usage.prompt_tokens
+        """
+        raw = self.estimate_raw(text)
+        if raw <= 0 or not reported_tokens:
+            return
+
+        ratio = reported_tokens / raw
+        low, high = CALIBRATION_RANGE
+        ratio = max(low, min(high, ratio))
+
+        with self._lock:
+            if self.calibration_samples == 0:
+                self.scale = ratio
+            else:
+                self.scale = (1 - CALIBRATION_ALPHA) * self.scale + CALIBRATION_ALPHA * ratio
+            self.calibration_samples += 1
+
+        logger.debug(f"token估算校准: 估算 {raw:.0f}，实际 {reported_tokens}，校准系数 {self.scale:.3f}")
+
+
+# 提示分段的默认token预算
+DEFAULT_SECTION_BUDGETS = {
+    "equipment_info": 200,
+    "npc_info": 3000,
+    "npc_states": 1500,
+    "location_details": 600,
+    "world_lore": 1500,
+    "world_info": 1500,
+    "history_summary": 600,
+    "history_events": 1200,
+    "fixed_events_info": 400,
+    "location_properties": 300,
+    "current_world_state": 1500,
+    "current_character_states": 1200,
+    "world_history": 1200,
+    "character_actions": 800
+}
+
+# 各分段超出预算时的压缩策略：
+#   head - 按行保留开头部分（列表、描述类内容）
+#   tail - 按行保留末尾部分（历史记录，越新越重要）
+#   json - 单行紧凑JSON，按顶层条目整体保留开头部分，结果仍是合法JSON；无法解析时不截断
+DEFAULT_SECTION_STRATEGIES = {
+    "history_events": "tail",
+    "world_history": "tail",
+    "location_properties": "json",
+    "current_world_state": "json"
+}
+
+
+class PromptBudget:
+    """提示分段预算"""
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None,
+                 strategies: Optional[Dict[str, str]] = None,
+                 estimator: Optional[TokenEstimator] = None):
+        """
+        初始化提示分段预算
+
+        Args:
+            budgets (Optional[Dict[str, int]]): 分段名到token预算的映射，未列出的分段不限制
+            strategies (Optional[Dict[str, str]]): 分段名到压缩策略的映射，默认 head
+            estimator (Optional[TokenEstimator]): token估算器，默认使用全局估算器
+        """
+        self.budgets = dict(DEFAULT_SECTION_BUDGETS if budgets is None else budgets)
+        self.strategies = dict(DEFAULT_SECTION_STRATEGIES if strategies is None else strategies)
+        self.estimator = estimator or get_token_estimator()
+
+    def fit(self, section: str, text: str) -> str:
+        """
+        使单个分段符合预算
+
+        Args:
+            section (str): 分段名
+            text (str): 分段文本
+
+        Returns:
+            str: 符合预算的文本
+        """
+        budget = self.budgets.get(section)
+        if budget is None or not text or self.estimator.estimate(text) <= budget:
+            return text
+
+        strategy = self.strategies.get(section, "head")
+        if strategy == "json":
+            return self._fit_json(section, text, budget)
+
+        lines = text.split("\n")
+        if strategy == "tail":
+            lines.reverse()
+
+        kept = []
+        used = self.estimator.estimate(TRUNCATED_MARK)
+        for line in lines:
+            line_tokens = self.estimator.estimate(line) + 1
+            if used + line_tokens <= budget:
+                kept.append(line)
+                used += line_tokens
+                continue
+            # 第一行就超出预算时按比例截断该行，尽量保留部分内容；预算不足一个字符时整行丢弃
+            if not kept:
+                remaining = max(budget - used, 0)
+                keep_chars = int(len(line) * remaining / line_tokens)
+                if keep_chars > 0:
+                    kept.append(line[-keep_chars:] if strategy == "tail" else line[:keep_chars])
+            break
+
+        if strategy == "tail":
+            kept.reverse()
+            result = TRUNCATED_MARK + "\n" + "\n".join(kept) if kept else TRUNCATED_MARK
+        else:
+            result = "\n".join(kept) + "\n" + TRUNCATED_MARK if kept else TRUNCATED_MARK
+
+        logger.info(f"提示分段 {section} 超出预算 {budget} token，已按 {strategy} 策略压缩")
+        return result
+
+    def _fit_json(self, section: str, text: str, budget: int) -> str:
+        """按顶层条目整体截断紧凑JSON分段，截断提示放在JSON之后的单独一行"""
+        try:
+            data = json.loads(text)
+        except ValueError:
+            logger.warning(f"提示分段 {section} 不是合法JSON，超出预算 {budget} token 但不截断")
+            return text
+        if not isinstance(data, (dict, list)):
+            return text
+
+        items = list(data.items()) if isinstance(data, dict) else list(data)
+        kept = []
+        used = self.estimator.estimate(TRUNCATED_MARK) + 2
+        for item in items:
+            item_text = _compact_json(dict([item]) if isinstance(data, dict) else item)
+            item_tokens = self.estimator.estimate(item_text)
+            if used + item_tokens > budget:
+                break
+            kept.append(item)
+            used += item_tokens
+
+        result = _compact_json(dict(kept) if isinstance(data, dict) else kept) + "\n" + TRUNCATED_MARK
+        logger.info(f"提示分段 {section} 超出预算 {budget} token，已保留前 {len(kept)}/{len(items)} 个JSON条目")
+        return result
+
+    def apply(self, sections: Dict[str, str]) -> Dict[str, str]:
+        """
+        对所有分段应用预算
+
+        Args:
+            sections (Dict[str, str]): 分段名到文本的映射
+
+        Returns:
+            Dict[str, str]: 符合预算的分段
+        """
+        return {name: self.fit(name, text) for name, text in sections.items()}
+
+    def log_usage(self, label: str, sections: Dict[str, str], total_text: Optional[str] = None) -> Dict[str, int]:
+        """
+        记录各分段的token数
+
+        Args:
+            label (str): 调用标识，如 game_action
+            sections (Dict[str, str]): 分段名到文本的映射
+            total_text (Optional[str]): 完整提示文本，用于统计总token数
+
+        Returns:
+            Dict[str, int]: 分段名到估算token数的映射
+        """
+        usage = {name: self.estimator.estimate(text) for name, text in sections.items()}
+        total = self.estimator.estimate(total_text) if total_text is not None else sum(usage.values())
+        details = ", ".join(f"{name}={tokens}" for name, tokens in usage.items())
+        logger.info(f"[{label}] 提示token估算: 总计 {total}，{details}")
+        return usage
+
+
+# 全局token估算器实例
+_token_estimator = None
+
+
+def get_token_estimator() -> TokenEstimator:
+    """
+    获取全局token估算器实例
+
+    Returns:
+        TokenEstimator: token估算器实例
+    """
+    global _token_estimator
+    if _token_estimator is None:
+        _token_estimator = TokenEstimator()
+    return _token_estimator
@@ -99,6 +99,11 @@ const gameApi = {
     return api.get('/game/prologue')
   },
 
+  // 提交开场白回应，后端在后台预取勇者信息，随后的 createWorld 直接使用预取结果
+  startGame: (playerResponse) => {
+    return api.post('/game/start', { playerResponse })
+  },
+
   // 创建世界（包含勇者信息分析和世界生成）- 使用长超时
   createWorld: (playerResponse) => {
     console.log('[createWorld] 开始创建世界，使用长超时API')
@@ -116,6 +121,75 @@ const gameApi = {
     })
   },
 
+  // 以SSE流式处理游戏行动，叙述文本生成时即通过 onNarrative 回调推送
+  // mode 为 'pipeline' 时按时段分别推演，每个时段完成后通过 onPeriod 回调推送该时段的结果；
+  // 为 'fanout' 时先规划勇者的一天再并行推演NPC反应
+  processActionStream: async (gameId, action, { onNarrative, onPeriod, onResult, onError, mode } = {}) => {
+    console.log('[processActionStream] 开始流式处理游戏行动')
+    console.log('[processActionStream] 游戏ID:', gameId)
+
+    const response = await fetch('/api/game/action/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(mode ? { game_id: gameId, action: action, mode: mode } : { game_id: gameId, action: action })
+    })
+
+    if (!response.ok || !response.body) {
+      const errorData = await response.json().catch(() => ({}))
+      const message = errorData.message || `请求失败: ${response.status}`
+      console.error('[processActionStream] 请求失败:', message)
+      if (onError) onError(message)
+      throw new Error(message)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder('utf-8')
+    let buffer = ''
+    let finalResult = null
+
+    const handleEvent = (rawEvent) => {
+      let eventName = 'message'
+      const dataLines = []
+      rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+          eventName = line.slice(6).trim()
+        } else if (line.startsWith('data:')) {
+          dataLines.push(line.slice(5).trim())
+        }
+      })
+      if (dataLines.length === 0) return
+
+      const payload = JSON.parse(dataLines.join('\n'))
+      if (eventName === 'narrative') {
+        if (onNarrative) onNarrative(payload.text)
+      } else if (eventName === 'period') {
+        if (onPeriod) onPeriod(payload)
+      } else if (eventName === 'result') {
+        finalResult = payload
+        if (onResult) onResult(payload)
+      } else if (eventName === 'error') {
+        console.error('[processActionStream] 处理失败:', payload.message)
+        if (onError) onError(payload.message)
+      }
+    }
+
+    for (;;) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+
+      let separatorIndex = buffer.indexOf('\n\n')
+      while (separatorIndex !== -1) {
+        handleEvent(buffer.slice(0, separatorIndex))
+        buffer = buffer.slice(separatorIndex + 2)
+        separatorIndex = buffer.indexOf('\n\n')
+      }
+    }
+
+    console.log(`[processActionStream] 完成时间: ${new Date().toLocaleTimeString()}`)
+    return finalResult
+  },
+
   // 获取游戏状态
   getGameState: (gameId) => {
     return api.get(`/game/session/${gameId}/state`)